@@ -0,0 +1,122 @@
+""" Fetching indices and eggs from a local stand-in server with artificial
+latency (Python >= 3.4).
+
+- blocking: repository_factory (4 worker threads), then the eggs one after
+  the other, as enpkg does by default.
+- asyncio: the indices, then the eggs, each batch fetched concurrently from
+  one event loop (enstaller.async_fetch).
+- asyncio, multiplexed: indices and eggs fetched at the same time from one
+  event loop, e.g. when refreshing the indices while fetching eggs of an
+  already resolved set.
+"""
+from __future__ import print_function
+
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import os.path
+import shutil
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from enstaller.async_fetch import (DEFAULT_MAX_WORKERS, AsyncDownloadManager,
+                                   AsyncSession)
+from enstaller.cli.utils import repository_factory
+from enstaller.fetch import _DownloadManager
+from enstaller.repository import RemotePackageMetadata, Repository
+from enstaller.repository_info import OldstyleRepositoryInfo
+from enstaller.session import Session
+from enstaller.tests.common import DummyAuthenticator
+from enstaller.utils import RUNNING_PYTHON
+from enstaller.versions import EnpkgVersion
+
+from common import StandInServer, run, synthetic_index
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser()
+    p.add_argument("-r", "--repositories", type=int, default=4)
+    p.add_argument("-e", "--eggs", type=int, default=8)
+    p.add_argument("-s", "--size", type=int, default=1024 * 1024,
+                   help="Size of each egg (bytes)")
+    p.add_argument("-l", "--latency", type=float, default=0.2,
+                   help="Latency of the stand-in server (seconds)")
+    p.add_argument("-w", "--workers", type=int, default=DEFAULT_MAX_WORKERS,
+                   help="Maximum number of requests in flight (asyncio)")
+    namespace = p.parse_args(argv)
+
+    routes = {}
+    with StandInServer(routes, namespace.latency) as server:
+        repository_infos = []
+        for i in range(namespace.repositories):
+            routes["/repo{0}/index.json".format(i)] = json.dumps(
+                synthetic_index(5000, seed=i)).encode("utf8")
+            repository_infos.append(OldstyleRepositoryInfo(
+                "{0}/repo{1}/".format(server.url, i)))
+
+        eggs_info = OldstyleRepositoryInfo(server.url + "/eggs/")
+        packages = []
+        for i in range(namespace.eggs):
+            data = os.urandom(namespace.size)
+            name = "egg{0}".format(i)
+            package = RemotePackageMetadata(
+                "{0}-1.0.0-1.egg".format(name), name,
+                EnpkgVersion.from_string("1.0.0-1"), [], RUNNING_PYTHON,
+                len(data), hashlib.md5(data).hexdigest(), 0.0, "commercial",
+                True, eggs_info
+            )
+            routes["/eggs/" + package.key] = data
+            packages.append(package)
+        egg_repository = Repository(packages)
+
+        def _in_new_cache(f):
+            def _f():
+                cache_directory = tempfile.mkdtemp()
+                try:
+                    session = Session(DummyAuthenticator(), cache_directory)
+                    with session:
+                        f(session)
+                finally:
+                    shutil.rmtree(cache_directory)
+            return _f
+
+        def _blocking(session):
+            repository_factory(session, repository_infos, quiet=True)
+            downloader = _DownloadManager(session, egg_repository)
+            for package in packages:
+                downloader.fetch(package)
+
+        def _asyncio(multiplexed):
+            def _f(session):
+                loop = asyncio.new_event_loop()
+                try:
+                    with AsyncSession(session, loop,
+                                      namespace.workers) as async_session:
+                        downloader = AsyncDownloadManager(
+                            _DownloadManager(session, egg_repository),
+                            async_session
+                        )
+                        indices = async_session.fetch_repositories(
+                            repository_infos)
+                        if not multiplexed:
+                            loop.run_until_complete(indices)
+                        eggs = [downloader.fetch(package)
+                                for package in packages]
+                        loop.run_until_complete(
+                            asyncio.gather(indices, *eggs))
+                finally:
+                    loop.close()
+            return _f
+
+        run("blocking", _in_new_cache(_blocking), repeat=1)
+        run("asyncio", _in_new_cache(_asyncio(False)), repeat=1)
+        run("asyncio, multiplexed", _in_new_cache(_asyncio(True)),
+            repeat=1)
+
+
+if __name__ == "__main__":
+    main()
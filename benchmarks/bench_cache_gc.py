@@ -0,0 +1,63 @@
+""" Benchmark the overhead of keeping the download cache within its budget,
+as done after each Enpkg.execute when repository_cache_max_size is set.
+
+- touch: record the use of every cached egg (one per cache hit).
+- collect (no-op): check a cache which fits in its budget.
+- collect: evict the least recently used half of the cache.
+"""
+from __future__ import print_function
+
+import argparse
+import os
+import os.path
+import shutil
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from enstaller.egg_cache import EggCache
+
+from common import run
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser()
+    p.add_argument("-n", "--eggs", type=int, default=2000)
+    p.add_argument("-s", "--size", type=int, default=1024,
+                   help="Size of each egg (bytes)")
+    namespace = p.parse_args(argv)
+
+    directory = tempfile.mkdtemp()
+    try:
+        paths = []
+        for i in range(namespace.eggs):
+            path = os.path.join(directory, "package{0}-1.0.0-1.egg".format(i))
+            with open(path, "wb") as fp:
+                fp.write(b"a" * namespace.size)
+            paths.append(path)
+
+        total = namespace.eggs * namespace.size
+        egg_cache = EggCache(directory, total)
+
+        def _touch():
+            for i, path in enumerate(paths):
+                egg_cache.touch(path, float(i))
+
+        def _collect():
+            for path in paths:
+                if not os.path.exists(path):
+                    with open(path, "wb") as fp:
+                        fp.write(b"a" * namespace.size)
+            return egg_cache.collect(max_size=total // 2)
+
+        print("{0} cached eggs".format(namespace.eggs))
+        run("touch (per egg)", _touch, repeat=1)
+        run("collect (no-op)", egg_cache.collect)
+        run("collect", _collect)
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
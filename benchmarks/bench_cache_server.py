@@ -0,0 +1,133 @@
+""" Many clients fetching the same eggs from a remote repository (a local
+stand-in server with WAN-like latency and bandwidth), either directly or
+through an enpkg --serve-cache server on the LAN.
+
+- upstream: every client fetches every egg from the remote repository.
+- cache server, cold: clients fetch from the cache server, which fetches
+  each egg from upstream once.
+- cache server, warm: every egg is already in the cache of the server.
+
+The number of bytes fetched from upstream is printed after each case.
+"""
+from __future__ import print_function
+
+import argparse
+import hashlib
+import os
+import os.path
+import shutil
+import sys
+import tempfile
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from enstaller.cache_server import CacheServer
+from enstaller.fetch import _DownloadManager
+from enstaller.repository import (RemotePackageMetadata, Repository,
+                                  parse_index)
+from enstaller.repository_info import OldstyleRepositoryInfo
+from enstaller.session import Session
+from enstaller.tests.common import DummyAuthenticator
+from enstaller.utils import RUNNING_PYTHON
+from enstaller.versions import EnpkgVersion
+
+from common import StandInServer, run
+
+
+def _fetch_all_clients(n_clients, repository_factory):
+    """ Fetch every egg from n_clients threads, each with its own session and
+    download cache."""
+    def _client():
+        cache_directory = tempfile.mkdtemp()
+        try:
+            with Session(DummyAuthenticator(), cache_directory) as session:
+                repository = repository_factory(session)
+                downloader = _DownloadManager(session, repository)
+                for package in repository.iter_packages():
+                    downloader.fetch(package)
+        finally:
+            shutil.rmtree(cache_directory)
+
+    threads = [threading.Thread(target=_client) for _ in range(n_clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser()
+    p.add_argument("-c", "--clients", type=int, default=16,
+                   help="Number of clients")
+    p.add_argument("-n", "--eggs", type=int, default=8,
+                   help="Number of eggs")
+    p.add_argument("-s", "--size", type=int, default=512 * 1024,
+                   help="Size of each egg (bytes)")
+    p.add_argument("-l", "--latency", type=float, default=0.1,
+                   help="Latency of upstream (seconds)")
+    p.add_argument("-b", "--bandwidth", type=int, default=4 * 1024 * 1024,
+                   help="Bandwidth of upstream, per connection (bytes/s)")
+    namespace = p.parse_args(argv)
+
+    eggs = {}
+    for i in range(namespace.eggs):
+        eggs["egg{0}-1.0.0-1.egg".format(i)] = os.urandom(namespace.size)
+    routes = dict(("/eggs/" + key, data) for key, data in eggs.items())
+
+    upstream = StandInServer(routes, namespace.latency,
+                             bandwidth=namespace.bandwidth)
+    with upstream:
+        upstream_info = OldstyleRepositoryInfo(upstream.url + "/eggs/")
+        upstream_repository = Repository([
+            RemotePackageMetadata(
+                key, key.split("-")[0], EnpkgVersion.from_string("1.0.0-1"),
+                [], RUNNING_PYTHON, len(data), hashlib.md5(data).hexdigest(),
+                0.0, "commercial", True, upstream_info
+            ) for key, data in sorted(eggs.items())
+        ])
+
+        def _upstream_clients():
+            _fetch_all_clients(namespace.clients,
+                               lambda session: upstream_repository)
+
+        server_cache = tempfile.mkdtemp()
+        try:
+            server_session = Session(DummyAuthenticator(), server_cache)
+            downloader = _DownloadManager(server_session, upstream_repository)
+            cache_server = CacheServer(downloader, upstream_repository,
+                                       ("127.0.0.1", 0))
+            thread = threading.Thread(target=cache_server.serve_forever)
+            thread.start()
+            try:
+                server_info = OldstyleRepositoryInfo(
+                    "http://127.0.0.1:{0}/".format(
+                        cache_server.server_address[1]
+                    )
+                )
+
+                def _server_repository(session):
+                    index = session.fetch(server_info.index_url).json()
+                    return Repository(parse_index(index, server_info))
+
+                def _server_clients():
+                    _fetch_all_clients(namespace.clients, _server_repository)
+
+                for label, f in (("upstream", _upstream_clients),
+                                 ("cache server, cold", _server_clients),
+                                 ("cache server, warm", _server_clients)):
+                    upstream.bytes_sent = 0
+                    run(label, f, repeat=1)
+                    print("    {0:.1f} MB from upstream".format(
+                        upstream.bytes_sent / 1024.0 ** 2))
+            finally:
+                cache_server.shutdown()
+                thread.join()
+                cache_server.close()
+                server_session.close()
+        finally:
+            shutil.rmtree(server_cache)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+""" Benchmark checking cached eggs against their md5, as done for every egg
+by enpkg --force/--forceall.
+
+- rehash: compute the md5 of every cached egg (previous behaviour).
+- checksum db: look the md5s up in the checksum database, as recorded
+  when the eggs were downloaded.
+- verify: re-hash every egg in parallel (enpkg --verify-cache).
+"""
+from __future__ import print_function
+
+import argparse
+import os
+import os.path
+import shutil
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from egginst.utils import compute_md5
+
+from enstaller.checksum_db import ChecksumDatabase
+
+from common import run
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser()
+    p.add_argument("-n", "--eggs", type=int, default=200)
+    p.add_argument("-s", "--size", type=int, default=4 * 1024 * 1024,
+                   help="Size of each egg (bytes)")
+    namespace = p.parse_args(argv)
+
+    directory = tempfile.mkdtemp()
+    try:
+        checksums = ChecksumDatabase.from_directory(directory)
+        paths = []
+        for i in range(namespace.eggs):
+            path = os.path.join(directory, "package{0}-1.0.0-1.egg".format(i))
+            with open(path, "wb") as fp:
+                fp.write(os.urandom(namespace.size))
+            checksums.record(path, compute_md5(path))
+            paths.append(path)
+
+        print("{0} eggs of {1} kB".format(namespace.eggs,
+                                          namespace.size // 1024))
+        run("rehash", lambda: [compute_md5(path) for path in paths])
+        run("checksum db", lambda: [checksums.md5(path) for path in paths])
+        run("verify (4 threads)", lambda: checksums.verify(paths))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
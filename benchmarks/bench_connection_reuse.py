@@ -0,0 +1,100 @@
+""" Fetching indices then eggs from one host several times in a session,
+against a local stand-in server with keep-alive and an emulated connection
+setup (TCP + TLS handshake) latency.
+
+- fresh adapters: new etag adapters, with their own connection pools, are
+  created every time the etag context is entered (previous behaviour).
+- persistent: the etag adapters are kept, and share the connections of the
+  default adapter.
+
+Reports the time, and the number of connections accepted by the server.
+"""
+from __future__ import print_function
+
+import argparse
+import json
+import os.path
+import shutil
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from cachecontrol.adapter import CacheControlAdapter
+
+from enstaller.cli.utils import repository_factory
+from enstaller.repository_info import OldstyleRepositoryInfo
+from enstaller.requests_utils import DBCache, QueryPathOnlyCacheController
+from enstaller.session import Session
+from enstaller.tests.common import DummyAuthenticator
+
+from common import StandInServer, run, synthetic_index
+
+
+class FreshAdaptersSession(Session):
+    def _etag_setup(self):
+        if self._in_etag_context == 0:
+            uri = os.path.join(self.cache_directory, "index_cache",
+                               "index.db")
+            cache = DBCache(uri)
+            for prefix in ("http://", "https://"):
+                adapter = CacheControlAdapter(
+                    cache, controller_class=QueryPathOnlyCacheController,
+                    max_retries=self.max_retries)
+                self._raw.mount(prefix, adapter)
+        self._in_etag_context += 1
+
+    def _etag_tear(self):
+        if self._in_etag_context == 1:
+            for prefix in ("https://", "http://"):
+                adapter = self._raw.umount(prefix)
+                adapter.cache.close()
+        self._in_etag_context -= 1
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser()
+    p.add_argument("-r", "--repositories", type=int, default=4)
+    p.add_argument("-e", "--eggs", type=int, default=4)
+    p.add_argument("-n", "--runs", type=int, default=5,
+                   help="Number of index + eggs fetches in the session")
+    p.add_argument("-c", "--connect-latency", type=float, default=0.1)
+    namespace = p.parse_args(argv)
+
+    routes = {}
+    for i in range(namespace.repositories):
+        routes["/repo{0}/index.json".format(i)] = json.dumps(
+            synthetic_index(1000, seed=i)).encode("utf8")
+    for i in range(namespace.eggs):
+        routes["/eggs/egg{0}-1.0.0-1.egg".format(i)] = os.urandom(64 * 1024)
+
+    with StandInServer(routes, keep_alive=True,
+                       connect_latency=namespace.connect_latency) as server:
+        repository_infos = [
+            OldstyleRepositoryInfo("{0}/repo{1}/".format(server.url, i))
+            for i in range(namespace.repositories)
+        ]
+        egg_urls = ["{0}/eggs/egg{1}-1.0.0-1.egg".format(server.url, i)
+                    for i in range(namespace.eggs)]
+
+        def _session_run(klass):
+            cache_directory = tempfile.mkdtemp()
+            try:
+                with klass(DummyAuthenticator(), cache_directory) as session:
+                    for _ in range(namespace.runs):
+                        repository_factory(session, repository_infos,
+                                           quiet=True)
+                        for url in egg_urls:
+                            session.fetch(url).content
+            finally:
+                shutil.rmtree(cache_directory)
+
+        for label, klass in (("fresh adapters", FreshAdaptersSession),
+                             ("persistent", Session)):
+            server.connections = 0
+            run(label, lambda: _session_run(klass), repeat=1)
+            print("    {0} connections".format(server.connections))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+""" Concurrent egg downloads from a local stand-in server, with and without
+a bandwidth limit in the download scheduler of the session.
+
+For each case, the aggregate rate and the rate of the slowest and fastest
+transfers are printed: with a limit, the aggregate rate stays under the
+limit, and every transfer gets about the same share of it.
+
+The last case caps the number of transfers, and prints the order in which
+eggs were completed, which follows their priority (install order) rather
+than the order in which they were submitted.
+"""
+from __future__ import print_function
+
+import argparse
+import hashlib
+import os
+import os.path
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from enstaller.download_scheduler import DownloadScheduler
+from enstaller.fetch import _DownloadManager
+from enstaller.repository import RemotePackageMetadata, Repository
+from enstaller.repository_info import OldstyleRepositoryInfo
+from enstaller.session import Session
+from enstaller.tests.common import DummyAuthenticator
+from enstaller.utils import RUNNING_PYTHON
+from enstaller.versions import EnpkgVersion
+
+from common import StandInServer
+
+
+def _fetch_concurrently(packages, scheduler, priorities=None):
+    """ Fetch every package from its own thread, and returns the (package,
+    start, end) of each transfer, in order of completion."""
+    cache_directory = tempfile.mkdtemp()
+    transfers = []
+    lock = threading.Lock()
+    try:
+        with Session(DummyAuthenticator(), cache_directory,
+                     download_scheduler=scheduler) as session:
+            downloader = _DownloadManager(session, Repository(packages))
+
+            def _fetch(package, priority):
+                start = time.time()
+                downloader.fetch(package, priority=priority)
+                with lock:
+                    transfers.append((package, start, time.time()))
+
+            threads = [
+                threading.Thread(target=_fetch, args=(package, priority))
+                for package, priority in zip(packages, priorities or
+                                             [0] * len(packages))
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+    finally:
+        shutil.rmtree(cache_directory)
+    return transfers
+
+
+def _print_rates(label, transfers):
+    start = min(t[1] for t in transfers)
+    end = max(t[2] for t in transfers)
+    size = sum(t[0].size for t in transfers)
+    rates = [package.size / (t_end - t_start)
+             for package, t_start, t_end in transfers]
+    print("{0:<40} {1:8.2f} MB/s (transfers: {2:.2f} - {3:.2f} MB/s)".format(
+        label, size / (end - start) / 1024.0 ** 2,
+        min(rates) / 1024.0 ** 2, max(rates) / 1024.0 ** 2
+    ))
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser()
+    p.add_argument("-n", "--eggs", type=int, default=8,
+                   help="Number of eggs")
+    p.add_argument("-s", "--size", type=int, default=1024 * 1024,
+                   help="Size of each egg (bytes)")
+    p.add_argument("-r", "--rate", type=int, default=4 * 1024 * 1024,
+                   help="Bandwidth limit (bytes/s)")
+    namespace = p.parse_args(argv)
+
+    eggs = {}
+    for i in range(namespace.eggs):
+        eggs["egg{0}-1.0.0-1.egg".format(i)] = os.urandom(namespace.size)
+    routes = dict(("/eggs/" + key, data) for key, data in eggs.items())
+
+    with StandInServer(routes) as server:
+        repository_info = OldstyleRepositoryInfo(server.url + "/eggs/")
+        packages = [
+            RemotePackageMetadata(
+                key, key.split("-")[0], EnpkgVersion.from_string("1.0.0-1"),
+                [], RUNNING_PYTHON, len(data), hashlib.md5(data).hexdigest(),
+                0.0, "commercial", True, repository_info
+            ) for key, data in sorted(eggs.items())
+        ]
+
+        _print_rates("unlimited",
+                     _fetch_concurrently(packages, DownloadScheduler()))
+        _print_rates(
+            "limited to {0:.1f} MB/s".format(namespace.rate / 1024.0 ** 2),
+            _fetch_concurrently(
+                packages,
+                DownloadScheduler(max_bytes_per_second=namespace.rate)
+            )
+        )
+
+        # Eggs are submitted in order, but needed in reverse order
+        priorities = list(reversed(range(len(packages))))
+        scheduler = DownloadScheduler(max_transfers=2,
+                                      max_bytes_per_second=namespace.rate)
+        # Hold every slot until all the transfers are queued
+        holders = [scheduler.transfer(), scheduler.transfer()]
+        for holder in holders:
+            holder.__enter__()
+        done = []
+        thread = threading.Thread(target=lambda: done.extend(
+            _fetch_concurrently(packages, scheduler, priorities)
+        ))
+        thread.start()
+        while len(scheduler._waiting) < len(packages):
+            time.sleep(0.01)
+        for holder in holders:
+            holder.__exit__(None, None, None)
+        thread.join()
+        print("2 transfers, completion order:",
+              " ".join(package.name for package, _, _ in done))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+""" Fetching indices whose ETag did not change (warm ETag hits), against a
+local stand-in server.
+
+- legacy: the previous DBCache layout (sqlite_cache, base64-encoded values,
+  10 entries at most).
+- v2: raw or zlib-compressed BLOBs, with the default capacity.
+
+First, the cache alone: reading then writing back one entry, as done for
+each warm hit, for a cachecontrol entry (whose payload is already
+compressed by cachecontrol) and for a raw index body.
+
+Then the whole fetch: each round fetches every index once, so that with more
+indices than the legacy capacity the legacy cache is thrashed. Reports the
+time of a round, the number of bytes sent by the server and the size of the
+cache database.
+"""
+from __future__ import print_function
+
+import argparse
+import base64
+import json
+import os.path
+import shutil
+import sys
+import tempfile
+import zlib
+
+import mock
+import sqlite_cache
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from egginst._compat import buffer
+
+from enstaller.requests_utils import DBCache
+from enstaller.session import Session
+from enstaller.tests.common import DummyAuthenticator
+
+from common import StandInServer, run, synthetic_index
+
+
+class LegacyDBCache(DBCache):
+    def __init__(self, uri, *a, **kw):
+        self._cache = sqlite_cache.SQLiteCache(uri, 10,
+                                               use_separate_connection=True)
+        self.closed = False
+
+    def _encode_key(self, key):
+        return base64.b64encode(key.encode("utf8")).decode("utf8")
+
+    def get(self, key):
+        value = self._cache.get(self._encode_key(key))
+        if value is not None:
+            return base64.b64decode(bytes(value))
+
+    def set(self, key, value):
+        self._cache.set(self._encode_key(key),
+                        buffer(base64.b64encode(value)))
+
+    def delete(self, key):
+        self._cache.delete(self._encode_key(key))
+
+
+CACHES = (("legacy", LegacyDBCache), ("v2", DBCache))
+
+
+def bench_cache_layer(data):
+    # Roughly what cachecontrol stores for a response with that body
+    entry = b"cc=2," + zlib.compress(json.dumps({"body": data.decode("utf8")})
+                                     .encode("utf8"))
+    for value_label, value in (("cachecontrol entry", entry),
+                               ("raw body", data)):
+        for label, klass in CACHES:
+            tempdir = tempfile.mkdtemp()
+            try:
+                uri = os.path.join(tempdir, "index.db")
+                cache = klass(uri)
+                cache.set("http://acme.com/index.json", value)
+
+                def _hit():
+                    assert cache.get("http://acme.com/index.json") == value
+                    cache.set("http://acme.com/index.json", value)
+
+                run("get + set, {0} ({1})".format(value_label, label), _hit,
+                    repeat=3, number=5)
+                print("    {0:.2f} MB database".format(
+                    os.path.getsize(uri) / 1e6))
+            finally:
+                shutil.rmtree(tempdir)
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser()
+    p.add_argument("-n", "--entries", type=int, default=10000,
+                   help="Number of entries per index")
+    p.add_argument("-i", "--indices", type=int, default=4,
+                   help="Number of indices (repositories)")
+    namespace = p.parse_args(argv)
+
+    paths = ["/repo{0}/index.json".format(i)
+             for i in range(namespace.indices)]
+    routes = dict(
+        (path, json.dumps(synthetic_index(namespace.entries, seed=i))
+         .encode("utf8"))
+        for i, path in enumerate(paths)
+    )
+    print("{0} indices of {1:.1f} MB".format(
+        len(paths), len(routes[paths[0]]) / 1e6))
+
+    bench_cache_layer(routes[paths[0]])
+
+    with StandInServer(routes) as server:
+        def _round(session):
+            with session.etag():
+                for path in paths:
+                    session.fetch(server.url + path).content
+
+        for label, klass in CACHES:
+            cache_directory = tempfile.mkdtemp()
+            try:
+                with mock.patch("enstaller.session.DBCache", klass):
+                    with Session(DummyAuthenticator(),
+                                 cache_directory) as session:
+                        # Warm the cache
+                        _round(session)
+                        server.bytes_sent = 0
+                        run("warm round ({0})".format(label),
+                            lambda: _round(session), repeat=3)
+                db = os.path.join(cache_directory, "index_cache",
+                                  "index.db")
+                print("    {0:.1f} MB sent, {1:.1f} MB database".format(
+                    server.bytes_sent / 3e6, os.path.getsize(db) / 1e6))
+            finally:
+                shutil.rmtree(cache_directory)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+""" Updating a large index which changed on the server, against a local
+stand-in server with ETag support.
+
+- full fetch: the server does not support deltas, the new index is
+  downloaded and parsed.
+- delta: the server answers with a delta against the previous index, which
+  is applied to the stored snapshot.
+"""
+from __future__ import print_function
+
+import argparse
+import json
+import os.path
+import shutil
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from enstaller.cli.utils import repository_factory
+from enstaller.index_delta import compute_index_delta
+from enstaller.repository_info import OldstyleRepositoryInfo
+from enstaller.session import Session
+from enstaller.tests.common import DummyAuthenticator
+
+from common import (StandInServer, copy_index, etag_of, run,
+                    synthetic_index)
+
+PATH = "/repo/index.json"
+
+
+def _next_day(index, n_changes):
+    """ A few eggs added, a few removed."""
+    new_index = copy_index(index)
+    for key in sorted(new_index)[:n_changes]:
+        del new_index[key]
+    for i in range(n_changes):
+        entry = dict(index[sorted(index)[-1]])
+        entry.update(name="newpackage{0}".format(i), version="1.0.0")
+        new_index["newpackage{0}-1.0.0-1.egg".format(i)] = entry
+    return new_index
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser()
+    p.add_argument("-n", "--entries", type=int, default=50000)
+    p.add_argument("-c", "--changes", type=int, default=20)
+    namespace = p.parse_args(argv)
+
+    old_index = synthetic_index(namespace.entries)
+    new_index = _next_day(old_index, namespace.changes)
+    old_data = json.dumps(old_index).encode("utf8")
+    new_data = json.dumps(new_index).encode("utf8")
+    delta = json.dumps(compute_index_delta(old_index, new_index))
+
+    cache_directory = tempfile.mkdtemp()
+    previous_day = tempfile.mkdtemp()
+
+    with StandInServer({PATH: old_data}) as server:
+        repository_info = OldstyleRepositoryInfo(server.url + "/repo/")
+
+        def _factory(use_deltas):
+            with Session(DummyAuthenticator(), cache_directory) as session:
+                return repository_factory(session, [repository_info],
+                                          quiet=True, use_deltas=use_deltas)
+
+        def _update(use_deltas):
+            def _f():
+                # Start from the previous day's caches every time
+                shutil.rmtree(cache_directory)
+                shutil.copytree(previous_day, cache_directory)
+                _factory(use_deltas)
+            return _f
+
+        try:
+            _factory(True)
+            shutil.rmtree(previous_day)
+            shutil.copytree(cache_directory, previous_day)
+
+            server.routes[PATH] = new_data
+            server.deltas[(PATH, etag_of(old_data))] = delta.encode("utf8")
+
+            print("{0} entries, {1} changes, delta {2:.1f} kB".format(
+                len(new_index), 2 * namespace.changes, len(delta) / 1024.))
+            run("full fetch", _update(False))
+            run("delta", _update(True))
+        finally:
+            shutil.rmtree(cache_directory)
+            shutil.rmtree(previous_day)
+
+
+if __name__ == "__main__":
+    main()
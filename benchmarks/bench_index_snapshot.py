@@ -0,0 +1,60 @@
+""" Cold versus warm start of repository_factory against a local stand-in
+server serving a large index with ETag support.
+
+- cold: empty cache, the index is downloaded and parsed.
+- warm (no snapshot): the server answers 304, the cached index is parsed.
+- warm: the server answers 304, the parsed index snapshot is loaded.
+"""
+from __future__ import print_function
+
+import argparse
+import json
+import os.path
+import shutil
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from enstaller.cli.utils import repository_factory
+from enstaller.repository_info import OldstyleRepositoryInfo
+from enstaller.session import Session
+from enstaller.tests.common import DummyAuthenticator
+
+from common import StandInServer, run, synthetic_index
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser()
+    p.add_argument("-n", "--entries", type=int, default=50000)
+    namespace = p.parse_args(argv)
+
+    index = synthetic_index(namespace.entries)
+    data = json.dumps(index).encode("utf8")
+
+    with StandInServer({"/repo/index.json": data}) as server:
+        repository_info = OldstyleRepositoryInfo(server.url + "/repo/")
+        cache_directory = tempfile.mkdtemp()
+        try:
+            def _factory(use_snapshots):
+                with Session(DummyAuthenticator(), cache_directory) as session:
+                    return repository_factory(session, [repository_info],
+                                              quiet=True,
+                                              use_snapshots=use_snapshots)
+
+            def cold():
+                shutil.rmtree(cache_directory)
+                _factory(True)
+
+            print("{0} entries, {1:.1f} MB".format(len(index),
+                                                   len(data) / 1024. ** 2))
+            run("cold", cold)
+            run("warm (no snapshot)", lambda: _factory(False))
+            _factory(True)
+            run("warm", lambda: _factory(True))
+        finally:
+            shutil.rmtree(cache_directory)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+""" Peak memory of fetching and parsing a large index, buffered versus
+streaming.
+
+The index is fetched both from a file:// repository and from a local
+stand-in http server. In streaming mode, http indices bypass the etag cache,
+which would otherwise buffer the whole response body.
+
+Each mode is run in a fresh process, so that peak RSS figures are not
+polluted by one another. The reported increment is the peak RSS minus the
+RSS after imports (unix only).
+"""
+from __future__ import print_function
+
+import argparse
+import json
+import os.path
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from enstaller.cli.utils import repository_factory
+from enstaller.compat import path_to_uri
+from enstaller.repository_info import FSRepositoryInfo, OldstyleRepositoryInfo
+from enstaller.session import Session
+from enstaller.tests.common import DummyAuthenticator
+
+from common import StandInServer, synthetic_index
+
+
+def _max_rss_mb():
+    # On linux, ru_maxrss is inherited from the parent process, so we use
+    # the high water mark of the process' own address space instead.
+    if os.path.exists("/proc/self/status"):
+        with open("/proc/self/status") as fp:
+            for line in fp:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024.
+
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on OS X, in kilobytes on linux
+    if sys.platform == "darwin":
+        return rss / 1024. ** 2
+    else:
+        return rss / 1024.
+
+
+def child(url, mode):
+    if url.startswith("file://"):
+        repository_info = FSRepositoryInfo(url)
+    else:
+        repository_info = OldstyleRepositoryInfo(url)
+    cache_directory = tempfile.mkdtemp()
+    try:
+        with Session(DummyAuthenticator(), cache_directory) as session:
+            before = _max_rss_mb()
+            t0 = time.time()
+            repository = repository_factory(session, [repository_info],
+                                            quiet=True, use_snapshots=False,
+                                            streaming=(mode == "streaming"))
+            # Make sure every package is materialized in both modes
+            n = len(list(repository.iter_packages()))
+            elapsed = time.time() - t0
+            after = _max_rss_mb()
+    finally:
+        shutil.rmtree(cache_directory)
+
+    scheme = url.split(":", 1)[0]
+    template = ("{0:<5} {1:<10} {2:6d} packages {3:8.1f} s  "
+                "peak RSS {4:8.1f} MB (+{5:.1f} MB)")
+    print(template.format(scheme, mode, n, elapsed, after, after - before))
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser()
+    p.add_argument("-n", "--entries", type=int, default=50000)
+    p.add_argument("--child", nargs=2, metavar=("URL", "MODE"),
+                   help=argparse.SUPPRESS)
+    namespace = p.parse_args(argv)
+
+    if namespace.child:
+        child(*namespace.child)
+        return
+
+    index = synthetic_index(namespace.entries)
+    data = json.dumps(index).encode("utf8")
+    del index
+
+    print("{0} entries, {1:.1f} MB".format(namespace.entries,
+                                           len(data) / 1024. ** 2))
+
+    def _run_children(url):
+        for mode in ("buffered", "streaming"):
+            subprocess.check_call([
+                sys.executable, os.path.abspath(__file__),
+                "--child", url, mode,
+            ])
+
+    directory = tempfile.mkdtemp()
+    try:
+        with open(os.path.join(directory, "index.json"), "wb") as fp:
+            fp.write(data)
+        _run_children(path_to_uri(directory) + "/")
+    finally:
+        shutil.rmtree(directory)
+
+    with StandInServer({"/repo/index.json": data}) as server:
+        _run_children(server.url + "/repo/")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+""" Benchmark listing the packages installed in a prefix with many packages,
+with and without the installed packages index.
+
+The prefix is made of synthetic metadata directories (no actual package
+content), with egginst.json files listing a few hundred files each, as for
+real packages.
+"""
+from __future__ import print_function
+
+import argparse
+import json
+import os
+import os.path
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from egginst.installed_index import InstalledIndex
+from egginst.main import get_installed, read_meta
+from enstaller.eggcollect import info_from_metadir
+from enstaller.package import InstalledPackageMetadata
+from enstaller.repository import Repository
+
+from common import run
+
+
+def _populate_prefix(prefix, n_packages, n_files=300):
+    mtime = time.time() - 3600
+    for i in range(n_packages):
+        name = "package{0}".format(i)
+        key = "{0}-1.0.0-1.egg".format(name)
+        meta_dir = os.path.join(prefix, "EGG-INFO", name)
+        os.makedirs(meta_dir)
+
+        info_path = os.path.join(meta_dir, "_info.json")
+        with open(info_path, "w") as fp:
+            json.dump({
+                "key": key, "name": name, "version": "1.0.0", "build": 1,
+                "packages": ["package{0} 1.0.0-1".format(j)
+                             for j in range(max(0, i - 3), i)],
+                "python": "2.7", "type": "egg", "arch": "amd64",
+                "platform": "linux2", "osdist": "RedHat_5",
+                "md5": "a" * 32, "size": 1024, "ctime": "Mon Oct 5 2015",
+            }, fp)
+        egginst_path = os.path.join(meta_dir, "egginst.json")
+        with open(egginst_path, "w") as fp:
+            json.dump({
+                "egg_name": key, "prefix": prefix, "installed_size": 1024,
+                "files": [
+                    os.path.join(prefix, "lib", "python2.7", "site-packages",
+                                 name, "module{0}.py".format(j))
+                    for j in range(n_files)
+                ],
+            }, fp)
+
+        for path in (info_path, egginst_path, meta_dir):
+            os.utime(path, (mtime, mtime))
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser()
+    p.add_argument("-n", "--packages", type=int, default=450)
+    namespace = p.parse_args(argv)
+
+    prefix = tempfile.mkdtemp()
+    try:
+        _populate_prefix(prefix, namespace.packages)
+        egg_info_root = os.path.join(prefix, "EGG-INFO")
+        index = InstalledIndex(prefix)
+        old = time.time() - 3600
+
+        def _cold(f):
+            def _f():
+                if os.path.exists(index.path):
+                    os.unlink(index.path)
+                f()
+            return _f
+
+        def _validated(f):
+            # EGG-INFO modified by something else than egginst: every entry
+            # is checked against the mtimes of its metadata directory.
+            def _f():
+                os.utime(egg_info_root, None)
+                f()
+            return _f
+
+        def _settle():
+            # Nothing added nor removed for a while: the index is used as is.
+            index.entries()
+            os.utime(egg_info_root, (old, old))
+            index.entries()
+
+        def legacy_from_prefixes():
+            # What Repository._from_prefixes used to do: parse the
+            # _info.json of every package.
+            Repository(
+                InstalledPackageMetadata.from_installed_meta_dict(info, prefix)
+                for info in (info_from_metadir(os.path.join(egg_info_root, p))
+                             for p in os.listdir(egg_info_root))
+                if info is not None
+            )
+
+        def legacy_list_egg_names():
+            # What get_installed used to do: parse the egginst.json of every
+            # package.
+            for p in sorted(os.listdir(egg_info_root)):
+                meta = read_meta(os.path.join(egg_info_root, p))
+                if meta is not None:
+                    meta["egg_name"]
+
+        def from_prefixes():
+            Repository._from_prefixes([prefix])
+
+        def list_egg_names():
+            list(get_installed(prefix))
+
+        print("{0} installed packages".format(namespace.packages))
+        for label, legacy, f in (
+                ("Repository._from_prefixes", legacy_from_prefixes,
+                 from_prefixes),
+                ("get_installed", legacy_list_egg_names, list_egg_names)):
+            run("{0}, no index (legacy)".format(label), legacy)
+            run("{0}, cold index".format(label), _cold(f))
+            run("{0}, warm index, validated".format(label), _validated(f))
+            _settle()
+            run("{0}, warm index".format(label), f)
+
+        # The index alone, and what egginst does after installing or
+        # removing a package, compared to rescanning the whole prefix.
+        run("InstalledIndex.entries, validated", _validated(index.entries),
+            repeat=10)
+        _settle()
+        run("InstalledIndex.entries, warm", index.entries, repeat=10)
+        run("InstalledIndex.update (single entry)",
+            lambda: index.update("package{0}".format(namespace.packages // 2)),
+            repeat=10)
+    finally:
+        shutil.rmtree(prefix)
+
+
+if __name__ == "__main__":
+    main()
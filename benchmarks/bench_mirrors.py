@@ -0,0 +1,106 @@
+""" Fetching eggs from a repository available from two mirrors: a slow one
+(high latency, low bandwidth), listed first, and a fast one, both local
+stand-in servers.
+
+- primary only: every egg is fetched from the first mirror (previous
+  behaviour, one url per package).
+- mirrored: each egg is routed to the mirror measured as the fastest so far.
+- mirrored, race: the first bytes of each egg are raced across both mirrors.
+- primary failing: the first mirror drops the connection in the middle of
+  every egg; with mirrors, the eggs are completed from the other one.
+"""
+from __future__ import print_function
+
+import argparse
+import hashlib
+import os
+import os.path
+import shutil
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from egginst.errors import InvalidChecksum
+
+from enstaller.fetch import _DownloadManager
+from enstaller.repository import RemotePackageMetadata, Repository
+from enstaller.repository_info import (MirroredRepositoryInfo,
+                                       OldstyleRepositoryInfo)
+from enstaller.session import Session
+from enstaller.tests.common import DummyAuthenticator
+from enstaller.utils import RUNNING_PYTHON
+from enstaller.versions import EnpkgVersion
+
+from common import StandInServer, run
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser()
+    p.add_argument("-n", "--eggs", type=int, default=8,
+                   help="Number of eggs")
+    p.add_argument("-s", "--size", type=int, default=1024 * 1024,
+                   help="Size of each egg (bytes)")
+    p.add_argument("-l", "--latency", type=float, default=0.2,
+                   help="Latency of the slow mirror (seconds)")
+    p.add_argument("-b", "--bandwidth", type=int, default=4 * 1024 * 1024,
+                   help="Bandwidth of the slow mirror (bytes/s)")
+    namespace = p.parse_args(argv)
+
+    eggs = {}
+    for i in range(namespace.eggs):
+        eggs["egg{0}-1.0.0-1.egg".format(i)] = os.urandom(namespace.size)
+    routes = dict(("/eggs/" + key, data) for key, data in eggs.items())
+
+    slow = StandInServer(routes, namespace.latency,
+                         bandwidth=namespace.bandwidth)
+    fast = StandInServer(routes, namespace.latency / 10)
+    with slow, fast:
+        slow_info = OldstyleRepositoryInfo(slow.url + "/eggs/")
+        fast_info = OldstyleRepositoryInfo(fast.url + "/eggs/")
+
+        def _fetch_all(repository_info, drop=False):
+            def _f():
+                packages = [
+                    RemotePackageMetadata(
+                        key, key.split("-")[0],
+                        EnpkgVersion.from_string("1.0.0-1"), [],
+                        RUNNING_PYTHON, len(data),
+                        hashlib.md5(data).hexdigest(), 0.0, "commercial",
+                        True, repository_info
+                    ) for key, data in sorted(eggs.items())
+                ]
+                if drop:
+                    slow.drops.update(
+                        ("/eggs/" + key, namespace.size // 2) for key in eggs
+                    )
+                cache_directory = tempfile.mkdtemp()
+                try:
+                    with Session(DummyAuthenticator(),
+                                 cache_directory) as session:
+                        downloader = _DownloadManager(session,
+                                                      Repository(packages))
+                        for package in packages:
+                            try:
+                                downloader.fetch(package)
+                            except InvalidChecksum:
+                                # Truncated eggs are resumed
+                                downloader.fetch(package)
+                finally:
+                    slow.drops.clear()
+                    shutil.rmtree(cache_directory)
+            return _f
+
+        mirrored = MirroredRepositoryInfo([slow_info, fast_info])
+        raced = MirroredRepositoryInfo([slow_info, fast_info], race=True)
+
+        run("primary only", _fetch_all(slow_info), repeat=1)
+        run("mirrored", _fetch_all(mirrored), repeat=1)
+        run("mirrored, race", _fetch_all(raced), repeat=1)
+        run("primary failing", _fetch_all(slow_info, True), repeat=1)
+        run("primary failing, mirrored", _fetch_all(mirrored, True),
+            repeat=1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+""" Report the memory cost of a fully loaded Repository, in bytes per
+package.
+
+The size is computed by walking every object reachable from the repository
+(shared objects such as interned strings are only counted once). When
+tracemalloc is available (python >= 3.4), the allocated size while building
+the repository is reported as well.
+"""
+from __future__ import print_function
+
+import argparse
+import gc
+import os.path
+import sys
+import types
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from enstaller.repository import Repository, parse_index
+from enstaller.repository_info import FSRepositoryInfo
+
+from common import copy_index, synthetic_index
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+
+_SKIPPED_TYPES = (type, types.ModuleType, types.FunctionType)
+
+
+def deep_getsizeof(root):
+    seen = set()
+    total = 0
+    to_visit = [root]
+    while to_visit:
+        obj = to_visit.pop()
+        if id(obj) in seen or isinstance(obj, _SKIPPED_TYPES):
+            continue
+        seen.add(id(obj))
+        total += sys.getsizeof(obj)
+        to_visit.extend(gc.get_referents(obj))
+    return total
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser()
+    p.add_argument("-n", "--entries", type=int, default=50000)
+    p.add_argument("--indices", type=int, default=3,
+                   help="Number of (identical) indices to load.")
+    namespace = p.parse_args(argv)
+
+    index = synthetic_index(namespace.entries)
+    repository_infos = [
+        FSRepositoryInfo("file:///acme/{0}".format(i))
+        for i in range(namespace.indices)
+    ]
+
+    if tracemalloc is not None:
+        tracemalloc.start()
+
+    repository = Repository()
+    for repository_info in repository_infos:
+        repository.update(
+            Repository(parse_index(copy_index(index), repository_info))
+        )
+
+    if tracemalloc is not None:
+        current, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    n = len(repository)
+    print("{0} packages".format(n))
+    print("reachable size: {0:.1f} bytes / package".format(
+        deep_getsizeof(repository) / float(n)))
+    if tracemalloc is not None:
+        print("traced allocations: {0:.1f} bytes / package".format(
+            current / float(n)))
+
+
+if __name__ == "__main__":
+    main()
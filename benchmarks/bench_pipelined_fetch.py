@@ -0,0 +1,98 @@
+""" Benchmark executing fetch + install actions for a set of eggs served by
+a local stand-in server with latency.
+
+- serial: each egg is fetched, then installed, one after the other
+  (max_concurrent_fetches=1).
+- pipelined: eggs are fetched concurrently, each install starting as soon as
+  its egg is downloaded.
+
+Installs are replaced by a stand-in sleeping for a fixed time, so that only
+the scheduling of the actions is measured.
+"""
+from __future__ import print_function
+
+import argparse
+import hashlib
+import os
+import os.path
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import mock
+
+from enstaller.enpkg import Enpkg
+from enstaller.repository import RemotePackageMetadata, Repository
+from enstaller.repository_info import OldstyleRepositoryInfo
+from enstaller.session import Session
+from enstaller.tests.common import DummyAuthenticator
+from enstaller.utils import RUNNING_PYTHON
+from enstaller.versions import EnpkgVersion
+
+from common import StandInServer, run
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser()
+    p.add_argument("-n", "--eggs", type=int, default=16)
+    p.add_argument("-s", "--size", type=int, default=1024 * 1024,
+                   help="Size of each egg (bytes)")
+    p.add_argument("-l", "--latency", type=float, default=0.1,
+                   help="Server latency (seconds)")
+    p.add_argument("-i", "--install-time", type=float, default=0.05,
+                   help="Time taken by the install stand-in (seconds)")
+    p.add_argument("-j", "--max-concurrent-fetches", type=int, default=4)
+    namespace = p.parse_args(argv)
+
+    routes = {}
+    eggs = []
+    with StandInServer(routes, latency=namespace.latency) as server:
+        repository_info = OldstyleRepositoryInfo(server.url + "/eggs/")
+        remote_repository = Repository()
+        for i in range(namespace.eggs):
+            data = os.urandom(namespace.size)
+            name = "package{0}".format(i)
+            egg = RemotePackageMetadata(
+                "{0}-1.0.0-1.egg".format(name), name,
+                EnpkgVersion.from_string("1.0.0-1"), [], RUNNING_PYTHON, len(data),
+                hashlib.md5(data).hexdigest(), 0.0, "commercial", True,
+                repository_info
+            )
+            routes["/eggs/" + egg.key] = data
+            remote_repository.add_package(egg)
+            eggs.append(egg)
+
+        actions = [("fetch_0", package) for package in eggs]
+        actions.extend(("install", package) for package in eggs)
+
+        def _install_stand_in():
+            time.sleep(namespace.install_time)
+
+        def _execute(max_concurrent_fetches):
+            prefix = tempfile.mkdtemp()
+            cache_directory = tempfile.mkdtemp()
+            try:
+                session = Session(DummyAuthenticator(), cache_directory)
+                enpkg = Enpkg(remote_repository, session, [prefix],
+                              max_concurrent_fetches=max_concurrent_fetches)
+                with mock.patch("enstaller.enpkg.InstallAction.execute",
+                                side_effect=_install_stand_in):
+                    enpkg.execute(actions)
+                assert len(os.listdir(cache_directory)) >= len(eggs)
+            finally:
+                shutil.rmtree(prefix)
+                shutil.rmtree(cache_directory)
+
+        print("{0} eggs of {1} kB, {2:.0f} ms latency".format(
+            namespace.eggs, namespace.size // 1024, namespace.latency * 1e3))
+        run("serial", lambda: _execute(1))
+        run("pipelined ({0} fetches)".format(
+            namespace.max_concurrent_fetches),
+            lambda: _execute(namespace.max_concurrent_fetches))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+""" Filling an empty download cache with the eggs of a set of requirements,
+from a local stand-in server with latency and limited bandwidth per
+connection.
+
+- sequential: each egg is fetched in turn (what installing the requirements
+  one at a time does).
+- prefetch: every egg is fetched by enstaller.prefetch, with the given
+  number of concurrent downloads.
+"""
+from __future__ import print_function
+
+import argparse
+import hashlib
+import os
+import os.path
+import shutil
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from enstaller.fetch import _DownloadManager
+from enstaller.prefetch import prefetch, resolve_requirements
+from enstaller.repository import RemotePackageMetadata, Repository
+from enstaller.repository_info import OldstyleRepositoryInfo
+from enstaller.session import Session
+from enstaller.tests.common import DummyAuthenticator
+from enstaller.utils import RUNNING_PYTHON
+from enstaller.versions import EnpkgVersion
+
+from common import StandInServer, run
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser()
+    p.add_argument("-n", "--eggs", type=int, default=16,
+                   help="Number of eggs")
+    p.add_argument("-s", "--size", type=int, default=512 * 1024,
+                   help="Size of each egg (bytes)")
+    p.add_argument("-l", "--latency", type=float, default=0.1,
+                   help="Latency of the server (seconds)")
+    p.add_argument("-b", "--bandwidth", type=int, default=4 * 1024 * 1024,
+                   help="Bandwidth of the server, per connection (bytes/s)")
+    namespace = p.parse_args(argv)
+
+    eggs = {}
+    for i in range(namespace.eggs):
+        eggs["egg{0}-1.0.0-1.egg".format(i)] = os.urandom(namespace.size)
+    routes = dict(("/eggs/" + key, data) for key, data in eggs.items())
+
+    with StandInServer(routes, namespace.latency,
+                       bandwidth=namespace.bandwidth) as server:
+        repository_info = OldstyleRepositoryInfo(server.url + "/eggs/")
+        # Each egg depends on the previous one
+        packages = []
+        for i, (key, data) in enumerate(sorted(eggs.items())):
+            dependencies = []
+            if i > 0:
+                dependencies.append("{0} 1.0.0-1".format(packages[-1].name))
+            packages.append(RemotePackageMetadata(
+                key, key.split("-")[0], EnpkgVersion.from_string("1.0.0-1"),
+                dependencies, RUNNING_PYTHON, len(data),
+                hashlib.md5(data).hexdigest(), 0.0, "commercial", True,
+                repository_info
+            ))
+        repository = Repository(packages)
+        requirements = [packages[-1].name]
+
+        def _fill_cache(max_workers=None):
+            def _f():
+                cache_directory = tempfile.mkdtemp()
+                try:
+                    with Session(DummyAuthenticator(),
+                                 cache_directory) as session:
+                        downloader = _DownloadManager(session, repository)
+                        to_fetch = resolve_requirements(repository,
+                                                        requirements)
+                        assert len(to_fetch) == len(packages)
+                        if max_workers is None:
+                            for package in to_fetch:
+                                downloader.fetch(package)
+                        else:
+                            stats = prefetch(downloader, to_fetch,
+                                             max_workers)
+                            assert stats.fetched == len(packages)
+                finally:
+                    shutil.rmtree(cache_directory)
+            return _f
+
+        run("sequential", _fill_cache(), repeat=1)
+        for max_workers in (4, 8):
+            run("prefetch, {0} downloads".format(max_workers),
+                _fill_cache(max_workers), repeat=1)
+
+
+if __name__ == "__main__":
+    main()
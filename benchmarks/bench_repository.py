@@ -0,0 +1,71 @@
+""" Benchmark Repository construction from a large synthetic index.
+
+Compares the historical add_package (append + full re-sort on each insert)
+with bisect insertion and bulk construction through Repository.extend.
+"""
+from __future__ import print_function
+
+import argparse
+import operator
+import os.path
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from enstaller.repository import Repository, parse_index
+from enstaller.repository_info import FSRepositoryInfo
+
+from common import copy_index, run, synthetic_index
+
+
+def _legacy_add_package(repository, package):
+    repository._name_to_packages[package.name].append(package)
+    repository._name_to_packages[package.name].sort(
+        key=operator.attrgetter("version")
+    )
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser()
+    p.add_argument("-n", "--entries", type=int, default=50000)
+    namespace = p.parse_args(argv)
+
+    index = synthetic_index(namespace.entries)
+    repository_info = FSRepositoryInfo("file:///acme")
+    packages = list(parse_index(copy_index(index), repository_info))
+
+    print("{0} packages, {1} names".format(
+        len(packages), len(set(p.name for p in packages))))
+
+    def legacy():
+        repository = Repository()
+        for package in packages:
+            _legacy_add_package(repository, package)
+
+    def bisect_add_package():
+        repository = Repository()
+        for package in packages:
+            repository.add_package(package)
+
+    def bulk():
+        Repository(packages)
+
+    def merge():
+        repository = Repository(packages[::2])
+        repository.update(Repository(packages[1::2]))
+
+    def from_index(lazy):
+        repository = Repository.from_index(copy_index(index),
+                                           repository_info, lazy=lazy)
+        repository.find_packages(packages[0].name)
+
+    run("from_index + 1 lookup, eager", lambda: from_index(False))
+    run("from_index + 1 lookup, lazy", lambda: from_index(True))
+    run("add_package, append + sort (legacy)", legacy, repeat=1)
+    run("add_package, bisect insertion", bisect_add_package)
+    run("Repository(packages) (bulk extend)", bulk)
+    run("Repository.update", merge)
+
+
+if __name__ == "__main__":
+    main()
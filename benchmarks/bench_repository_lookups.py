@@ -0,0 +1,104 @@
+""" Microbenchmarks of Repository version lookups, for names with 1, 100 and
+1000 builds.
+
+Compares the historical linear scans with the bisect-based lookups.
+"""
+from __future__ import print_function
+
+import argparse
+import operator
+import os.path
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from enstaller.errors import NoSuchPackage
+from enstaller.repository import Repository
+from enstaller.solver import Requirement
+from enstaller.tests.common import dummy_repository_package_factory
+from enstaller.versions import EnpkgVersion
+
+from common import run
+
+
+def _legacy_find_package(repository, name, version):
+    version = EnpkgVersion.from_string(version)
+    for candidate in repository._packages(name):
+        if candidate.version == version:
+            return candidate
+    raise NoSuchPackage()
+
+
+def _legacy_has_package(repository, package_metadata):
+    for candidate in repository._packages(package_metadata.name):
+        if candidate.full_version == package_metadata.full_version:
+            return True
+    return False
+
+
+def _legacy_find_packages(repository, name, version):
+    return [package for package in repository._packages(name)
+            if package.full_version == version]
+
+
+def _legacy_find_package_from_requirement(repository, requirement):
+    candidates = [
+        candidate for candidate in repository.find_packages(requirement.name)
+        if requirement.matches(candidate.version)
+    ]
+    candidates.sort(key=operator.attrgetter("version"))
+    return candidates[-1]
+
+
+def _repository(n_builds):
+    packages = [
+        dummy_repository_package_factory("numpy", "1.{0}.0".format(i), 1)
+        for i in range(n_builds)
+    ]
+    return Repository(packages), packages
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser()
+    p.add_argument("--number", type=int, default=2000,
+                   help="Number of lookups per timing.")
+    namespace = p.parse_args(argv)
+    number = namespace.number
+
+    for n_builds in (1, 100, 1000):
+        repository, packages = _repository(n_builds)
+        # A version in the middle of the list, as a worst-case for neither
+        # implementation.
+        package = packages[n_builds // 2]
+        version = package.full_version
+        requirement = Requirement.from_legacy_requirement_string("numpy")
+        pinned = Requirement.from_legacy_requirement_string(
+            "numpy {0}".format(packages[0].version.upstream)
+        )
+
+        print("\n{0} build(s)".format(n_builds))
+        for label, legacy, new in (
+            ("find_package",
+             lambda: _legacy_find_package(repository, "numpy", version),
+             lambda: repository.find_package("numpy", version)),
+            ("has_package",
+             lambda: _legacy_has_package(repository, package),
+             lambda: repository.has_package(package)),
+            ("find_packages(name, version)",
+             lambda: _legacy_find_packages(repository, "numpy", version),
+             lambda: repository.find_packages("numpy", version)),
+            ("find_package_from_requirement (latest)",
+             lambda: _legacy_find_package_from_requirement(repository,
+                                                           requirement),
+             lambda: repository.find_package_from_requirement(requirement)),
+            ("find_package_from_requirement (oldest)",
+             lambda: _legacy_find_package_from_requirement(repository,
+                                                           pinned),
+             lambda: repository.find_package_from_requirement(pinned)),
+        ):
+            run("  {0}, linear".format(label), legacy, number=number)
+            run("  {0}, bisect".format(label), new, number=number)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+""" Benchmark combining per-index repositories into the full repository, as
+repository_factory does, for a few indices sharing most of their names (e.g.
+the same packages built for several platforms or channels).
+
+Compares the historical per-repository update (extend + sort of each
+per-name list) with the k-way merge of Repository.merge.
+"""
+from __future__ import print_function
+
+import argparse
+import os.path
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from enstaller.repository import Repository
+from enstaller.repository_info import FSRepositoryInfo
+
+from common import copy_index, run, synthetic_index
+
+
+def _legacy_update(full_repository, repository):
+    for packages in repository._name_to_packages.values():
+        full_repository.extend(packages)
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser()
+    p.add_argument("-n", "--entries", type=int, default=50000,
+                   help="Number of entries per index")
+    p.add_argument("-k", "--indices", type=int, default=4)
+    namespace = p.parse_args(argv)
+
+    repositories = []
+    for i in range(namespace.indices):
+        index = synthetic_index(namespace.entries, seed=i % 2)
+        repository_info = FSRepositoryInfo("file:///index{0}".format(i))
+        repositories.append(Repository.from_index(copy_index(index),
+                                                  repository_info))
+
+    def legacy():
+        full_repository = Repository()
+        for repository in repositories:
+            _legacy_update(full_repository, repository)
+        return full_repository
+
+    def merge():
+        return Repository.merge(repositories)
+
+    assert list(legacy()) == list(merge())
+
+    print("{0} indices of {1} entries".format(namespace.indices,
+                                              namespace.entries))
+    run("sequential update", legacy)
+    run("k-way merge", merge)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+""" Benchmark fetching a large egg whose download is interrupted, from a
+local stand-in server dropping the connection after most of the egg was
+sent.
+
+- restart: the partial download is discarded, and the retry starts from
+  byte zero (previous behaviour, emulated by removing the .part file).
+- resume: the retry resumes the .part file with a range request.
+
+Reports the time and the number of bytes sent by the server.
+"""
+from __future__ import print_function
+
+import argparse
+import hashlib
+import os
+import os.path
+import shutil
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from egginst.utils import PART_SUFFIX
+
+from enstaller.enpkg import FetchAction
+from enstaller.fetch import _DownloadManager
+from enstaller.repository import RemotePackageMetadata, Repository
+from enstaller.repository_info import OldstyleRepositoryInfo
+from enstaller.session import Session
+from enstaller.tests.common import DummyAuthenticator
+from enstaller.utils import RUNNING_PYTHON
+from enstaller.versions import EnpkgVersion
+
+from common import StandInServer, run
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser()
+    p.add_argument("-s", "--size", type=int, default=64 * 1024 * 1024,
+                   help="Size of the egg (bytes)")
+    p.add_argument("-d", "--drop-at", type=float, default=0.9,
+                   help="Fraction of the egg sent before dropping")
+    namespace = p.parse_args(argv)
+
+    data = os.urandom(namespace.size)
+    routes = {}
+    with StandInServer(routes) as server:
+        repository_info = OldstyleRepositoryInfo(server.url + "/eggs/")
+        package = RemotePackageMetadata(
+            "mkl-1.0.0-1.egg", "mkl", EnpkgVersion.from_string("1.0.0-1"),
+            [], RUNNING_PYTHON, len(data), hashlib.md5(data).hexdigest(),
+            0.0, "commercial", True, repository_info
+        )
+        routes["/eggs/" + package.key] = data
+        repository = Repository([package])
+
+        def _fetch(resume):
+            cache_directory = tempfile.mkdtemp()
+            try:
+                session = Session(DummyAuthenticator(), cache_directory)
+                downloader = _DownloadManager(session, repository)
+                server.drops["/eggs/" + package.key] = \
+                    int(len(data) * namespace.drop_at)
+                part = os.path.join(cache_directory,
+                                    package.key + PART_SUFFIX)
+                try:
+                    FetchAction(package, downloader, repository,
+                                max_retries=0).execute()
+                except Exception:
+                    pass
+                if not resume and os.path.exists(part):
+                    os.unlink(part)
+                FetchAction(package, downloader, repository,
+                            max_retries=0).execute()
+                assert os.path.exists(os.path.join(cache_directory,
+                                                   package.key))
+            finally:
+                shutil.rmtree(cache_directory)
+
+        for label, resume in (("restart", False), ("resume", True)):
+            server.bytes_sent = 0
+            run(label, lambda: _fetch(resume), repeat=1)
+            print("    {0:.1f} MB sent".format(server.bytes_sent / 1e6))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+""" Benchmark looking up the package names matching a search pattern, as
+enpkg --search does, on a large lazy repository.
+
+- legacy: create every package to collect the names, and match the pattern
+  against each name (what enpkg --search used to do).
+- scan: match the pattern against the names only.
+- index: query a prebuilt name index (for repeated, interactive searches).
+"""
+from __future__ import print_function
+
+import argparse
+import os.path
+import re
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from enstaller.repository import Repository
+from enstaller.repository_info import FSRepositoryInfo
+
+from common import copy_index, run, synthetic_index
+
+
+def _lazy_repository(index):
+    return Repository.from_index(copy_index(index),
+                                 FSRepositoryInfo("file:///repo"), lazy=True)
+
+
+def _legacy_search(repository, pat):
+    names = set(package.name for package in repository.iter_packages())
+    return sorted((name for name in names if pat.search(name)),
+                  key=lambda s: s.lower())
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser()
+    p.add_argument("-n", "--entries", type=int, default=50000)
+    namespace = p.parse_args(argv)
+
+    index = synthetic_index(namespace.entries)
+    print("{0} entries, {1} names".format(
+        len(index), len(_lazy_repository(index)._name_to_packages)))
+
+    indexed = _lazy_repository(index)
+    run("build name index", indexed.build_name_index)
+
+    for pattern in ("package12", "^package99", r"package\d+7$"):
+        pat = re.compile(pattern, re.I)
+        assert (_legacy_search(_lazy_repository(index), pat)
+                == indexed.search_names(pat))
+
+        def legacy():
+            _legacy_search(_lazy_repository(index), pat)
+
+        def scan():
+            _lazy_repository(index).search_names(pat)
+
+        run("{0!r}, legacy".format(pattern), legacy)
+        run("{0!r}, scan".format(pattern), scan)
+        run("{0!r}, index".format(pattern),
+            lambda: indexed.search_names(pat), number=100)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+""" Benchmark several runtimes fetching the same eggs at the same time, from
+a local stand-in server with some latency.
+
+- private: each runtime downloads the eggs into its own cache (previous
+  behaviour).
+- shared: the caches share an egg store, so each egg is downloaded once and
+  hard linked into every cache.
+
+Reports the time, the number of bytes sent by the server and the disk space
+used by the caches.
+"""
+from __future__ import print_function
+
+import argparse
+import hashlib
+import os
+import os.path
+import shutil
+import sys
+import tempfile
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from enstaller.egg_store import SharedEggStore
+from enstaller.fetch import _DownloadManager
+from enstaller.repository import RemotePackageMetadata, Repository
+from enstaller.repository_info import OldstyleRepositoryInfo
+from enstaller.session import Session
+from enstaller.tests.common import DummyAuthenticator
+from enstaller.utils import RUNNING_PYTHON
+from enstaller.versions import EnpkgVersion
+
+from common import StandInServer, run
+
+
+def _disk_usage(directory):
+    inodes = {}
+    for root, dirs, files in os.walk(directory):
+        for filename in files:
+            st = os.stat(os.path.join(root, filename))
+            inodes[st.st_ino] = st.st_size
+    return sum(inodes.values())
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser()
+    p.add_argument("-r", "--runtimes", type=int, default=4,
+                   help="Number of runtimes fetching the eggs")
+    p.add_argument("-n", "--eggs", type=int, default=8,
+                   help="Number of eggs")
+    p.add_argument("-s", "--size", type=int, default=4 * 1024 * 1024,
+                   help="Size of each egg (bytes)")
+    p.add_argument("-l", "--latency", type=float, default=0.05,
+                   help="Latency of the stand-in server (seconds)")
+    namespace = p.parse_args(argv)
+
+    routes = {}
+    with StandInServer(routes, namespace.latency) as server:
+        repository_info = OldstyleRepositoryInfo(server.url + "/eggs/")
+        packages = []
+        for i in range(namespace.eggs):
+            data = os.urandom(namespace.size)
+            name = "egg{0}".format(i)
+            package = RemotePackageMetadata(
+                "{0}-1.0.0-1.egg".format(name), name,
+                EnpkgVersion.from_string("1.0.0-1"), [], RUNNING_PYTHON,
+                len(data), hashlib.md5(data).hexdigest(), 0.0, "commercial",
+                True, repository_info
+            )
+            routes["/eggs/" + package.key] = data
+            packages.append(package)
+        repository = Repository(packages)
+
+        usage = {}
+
+        def _fetch_all(shared):
+            tempdir = tempfile.mkdtemp()
+            try:
+                if shared:
+                    egg_store = SharedEggStore(os.path.join(tempdir, "store"))
+                else:
+                    egg_store = None
+
+                def _runtime(i):
+                    cache_directory = os.path.join(tempdir, str(i))
+                    session = Session(DummyAuthenticator(), cache_directory)
+                    downloader = _DownloadManager(session, repository,
+                                                  egg_store=egg_store)
+                    for package in packages:
+                        downloader.fetch(package)
+
+                threads = [threading.Thread(target=_runtime, args=(i,))
+                           for i in range(namespace.runtimes)]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+                usage[shared] = _disk_usage(tempdir)
+            finally:
+                shutil.rmtree(tempdir)
+
+        for label, shared in (("private", False), ("shared", True)):
+            server.bytes_sent = 0
+            run(label, lambda: _fetch_all(shared), repeat=1)
+            print("    {0:.1f} MB sent, {1:.1f} MB on disk".format(
+                server.bytes_sent / 1e6, usage[shared] / 1e6))
+
+
+if __name__ == "__main__":
+    main()
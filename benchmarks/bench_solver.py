@@ -0,0 +1,98 @@
+""" Benchmark the legacy solver on a deep dependency tree, similar to a full
+EPD upgrade: a top-level package depending on every package of the
+repository, each of them depending on a few others.
+
+Compares package metadata with a cached hash and comparison key against
+the historical implementation, which rebuilt the comparison key on every
+__hash__/__eq__ call.
+"""
+from __future__ import print_function
+
+import argparse
+import contextlib
+import os.path
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from enstaller.package import PackageMetadata
+from enstaller.repository import Repository
+from enstaller.solver import Request, Requirement, Solver
+from enstaller.tests.common import dummy_repository_package_factory
+
+from common import run
+
+
+def _legacy_eq(self, other):
+    if not isinstance(other, self.__class__):
+        return False
+    else:
+        return self._make_comp_key() == other._make_comp_key()
+
+
+def _legacy_hash(self):
+    return hash(self._make_comp_key())
+
+
+@contextlib.contextmanager
+def legacy_comparisons():
+    eq, h = PackageMetadata.__eq__, PackageMetadata.__hash__
+    PackageMetadata.__eq__, PackageMetadata.__hash__ = _legacy_eq, _legacy_hash
+    try:
+        yield
+    finally:
+        PackageMetadata.__eq__, PackageMetadata.__hash__ = eq, h
+
+
+def epd_like_repository(n_names, n_versions=5, max_dependencies=6, seed=0):
+    rng = random.Random(seed)
+
+    packages = []
+    latest = []
+    for i in range(n_names):
+        name = "package{0}".format(i)
+        # Depend on packages defined earlier, so that the graph is acyclic
+        # but deep.
+        candidates = latest[max(0, i - 50):]
+        dependencies = rng.sample(candidates,
+                                  min(len(candidates),
+                                      rng.randint(0, max_dependencies)))
+        for j in range(n_versions):
+            packages.append(dummy_repository_package_factory(
+                name, "1.{0}.0".format(j), 1, dependencies=dependencies,
+            ))
+        latest.append("{0} 1.{1}.0-1".format(name, n_versions - 1))
+
+    packages.append(dummy_repository_package_factory(
+        "epd", "7.3", 1, dependencies=latest
+    ))
+    return Repository(packages)
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser()
+    p.add_argument("-n", "--names", type=int, default=400)
+    namespace = p.parse_args(argv)
+
+    remote_repository = epd_like_repository(namespace.names)
+    installed_repository = Repository()
+
+    def resolve():
+        request = Request()
+        request.install(Requirement.from_legacy_requirement_string("epd"))
+        solver = Solver(remote_repository, installed_repository)
+        return solver.resolve(request)
+
+    # Warm the requirement cache, so that both runs measure the same thing
+    n = len(resolve())
+    print("{0} packages in repository, {1} operations".format(
+        len(remote_repository), n))
+
+    with legacy_comparisons():
+        run("full EPD upgrade, hash/eq rebuilding the key", resolve)
+    run("full EPD upgrade, cached hash and key", resolve)
+
+
+if __name__ == "__main__":
+    main()
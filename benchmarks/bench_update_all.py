@@ -0,0 +1,82 @@
+""" Benchmark planning enpkg --update-all for a prefix where every installed
+package is outdated, on an EPD-like repository (see bench_solver).
+
+- legacy: one request (and one solver run, and one execution) per outdated
+  package.
+- combined: a single request for every outdated package.
+
+Reports the planning time and the number of install/remove actions.
+"""
+from __future__ import print_function
+
+import argparse
+import os.path
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from enstaller.cli.utils import updates_check
+from enstaller.repository import Repository
+from enstaller.solver import Request, Requirement, Solver
+from enstaller.tests.common import dummy_installed_package_factory
+
+from bench_solver import epd_like_repository
+from common import run
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser()
+    p.add_argument("-n", "--names", type=int, default=200)
+    namespace = p.parse_args(argv)
+
+    remote_repository = epd_like_repository(namespace.names)
+
+    def _installed_repository():
+        return Repository(
+            dummy_installed_package_factory("package{0}".format(i), "1.0.0",
+                                            1)
+            for i in range(namespace.names)
+        )
+
+    def _names(installed_repository):
+        updates, _ = updates_check(remote_repository, installed_repository)
+        return [update["current"].name for update in updates]
+
+    def _resolve(names, installed_repository):
+        request = Request()
+        for name in names:
+            request.install(Requirement.from_legacy_requirement_string(name))
+        solver = Solver(remote_repository, installed_repository)
+        return solver.resolve(request)
+
+    def _execute(actions, installed_repository):
+        # Stand-in for Enpkg.execute: only update the installed repository
+        for opcode, package in actions:
+            if opcode == "remove":
+                installed_repository.delete_package(package)
+            else:
+                installed_repository.add_package(package)
+
+    def legacy():
+        installed_repository = _installed_repository()
+        actions = []
+        for name in _names(installed_repository):
+            name_actions = _resolve([name], installed_repository)
+            _execute(name_actions, installed_repository)
+            actions.extend(name_actions)
+        return actions
+
+    def combined():
+        installed_repository = _installed_repository()
+        return _resolve(_names(installed_repository), installed_repository)
+
+    print("{0} outdated packages".format(
+        len(_names(_installed_repository()))))
+    print("actions: legacy {0}, combined {1}".format(len(legacy()),
+                                                     len(combined())))
+    run("legacy (one request per package)", legacy)
+    run("combined (single request)", combined)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+""" Helpers shared by the benchmark scripts.
+
+Those are not part of the test suite: run them directly, e.g.::
+
+    python benchmarks/bench_repository.py
+"""
+from __future__ import print_function
+
+import hashlib
+import random
+import socket
+import threading
+import time
+import timeit
+
+from egginst._compat import PY2
+
+from enstaller.utils import PY_VER
+
+if PY2:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+else:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+
+
+def synthetic_index(n_entries=50000, max_builds=800, seed=0):
+    """ Create a legacy json index with n_entries entries.
+
+    The number of builds per name follows a Pareto distribution, so that most
+    names have a handful of builds, and a few have hundreds, as in our
+    mirrored PyPI index.
+    """
+    rng = random.Random(seed)
+
+    index = {}
+    names = []
+    while len(index) < n_entries:
+        name = "package{0}".format(len(names))
+        names.append(name)
+        n_builds = min(int(rng.paretovariate(0.8)), max_builds)
+        for _ in range(n_builds):
+            version = "{0}.{1}.{2}".format(rng.randint(0, 3),
+                                           rng.randint(0, 40),
+                                           rng.randint(0, 9))
+            build = rng.randint(1, 5)
+            key = "{0}-{1}-{2}.egg".format(name, version, build)
+            dependencies = [
+                "{0} 1.0.0-1".format(names[rng.randint(0, len(names) - 1)])
+                for _ in range(rng.randint(0, 3))
+            ]
+            index[key] = {
+                "available": True,
+                "build": build,
+                "md5": "a" * 32,
+                "mtime": 1409944509.0,
+                "name": name,
+                "packages": dependencies,
+                "product": "free",
+                "python": PY_VER,
+                "size": 1024,
+                "type": "egg",
+                "version": version,
+            }
+            if len(index) >= n_entries:
+                break
+    return index
+
+
+def copy_index(index):
+    """ parse_index modifies the index entries in place."""
+    return dict((key, dict(value)) for key, value in index.items())
+
+
+def run(label, f, repeat=3, number=1):
+    timings = timeit.repeat(f, repeat=repeat, number=number)
+    best = min(timings) / number
+    print("{0:<50} {1:10.2f} ms".format(label, best * 1e3))
+    return best
+
+
+def etag_of(data):
+    """ The ETag the stand-in server sends for the given content."""
+    return '"{0}"'.format(hashlib.md5(data).hexdigest())
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class StandInServer(object):
+    """ A local stand-in HTTP server, serving in-memory content with ETag
+    support.
+
+    Parameters
+    ----------
+    routes : dict
+        path -> bytes mapping.
+    latency : float
+        Artificial latency (in seconds) added before each response.
+    deltas : dict
+        (path, base etag) -> bytes mapping of index deltas, served as 226
+        responses to requests asking for them (see enstaller.index_delta).
+    drops : dict
+        path -> number of bytes. The connection of the next response for
+        this path is dropped after sending that many bytes (once).
+    keep_alive : bool
+        If True, connections are kept open between requests (HTTP/1.1).
+    connect_latency : float
+        Artificial latency (in seconds) added when accepting a connection,
+        e.g. to emulate TCP and TLS handshakes.
+    bandwidth : int
+        If given, response bodies are sent at (at most) that many bytes per
+        second.
+
+    Open-ended range requests are supported, and the number of bytes sent
+    and of connections accepted are available as bytes_sent and
+    connections.
+    """
+    def __init__(self, routes, latency=0.0, deltas=None, drops=None,
+                 keep_alive=False, connect_latency=0.0, bandwidth=None):
+        self.routes = routes
+        self.latency = latency
+        self.deltas = deltas or {}
+        self.drops = dict(drops or {})
+        self.connect_latency = connect_latency
+        self.bandwidth = bandwidth
+        self.bytes_sent = 0
+        self.connections = 0
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            if keep_alive:
+                protocol_version = "HTTP/1.1"
+
+            def log_message(self, *a, **kw):
+                pass
+
+            def setup(self):
+                BaseHTTPRequestHandler.setup(self)
+                server.connections += 1
+                if server.connect_latency:
+                    time.sleep(server.connect_latency)
+
+            def do_GET(self):
+                if server.latency:
+                    time.sleep(server.latency)
+                path = self.path.split("?", 1)[0]
+                data = server.routes.get(path)
+                if data is None:
+                    self.send_response(404)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                etag = etag_of(data)
+                base_etag = self.headers.get("If-None-Match")
+                delta = server.deltas.get((path, base_etag))
+                if delta is not None and self.headers.get("A-IM"):
+                    self.send_response(226)
+                    self.send_header("ETag", etag)
+                    self.send_header("IM", self.headers.get("A-IM"))
+                    self.send_header("Content-Length", str(len(delta)))
+                    self.end_headers()
+                    self.wfile.write(delta)
+                    return
+                if base_etag == etag:
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.end_headers()
+                    return
+                range_header = self.headers.get("Range", "")
+                start = 0
+                if range_header.startswith("bytes=") \
+                        and range_header.endswith("-"):
+                    start = int(range_header[len("bytes="):-1])
+                if 0 < start < len(data):
+                    self.send_response(206)
+                    self.send_header("Content-Range", "bytes {0}-{1}/{2}"
+                                     .format(start, len(data) - 1, len(data)))
+                else:
+                    start = 0
+                    self.send_response(200)
+                self.send_header("ETag", etag)
+                self.send_header("Content-Length", str(len(data) - start))
+                self.end_headers()
+
+                body = data[start:]
+                drop = server.drops.pop(path, None)
+                if drop is not None:
+                    body = body[:drop]
+                    self.close_connection = True
+                if server.bandwidth:
+                    block_size = 64 * 1024
+                    for i in range(0, len(body), block_size):
+                        block = body[i:i + block_size]
+                        time.sleep(len(block) / float(server.bandwidth))
+                        try:
+                            self.wfile.write(block)
+                        except socket.error:
+                            # Closed by the client (e.g. the loser of a race)
+                            self.close_connection = True
+                            return
+                        server.bytes_sent += len(block)
+                else:
+                    self.wfile.write(body)
+                    server.bytes_sent += len(body)
+
+        self._httpd = _ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._thread = threading.Thread(target=self._httpd.serve_forever)
+        self._thread.daemon = True
+
+    @property
+    def url(self):
+        return "http://127.0.0.1:{0}".format(self._httpd.server_address[1])
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *a):
+        self._httpd.shutdown()
+        self._httpd.server_close()
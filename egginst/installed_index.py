@@ -0,0 +1,255 @@
+"""
+A per-prefix index of the installed packages' metadata.
+
+Listing the installed packages requires reading the _info.json and
+egginst.json files of every package installed in a prefix. The index keeps
+what is needed from those files in a single file.
+
+egginst updates the entry of a package whenever it installs or removes it.
+The index is then used as is, as long as the mtime of the EGG-INFO
+directory shows that no metadata directory was added or removed by other
+means. Otherwise, each entry is validated against the mtimes of its
+metadata directory, and re-read if stale.
+"""
+from __future__ import absolute_import
+
+import json
+import logging
+import os
+import time
+
+from os.path import isdir, join
+
+from egginst.utils import atomic_file, ensure_dir, rm_empty_dir, rm_rf
+
+
+logger = logging.getLogger(__name__)
+
+# The index lives in its own directory, so that writing it does not change
+# the mtime of EGG-INFO.
+INDEX_DIRNAME = "_installed_index"
+INDEX_FILENAME = "index.json"
+
+# Location of the index in format 1
+_OLD_INDEX_FILENAME = "_installed_index.json"
+
+# Bump this whenever the format of the index changes.
+_INDEX_FORMAT = 2
+
+# Some filesystems have a coarse mtime resolution, so a change happening
+# shortly after (or before) an entry or EGG-INFO is checked may not change
+# its mtimes. Entries modified within that many seconds of being checked
+# are always checked again.
+_RACY_WINDOW = 2.0
+
+
+def _load_json(path):
+    with open(path) as fp:
+        return json.load(fp)
+
+
+def _mtimes(meta_dir):
+    mtimes = []
+    for path in (meta_dir, join(meta_dir, "_info.json"),
+                 join(meta_dir, "egginst.json")):
+        try:
+            mtimes.append(os.stat(path).st_mtime)
+        except OSError:
+            mtimes.append(None)
+    return mtimes
+
+
+def _read_entry(meta_dir, mtimes):
+    info = egg_name = None
+
+    if mtimes[1] is not None:
+        try:
+            info = _load_json(join(meta_dir, "_info.json"))
+        except (IOError, ValueError):
+            pass
+
+    if mtimes[2] is not None:
+        try:
+            egg_name = _load_json(join(meta_dir, "egginst.json"))["egg_name"]
+        except (IOError, ValueError, KeyError) as e:
+            logger.warn("Invalid egginst metadata in %r: %r", meta_dir, e)
+
+    return {"mtimes": mtimes, "checked_at": time.time(), "info": info,
+            "egg_name": egg_name}
+
+
+def _is_racy(mtimes, checked_at):
+    newest = max(mtime for mtime in mtimes if mtime is not None)
+    return newest >= checked_at - _RACY_WINDOW
+
+
+class InstalledIndex(object):
+    """ The index of the packages installed in the given prefix.
+
+    The index is stored in the prefix's EGG-INFO directory. Failing to read
+    or write it is not an error: the metadata are then read from each
+    package's metadata directory.
+
+    Parameters
+    ----------
+    prefix : str
+        The prefix.
+    """
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self.egg_info_dir = join(prefix, "EGG-INFO")
+        self.path = join(self.egg_info_dir, INDEX_DIRNAME, INDEX_FILENAME)
+
+    def _load(self):
+        try:
+            data = _load_json(self.path)
+            if data["format"] == _INDEX_FORMAT:
+                return data
+        except (IOError, ValueError, KeyError, TypeError):
+            pass
+        return None
+
+    def _save(self, entries, egg_info_mtime, checked_at):
+        """ Write the given entries.
+
+        egg_info_mtime is the mtime of EGG-INFO when the entries were known
+        to match its metadata directories (at checked_at), or None.
+        """
+        data = {
+            "format": _INDEX_FORMAT,
+            "egg_info_mtime": egg_info_mtime,
+            "checked_at": checked_at,
+            "entries": dict(entries),
+        }
+        try:
+            ensure_dir(self.path)
+            with atomic_file(self.path, "w") as fp:
+                fp.write(json.dumps(data))
+            rm_rf(join(self.egg_info_dir, _OLD_INDEX_FILENAME))
+        except (IOError, OSError) as e:
+            logger.warn("Could not write installed packages index %r: %r",
+                        self.path, e)
+
+    def _remove(self):
+        try:
+            rm_rf(join(self.egg_info_dir, INDEX_DIRNAME))
+            rm_rf(join(self.egg_info_dir, _OLD_INDEX_FILENAME))
+            rm_empty_dir(self.egg_info_dir)
+        except OSError as e:
+            logger.warn("Could not remove installed packages index %r: %r",
+                        self.path, e)
+
+    def _metadata_dirnames(self):
+        return set(name for name in os.listdir(self.egg_info_dir)
+                   if name not in (INDEX_DIRNAME, _OLD_INDEX_FILENAME))
+
+    def entries(self):
+        """ Returns the list of (name, entry) pairs, one for each metadata
+        directory in the prefix, sorted by name.
+
+        Each entry is a dict with the following keys:
+
+        - info: the content of _info.json (None if missing or invalid)
+        - egg_name: the installed egg name, from egginst.json (None if
+          missing or invalid)
+
+        The index is updated on disk if any entry was stale.
+        """
+        now = time.time()
+        try:
+            egg_info_mtime = os.stat(self.egg_info_dir).st_mtime
+        except OSError:
+            return []
+
+        data = self._load()
+        if (data is not None and data["egg_info_mtime"] == egg_info_mtime
+                and egg_info_mtime < data["checked_at"] - _RACY_WINDOW):
+            return sorted(data["entries"].items())
+
+        if data is None:
+            cached = {}
+        else:
+            cached = data["entries"]
+
+        dirty = (data is None or data["egg_info_mtime"] != egg_info_mtime
+                 or egg_info_mtime < now - _RACY_WINDOW)
+        entries = []
+        for name in sorted(self._metadata_dirnames()):
+            meta_dir = join(self.egg_info_dir, name)
+            if not isdir(meta_dir):
+                continue
+            mtimes = _mtimes(meta_dir)
+
+            entry = cached.get(name)
+            if entry is None or entry["mtimes"] != mtimes:
+                dirty = True
+                entry = _read_entry(meta_dir, mtimes)
+            elif _is_racy(mtimes, entry["checked_at"]):
+                entry = _read_entry(meta_dir, mtimes)
+                # Rewrite the index once the entry can be trusted
+                dirty = dirty or not _is_racy(mtimes, entry["checked_at"])
+            entries.append((name, entry))
+
+        if dirty or len(entries) != len(cached):
+            self._save(entries, egg_info_mtime, now)
+
+        return entries
+
+    def update(self, name):
+        """ Update the entry of the given metadata directory, after its
+        package was installed or removed.
+
+        Only this entry is read again. The index is removed once no package
+        is installed anymore, so that an empty EGG-INFO directory can be
+        removed as well.
+        """
+        data = self._load()
+        if data is None:
+            # Built on next use
+            return
+
+        entries = data["entries"]
+        meta_dir = join(self.egg_info_dir, name)
+        if isdir(meta_dir):
+            entries[name] = _read_entry(meta_dir, _mtimes(meta_dir))
+        else:
+            entries.pop(name, None)
+
+        if len(entries) == 0:
+            self._remove()
+            return
+
+        now = time.time()
+        try:
+            egg_info_mtime = os.stat(self.egg_info_dir).st_mtime
+            # Other metadata directories may have been added or removed
+            # since the index was last checked
+            if self._metadata_dirnames() != set(entries):
+                egg_info_mtime = None
+        except OSError:
+            egg_info_mtime = None
+        self._save(entries.items(), egg_info_mtime, now)
+
+
+def iter_installed_infos(prefix):
+    """ Iterate over the (meta_dir, info) pairs of the packages installed in
+    the given prefix, info being the content of their _info.json (as
+    returned by enstaller.eggcollect.info_from_metadir).
+    """
+    index = InstalledIndex(prefix)
+    for name, entry in index.entries():
+        if entry["info"] is not None:
+            meta_dir = join(index.egg_info_dir, name)
+            info = dict(entry["info"])
+            info["installed"] = True
+            info["meta_dir"] = meta_dir
+            yield meta_dir, info
+
+
+def iter_installed_egg_names(prefix):
+    """ Iterate over the (metadata directory name, egg name) pairs of the
+    packages installed in the given prefix.
+    """
+    for name, entry in InstalledIndex(prefix).entries():
+        if entry["egg_name"] is not None:
+            yield name, entry["egg_name"]
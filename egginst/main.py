@@ -38,6 +38,7 @@ from . import object_code
 from . import scripts
 
 from ._compat import configparser, StringIO
+from .installed_index import InstalledIndex, iter_installed_egg_names
 from .links import create_link
 from .progress import console_progress_manager_factory
 from .utils import (on_win, ensure_dir, rm_empty_dir, rm_rf, is_zipinfo_dir,
@@ -290,6 +291,7 @@ class _EggInstRemove(object):
 
         self._rm_dirs(self.files)
         rm_rf(self.meta_dir)
+        InstalledIndex(self.prefix).update(self.cname)
         rm_empty_dir(self.egginfo_dir)
 
     def remove(self):
@@ -474,6 +476,7 @@ class EggInst(object):
                 yield n
 
         self.post_extract(extra_info)
+        InstalledIndex(self.prefix).update(self.cname)
 
     def _extract_egg_with_legacy_egg_info(self, name, is_custom_egg):
         zip_info = self.z.getinfo(name)
@@ -607,17 +610,11 @@ def get_installed(prefix=sys.prefix):
     Each element is the filename of the egg which was used to install the
     package.
     """
-    egg_info_dir = join(prefix, 'EGG-INFO')
-    if not isdir(egg_info_dir):
-        return
     pat = re.compile(r'([a-z0-9_.]+)$')
-    for fn in sorted(os.listdir(egg_info_dir)):
+    for fn, egg_name in sorted(iter_installed_egg_names(prefix)):
         if not pat.match(fn):
             continue
-        d = read_meta(join(egg_info_dir, fn))
-        if d is None:
-            continue
-        yield d['egg_name']
+        yield egg_name
 
 
 def print_installed(prefix=sys.prefix):
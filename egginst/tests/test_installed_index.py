@@ -0,0 +1,260 @@
+import json
+import os
+import os.path
+import shutil
+import sys
+import tempfile
+import time
+
+import mock
+
+from egginst.installed_index import (InstalledIndex, _read_entry,
+                                     iter_installed_egg_names,
+                                     iter_installed_infos)
+
+if sys.version_info[0] == 2:
+    import unittest2 as unittest
+else:
+    import unittest
+
+
+def _write_meta_dir(prefix, name, version, mtime=None):
+    meta_dir = os.path.join(prefix, "EGG-INFO", name)
+    if not os.path.isdir(meta_dir):
+        os.makedirs(meta_dir)
+
+    egg_name = "{0}-{1}-1.egg".format(name, version)
+    paths = [os.path.join(meta_dir, "_info.json"),
+             os.path.join(meta_dir, "egginst.json")]
+    with open(paths[0], "w") as fp:
+        json.dump({"key": egg_name, "name": name, "version": version}, fp)
+    with open(paths[1], "w") as fp:
+        json.dump({"egg_name": egg_name, "files": []}, fp)
+
+    if mtime is not None:
+        for path in paths + [meta_dir]:
+            os.utime(path, (mtime, mtime))
+    return meta_dir
+
+
+class TestInstalledIndex(unittest.TestCase):
+    def setUp(self):
+        self.prefix = tempfile.mkdtemp()
+        self.egg_info_dir = os.path.join(self.prefix, "EGG-INFO")
+        self.index_path = InstalledIndex(self.prefix).path
+        self.old = time.time() - 3600
+
+        _write_meta_dir(self.prefix, "numpy", "1.8.0", self.old)
+        _write_meta_dir(self.prefix, "mkl", "10.3", self.old)
+
+    def tearDown(self):
+        shutil.rmtree(self.prefix)
+
+    def _entries(self):
+        return dict(InstalledIndex(self.prefix).entries())
+
+    def test_simple(self):
+        # When
+        entries = self._entries()
+
+        # Then
+        self.assertEqual(sorted(entries), ["mkl", "numpy"])
+        self.assertEqual(entries["numpy"]["egg_name"], "numpy-1.8.0-1.egg")
+        self.assertEqual(entries["numpy"]["info"]["version"], "1.8.0")
+        self.assertTrue(os.path.exists(self.index_path))
+
+    def test_cached(self):
+        # Given
+        r_entries = self._entries()
+
+        # When
+        with mock.patch("egginst.installed_index._read_entry") as read_entry:
+            entries = self._entries()
+
+        # Then
+        self.assertFalse(read_entry.called)
+        self.assertEqual(entries, r_entries)
+
+    def test_stale_entry(self):
+        # Given
+        self._entries()
+        _write_meta_dir(self.prefix, "numpy", "1.9.0", self.old + 10)
+
+        # When
+        entries = self._entries()
+
+        # Then
+        self.assertEqual(entries["numpy"]["egg_name"], "numpy-1.9.0-1.egg")
+
+        # When
+        with mock.patch("egginst.installed_index._read_entry") as read_entry:
+            entries = self._entries()
+
+        # Then
+        self.assertFalse(read_entry.called)
+        self.assertEqual(entries["numpy"]["egg_name"], "numpy-1.9.0-1.egg")
+
+    def test_racy_entry(self):
+        # Given
+        # Modified right now: the mtimes may not change if the entry is
+        # modified again within the same mtime resolution.
+        _write_meta_dir(self.prefix, "scipy", "0.14.0")
+        self._entries()
+
+        # When
+        with mock.patch("egginst.installed_index._read_entry",
+                        wraps=_read_entry) as read_entry:
+            self._entries()
+
+        # Then
+        self.assertEqual(read_entry.call_count, 1)
+
+    def test_added_and_removed_entries(self):
+        # Given
+        self._entries()
+        _write_meta_dir(self.prefix, "scipy", "0.14.0", self.old)
+        shutil.rmtree(os.path.join(self.egg_info_dir, "mkl"))
+
+        # When
+        entries = self._entries()
+
+        # Then
+        self.assertEqual(sorted(entries), ["numpy", "scipy"])
+
+    def test_invalid_metadata(self):
+        # Given
+        meta_dir = os.path.join(self.egg_info_dir, "numpy")
+        with open(os.path.join(meta_dir, "_info.json"), "w") as fp:
+            fp.write("{")
+        os.unlink(os.path.join(meta_dir, "egginst.json"))
+
+        # When
+        entries = self._entries()
+
+        # Then
+        self.assertEqual(entries["numpy"]["info"], None)
+        self.assertEqual(entries["numpy"]["egg_name"], None)
+
+    def test_corrupted_index(self):
+        # Given
+        self._entries()
+        with open(self.index_path, "w") as fp:
+            fp.write("garbage")
+
+        # When
+        entries = self._entries()
+
+        # Then
+        self.assertEqual(sorted(entries), ["mkl", "numpy"])
+
+    def test_cannot_write_index(self):
+        # Given
+        with mock.patch("egginst.installed_index.atomic_file",
+                        side_effect=IOError("read-only filesystem")):
+            # When
+            entries = self._entries()
+
+        # Then
+        self.assertEqual(sorted(entries), ["mkl", "numpy"])
+        self.assertFalse(os.path.exists(self.index_path))
+
+    def test_no_egg_info(self):
+        # Given
+        shutil.rmtree(self.egg_info_dir)
+
+        # When/Then
+        self.assertEqual(self._entries(), {})
+
+    def test_warm(self):
+        # Given
+        self._entries()
+        # Nothing added or removed for a while
+        os.utime(self.egg_info_dir, (self.old, self.old))
+        r_entries = self._entries()
+
+        # When
+        with mock.patch("egginst.installed_index._mtimes") as mtimes:
+            entries = self._entries()
+
+        # Then
+        # Packages are not looked at one by one
+        self.assertFalse(mtimes.called)
+        self.assertEqual(entries, r_entries)
+
+        # Given
+        _write_meta_dir(self.prefix, "scipy", "0.14.0", self.old)
+
+        # When
+        entries = self._entries()
+
+        # Then
+        self.assertEqual(sorted(entries), ["mkl", "numpy", "scipy"])
+
+    def test_update(self):
+        # Given
+        self._entries()
+        _write_meta_dir(self.prefix, "scipy", "0.14.0", self.old)
+
+        # When
+        with mock.patch("egginst.installed_index._read_entry",
+                        wraps=_read_entry) as read_entry:
+            InstalledIndex(self.prefix).update("scipy")
+
+        # Then
+        self.assertEqual(read_entry.call_count, 1)
+        with mock.patch("egginst.installed_index._read_entry") as read_entry:
+            entries = self._entries()
+        self.assertFalse(read_entry.called)
+        self.assertEqual(entries["scipy"]["egg_name"], "scipy-0.14.0-1.egg")
+
+        # Given
+        shutil.rmtree(os.path.join(self.egg_info_dir, "scipy"))
+
+        # When
+        InstalledIndex(self.prefix).update("scipy")
+
+        # Then
+        self.assertEqual(sorted(self._entries()), ["mkl", "numpy"])
+
+    def test_update_last_package_removed(self):
+        # Given
+        self._entries()
+
+        # When
+        for name in ("mkl", "numpy"):
+            shutil.rmtree(os.path.join(self.egg_info_dir, name))
+            InstalledIndex(self.prefix).update(name)
+
+        # Then
+        self.assertFalse(os.path.exists(self.egg_info_dir))
+
+    def test_old_index_removed(self):
+        # Given
+        old_index = os.path.join(self.egg_info_dir, "_installed_index.json")
+        with open(old_index, "w") as fp:
+            fp.write("{}")
+
+        # When
+        entries = self._entries()
+
+        # Then
+        self.assertEqual(sorted(entries), ["mkl", "numpy"])
+        self.assertFalse(os.path.exists(old_index))
+
+    def test_iter_installed_infos(self):
+        # When
+        infos = dict(iter_installed_infos(self.prefix))
+
+        # Then
+        meta_dir = os.path.join(self.egg_info_dir, "numpy")
+        self.assertEqual(infos[meta_dir]["key"], "numpy-1.8.0-1.egg")
+        self.assertEqual(infos[meta_dir]["meta_dir"], meta_dir)
+        self.assertTrue(infos[meta_dir]["installed"])
+
+    def test_iter_installed_egg_names(self):
+        # When
+        egg_names = sorted(iter_installed_egg_names(self.prefix))
+
+        # Then
+        self.assertEqual(egg_names, [("mkl", "mkl-10.3-1.egg"),
+                                     ("numpy", "numpy-1.8.0-1.egg")])
@@ -6,8 +6,9 @@ import tempfile
 import textwrap
 
 from egginst._compat import StringIO
-from egginst.utils import (Checksummer, atomic_file, checked_content,
-                           compute_md5, parse_assignments,
+from egginst.utils import (PART_LOCK_SUFFIX, PART_SUFFIX, Checksummer,
+                           atomic_file, checked_content, compute_md5,
+                           parse_assignments, resumable_checked_content,
                            samefile)
 from enstaller.errors import InvalidChecksum, InvalidFormat
 
@@ -243,3 +244,189 @@ class TestCheckedContent(unittest.TestCase):
         # When/Then
         with checked_content(path, checksum) as fp:
             fp.abort()
+
+
+class TestResumableCheckedContent(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tempdir, "foo.data")
+        self.part_path = self.path + PART_SUFFIX
+        self.lock_path = self.part_path + PART_LOCK_SUFFIX
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def _read(self, path):
+        with open(path, "rb") as fp:
+            return fp.read()
+
+    def test_simple(self):
+        # Given
+        data = b"data"
+        checksum = hashlib.md5(data).hexdigest()
+
+        # When
+        with resumable_checked_content(self.path, checksum) as fp:
+            offset = fp.offset
+            fp.write(data)
+
+        # Then
+        self.assertEqual(offset, 0)
+        self.assertEqual(self._read(self.path), data)
+        self.assertFalse(os.path.exists(self.part_path))
+
+    def test_resume_after_error(self):
+        # Given
+        data = b"some data"
+        checksum = hashlib.md5(data).hexdigest()
+
+        # When
+        with self.assertRaises(ValueError):
+            with resumable_checked_content(self.path, checksum) as fp:
+                fp.write(data[:4])
+                raise ValueError("connection dropped")
+
+        # Then
+        self.assertFalse(os.path.exists(self.path))
+        self.assertEqual(self._read(self.part_path), data[:4])
+
+        # When
+        with resumable_checked_content(self.path, checksum) as fp:
+            offset = fp.offset
+            fp.write(data[offset:])
+
+        # Then
+        self.assertEqual(offset, 4)
+        self.assertEqual(self._read(self.path), data)
+        self.assertFalse(os.path.exists(self.part_path))
+
+    def test_restart(self):
+        # Given
+        data = b"some data"
+        checksum = hashlib.md5(data).hexdigest()
+        with open(self.part_path, "wb") as fp:
+            fp.write(b"garbage")
+
+        # When
+        with resumable_checked_content(self.path, checksum) as fp:
+            fp.restart()
+            offset = fp.offset
+            fp.write(data)
+
+        # Then
+        self.assertEqual(offset, 0)
+        self.assertEqual(self._read(self.path), data)
+
+    def test_abort(self):
+        # Given
+        data = b"some data"
+        checksum = hashlib.md5(data).hexdigest()
+
+        # When
+        with resumable_checked_content(self.path, checksum) as fp:
+            fp.write(data[:4])
+            fp.abort()
+
+        # Then
+        self.assertFalse(os.path.exists(self.path))
+        self.assertEqual(self._read(self.part_path), data[:4])
+
+    def test_invalid_checksum(self):
+        # Given
+        data = b"some data"
+        checksum = hashlib.md5(data).hexdigest()
+
+        # When/Then
+        with self.assertRaises(InvalidChecksum):
+            with resumable_checked_content(self.path, checksum,
+                                           len(data)) as fp:
+                fp.write(b"some dat!")
+
+        # Then
+        self.assertFalse(os.path.exists(self.path))
+        self.assertFalse(os.path.exists(self.part_path))
+
+    def test_truncated(self):
+        # Given
+        data = b"some data"
+        checksum = hashlib.md5(data).hexdigest()
+
+        # When/Then
+        with self.assertRaises(InvalidChecksum):
+            with resumable_checked_content(self.path, checksum,
+                                           len(data)) as fp:
+                fp.write(data[:4])
+
+        # Then
+        self.assertFalse(os.path.exists(self.path))
+        self.assertEqual(self._read(self.part_path), data[:4])
+
+    def test_concurrent_writers(self):
+        # Given
+        data = b"some data"
+        checksum = hashlib.md5(data).hexdigest()
+        with open(self.part_path, "wb") as fp:
+            fp.write(data[:2])
+
+        # When
+        with resumable_checked_content(self.path, checksum) as first:
+            first_offset = first.offset
+            first.write(data[first_offset:4])
+
+            with resumable_checked_content(self.path, checksum) as second:
+                second_offset = second.offset
+                second.write(data)
+
+            # Then
+            self.assertEqual(self._read(self.path), data)
+            self.assertTrue(os.path.exists(self.lock_path))
+
+            first.write(data[4:])
+
+        # Then
+        self.assertEqual(first_offset, 2)
+        self.assertEqual(second_offset, 0)
+        self.assertEqual(self._read(self.path), data)
+        self.assertEqual(sorted(os.listdir(self.tempdir)), ["foo.data"])
+
+    def test_concurrent_writer_error(self):
+        # Given
+        data = b"some data"
+        checksum = hashlib.md5(data).hexdigest()
+
+        # When
+        with resumable_checked_content(self.path, checksum) as first:
+            first.write(data[:4])
+            with self.assertRaises(ValueError):
+                with resumable_checked_content(self.path, checksum) as second:
+                    second.write(data[:2])
+                    raise ValueError("connection dropped")
+
+            # Then
+            self.assertEqual(sorted(os.listdir(self.tempdir)),
+                             ["foo.data.part", "foo.data.part.lock"])
+            first.abort()
+
+        # Then
+        self.assertEqual(self._read(self.part_path), data[:4])
+        self.assertFalse(os.path.exists(self.lock_path))
+
+    def test_stale_lock(self):
+        # Given
+        data = b"some data"
+        checksum = hashlib.md5(data).hexdigest()
+        with open(self.part_path, "wb") as fp:
+            fp.write(data[:4])
+        with open(self.lock_path, "wb") as fp:
+            fp.write(b"12345:deadbeef")
+        os.utime(self.lock_path, (0, 0))
+
+        # When
+        with resumable_checked_content(self.path, checksum) as fp:
+            offset = fp.offset
+            fp.write(data[offset:])
+
+        # Then
+        self.assertEqual(offset, 4)
+        self.assertEqual(self._read(self.path), data)
+        self.assertEqual(sorted(os.listdir(self.tempdir)), ["foo.data"])
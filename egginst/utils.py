@@ -10,8 +10,10 @@ import os
 import shutil
 import stat
 import tempfile
+import time
+import uuid
 
-from os.path import basename, isdir, isfile, islink, join
+from os.path import basename, dirname, isdir, isfile, islink, join
 
 from egginst._compat import string_types
 from egginst.errors import EnstallerException, InvalidChecksum, InvalidFormat
@@ -31,6 +33,14 @@ _CHECKSUM_KIND_TO_HASHER = {
     'sha256': hashlib.sha256,
 }
 
+PART_SUFFIX = ".part"
+PART_LOCK_SUFFIX = ".lock"
+
+# A partial file lock which has not been refreshed for that long (in seconds)
+# is assumed to be left over by a dead process.
+_STALE_PART_LOCK_AGE = 600.0
+_PART_LOCK_REFRESH_INTERVAL = 10.0
+
 
 def rm_empty_dir(path):
     """
@@ -390,6 +400,226 @@ def checked_content(filename, expected_checksum, checksum_kind='md5'):
             if expected_checksum != actual_checksum:
                 raise InvalidChecksum(filename, expected_checksum,
                                       actual_checksum)
+
+
+class _PartLock(object):
+    """ An exclusive lock on a partial file, held by creating a lock file
+    next to it.
+
+    Unlike a blocking lock, acquiring it never waits: the caller is expected
+    to write somewhere else when the partial file is in use.
+    """
+    def __init__(self, part_path):
+        self.path = part_path + PART_LOCK_SUFFIX
+        self._token = "{0}:{1}".format(os.getpid(), uuid.uuid4().hex)
+        self._last_refresh = None
+
+    def _is_stale(self, path):
+        try:
+            mtime = os.stat(path).st_mtime
+        except OSError:
+            return False
+        return time.time() - mtime > _STALE_PART_LOCK_AGE
+
+    def _break_stale(self):
+        """ Remove the lock file if it is stale, and return True if it was
+        removed.
+
+        The lock file is first moved away atomically, so that a lock taken
+        again by another process in the meantime is never removed: it is put
+        back instead, or left alone if that fails.
+        """
+        if not self._is_stale(self.path):
+            return False
+
+        moved = "{0}.{1}.stale".format(self.path, uuid.uuid4().hex)
+        try:
+            os.rename(self.path, moved)
+        except OSError:
+            # Already broken by someone else
+            return False
+
+        if self._is_stale(moved):
+            logger.warn("Removed stale lock %r", self.path)
+            os.unlink(moved)
+            return True
+        else:
+            try:
+                # Unlike rename, link does not replace an existing lock
+                os.link(moved, self.path)
+            except (AttributeError, OSError) as e:
+                logger.warn("Could not restore lock %r: %r", self.path, e)
+            else:
+                os.unlink(moved)
+            return False
+
+    def try_acquire(self):
+        """ Take the lock, and return False if it is held by someone else.
+        """
+        for _ in range(2):
+            try:
+                fd = os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+                if not self._break_stale():
+                    return False
+            else:
+                os.write(fd, self._token.encode("ascii"))
+                os.close(fd)
+                self._last_refresh = time.time()
+                return True
+        return False
+
+    def refresh(self):
+        """ Mark the lock as still in use."""
+        now = time.time()
+        if now - self._last_refresh > _PART_LOCK_REFRESH_INTERVAL:
+            try:
+                os.utime(self.path, None)
+            except OSError as e:
+                logger.warn("Could not refresh lock %r: %r", self.path, e)
+            self._last_refresh = now
+
+    def release(self):
+        """ Remove the lock file, unless it was broken and taken by someone
+        else in the meantime."""
+        try:
+            with open(self.path, "rb") as fp:
+                token = fp.read().decode("ascii")
+            if token == self._token:
+                os.unlink(self.path)
+        except (OSError, IOError, UnicodeDecodeError) as e:
+            logger.warn("Could not release lock %r: %r", self.path, e)
+
+
+class _PartialContent(Checksummer):
+    def __init__(self, fp, hasher_factory, block_size=256 * 1024,
+                 on_write=None):
+        """
+        A Checksummer appending to a partially written file, as used by
+        resumable_checked_content.
+
+        The checksum of the data already in the file is computed first.
+        """
+        hasher = hasher_factory()
+        size = 0
+        fp.seek(0)
+        while True:
+            data = fp.read(block_size)
+            hasher.update(data)
+            size += len(data)
+            if len(data) < block_size:
+                break
+
+        super(_PartialContent, self).__init__(fp, hasher)
+        self._hasher_factory = hasher_factory
+        self._on_write = on_write
+
+        self.offset = size
+        self.size = size
+
+    def restart(self):
+        """
+        Discard any data already written.
+        """
+        self._fp.seek(0)
+        self._fp.truncate()
+        self._h = self._hasher_factory()
+        self.offset = self.size = 0
+
+    def write(self, data):
+        super(_PartialContent, self).write(data)
+        self.size += len(data)
+        if self._on_write is not None:
+            self._on_write()
+
+
+@contextlib.contextmanager
+def resumable_checked_content(filename, expected_checksum, expected_size=None,
+                              checksum_kind='md5'):
+    """
+    Like checked_content, but data are appended to a partial file
+    (filename + PART_SUFFIX) which is kept if the context manager is exited
+    with an error or aborted, so that a later call may resume from there.
+
+    The partial file is locked while in use (through a PART_LOCK_SUFFIX lock
+    file next to it). If another process holds the lock, data are written to
+    a temporary file of our own instead, and nothing is resumed nor kept.
+
+    Parameters
+    ----------
+    filename : str
+        The path to write to
+    expected_checksum : str
+        The expected checksum
+    expected_size : int or None
+        The expected size. If given, a partial file smaller than this is kept
+        on checksum mismatch, as it was most likely truncated and may still be
+        completed. Otherwise, the partial file is removed.
+
+    Returns
+    -------
+    fp : file-like
+        A Checksummer, with an offset attribute (the size of the data kept
+        from a previous call), a size attribute (the current size of the
+        data), and a restart method to discard any data already written.
+
+    Example
+    -------
+    A simple example::
+
+        with resumable_checked_content("foo.bin", expected_md5) as fp:
+            if fp.offset > 0:
+                data = get_data_from(fp.offset)
+            else:
+                data = get_data()
+            fp.write(data)
+    """
+    hasher = _CHECKSUM_KIND_TO_HASHER.get(checksum_kind)
+    if hasher is None:
+        msg = "Invalid checksum kind: {0!r}"
+        raise EnstallerException(msg.format(checksum_kind))
+
+    part_path = filename + PART_SUFFIX
+    lock = _PartLock(part_path)
+    if lock.try_acquire():
+        path = part_path
+        on_write = lock.refresh
+    else:
+        logger.info("%r is in use by another process, not resuming",
+                    part_path)
+        fd, path = tempfile.mkstemp(prefix=basename(part_path) + ".",
+                                    dir=dirname(part_path) or None)
+        os.close(fd)
+        lock = on_write = None
+
+    try:
+        mode = "r+b" if isfile(path) else "w+b"
+        with open(path, mode) as fp:
+            target = _PartialContent(fp, hasher, on_write=on_write)
+            fp.seek(0, os.SEEK_END)
+            yield target
+
+        if target.is_aborted:
+            return
+
+        actual_checksum = target.hexdigest()
+        if expected_checksum != actual_checksum:
+            if expected_size is None or target.size >= expected_size:
+                os.unlink(path)
+            raise InvalidChecksum(filename, expected_checksum,
+                                  actual_checksum)
+        else:
+            rename(path, filename)
+    finally:
+        if lock is not None:
+            lock.release()
+        elif isfile(path):
+            # A temporary file cannot be resumed later
+            os.unlink(path)
+
+
 if sys.platform == "win32":
     from egginst._win32_compat import samefile
 else:
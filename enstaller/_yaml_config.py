@@ -13,32 +13,95 @@ _AUTHENTICATION_TYPE = "kind"
 _AUTHENTICATION_TYPE_BASIC = "basic"
 _AUTHENTICATION_TYPE_SIMPLE = "simple"
 _AUTHENTICATION_TYPE_TOKEN = "token"
+_CONNECTION_POOL_BLOCK = "connection_pool_block"
+_CONNECTION_POOL_SIZE = "connection_pool_size"
+_INDEX_CACHE_MAX_ENTRIES = "index_cache_max_entries"
+_INDEX_CACHE_MAX_SIZE = "index_cache_max_size"
+_MAX_CONCURRENT_FETCHES = "max_concurrent_fetches"
+_MAX_CONCURRENT_TRANSFERS = "max_concurrent_transfers"
+_MAX_DOWNLOAD_RATE = "max_download_rate"
 _MAX_RETRIES = "max_retries"
 _SSL_VERIFY = "verify_ssl"
+_STREAM_INDICES = "stream_indices"
 _USERNAME = "username"
 _PASSWORD = "password"
 _AUTH_STRING = "auth"
 _REPOSITORIES = "repositories"
 _FILES_CACHE = "files_cache"
+_FILES_CACHE_MAX_SIZE = "files_cache_max_size"
+_SHARED_FILES_CACHE = "shared_files_cache"
 _STORE_URL = "store_url"
 
+# yaml option -> Configuration.update keyword, for the options whose value is
+# passed as is.
+_SIMPLE_OPTIONS = (
+    (_FILES_CACHE_MAX_SIZE, "repository_cache_max_size"),
+    (_SHARED_FILES_CACHE, "shared_egg_store"),
+    (_CONNECTION_POOL_SIZE, "connection_pool_size"),
+    (_CONNECTION_POOL_BLOCK, "connection_pool_block"),
+    (_INDEX_CACHE_MAX_ENTRIES, "index_cache_max_entries"),
+    (_INDEX_CACHE_MAX_SIZE, "index_cache_max_size"),
+    (_MAX_RETRIES, "max_retries"),
+    (_MAX_CONCURRENT_FETCHES, "max_concurrent_fetches"),
+    (_MAX_CONCURRENT_TRANSFERS, "max_concurrent_transfers"),
+    (_MAX_DOWNLOAD_RATE, "max_download_rate"),
+    (_STREAM_INDICES, "stream_indices"),
+)
+
+
+def _integer_property(description, minimum=None):
+    schema = {"description": description, "type": "integer"}
+    if minimum is not None:
+        schema["minimum"] = minimum
+    return schema
+
+
+def _boolean_property(description):
+    return {"description": description, "type": "boolean"}
+
+
 _SCHEMA = {
     "$schema": "http://json-schema.org/draft-04/schema#",
     "title": "EnstallerConfiguration",
     "description": "Enstaller >= 4.8.0 configuration",
     "type": "object",
     "properties": {
-        "max_retries": {
-            "description": "Max number of time to retry connecting to a "
-                           "remote server or re-fetching data with invalid "
-                           "checksum",
-            "type": "integer"
-        },
-        "verify_ssl": {
-            "description": "Whether to actually check SSL CA certificate or "
-                           "not",
-            "type": "boolean"
-        },
+        "connection_pool_size": _integer_property(
+            "Max number of connections kept open to each host", minimum=1
+        ),
+        "connection_pool_block": _boolean_property(
+            "Whether to wait for a pooled connection instead of opening more "
+            "than connection_pool_size connections to a host"
+        ),
+        "index_cache_max_entries": _integer_property(
+            "Max number of index responses kept in the index cache",
+            minimum=1
+        ),
+        "index_cache_max_size": _integer_property(
+            "Size budget (in bytes) of the index cache", minimum=0
+        ),
+        "max_concurrent_fetches": _integer_property(
+            "Max number of eggs to download at the same time", minimum=1
+        ),
+        "max_concurrent_transfers": _integer_property(
+            "Max number of eggs downloaded at the same time by the whole "
+            "process", minimum=1
+        ),
+        "max_download_rate": _integer_property(
+            "Max bandwidth (in bytes per second) used to download eggs",
+            minimum=1
+        ),
+        "max_retries": _integer_property(
+            "Max number of time to retry connecting to a remote server or "
+            "re-fetching data with invalid checksum"
+        ),
+        "stream_indices": _boolean_property(
+            "Whether to parse indices while they are downloaded, instead of "
+            "buffering them"
+        ),
+        "verify_ssl": _boolean_property(
+            "Whether to actually check SSL CA certificate or not"
+        ),
         "store_url": {
             "description": "The url (schema + hostname only of the store to "
                            "connect to).",
@@ -48,6 +111,14 @@ _SCHEMA = {
             "description": "Where to cache downloaded files.",
             "type": "string"
         },
+        "files_cache_max_size": _integer_property(
+            "Size budget (in bytes) of the downloaded files cache.", minimum=0
+        ),
+        "shared_files_cache": {
+            "description": "Where to store downloaded files shared between "
+                           "files caches.",
+            "type": "string"
+        },
         "authentication": {
             "type": "object",
             "oneOf": [
@@ -59,11 +130,35 @@ _SCHEMA = {
         },
         "repositories": {
             "type": "array",
-            "items": {"type": "string"},
+            "items": {
+                "oneOf": [
+                    {"type": "string"},
+                    {"$ref": "#/definitions/mirrored_repository"}
+                ]
+            },
             "description": "List of repositories."
         }
     },
     "definitions": {
+        "mirrored_repository": {
+            "type": "object",
+            "properties": {
+                "mirrors": {
+                    "type": "array",
+                    "items": {"type": "string"},
+                    "minItems": 1,
+                    "description": "Equivalent repositories, in order of "
+                                   "preference."
+                },
+                "race": {
+                    "type": "boolean",
+                    "description": "Fetch eggs from the first of the two "
+                                   "preferred mirrors to respond."
+                }
+            },
+            "required": ["mirrors"],
+            "additionalProperties": False
+        },
         "api_token_authentication": {
             "properties": {
                 "kind": {
@@ -156,8 +251,9 @@ def load_configuration_from_yaml(cls, filename_or_fp):
         files_cache = os.path.expanduser(data[_FILES_CACHE]). \
             replace("{PLATFORM}", custom_plat)
         config._repository_cache = files_cache
-    if _MAX_RETRIES in data:
-        config.update(max_retries=data[_MAX_RETRIES])
+    for option, keyword in _SIMPLE_OPTIONS:
+        if option in data:
+            config.update(**{keyword: data[option]})
     if _SSL_VERIFY in data and not data[_SSL_VERIFY]:
         config.update(verify_ssl=data[_SSL_VERIFY])
 
@@ -0,0 +1,204 @@
+"""
+An asyncio front-end to Session and _DownloadManager (Python >= 3.4).
+
+Index and egg fetches are scheduled from a single event loop, and run
+concurrently on one bounded pool of workers shared by both kinds of
+fetches. Each fetch returns an asyncio future instead of blocking::
+
+    loop = asyncio.get_event_loop()
+    async_session = AsyncSession(session, loop)
+    repository = loop.run_until_complete(
+        async_session.fetch_repositories(config.repositories)
+    )
+    downloader = AsyncDownloadManager(
+        _DownloadManager(session, repository), async_session
+    )
+    loop.run_until_complete(asyncio.gather(
+        *[downloader.fetch(package) for package in packages]
+    ))
+
+The HTTP requests themselves are still made by the (blocking) Session, so
+that authentication, proxies, SSL verification and the ETag cache behave
+exactly as with the synchronous API.
+"""
+from __future__ import absolute_import
+
+import asyncio
+import functools
+
+from concurrent.futures import ThreadPoolExecutor
+
+from enstaller.index_cache import IndexSnapshotCache
+from enstaller.index_fetch import fetch_repository
+from enstaller.repository import Repository
+
+
+DEFAULT_MAX_WORKERS = 8
+
+
+def _then(future, f, loop):
+    """ Returns a future for the result of f applied to the result of the
+    given future."""
+    result = asyncio.Future(loop=loop)
+
+    def _done(future):
+        if future.cancelled():
+            result.cancel()
+        elif future.exception() is not None:
+            result.set_exception(future.exception())
+        else:
+            try:
+                result.set_result(f(future.result()))
+            except Exception as e:
+                result.set_exception(e)
+
+    future.add_done_callback(_done)
+    return result
+
+
+class AsyncSession(object):
+    """ Schedule the requests of a Session from an asyncio event loop.
+
+    Parameters
+    ----------
+    session : Session
+        The session used to make the requests.
+    loop : asyncio.AbstractEventLoop
+        The event loop the returned futures belong to. The current event
+        loop if not specified.
+    max_workers : int
+        Maximum number of requests in flight at the same time.
+    """
+    def __init__(self, session, loop=None, max_workers=DEFAULT_MAX_WORKERS):
+        self.session = session
+        self.loop = loop or asyncio.get_event_loop()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    def close(self):
+        """ Wait for the pending requests, and release the workers."""
+        self._executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *a):
+        self.close()
+
+    def run_in_executor(self, f, *a, **kw):
+        """ Run the given blocking function on the workers of this session,
+        and returns a future for its result."""
+        return self.loop.run_in_executor(self._executor,
+                                         functools.partial(f, *a, **kw))
+
+    def fetch(self, url, headers=None):
+        """ Asynchronous version of Session.fetch.
+
+        The future's result is the response, whose content has already been
+        read.
+        """
+        def _fetch():
+            response = self.session.fetch(url, headers=headers)
+            # Read the content on the workers, not from the event loop
+            response.content
+            return response
+
+        return self.run_in_executor(_fetch)
+
+    def download(self, url, target=None):
+        """ Asynchronous version of Session.download.
+
+        The future's result is the path of the downloaded file.
+        """
+        return self.run_in_executor(self.session.download, url, target)
+
+    def fetch_repository(self, repository_info, raise_on_error=False,
+                         snapshot_cache=None, use_deltas=True):
+        """ Fetch the index of the given repository, using etag caching.
+
+        The future's result is a Repository, or None if the index is not
+        available and raise_on_error is False.
+        """
+        return self.run_in_executor(
+            fetch_repository, self.session, repository_info,
+            raise_on_error, snapshot_cache, False, use_deltas
+        )
+
+    def fetch_repositories(self, repository_infos, raise_on_error=False,
+                           use_snapshots=True, use_deltas=True):
+        """ Asynchronous version of repository_factory (without any output).
+
+        The future's result is the Repository merging every available
+        index, in the order of repository_infos.
+        """
+        if use_snapshots:
+            snapshot_cache = IndexSnapshotCache.from_session(self.session)
+        else:
+            snapshot_cache = None
+
+        futures = [
+            self.fetch_repository(repository_info, raise_on_error,
+                                  snapshot_cache, use_deltas)
+            for repository_info in repository_infos
+        ]
+
+        def _merge(repositories):
+            return Repository.merge(repository for repository in repositories
+                                    if repository is not None)
+
+        if len(futures) == 0:
+            result = asyncio.Future(loop=self.loop)
+            result.set_result(Repository())
+            return result
+        return _then(asyncio.gather(*futures), _merge, self.loop)
+
+
+class AsyncDownloadManager(object):
+    """ Schedule the egg fetches of a _DownloadManager from an asyncio event
+    loop.
+
+    Parameters
+    ----------
+    downloader : _DownloadManager
+        The download manager writing the eggs in the cache.
+    async_session : AsyncSession
+        The asynchronous session whose workers fetch the eggs.
+    """
+    def __init__(self, downloader, async_session):
+        self._downloader = downloader
+        self._async_session = async_session
+
+    def iter_fetch(self, package, force=False, on_chunk=None):
+        """ Asynchronous version of _DownloadManager.iter_fetch.
+
+        Parameters
+        ----------
+        package : PackageMetadata
+            The package to fetch
+        force : bool
+            If force is True, will download even if the file is already in
+            the download cache.
+        on_chunk : callable
+            If given, called from the event loop with the size of each
+            fetched chunk.
+
+        Returns
+        -------
+        response : object
+            The cancelable response (see _DownloadManager.iter_fetch).
+        future : asyncio.Future
+            A future done once the egg is in the download cache (or the
+            fetch was canceled).
+        """
+        response = self._downloader.iter_fetch(package, force)
+        loop = self._async_session.loop
+
+        def _consume():
+            for chunk in response:
+                if on_chunk is not None:
+                    loop.call_soon_threadsafe(on_chunk, len(chunk))
+
+        return response, self._async_session.run_in_executor(_consume)
+
+    def fetch(self, package, force=False):
+        """ Asynchronous version of _DownloadManager.fetch."""
+        return self.iter_fetch(package, force)[1]
@@ -0,0 +1,305 @@
+"""
+Serve the egg download cache to other machines (``enpkg --serve-cache``).
+
+The cache is served over HTTP in the layout of OldstyleRepositoryInfo: an
+index.json synthesized from the upstream repositories at the root, and each
+egg at <root>/<egg filename>. Eggs missing from the cache are first fetched
+from upstream through the same session and download manager as enpkg
+itself, so that they are checked and kept in the cache for the next clients.
+Concurrent requests for the same missing egg only fetch it once.
+
+As the index is the one enpkg uses on this machine, clients must run on the
+same platform and python version as the server. The index is rebuilt from
+upstream when a client asks for it after a while (see
+DEFAULT_REFRESH_INTERVAL), so that new upstream eggs get served without a
+restart.
+
+There is no authentication: anyone able to connect can download every egg
+the configured credentials give access to. The server thus only listens on
+the loopback interface unless a host is explicitly given.
+"""
+from __future__ import absolute_import
+
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from six.moves.BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+
+from egginst._compat import urlparse
+from egginst.errors import InvalidChecksum
+
+from enstaller.auth import _INDEX_NAME
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8080
+DEFAULT_MAX_WORKERS = 32
+# Minimum time (in seconds) between two refreshes of the served index
+DEFAULT_REFRESH_INTERVAL = 300.0
+
+_RANGE_R = re.compile(r"bytes=(\d+)-$")
+
+_COPY_BUFFER_SIZE = 256 * 1024
+
+
+def _packages_by_key(repository):
+    """ Returns a key -> package dictionary of the packages of the given
+    repository. For packages with the same key, the first one wins."""
+    packages = {}
+    for package in repository.iter_packages():
+        packages.setdefault(package.key, package)
+    return packages
+
+
+def parse_address(s):
+    """ Parse a "[HOST:]PORT" string into a (host, port) pair. The host is
+    DEFAULT_HOST if not given."""
+    host, _, port = s.rpartition(":")
+    host = host or DEFAULT_HOST
+    try:
+        port = int(port)
+    except ValueError:
+        raise ValueError("Invalid address: {0!r}".format(s))
+    if not 0 <= port < 65536:
+        raise ValueError("Invalid port: {0!r}".format(s))
+    return host, port
+
+
+class _ServedIndex(object):
+    """ The index served for the given upstream repository, and the packages
+    it lists."""
+    def __init__(self, repository):
+        self.packages = _packages_by_key(repository)
+        index = dict((key, package.s3index_data)
+                     for key, package in self.packages.items())
+        self.data = json.dumps(index, sort_keys=True).encode("utf8")
+        self.etag = '"{0}"'.format(hashlib.md5(self.data).hexdigest())
+
+
+class _ThreadPoolHTTPServer(HTTPServer):
+    """ An HTTPServer handling requests on a bounded pool of threads."""
+    def __init__(self, server_address, handler_class, max_workers):
+        HTTPServer.__init__(self, server_address, handler_class)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    def _process_request(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def process_request(self, request, client_address):
+        self._executor.submit(self._process_request, request, client_address)
+
+    def server_close(self):
+        HTTPServer.server_close(self)
+        self._executor.shutdown(wait=True)
+
+
+class _CacheRequestHandler(BaseHTTPRequestHandler):
+    # Connections are closed after each request (HTTP/1.0): idle keep-alive
+    # connections would hold the workers of the pool.
+
+    def log_message(self, format, *args):
+        logger.info("%s - %s", self.address_string(), format % args)
+
+    def do_GET(self):
+        self._serve(True)
+
+    def do_HEAD(self):
+        self._serve(False)
+
+    def _serve(self, send_body):
+        cache_server = self.server.cache_server
+        name = urlparse(self.path).path.lstrip("/")
+
+        if name == _INDEX_NAME:
+            self._send_index(cache_server, send_body)
+            return
+
+        if name not in cache_server:
+            self.send_error(404)
+            return
+
+        try:
+            path = cache_server.fetch(name)
+        except (requests.exceptions.RequestException, InvalidChecksum) as e:
+            logger.warn("Could not fetch %r from upstream: %r", name, e)
+            self.send_error(502)
+        else:
+            self._send_file(path, send_body)
+
+    def _send_index(self, cache_server, send_body):
+        index = cache_server.index()
+        if self.headers.get("If-None-Match") == index.etag:
+            self.send_response(304)
+            self.send_header("ETag", index.etag)
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(index.data)))
+        self.send_header("ETag", index.etag)
+        self.end_headers()
+        if send_body:
+            self.wfile.write(index.data)
+
+    def _send_file(self, path, send_body):
+        with open(path, "rb") as fp:
+            size = os.fstat(fp.fileno()).st_size
+            start = 0
+            m = _RANGE_R.match(self.headers.get("Range", ""))
+            if m is not None:
+                start = int(m.group(1))
+                if start >= size:
+                    self.send_response(416)
+                    self.send_header("Content-Range",
+                                     "bytes */{0}".format(size))
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                self.send_response(206)
+                self.send_header("Content-Range", "bytes {0}-{1}/{2}".format(
+                    start, size - 1, size
+                ))
+            else:
+                self.send_response(200)
+            self.send_header("Content-Type", "application/octet-stream")
+            self.send_header("Content-Length", str(size - start))
+            self.end_headers()
+
+            if send_body:
+                fp.seek(start)
+                shutil.copyfileobj(fp, self.wfile, _COPY_BUFFER_SIZE)
+
+
+class CacheServer(object):
+    """ An HTTP server for the download cache of a _DownloadManager.
+
+    Parameters
+    ----------
+    downloader : _DownloadManager
+        The download manager whose cache is served, and used to fetch the
+        missing eggs from upstream.
+    repository : Repository
+        The upstream packages, listed in the served index.
+    address : tuple
+        The (host, port) pair to listen at. Port 0 picks any free port, an
+        empty host every interface.
+    max_workers : int
+        Maximum number of requests handled at the same time.
+    refresh_repository : callable
+        If given, called without arguments to get the up to date upstream
+        repository when the index is requested, at most once every
+        refresh_interval seconds. The previous index is kept if it fails.
+    refresh_interval : float
+        See refresh_repository.
+    """
+    def __init__(self, downloader, repository,
+                 address=(DEFAULT_HOST, DEFAULT_PORT),
+                 max_workers=DEFAULT_MAX_WORKERS, refresh_repository=None,
+                 refresh_interval=DEFAULT_REFRESH_INTERVAL):
+        self._downloader = downloader
+
+        self._index = _ServedIndex(repository)
+        self._refresh_repository = refresh_repository
+        self._refresh_interval = refresh_interval
+        self._refreshed_at = time.time()
+        self._refresh_lock = threading.Lock()
+
+        self._fetch_locks = {}
+        self._fetch_locks_lock = threading.Lock()
+
+        self._httpd = _ThreadPoolHTTPServer(address, _CacheRequestHandler,
+                                            max_workers)
+        self._httpd.cache_server = self
+
+    @property
+    def server_address(self):
+        return self._httpd.server_address
+
+    @property
+    def index_data(self):
+        return self._index.data
+
+    @property
+    def index_etag(self):
+        return self._index.etag
+
+    def _needs_refresh(self):
+        return (self._refresh_repository is not None and
+                time.time() - self._refreshed_at >= self._refresh_interval)
+
+    def _refresh(self):
+        try:
+            repository = self._refresh_repository()
+        except requests.exceptions.RequestException as e:
+            logger.warn("Could not refresh the index, serving the previous "
+                        "one: %r", e)
+        else:
+            index = _ServedIndex(repository)
+            if index.etag != self._index.etag:
+                logger.info("Upstream index changed, now serving %d eggs",
+                            len(index.packages))
+                self._index = index
+        finally:
+            self._refreshed_at = time.time()
+
+    def index(self):
+        """ Returns the served index, refreshed from upstream first if it is
+        due (see refresh_repository)."""
+        if self._needs_refresh():
+            with self._refresh_lock:
+                # Only one of the concurrent requests refreshes it
+                if self._needs_refresh():
+                    self._refresh()
+        return self._index
+
+    def _fetch_lock(self, key):
+        with self._fetch_locks_lock:
+            return self._fetch_locks.setdefault(key, threading.Lock())
+
+    def __contains__(self, key):
+        return key in self._index.packages
+
+    def fetch(self, key):
+        """ Returns the path of the cached egg with the given filename (which
+        must be in the index), fetching it from upstream first if needed.
+        """
+        package = self._index.packages[key]
+        with self._fetch_lock(key):
+            self._downloader.fetch(package)
+        return os.path.join(self._downloader.cache_directory, key)
+
+    def serve_forever(self):
+        """ Handle requests until shutdown is called."""
+        self._httpd.serve_forever()
+
+    def shutdown(self):
+        """ Stop serve_forever (must be called from another thread)."""
+        self._httpd.shutdown()
+
+    def close(self):
+        """ Stop listening, and wait for the requests being handled."""
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *a):
+        self.close()
@@ -0,0 +1,143 @@
+"""
+A persistent database of the checksums of cached eggs.
+
+Checking a cached egg against its expected md5 requires hashing the whole
+file. The database remembers the md5 of each file together with its size,
+mtime and inode, and the md5 is reused as long as none of those changed.
+Entries are recorded for free when downloading eggs, as the md5 is computed
+while writing them anyway.
+"""
+from __future__ import absolute_import
+
+import contextlib
+import logging
+import os.path
+import sqlite3
+
+from concurrent.futures import ThreadPoolExecutor
+
+from egginst.utils import compute_md5
+
+
+logger = logging.getLogger(__name__)
+
+CHECKSUM_DB_FILENAME = "_checksums.db"
+
+_DEFAULT_MAX_WORKERS = 4
+
+_CREATE_TABLE = """\
+CREATE TABLE IF NOT EXISTS checksums (
+    path TEXT PRIMARY KEY,
+    size INTEGER,
+    mtime REAL,
+    inode INTEGER,
+    md5 TEXT
+)"""
+
+
+def _stat_key(path):
+    st = os.stat(path)
+    return st.st_size, st.st_mtime, st.st_ino
+
+
+def _hash(path):
+    # The file is stat'ed first: if it changes while being hashed, the
+    # recorded entry will not match anymore.
+    key = _stat_key(path)
+    return path, key, compute_md5(path)
+
+
+class ChecksumDatabase(object):
+    """ A sqlite database of file checksums.
+
+    Failing to read or write the database is not an error: checksums are
+    then computed from the files.
+
+    Parameters
+    ----------
+    path : str
+        The path of the database (created if needed).
+    """
+    @classmethod
+    def from_directory(cls, directory):
+        """ Create the database for the files of the given directory."""
+        return cls(os.path.join(directory, CHECKSUM_DB_FILENAME))
+
+    def __init__(self, path):
+        self.path = path
+
+    @contextlib.contextmanager
+    def _connection(self):
+        # One connection per operation, so that the database may be used
+        # from several threads (and processes).
+        connection = sqlite3.connect(self.path)
+        try:
+            with connection:
+                connection.execute(_CREATE_TABLE)
+                yield connection
+        finally:
+            connection.close()
+
+    def _record_many(self, entries):
+        rows = [(os.path.abspath(path), size, mtime, inode, md5)
+                for path, (size, mtime, inode), md5 in entries]
+        try:
+            with self._connection() as connection:
+                connection.executemany(
+                    "INSERT OR REPLACE INTO checksums VALUES (?, ?, ?, ?, ?)",
+                    rows
+                )
+        except sqlite3.Error as e:
+            logger.warn("Could not write checksum database: %r", e)
+
+    def lookup(self, path):
+        """ Returns the recorded md5 of the given file, or None if unknown
+        or if the file changed since it was recorded."""
+        try:
+            key = _stat_key(path)
+        except OSError:
+            return None
+
+        try:
+            with self._connection() as connection:
+                row = connection.execute(
+                    "SELECT size, mtime, inode, md5 FROM checksums "
+                    "WHERE path = ?", (os.path.abspath(path),)
+                ).fetchone()
+        except sqlite3.Error as e:
+            logger.warn("Could not read checksum database: %r", e)
+            return None
+
+        if row is None or tuple(row[:3]) != key:
+            return None
+        else:
+            return row[3]
+
+    def record(self, path, md5):
+        """ Record the md5 of the given file, which must not have changed
+        since the md5 was computed."""
+        try:
+            key = _stat_key(path)
+        except OSError:
+            return
+        self._record_many([(path, key, md5)])
+
+    def md5(self, path):
+        """ Returns the md5 of the given file, only hashing it if it is not
+        recorded yet."""
+        md5 = self.lookup(path)
+        if md5 is None:
+            entry = _hash(path)
+            self._record_many([entry])
+            md5 = entry[2]
+        return md5
+
+    def verify(self, paths, max_workers=_DEFAULT_MAX_WORKERS):
+        """ Re-hash the given files in parallel, ignoring any recorded md5.
+
+        Returns a path -> md5 dictionary, and records every md5.
+        """
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            entries = list(executor.map(_hash, paths))
+        self._record_many(entries)
+        return dict((path, md5) for path, _, md5 in entries)
@@ -1,18 +1,67 @@
 from __future__ import absolute_import, print_function
 
 import datetime
+import os.path
 import sys
 import textwrap
 
+from egginst.utils import human_bytes
+
 from enstaller.auth import UserInfo
-from enstaller.errors import NotInstalledPackage
+from enstaller.cache_server import CacheServer
+from enstaller.egg_cache import EggCache, pinned_eggs
+from enstaller.egg_store import SharedEggStore
+from enstaller.errors import (MissingDependency, NoPackageFound,
+                              NotInstalledPackage)
 from enstaller.freeze import get_freeze_list
 from enstaller.history import History
+from enstaller.package import egg_name_to_name_version
+from enstaller.prefetch import prefetch, resolve_requirements
 from enstaller.repository import Repository
 from enstaller.solver import ForceMode, Request, SolverMode
 
-from .utils import (FMT, FMT4, install_req, install_time_string,
-                    name_egg, print_installed, updates_check)
+from .utils import (FMT, FMT4, _notify_unavailable_package, install_req,
+                    install_reqs, install_time_string, name_egg,
+                    print_installed, updates_check)
+
+
+def cache_gc(cache_directory, prefixes, max_size=None, shared_egg_store=None):
+    """ Remove the least recently used eggs of the download cache until it
+    fits in max_size bytes (every egg if None), keeping the eggs referenced
+    by the last history revisions of the given prefixes.
+
+    If shared_egg_store is given, the eggs of that store not linked from any
+    download cache anymore are removed as well."""
+    egg_cache = EggCache(cache_directory, max_size)
+    removed = egg_cache.collect(pinned_eggs(prefixes))
+    for egg in removed:
+        print("Removed {0}".format(egg.filename))
+    print("Reclaimed {0} ({1} remaining)".format(
+        human_bytes(sum(egg.size for egg in removed)),
+        human_bytes(egg_cache.size)))
+
+    if shared_egg_store is not None:
+        removed = SharedEggStore(shared_egg_store).collect()
+        print("Reclaimed {0} from the shared egg store".format(
+            human_bytes(sum(size for _, size in removed))))
+
+
+def serve_cache(remote_repository, downloader, address,
+                refresh_repository=None):
+    """ Serve the download cache over HTTP at the given (host, port) address,
+    until interrupted.
+
+    refresh_repository is called to rebuild the served index from upstream
+    (see CacheServer)."""
+    with CacheServer(downloader, remote_repository, address,
+                     refresh_repository=refresh_repository) as server:
+        host, port = server.server_address
+        print("Serving {0} at http://{1}:{2}/ (Ctrl-C to stop)".format(
+            downloader.cache_directory, address[0] or host, port))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
 
 
 def env_option(prefixes):
@@ -88,6 +137,56 @@ def install_from_requirements(enpkg, config, requirements_file,
             )
 
 
+def prefetch_reqs(enpkg, config, reqs, solver_mode=SolverMode.RECUR):
+    """ Resolve the given requirements together, and fetch every egg needed
+    to install them into the download cache, without installing anything.
+    """
+    # Unix exit-status codes
+    FAILURE = 1
+
+    try:
+        packages = resolve_requirements(enpkg._remote_repository, reqs,
+                                        solver_mode)
+    except NoPackageFound as e:
+        print(str(e))
+        sys.exit(FAILURE)
+    except MissingDependency as e:
+        print("One of the requested package has broken dependencies")
+        print("(Dependency solving error: {0})".format(e))
+        sys.exit(FAILURE)
+
+    if not all(package.available for package in packages):
+        _notify_unavailable_package(
+            config, ", ".join(str(req) for req in reqs), enpkg._session
+        )
+        sys.exit(FAILURE)
+
+    def _on_fetched(package, size):
+        if size > 0:
+            print("Fetched {0} ({1})".format(package.key, human_bytes(size)))
+        else:
+            print("{0} already in the cache".format(package.key))
+
+    stats = prefetch(enpkg._downloader, packages,
+                     enpkg.max_concurrent_fetches, enpkg.max_retries,
+                     _on_fetched)
+    print("{0} eggs in {1}: {2} fetched ({3} in {4:.1f}s, {5}/s), "
+          "{6} already cached".format(
+              stats.packages, enpkg._downloader.cache_directory,
+              stats.fetched, human_bytes(stats.size), stats.elapsed,
+              human_bytes(int(stats.throughput)), stats.cached))
+
+
+def prefetch_from_requirements(enpkg, config, requirements_file):
+    """ Fetch the eggs needed to install the requirements of the given
+    requirements file (see install_from_requirements), without installing
+    anything.
+    """
+    with open(requirements_file, "r") as fp:
+        reqs = [req.strip() for req in fp if req.strip()]
+    prefetch_reqs(enpkg, config, reqs, SolverMode.ROOT)
+
+
 def list_option(prefixes, pat=None):
     """ List the installed packages in the given prefixes. """
     for prefix in reversed(prefixes):
@@ -143,18 +242,20 @@ def search(remote_repository, installed_repository, config, session, pat=None):
     print(FMT4 % ('Name', '  Versions', 'Product', 'Note'))
     print(80 * '=')
 
-    names = {}
-    for metadata in remote_repository.iter_packages():
-        names[metadata.name] = metadata.name
+    # Only the packages of the matching names are created for lazy
+    # repositories
+    if pat:
+        names = remote_repository.search_names(pat)
+    else:
+        names = sorted(remote_repository.iter_names(),
+                       key=lambda s: s.lower())
 
     installed = {}
     for package in installed_repository.iter_packages():
         installed[package.name] = package.full_version
 
-    for name in sorted(names, key=lambda s: s.lower()):
-        if pat and not pat.search(name):
-            continue
-        disp_name = names[name]
+    for name in names:
+        disp_name = name
         installed_version = installed.get(name)
         for metadata in remote_repository.find_packages(name):
             version = metadata.full_version
@@ -210,9 +311,41 @@ def update_all(enpkg, config, solver_mode=SolverMode.RECUR,
                 print(FMT % (update['current'].name,
                              update['current'].full_version,
                              update['update'].full_version))
+            # All the updates are resolved and executed together, so that
+            # shared dependencies are handled once.
+            names = []
             for update in updates:
-                install_req(enpkg, config, update['current'].name, solver_mode,
-                            force_mode, always_yes)
+                if update['current'].name not in names:
+                    names.append(update['current'].name)
+            install_reqs(enpkg, config, names, solver_mode, force_mode,
+                         always_yes)
+
+
+def verify_cache(remote_repository, downloader):
+    """ Re-hash every cached egg, and remove the ones whose md5 does not match
+    the remote repository metadata."""
+    cache_directory = downloader.cache_directory
+    paths = sorted(os.path.join(cache_directory, filename)
+                   for filename in os.listdir(cache_directory)
+                   if filename.endswith(".egg"))
+    md5s = downloader.checksums.verify(paths)
+
+    n_invalid = 0
+    for path in paths:
+        key = os.path.basename(path)
+        name, version = egg_name_to_name_version(key)
+        expected_md5s = set(
+            package.md5
+            for package in remote_repository.find_packages(name, version)
+            if package.key == key
+        )
+        if expected_md5s and md5s[path] not in expected_md5s:
+            print("Invalid md5 for {0}: removed".format(key))
+            os.unlink(path)
+            n_invalid += 1
+
+    print("{0} cached eggs verified, {1} invalid".format(len(paths),
+                                                         n_invalid))
 
 
 def whats_new(remote_repository, installed_repository):
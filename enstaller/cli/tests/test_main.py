@@ -13,6 +13,8 @@ from egginst._compat import assertCountEqual
 from egginst.tests.common import mkdtemp
 
 from enstaller.config import Configuration
+from enstaller.egg_store import SharedEggStore
+from enstaller.prefetch import PrefetchStats
 from enstaller.solver import ForceMode, SolverMode
 from enstaller.tests.common import (FAKE_MD5, FAKE_SIZE,
                                     create_prefix_with_eggs,
@@ -22,8 +24,9 @@ from enstaller.tests.common import (FAKE_MD5, FAKE_SIZE,
                                     mock_print)
 from enstaller.utils import PY_VER
 
-from ..commands import (info_option, install_from_requirements, update_all,
-                        whats_new)
+from ..commands import (cache_gc, info_option, install_from_requirements,
+                        prefetch_from_requirements, prefetch_reqs,
+                        update_all, verify_cache, whats_new)
 
 if sys.version_info[0] == 2:
     import unittest2 as unittest
@@ -194,16 +197,21 @@ class TestUpdatesCheck(unittest.TestCase):
         ]
 
         with mkdtemp() as d:
-            enpkg = create_prefix_with_eggs(config, d, installed_entries, remote_entries)
-            with mock.patch("enstaller.cli.commands.install_req") as mocked_install_req:
+            enpkg = create_prefix_with_eggs(config, d, installed_entries,
+                                            remote_entries)
+            with mock.patch("enstaller.cli.commands.install_reqs") \
+                    as mocked_install_reqs:
                 with mock_print() as m:
                     update_all(enpkg, config)
                     self.assertMultiLineEqual(m.value, r_output)
-                    self.assertTrue(mocked_install_req.called)
+                    mocked_install_reqs.assert_called_once_with(
+                        enpkg, config, ["scipy"], SolverMode.RECUR,
+                        ForceMode.NONE, False)
 
     def test_update_all_epd_updates(self):
-        r_output = textwrap.dedent("""\
-        EPD 7.3-2 is available. To update to it (with confirmation warning), run 'enpkg epd'.
+        r_output = ("EPD 7.3-2 is available. To update to it (with "
+                    "confirmation warning), run 'enpkg epd'.\n")
+        r_output += textwrap.dedent("""\
         The following updates and their dependencies will be installed
         Name                 installed            available
         ============================================================
@@ -223,12 +231,117 @@ class TestUpdatesCheck(unittest.TestCase):
         ]
 
         with mkdtemp() as d:
-            enpkg = create_prefix_with_eggs(config, d, installed_entries, remote_entries)
-            with mock.patch("enstaller.cli.commands.install_req") as mocked_install_req:
+            enpkg = create_prefix_with_eggs(config, d, installed_entries,
+                                            remote_entries)
+            with mock.patch("enstaller.cli.commands.install_reqs") \
+                    as mocked_install_reqs:
                 with mock_print() as m:
                     update_all(enpkg, config)
                     self.assertMultiLineEqual(m.value, r_output)
-                    self.assertTrue(mocked_install_req.called)
+                    mocked_install_reqs.assert_called_once_with(
+                        enpkg, config, ["scipy"], SolverMode.RECUR,
+                        ForceMode.NONE, False)
+
+
+class TestCacheGC(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.prefix = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+        shutil.rmtree(self.prefix)
+
+    def test_simple(self):
+        # Given
+        for filename in ("numpy-1.8.0-1.egg", "scipy-0.14.0-1.egg"):
+            with open(os.path.join(self.tempdir, filename), "wb") as fp:
+                fp.write(b"a" * 2048)
+
+        r_output = textwrap.dedent("""\
+        Removed scipy-0.14.0-1.egg
+        Reclaimed 2 KB (2 KB remaining)
+        """)
+
+        # When
+        with mock.patch("enstaller.cli.commands.pinned_eggs",
+                        return_value=set(["numpy-1.8.0-1.egg"])):
+            with mock_print() as m:
+                cache_gc(self.tempdir, [self.prefix])
+
+        # Then
+        self.assertMultiLineEqual(m.value, r_output)
+        self.assertEqual([name for name in os.listdir(self.tempdir)
+                          if name.endswith(".egg")],
+                         ["numpy-1.8.0-1.egg"])
+
+    def test_shared_egg_store(self):
+        # Given
+        store = SharedEggStore(os.path.join(self.tempdir, "store"))
+        path = os.path.join(self.tempdir, "numpy-1.8.0-1.egg")
+        with open(path, "wb") as fp:
+            fp.write(b"a" * 2048)
+        store.add(path, FAKE_MD5)
+
+        r_output = textwrap.dedent("""\
+        Removed numpy-1.8.0-1.egg
+        Reclaimed 2 KB (0 B remaining)
+        Reclaimed 2 KB from the shared egg store
+        """)
+
+        # When
+        with mock.patch("enstaller.cli.commands.pinned_eggs",
+                        return_value=set()):
+            with mock_print() as m:
+                cache_gc(self.tempdir, [self.prefix],
+                         shared_egg_store=store.directory)
+
+        # Then
+        self.assertMultiLineEqual(m.value, r_output)
+        self.assertFalse(FAKE_MD5 in store)
+
+
+class TestVerifyCache(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_simple(self):
+        # Given
+        entries = [
+            dummy_repository_package_factory("numpy", "1.8.0", 1),
+            dummy_repository_package_factory("scipy", "0.14.0", 1),
+        ]
+        remote_repository, _ = create_repositories(remote_entries=entries)
+
+        md5s = {}
+        for filename in ("numpy-1.8.0-1.egg", "scipy-0.14.0-1.egg",
+                         "unknown-1.0.0-1.egg"):
+            path = os.path.join(self.tempdir, filename)
+            with open(path, "wb") as fp:
+                fp.write(b"data")
+            md5s[path] = FAKE_MD5 if filename.startswith("numpy") \
+                else "b" * 32
+
+        downloader = mock.Mock()
+        downloader.cache_directory = self.tempdir
+        downloader.checksums.verify.return_value = md5s
+
+        r_output = textwrap.dedent("""\
+        Invalid md5 for scipy-0.14.0-1.egg: removed
+        3 cached eggs verified, 1 invalid
+        """)
+
+        # When
+        with mock_print() as m:
+            verify_cache(remote_repository, downloader)
+
+        # Then
+        self.assertMultiLineEqual(m.value, r_output)
+        assertCountEqual(self, os.listdir(self.tempdir),
+                         ["numpy-1.8.0-1.egg", "unknown-1.0.0-1.egg"])
 
 
 class TestInstallFromRequirements(unittest.TestCase):
@@ -264,3 +377,75 @@ class TestInstallFromRequirements(unittest.TestCase):
                        ForceMode.NONE, False),
              mock.call(enpkg, config, "nose 1.2.1-1", SolverMode.ROOT,
                        ForceMode.NONE, False)])
+
+
+class TestPrefetch(unittest.TestCase):
+    def setUp(self):
+        self.prefix = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.prefix)
+
+    def test_prefetch_reqs(self):
+        # Given
+        remote_entries = [
+            dummy_repository_package_factory("mkl", "10.3", 1),
+            dummy_repository_package_factory("numpy", "1.8.0", 1,
+                                             dependencies=["MKL 10.3-1"]),
+        ]
+        config = Configuration()
+        config.update(repository_cache=self.prefix)
+        enpkg = create_prefix_with_eggs(config, self.prefix, [],
+                                        remote_entries)
+
+        def _prefetch(downloader, packages, max_workers, max_retries,
+                      on_fetched):
+            on_fetched(packages[0], 0)
+            on_fetched(packages[1], 2048)
+            return PrefetchStats(2, 1, 2048, 2.0)
+
+        # When
+        with mock_print() as m:
+            with mock.patch("enstaller.cli.commands.prefetch",
+                            side_effect=_prefetch) as mocked_prefetch:
+                prefetch_reqs(enpkg, config, ["numpy"])
+
+        # Then
+        packages = mocked_prefetch.call_args[0][1]
+        self.assertEqual([package.key for package in packages],
+                         ["mkl-10.3-1.egg", "numpy-1.8.0-1.egg"])
+        self.assertMultiLineEqual(m.value, textwrap.dedent("""\
+            mkl-10.3-1.egg already in the cache
+            Fetched numpy-1.8.0-1.egg (2 KB)
+            2 eggs in {0}: 1 fetched (2 KB in 2.0s, 1 KB/s), 1 already cached
+        """.format(enpkg._downloader.cache_directory)))
+
+    def test_prefetch_reqs_missing(self):
+        # Given
+        config = Configuration()
+        enpkg = create_prefix_with_eggs(config, self.prefix, [], [])
+
+        # When/Then
+        with mock_print():
+            with mock.patch("enstaller.cli.commands.prefetch") as \
+                    mocked_prefetch:
+                with self.assertRaises(SystemExit):
+                    prefetch_reqs(enpkg, config, ["numpy"])
+        self.assertFalse(mocked_prefetch.called)
+
+    def test_prefetch_from_requirements(self):
+        # Given
+        requirements_file = os.path.join(self.prefix, "requirements.txt")
+        with open(requirements_file, "w") as fp:
+            fp.write("numpy 1.8.0-1\n\nnose 1.2.1-1\n")
+        config = Configuration()
+        enpkg = create_prefix_with_eggs(config, self.prefix, [], [])
+
+        # When
+        with mock.patch("enstaller.cli.commands.prefetch_reqs") as m:
+            prefetch_from_requirements(enpkg, config, requirements_file)
+
+        # Then
+        m.assert_called_once_with(enpkg, config,
+                                  ["numpy 1.8.0-1", "nose 1.2.1-1"],
+                                  SolverMode.ROOT)
@@ -1,10 +1,13 @@
 from __future__ import absolute_import
 
+import json
+import os.path
 import re
 import shutil
 import sys
 import tempfile
 import textwrap
+import time
 
 import mock
 import requests
@@ -12,11 +15,16 @@ import responses
 
 from egginst._compat import assertCountEqual
 from egginst.main import EggInst
+from egginst.testing_utils import slow
 from egginst.tests.common import DUMMY_EGG, mkdtemp
 
 from enstaller.config import Configuration
+from enstaller.compat import OrderedDict
 from enstaller.enpkg import Enpkg
+from enstaller.index_delta import INDEX_DELTA_IM, compute_index_delta
 from enstaller.repository import Repository
+from enstaller.repository_info import (MirroredRepositoryInfo,
+                                       OldstyleRepositoryInfo)
 from enstaller.session import Session
 from enstaller.tests.common import (DummyAuthenticator,
                                     create_prefix_with_eggs,
@@ -27,7 +35,7 @@ from enstaller.tests.common import (DummyAuthenticator,
 from enstaller.utils import PY_VER
 from enstaller.versions import EnpkgVersion
 
-from ..utils import (exit_if_root_on_non_owned, install_req,
+from ..utils import (exit_if_root_on_non_owned, install_req, install_reqs,
                      install_time_string, name_egg, print_installed,
                      repository_factory, updates_check)
 from ..utils import _print_warning
@@ -145,6 +153,398 @@ class TestRepositoryFactory(unittest.TestCase):
             repository_factory(session, config.repositories,
                                raise_on_error=True)
 
+    def _index_factory(self, n):
+        index = {}
+        for i in range(n):
+            name = "package{0}".format(i % (n // 10 or 1))
+            key = "{0}-1.0.{1}-1.egg".format(name, i)
+            index[key] = {
+                "available": True, "build": 1, "md5": "a" * 32,
+                "mtime": 0.0, "name": name, "packages": ["MKL 10.3-1"],
+                "product": "free", "python": PY_VER, "size": 1,
+                "type": "egg", "version": "1.0.{0}".format(i),
+            }
+        return index
+
+    def _mock_index_with_etag(self, repository_info, index, etag):
+        responses.reset()
+        responses.add(responses.GET, repository_info.index_url,
+                      body=json.dumps(index),
+                      adding_headers={"ETag": etag})
+
+    @responses.activate
+    def test_mirrored_index_failover(self):
+        # Given
+        mirrors = [OldstyleRepositoryInfo("http://a.acme.com/eggs/"),
+                   OldstyleRepositoryInfo("http://b.acme.com/eggs/")]
+        repository_info = MirroredRepositoryInfo(mirrors)
+        index = self._index_factory(20)
+        responses.add(responses.GET, mirrors[0].index_url, status=500)
+        responses.add(responses.GET, mirrors[1].index_url,
+                      body=json.dumps(index))
+
+        session = mocked_session_factory(self.tempdir)
+
+        # When
+        repository = repository_factory(session, [repository_info],
+                                        quiet=True)
+
+        # Then
+        self.assertEqual(len(repository), 20)
+        self.assertEqual(
+            repository.find_packages("package0")[0].repository_info,
+            repository_info
+        )
+        # The failing mirror is not tried first anymore
+        self.assertEqual(repository_info.stats.rank(mirrors),
+                         [mirrors[1], mirrors[0]])
+
+        # Given
+        responses.reset()
+        for mirror in mirrors:
+            responses.add(responses.GET, mirror.index_url, status=500)
+
+        # When/Then
+        with self.assertRaises(requests.exceptions.HTTPError):
+            repository_factory(session, [repository_info], quiet=True)
+
+    @responses.activate
+    def test_index_snapshot(self):
+        # Given
+        config = Configuration(store_url="https://acme.com",
+                               use_webservice=False)
+        config.set_repositories_from_names(["enthought/free"])
+        repository_info = config.repositories[0]
+        index = self._index_factory(20)
+        self._mock_index_with_etag(repository_info, index, '"etag1"')
+
+        session = mocked_session_factory(self.tempdir)
+        r_repository = repository_factory(session, config.repositories,
+                                          quiet=True)
+
+        # When
+        with mock.patch("enstaller.repository.parse_index") as parse_index:
+            repository = repository_factory(session, config.repositories,
+                                            quiet=True)
+
+        # Then
+        self.assertFalse(parse_index.called)
+        self.assertEqual(list(repository.iter_packages()),
+                         list(r_repository.iter_packages()))
+
+        # Given
+        del index[sorted(index)[0]]
+        self._mock_index_with_etag(repository_info, index, '"etag2"')
+
+        # When
+        repository = repository_factory(session, config.repositories,
+                                        quiet=True)
+
+        # Then
+        self.assertEqual(len(repository), len(r_repository) - 1)
+
+    @responses.activate
+    def test_index_snapshot_disabled(self):
+        # Given
+        config = Configuration(store_url="https://acme.com",
+                               use_webservice=False)
+        config.set_repositories_from_names(["enthought/free"])
+        self._mock_index_with_etag(config.repositories[0],
+                                   self._index_factory(20), '"etag1"')
+
+        session = mocked_session_factory(self.tempdir)
+        repository_factory(session, config.repositories, quiet=True,
+                           use_snapshots=False)
+
+        # When/Then
+        self.assertFalse(
+            os.path.exists(os.path.join(self.tempdir, "index_cache",
+                                        "snapshots"))
+        )
+
+    @responses.activate
+    def test_streaming(self):
+        # Given
+        config = Configuration(store_url="https://acme.com",
+                               use_webservice=False)
+        config.set_repositories_from_names(["enthought/free"])
+        index = self._index_factory(20)
+        index["MKL-10.3-1.egg"] = {
+            "available": True, "build": 1, "md5": "a" * 32, "mtime": 0.0,
+            "name": "mkl", "packages": [], "product": "free", "python": None,
+            "size": 1, "type": "egg", "version": "10.3",
+        }
+        self._mock_index_with_etag(config.repositories[0], index, '"etag1"')
+
+        session = mocked_session_factory(self.tempdir)
+        r_repository = repository_factory(session, config.repositories,
+                                          quiet=True, use_snapshots=False)
+
+        # When
+        repository = repository_factory(session, config.repositories,
+                                        quiet=True, use_snapshots=False,
+                                        streaming=True)
+
+        # Then
+        self.assertEqual(len(repository), 21)
+        for name in set(entry["name"] for entry in index.values()):
+            self.assertEqual(repository.find_packages(name),
+                             r_repository.find_packages(name))
+        self.assertEqual(
+            repository.find_packages("package0")[0].dependencies,
+            frozenset(["mkl 10.3-1"])
+        )
+
+    @responses.activate
+    def test_streaming_snapshot(self):
+        # Given
+        config = Configuration(store_url="https://acme.com",
+                               use_webservice=False)
+        config.set_repositories_from_names(["enthought/free"])
+        repository_info = config.repositories[0]
+        index = self._index_factory(20)
+        requests = self._mock_index_with_deltas(repository_info,
+                                                {'"etag1"': index})
+
+        session = mocked_session_factory(self.tempdir)
+
+        # When
+        r_repository = repository_factory(session, config.repositories,
+                                          quiet=True, streaming=True,
+                                          use_deltas=False)
+        with mock.patch("enstaller.index_fetch.parse_index_items") as parse:
+            repository = repository_factory(session, config.repositories,
+                                            quiet=True, streaming=True,
+                                            use_deltas=False)
+
+        # Then
+        # The etag cache is bypassed, the snapshot is revalidated instead
+        self.assertFalse(parse.called)
+        self.assertEqual(len(requests), 2)
+        for request in requests:
+            self.assertEqual(request.headers["Cache-Control"], "no-store")
+        self.assertNotIn("If-None-Match", requests[0].headers)
+        self.assertEqual(requests[1].headers["If-None-Match"], '"etag1"')
+        self.assertEqual(list(repository.iter_packages()),
+                         list(r_repository.iter_packages()))
+
+    def _mock_index_with_deltas(self, repository_info, indices,
+                                supports_deltas=True):
+        """ Serve the last of the given etag -> index mapping, with deltas
+        against the older ones."""
+        etags = list(indices)
+        current_etag = etags[-1]
+        requests = []
+
+        def callback(request):
+            requests.append(request)
+            base_etag = request.headers.get("If-None-Match")
+            if base_etag == current_etag:
+                return (304, {"ETag": current_etag}, "")
+            elif (supports_deltas and base_etag in indices
+                  and request.headers.get("A-IM") == INDEX_DELTA_IM):
+                delta = compute_index_delta(indices[base_etag],
+                                            indices[current_etag])
+                headers = {"ETag": current_etag, "IM": INDEX_DELTA_IM}
+                return (226, headers, json.dumps(delta))
+            else:
+                return (200, {"ETag": current_etag},
+                        json.dumps(indices[current_etag]))
+
+        responses.reset()
+        responses.add_callback(responses.GET, repository_info.index_url,
+                               callback)
+        return requests
+
+    def _copy_index(self, index):
+        return dict((key, dict(value)) for key, value in index.items())
+
+    @responses.activate
+    def test_index_delta(self):
+        # Given
+        config = Configuration(store_url="https://acme.com",
+                               use_webservice=False)
+        config.set_repositories_from_names(["enthought/free"])
+        repository_info = config.repositories[0]
+        old_index = self._index_factory(20)
+        new_index = self._copy_index(old_index)
+        del new_index["package0-1.0.0-1.egg"]
+        new_index["package0-1.0.20-1.egg"] = dict(
+            new_index["package0-1.0.10-1.egg"], version="1.0.20"
+        )
+
+        session = mocked_session_factory(self.tempdir)
+        self._mock_index_with_deltas(repository_info,
+                                     {'"etag1"': old_index})
+        repository_factory(session, config.repositories, quiet=True)
+
+        requests = self._mock_index_with_deltas(
+            repository_info,
+            OrderedDict([('"etag1"', old_index), ('"etag2"', new_index)])
+        )
+        r_repository = Repository.from_index(self._copy_index(new_index),
+                                             repository_info)
+
+        # When
+        with mock.patch("enstaller.repository.parse_index") as parse_index:
+            repository = repository_factory(session, config.repositories,
+                                            quiet=True)
+
+        # Then
+        self.assertFalse(parse_index.called)
+        self.assertEqual(len(requests), 1)
+        self.assertEqual(requests[0].headers["If-None-Match"], '"etag1"')
+        self.assertEqual(len(repository), 20)
+        for name in ("package0", "package1"):
+            self.assertEqual(repository.find_packages(name),
+                             r_repository.find_packages(name))
+
+        # When
+        with mock.patch("enstaller.repository.parse_index") as parse_index:
+            repository = repository_factory(session, config.repositories,
+                                            quiet=True)
+
+        # Then
+        self.assertFalse(parse_index.called)
+        self.assertEqual(len(requests), 2)
+        self.assertEqual(requests[1].headers["If-None-Match"], '"etag2"')
+        self.assertEqual(repository.find_packages("package0"),
+                         r_repository.find_packages("package0"))
+
+    @responses.activate
+    def test_index_delta_unsupported(self):
+        # Given
+        config = Configuration(store_url="https://acme.com",
+                               use_webservice=False)
+        config.set_repositories_from_names(["enthought/free"])
+        repository_info = config.repositories[0]
+        old_index = self._index_factory(20)
+        new_index = self._copy_index(old_index)
+        del new_index["package0-1.0.0-1.egg"]
+
+        session = mocked_session_factory(self.tempdir)
+        self._mock_index_with_deltas(repository_info,
+                                     {'"etag1"': old_index})
+        repository_factory(session, config.repositories, quiet=True)
+
+        requests = self._mock_index_with_deltas(
+            repository_info,
+            OrderedDict([('"etag1"', old_index), ('"etag2"', new_index)]),
+            supports_deltas=False
+        )
+
+        # When
+        repository = repository_factory(session, config.repositories,
+                                        quiet=True)
+
+        # Then
+        # The full index answered to the delta request is used as is
+        self.assertEqual(len(repository), 19)
+        self.assertEqual(len(requests), 1)
+        self.assertEqual(requests[0].headers["A-IM"], INDEX_DELTA_IM)
+
+    @responses.activate
+    def test_index_delta_unsupported_streaming(self):
+        # Given
+        config = Configuration(store_url="https://acme.com",
+                               use_webservice=False)
+        config.set_repositories_from_names(["enthought/free"])
+        repository_info = config.repositories[0]
+        old_index = self._index_factory(20)
+        new_index = self._copy_index(old_index)
+        del new_index["package0-1.0.0-1.egg"]
+
+        session = mocked_session_factory(self.tempdir)
+        self._mock_index_with_deltas(repository_info,
+                                     {'"etag1"': old_index})
+        repository_factory(session, config.repositories, quiet=True,
+                           streaming=True)
+
+        requests = self._mock_index_with_deltas(
+            repository_info,
+            OrderedDict([('"etag1"', old_index), ('"etag2"', new_index)]),
+            supports_deltas=False
+        )
+
+        # When
+        repository = repository_factory(session, config.repositories,
+                                        quiet=True, streaming=True)
+
+        # Then
+        self.assertEqual(len(repository), 19)
+        self.assertEqual(len(requests), 1)
+        self.assertEqual(requests[0].headers["A-IM"], INDEX_DELTA_IM)
+        self.assertEqual(requests[0].headers["Cache-Control"], "no-store")
+
+        # When
+        with mock.patch("enstaller.index_fetch.parse_index_items") as parse:
+            repository = repository_factory(session, config.repositories,
+                                            quiet=True, streaming=True)
+
+        # Then
+        self.assertFalse(parse.called)
+        self.assertEqual(len(repository), 19)
+
+    @responses.activate
+    def test_deterministic_merge(self):
+        # Given
+        config = Configuration(store_url="https://acme.com",
+                               use_webservice=False)
+        config.set_repositories_from_names(["enthought/free",
+                                            "enthought/commercial"])
+        for repository_info in config.repositories:
+            responses.add(responses.GET, repository_info.index_url,
+                          body=json.dumps(self._index_factory(20)))
+        session = mocked_session_factory(self.tempdir)
+
+        def _repository_factory(reverse):
+            def _as_completed(tasks):
+                return sorted(tasks, key=lambda task: tasks[task],
+                              reverse=reverse)
+
+            with mock.patch("enstaller.cli.utils.as_completed",
+                            _as_completed):
+                return repository_factory(session, config.repositories,
+                                          quiet=True, use_snapshots=False)
+
+        # When
+        repository = _repository_factory(False)
+        reversed_repository = _repository_factory(True)
+
+        # Then
+        self.assertEqual(len(repository), 40)
+        self.assertEqual(
+            [(p.key, p.repository_info) for p in repository],
+            [(p.key, p.repository_info) for p in reversed_repository]
+        )
+        self.assertEqual(
+            [p.repository_info for p in repository.find_packages("package0")],
+            [config.repositories[0], config.repositories[1]] * 10
+        )
+
+    @slow
+    @responses.activate
+    def test_index_snapshot_cold_vs_warm_timings(self):
+        # Given
+        config = Configuration(store_url="https://acme.com",
+                               use_webservice=False)
+        config.set_repositories_from_names(["enthought/free"])
+        self._mock_index_with_etag(config.repositories[0],
+                                   self._index_factory(20000), '"etag1"')
+
+        def _timed_repository_factory():
+            session = mocked_session_factory(self.tempdir)
+            t0 = time.time()
+            repository_factory(session, config.repositories, quiet=True)
+            return time.time() - t0
+
+        # When
+        cold = _timed_repository_factory()
+        warm = _timed_repository_factory()
+
+        # Then
+        self.assertLess(warm, cold)
+
 
 class TestInfoStrings(unittest.TestCase):
     def test_print_install_time(self):
@@ -334,6 +734,32 @@ class TestInstallReq(unittest.TestCase):
             install_req(enpkg, Configuration(), "nose")
             m.assert_called_with([('fetch', nose), ('install', nose)])
 
+    def test_install_reqs_shared_dependency(self):
+        # Given
+        mkl = dummy_repository_package_factory("mkl", "10.3", 1)
+        numpy = dummy_repository_package_factory("numpy", "1.8.0", 1,
+                                                 dependencies=["mkl 10.3-1"])
+        scipy = dummy_repository_package_factory("scipy", "0.14.0", 1,
+                                                 dependencies=["mkl 10.3-1"])
+        remote_entries = [mkl, numpy, scipy]
+
+        with mock.patch("enstaller.main.Enpkg.execute") as m:
+            enpkg = create_prefix_with_eggs(Configuration(), self.prefix, [],
+                                            remote_entries)
+
+            # When
+            install_reqs(enpkg, Configuration(), ["numpy", "scipy"])
+
+        # Then
+        m.assert_called_once_with(mock.ANY)
+        actions = m.call_args[0][0]
+        self.assertEqual(
+            sorted(actions, key=lambda action: (action[0], action[1].name)),
+            [("fetch", mkl), ("fetch", numpy), ("fetch", scipy),
+             ("install", mkl), ("install", numpy), ("install", scipy)]
+        )
+        self.assertEqual(actions[3:4], [("install", mkl)])
+
     def test_simple_non_existing_requirement(self):
         config = Configuration()
         r_error_string = "No egg found for requirement 'nono_le_petit_robot'.\n"
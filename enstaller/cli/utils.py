@@ -1,7 +1,6 @@
 from __future__ import absolute_import, print_function
 
 import errno
-import io
 import os
 import os.path
 import sys
@@ -16,12 +15,13 @@ from egginst._compat import urlparse
 from enstaller.auth import UserInfo
 from enstaller.egg_meta import split_eggname
 from enstaller.errors import MissingDependency, NoSuchPackage, NoPackageFound
-from enstaller.repository import Repository, parse_index
-from enstaller.requests_utils import _ResponseIterator
+from enstaller.index_cache import IndexSnapshotCache
+from enstaller.index_fetch import fetch_repository
+from enstaller.repository import Repository
 from enstaller.solver import (
     ForceMode, JobType, Request, Requirement, SolverMode
 )
-from enstaller.utils import decode_json_from_buffer, prompt_yes_no
+from enstaller.utils import prompt_yes_no
 
 
 FMT = '%-20s %-20s %s'
@@ -87,14 +87,27 @@ def install_req(enpkg, config, req, solver_mode=SolverMode.RECUR,
     """
     Try to execute the install actions.
     """
-    if isinstance(req, six.string_types):
-        req = Requirement.from_legacy_requirement_string(req)
-    assert isinstance(req, Requirement)
+    install_reqs(enpkg, config, [req], solver_mode, force_mode, always_yes)
+
+
+def install_reqs(enpkg, config, reqs, solver_mode=SolverMode.RECUR,
+                 force_mode=ForceMode.NONE, always_yes=False):
+    """
+    Try to execute the install actions for the given requirements, resolved
+    together as a single request: shared dependencies are only fetched and
+    installed once, and the whole operation is recorded as a single history
+    entry.
+    """
+    reqs = [Requirement.from_legacy_requirement_string(req)
+            if isinstance(req, six.string_types) else req
+            for req in reqs]
+    assert all(isinstance(req, Requirement) for req in reqs)
 
     # Unix exit-status codes
     FAILURE = 1
     request = Request()
-    request.install(req)
+    for req in reqs:
+        request.install(req)
 
     def _done(exit_status):
         sys.exit(exit_status)
@@ -164,15 +177,18 @@ def install_req(enpkg, config, req, solver_mode=SolverMode.RECUR,
         actions = [("fetch", egg) for egg in installed] + actions
 
         if _is_any_package_unavailable(enpkg._remote_repository, actions):
-            _notify_unavailable_package(config, req, enpkg._session)
+            _notify_unavailable_package(
+                config, ", ".join(str(req) for req in reqs), enpkg._session
+            )
             _done(FAILURE)
         if not pypi_asked:
             _ask_pypi_confirmation_from_actions(actions)
         enpkg.execute(actions)
         if len(actions) == 0:
-            print("No update necessary, %r is up-to-date." % req.name)
-            print(install_time_string(enpkg._installed_repository,
-                                      req.name))
+            for req in reqs:
+                print("No update necessary, %r is up-to-date." % req.name)
+                print(install_time_string(enpkg._installed_repository,
+                                          req.name))
     except NoPackageFound as e:
         print(str(e))
         _done(FAILURE)
@@ -201,13 +217,6 @@ def print_installed(repository, pat=None):
         print(FMT % (package.name, package.full_version, package.prefix))
 
 
-def _should_raise(resp, raise_on_error):
-    if not raise_on_error:
-        if resp.status_code in (403, 404):
-            return False
-    return True
-
-
 def _print_warning(msg, width=DEFAULT_TEXT_WIDTH):
     preambule = "Warning: "
     wrapper = textwrap.TextWrapper(initial_indent=preambule,
@@ -216,22 +225,6 @@ def _print_warning(msg, width=DEFAULT_TEXT_WIDTH):
     print(wrapper.fill(msg) + "\n")
 
 
-def _fetch_repository(session, repository_info, raise_on_error):
-    with session.etag():
-        resp = session.get(repository_info.index_url, stream=True)
-        if resp.status_code != 200:
-            if _should_raise(resp, raise_on_error):
-                resp.raise_for_status()
-            else:
-                return None
-        else:
-            data = io.BytesIO()
-            for chunk in _ResponseIterator(resp):
-                data.write(chunk)
-            json_data = decode_json_from_buffer(data.getvalue())
-            return Repository(parse_index(json_data, repository_info))
-
-
 def _print_unavailables_warning(unavailables):
     store_names = [repository_info.name for repository_info in unavailables]
     preambule = "Warning: "
@@ -261,30 +254,71 @@ def _write_and_flush(s, quiet):
 
 
 def repository_factory(session, repository_infos, quiet=False,
-                       raise_on_error=False):
-    unavailables = []
-    full_repository = Repository()
+                       raise_on_error=False, use_snapshots=True,
+                       streaming=False, use_deltas=True):
+    """ Create a repository from the indices of the given repository infos.
+
+    Indices are fetched concurrently, using etag caching.
+
+    Parameters
+    ----------
+    session : Session
+        The session to use to fetch the indices.
+    repository_infos : iterable
+        Iterable of IRepositoryInfo instances.
+    quiet : bool
+        If True, do not print anything.
+    raise_on_error : bool
+        If True, raise an error if any index could not be fetched. Otherwise,
+        missing indices are ignored (and a warning is printed).
+    use_snapshots : bool
+        If True (default), parsed indices are stored as snapshots in the
+        session's cache directory, and reused as long as the server reports
+        the index to be unchanged (same ETag).
+    streaming : bool
+        If True, indices are decoded and parsed incrementally as they are
+        downloaded, which bounds the memory needed to parse them. Packages
+        are then created eagerly (no lazy materialization). The etag cache
+        is not used for those indices, only their snapshots (if enabled).
+    use_deltas : bool
+        If True (default), and a snapshot of an index is available, ask the
+        server for a delta against that snapshot instead of the full index
+        (see enstaller.index_delta). Servers which do not support deltas
+        fall back to a full fetch. Only used if use_snapshots is True.
+    """
+    if use_snapshots:
+        snapshot_cache = IndexSnapshotCache.from_session(session)
+    else:
+        snapshot_cache = None
 
     _write_and_flush("Fetching indices: ", quiet)
 
+    repository_infos = list(repository_infos)
     with ThreadPoolExecutor(max_workers=4) as executor:
         tasks = {}
-        for repository_info in repository_infos:
-            task = executor.submit(_fetch_repository, session,
-                                   repository_info, raise_on_error)
-            tasks[task] = repository_info
-
+        for i, repository_info in enumerate(repository_infos):
+            task = executor.submit(fetch_repository, session,
+                                   repository_info, raise_on_error,
+                                   snapshot_cache, streaming, use_deltas)
+            tasks[task] = i
+
+        # Indices are merged once all of them are available, in the order
+        # of repository_infos, so that the result does not depend on the
+        # order in which they were fetched.
+        repositories = [None] * len(repository_infos)
         for task in as_completed(tasks):
-            repository_or_none = task.result()
-            if repository_or_none is None:
-                unavailables.append(tasks[task])
-            else:
-                for package in repository_or_none.iter_packages():
-                    full_repository.add_package(package)
+            repositories[tasks[task]] = task.result()
             _write_and_flush(".", quiet)
 
     _write_and_flush("\n\n", quiet)
 
+    unavailables = [repository_info for repository_info, repository
+                    in zip(repository_infos, repositories)
+                    if repository is None]
+    full_repository = Repository.merge(
+        repository for repository in repositories if repository is not None
+    )
+
     if len(unavailables) > 0 and not quiet:
         _print_unavailables_warning(unavailables)
     return full_repository
@@ -294,14 +328,33 @@ def name_egg(egg):
     return split_eggname(egg)[0]
 
 
+def latest_packages(remote_repository, names):
+    """ Returns the name -> latest remote package mapping for the given
+    names, in a single pass. Names without any remote package are not
+    included.
+    """
+    latest = {}
+    for name in names:
+        if name not in latest:
+            try:
+                latest[name] = remote_repository.find_latest_package(name)
+            except NoSuchPackage:
+                latest[name] = None
+    return dict((name, package) for name, package in latest.items()
+                if package is not None)
+
+
 def updates_check(remote_repository, installed_repository):
+    installed = list(installed_repository.iter_packages())
+    latest = latest_packages(remote_repository,
+                             (package.name for package in installed))
+
     updates = []
     EPD_update = []
-    for package in installed_repository.iter_packages():
-        av_metadatas = remote_repository.find_packages(package.name)
-        if len(av_metadatas) == 0:
+    for package in installed:
+        av_metadata = latest.get(package.name)
+        if av_metadata is None:
             continue
-        av_metadata = av_metadatas[-1]
         if av_metadata.version > package.version:
             if package.name == "epd":
                 EPD_update.append({'current': package, 'update': av_metadata})
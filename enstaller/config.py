@@ -13,6 +13,7 @@ import warnings
 from os.path import isfile, join
 
 import requests
+from requests.adapters import DEFAULT_POOLSIZE
 
 from egginst._compat import string_types, urlparse
 from egginst.utils import parse_assignments
@@ -25,9 +26,12 @@ from enstaller.config_templates import RC_DEFAULT_TEMPLATE, RC_TEMPLATE
 from enstaller.errors import (EnstallerException, InvalidConfiguration,
                               InvalidFormat)
 from enstaller.proxy_info import ProxyInfo
+from enstaller.requests_utils import (DEFAULT_INDEX_CACHE_MAX_ENTRIES,
+                                      DEFAULT_INDEX_CACHE_MAX_SIZE)
 from enstaller.repository_info import (BroodRepositoryInfo,
                                        CanopyRepositoryInfo,
                                        FSRepositoryInfo,
+                                       MirroredRepositoryInfo,
                                        OldstyleRepositoryInfo)
 from enstaller.utils import real_prefix, under_venv
 from enstaller.cli.utils import humanize_ssl_error_and_die
@@ -45,6 +49,8 @@ STORE_KIND_LEGACY = "legacy"
 STORE_KIND_BROOD = "brood"
 _BROOD_PREFIX = "brood+"
 
+_DEFAULT_MAX_CONCURRENT_FETCHES = 4
+
 
 def legacy_configuration_read_search_order():
     """
@@ -136,6 +142,24 @@ def _is_using_epd_username(filename_or_fp):
     return "EPD_username" in data and "EPD_auth" not in data
 
 
+def _parse_integer_option(name, raw_value, minimum, allow_none=False):
+    """ Returns the given option value as an integer, raising an
+    InvalidConfiguration if it is not an integer greater or equal to minimum.
+
+    None is returned as is if allow_none is True.
+    """
+    if raw_value is None and allow_none:
+        return None
+    try:
+        value = int(raw_value)
+    except (TypeError, ValueError):
+        value = None
+    if value is None or value < minimum:
+        msg = "Invalid value for {0!r}: {1!r}"
+        raise InvalidConfiguration(msg.format(name, raw_value))
+    return value
+
+
 def _create_error_message(fp, exc):
     pos = fp.tell()
     try:
@@ -260,17 +284,29 @@ class Configuration(object):
         self._store_kind = STORE_KIND_LEGACY
 
         self._repository_cache = None
+        self._repository_cache_max_size = None
+        self._shared_egg_store = None
+        self._index_cache_max_entries = DEFAULT_INDEX_CACHE_MAX_ENTRIES
+        self._connection_pool_size = DEFAULT_POOLSIZE
+        self._connection_pool_block = False
+        self._stream_indices = False
+        self._index_cache_max_size = DEFAULT_INDEX_CACHE_MAX_SIZE
 
         self._filename = None
         self._platform = plat.custom_plat
 
         self._max_retries = 0
+        self._max_concurrent_fetches = _DEFAULT_MAX_CONCURRENT_FETCHES
+        self._max_concurrent_transfers = None
+        self._max_download_rate = None
         self._verify_ssl = True
 
         self._name_to_setter = {}
         simple_attributes = [
             ("autoupdate", "_autoupdate"),
+            ("connection_pool_block", "_connection_pool_block"),
             ("noapp", "_noapp"),
+            ("stream_indices", "_stream_indices"),
             ("verify_ssl", "_verify_ssl"),
             ("use_pypi", "_use_pypi"),
             ("use_webservice", "_use_webservice"),
@@ -281,11 +317,20 @@ class Configuration(object):
 
         self._name_to_setter.update({
             "auth": self._set_auth,
+            "connection_pool_size": self._set_connection_pool_size,
+            "index_cache_max_entries": self._set_index_cache_max_entries,
+            "index_cache_max_size": self._set_index_cache_max_size,
             "indexed_repositories": self._set_indexed_repositories,
+            "max_concurrent_fetches": self._set_max_concurrent_fetches,
+            "max_concurrent_transfers": self._set_max_concurrent_transfers,
+            "max_download_rate": self._set_max_download_rate,
             "max_retries": self._set_max_retries,
             "prefix": self._set_prefix,
             "proxy": self._set_proxy,
             "repository_cache": self._set_repository_cache,
+            "repository_cache_max_size":
+                self._set_repository_cache_max_size,
+            "shared_egg_store": self._set_shared_egg_store,
             "store_url": self._set_store_url,
         })
 
@@ -351,6 +396,29 @@ class Configuration(object):
         return tuple((repository_info.index_url, repository_info._base_url)
                      for repository_info in self.repositories)
 
+    @property
+    def max_concurrent_fetches(self):
+        """
+        Max number of eggs downloaded at the same time.
+        """
+        return self._max_concurrent_fetches
+
+    @property
+    def max_concurrent_transfers(self):
+        """
+        Max number of eggs downloaded at the same time by the whole process,
+        or None if unbounded.
+        """
+        return self._max_concurrent_transfers
+
+    @property
+    def max_download_rate(self):
+        """
+        Max bandwidth (in bytes per second) used to download eggs, or None if
+        unbounded.
+        """
+        return self._max_download_rate
+
     @property
     def max_retries(self):
         """
@@ -409,6 +477,59 @@ class Configuration(object):
         else:
             return self._repository_cache
 
+    @property
+    def repository_cache_max_size(self):
+        """
+        Size budget (in bytes) of the repository cache, or None if unbounded.
+        Least recently used eggs are removed when the cache grows larger.
+        """
+        return self._repository_cache_max_size
+
+    @property
+    def connection_pool_size(self):
+        """
+        Maximum number of connections kept open to each host.
+        """
+        return self._connection_pool_size
+
+    @property
+    def connection_pool_block(self):
+        """
+        If True, wait for a pooled connection instead of opening more than
+        connection_pool_size connections to a host.
+        """
+        return self._connection_pool_block
+
+    @property
+    def stream_indices(self):
+        """
+        If True, indices are parsed while they are downloaded, so that the
+        raw index is never kept in memory.
+        """
+        return self._stream_indices
+
+    @property
+    def index_cache_max_entries(self):
+        """
+        Maximum number of index responses kept in the index cache.
+        """
+        return self._index_cache_max_entries
+
+    @property
+    def index_cache_max_size(self):
+        """
+        Maximum size (in bytes) of the index cache.
+        """
+        return self._index_cache_max_size
+
+    @property
+    def shared_egg_store(self):
+        """
+        Absolute path of the egg store shared between repository caches, or
+        None if eggs are not shared.
+        """
+        return self._shared_egg_store
+
     @property
     def store_kind(self):
         """
@@ -472,21 +593,33 @@ class Configuration(object):
         Parameters
         ----------
         names : list
-            List of repository names
+            List of repository names. An item may also be a dictionary with
+            a 'mirrors' list of names (and an optional 'race' boolean), for
+            a repository available from several mirrors (see
+            MirroredRepositoryInfo).
         """
         repositories = []
         for name in names:
-            p = urlparse(name)
-            if p.scheme == "":
-                repositories.append(BroodRepositoryInfo(self.store_url, name,
-                                                        self._platform))
-            elif p.scheme == "file":
-                repositories.append(FSRepositoryInfo(name))
+            if isinstance(name, dict):
+                mirrors = [self._repository_from_name(mirror_name)
+                           for mirror_name in name["mirrors"]]
+                repositories.append(MirroredRepositoryInfo(
+                    mirrors, name.get("race", False)
+                ))
             else:
-                msg = "Unsupported syntax: {0!r}".format(name)
-                raise InvalidConfiguration(msg)
+                repositories.append(self._repository_from_name(name))
         self._repositories = tuple(repositories)
 
+    def _repository_from_name(self, name):
+        p = urlparse(name)
+        if p.scheme == "":
+            return BroodRepositoryInfo(self.store_url, name, self._platform)
+        elif p.scheme == "file":
+            return FSRepositoryInfo(name)
+        else:
+            msg = "Unsupported syntax: {0!r}".format(name)
+            raise InvalidConfiguration(msg)
+
     def update(self, **kw):
         """ Set configuration attributes given as keyword arguments."""
         for name, value in kw.items():
@@ -594,6 +727,36 @@ class Configuration(object):
         self._repositories = tuple(OldstyleRepositoryInfo(url) for url in
                                    self._indexed_repositories)
 
+    def _set_max_concurrent_fetches(self, raw_max_concurrent_fetches):
+        self._max_concurrent_fetches = _parse_integer_option(
+            "max_concurrent_fetches", raw_max_concurrent_fetches, 1
+        )
+
+    def _set_max_concurrent_transfers(self, raw_max_transfers):
+        self._max_concurrent_transfers = _parse_integer_option(
+            "max_concurrent_transfers", raw_max_transfers, 1, allow_none=True
+        )
+
+    def _set_max_download_rate(self, raw_rate):
+        self._max_download_rate = _parse_integer_option(
+            "max_download_rate", raw_rate, 1, allow_none=True
+        )
+
+    def _set_connection_pool_size(self, raw_pool_size):
+        self._connection_pool_size = _parse_integer_option(
+            "connection_pool_size", raw_pool_size, 1
+        )
+
+    def _set_index_cache_max_entries(self, raw_max_entries):
+        self._index_cache_max_entries = _parse_integer_option(
+            "index_cache_max_entries", raw_max_entries, 1
+        )
+
+    def _set_index_cache_max_size(self, raw_max_size):
+        self._index_cache_max_size = _parse_integer_option(
+            "index_cache_max_size", raw_max_size, 0
+        )
+
     def _set_max_retries(self, raw_max_retries):
         try:
             max_retries = int(raw_max_retries)
@@ -620,6 +783,17 @@ class Configuration(object):
         normalized = os.path.normpath(abs_expanduser(value))
         self._repository_cache = _get_writable_local_dir(normalized)
 
+    def _set_repository_cache_max_size(self, raw_max_size):
+        self._repository_cache_max_size = _parse_integer_option(
+            "repository_cache_max_size", raw_max_size, 0, allow_none=True
+        )
+
+    def _set_shared_egg_store(self, value):
+        if value is None:
+            self._shared_egg_store = None
+        else:
+            self._shared_egg_store = os.path.normpath(abs_expanduser(value))
+
     def _simple_attribute_set_factory(self, attribute_name):
         return lambda value: setattr(self, attribute_name, value)
 
@@ -647,6 +821,11 @@ def print_config(config, session):
     print("settings:")
     print("    prefix = %s" % config.prefix)
     print("    %s = %s" % ("repository_cache", config.repository_cache))
+    if config.repository_cache_max_size is not None:
+        print("    %s = %d" % ("repository_cache_max_size",
+                               config.repository_cache_max_size))
+    if config.shared_egg_store is not None:
+        print("    %s = %s" % ("shared_egg_store", config.shared_egg_store))
     print("    %s = %r" % ("noapp", config.noapp))
     print("    %s = %r" % ("proxy", config.proxy))
     if not config.use_webservice:
@@ -0,0 +1,152 @@
+"""
+A scheduler shared by every egg download of a process, to cap the number of
+concurrent transfers and the bandwidth they use.
+
+Transfers wait for a slot before opening their connection. Slots are granted
+by priority (lower values first, e.g. the position of the egg in install
+order), then in order of arrival.
+
+The bandwidth is limited by a token bucket shared by every transfer. Each
+chunk reserves its share of the bucket in turn, so concurrent transfers
+share the bandwidth fairly instead of the fastest connection taking it all.
+"""
+from __future__ import absolute_import, division
+
+import contextlib
+import heapq
+import itertools
+import threading
+import time
+
+
+# Waiting on a condition without timeout cannot be interrupted on python 2
+_WAIT_POLL_INTERVAL = 0.1
+
+
+class _TokenBucket(object):
+    """ A thread-safe token bucket.
+
+    Parameters
+    ----------
+    rate : int
+        Tokens (bytes) added to the bucket per second.
+    capacity : int
+        Maximum number of tokens in the bucket, i.e. the size of the bursts
+        allowed after being idle. A tenth of a second worth of tokens if not
+        given.
+    clock : callable
+        Returns the current time, in seconds.
+    sleep : callable
+        Sleeps for the given number of seconds.
+    """
+    def __init__(self, rate, capacity=None, clock=time.time,
+                 sleep=time.sleep):
+        self.rate = rate
+        self.capacity = capacity or max(rate // 10, 1)
+        self._clock = clock
+        self._sleep = sleep
+
+        self._lock = threading.Lock()
+        self._tokens = self.capacity
+        self._last = clock()
+
+    def consume(self, n):
+        """ Take n tokens from the bucket, waiting for them to be available.
+
+        The tokens are reserved before waiting (the bucket may go in debt),
+        so that callers are served in order of arrival.
+        """
+        with self._lock:
+            now = self._clock()
+            self._tokens = min(self.capacity,
+                               self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            self._tokens -= n
+            wait = -self._tokens / self.rate
+        if wait > 0:
+            self._sleep(wait)
+
+
+class DownloadScheduler(object):
+    """ Schedule the egg transfers of a process.
+
+    Parameters
+    ----------
+    max_transfers : int or None
+        Maximum number of transfers at the same time, or None for no limit.
+    max_bytes_per_second : int or None
+        Maximum bandwidth used by all the transfers, or None for no limit.
+    clock : callable
+        Returns the current time, in seconds.
+    sleep : callable
+        Sleeps for the given number of seconds.
+    """
+    def __init__(self, max_transfers=None, max_bytes_per_second=None,
+                 clock=time.time, sleep=time.sleep):
+        self.max_transfers = max_transfers
+        self.max_bytes_per_second = max_bytes_per_second
+
+        if max_bytes_per_second is None:
+            self._bucket = None
+        else:
+            self._bucket = _TokenBucket(max_bytes_per_second, clock=clock,
+                                        sleep=sleep)
+
+        self._condition = threading.Condition()
+        self._active = 0
+        # Heap of (priority, arrival) of the transfers waiting for a slot
+        self._waiting = []
+        self._arrivals = itertools.count()
+
+    @property
+    def active_transfers(self):
+        """ Number of transfers currently holding a slot."""
+        return self._active
+
+    def _acquire(self, priority):
+        with self._condition:
+            entry = (priority, next(self._arrivals))
+            heapq.heappush(self._waiting, entry)
+            try:
+                while self._waiting[0] != entry \
+                        or self._active >= self.max_transfers:
+                    self._condition.wait(_WAIT_POLL_INTERVAL)
+            except BaseException:
+                self._waiting.remove(entry)
+                heapq.heapify(self._waiting)
+                self._condition.notify_all()
+                raise
+            heapq.heappop(self._waiting)
+            self._active += 1
+            # The next waiting transfer may be able to start as well
+            self._condition.notify_all()
+
+    def _release(self):
+        with self._condition:
+            self._active -= 1
+            self._condition.notify_all()
+
+    @contextlib.contextmanager
+    def transfer(self, priority=0):
+        """ Context manager holding a transfer slot, waiting for one to be
+        available first.
+
+        Parameters
+        ----------
+        priority : int
+            Transfers with a lower priority value get a slot first.
+        """
+        if self.max_transfers is None:
+            with self._condition:
+                self._active += 1
+        else:
+            self._acquire(priority)
+        try:
+            yield
+        finally:
+            self._release()
+
+    def throttle(self, size):
+        """ Wait until size more bytes may be transferred."""
+        if self._bucket is not None:
+            self._bucket.consume(size)
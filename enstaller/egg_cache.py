@@ -0,0 +1,217 @@
+"""
+Size-bounded eviction of the egg download cache.
+
+Eggs are fetched into the repository cache and were never removed. The time
+each cached egg was last used (downloaded, or found in the cache when
+fetching) is recorded in a small database, and the least recently used eggs
+are removed when the cache grows over its budget. Eggs referenced by the
+last history revisions of a prefix are never removed, so that reverting to
+those revisions does not require a connection.
+"""
+from __future__ import absolute_import
+
+import contextlib
+import logging
+import os
+import os.path
+import sqlite3
+import time
+
+import egginst
+
+from egginst.utils import PART_SUFFIX
+
+from enstaller.history import History
+
+
+logger = logging.getLogger(__name__)
+
+USAGE_DB_FILENAME = "_usage.db"
+
+_EGG_SUFFIX = ".egg"
+
+# Eggs of that many history revisions (the current one included) are never
+# removed, so that recent revisions can be reverted to offline.
+PINNED_REVISIONS = 5
+
+_CREATE_TABLE = """\
+CREATE TABLE IF NOT EXISTS last_use (
+    filename TEXT PRIMARY KEY,
+    time REAL
+)"""
+
+
+def pinned_eggs(prefixes, max_revisions=PINNED_REVISIONS):
+    """ Returns the set of egg filenames referenced by the last history
+    revisions of the given prefixes.
+
+    Parameters
+    ----------
+    prefixes : list of str
+        The prefixes whose history is looked up.
+    max_revisions : int or None
+        The number of revisions to pin, starting from the current one. If
+        None, every revision is pinned.
+    """
+    pinned = set()
+    for prefix in prefixes:
+        states = History(prefix).construct_states()
+        if len(states) == 0:
+            # No history yet
+            pinned.update(egginst.get_installed(prefix))
+            continue
+        if max_revisions is not None:
+            states = states[-max_revisions:]
+        for _, state in states:
+            pinned.update(state)
+    return pinned
+
+
+class CachedEgg(object):
+    def __init__(self, path, size, last_use):
+        self.path = path
+        self.size = size
+        self.last_use = last_use
+
+    @property
+    def filename(self):
+        return os.path.basename(self.path)
+
+    @property
+    def key(self):
+        """ The key of the egg (partial downloads share their egg's key)."""
+        filename = self.filename
+        if filename.endswith(PART_SUFFIX):
+            filename = filename[:-len(PART_SUFFIX)]
+        return filename
+
+
+class EggCache(object):
+    """ The eggs (and partially downloaded eggs) of a download cache
+    directory.
+
+    Failing to read or write the usage database is not an error: the
+    modification time of each egg is then used as its last use.
+
+    Parameters
+    ----------
+    directory : str
+        The cache directory.
+    max_size : int or None
+        The budget of the cache, in bytes. If None, collect removes every egg
+        which is not pinned.
+    """
+    def __init__(self, directory, max_size=None):
+        self.directory = directory
+        self.max_size = max_size
+        self._db_path = os.path.join(directory, USAGE_DB_FILENAME)
+
+    @contextlib.contextmanager
+    def _connection(self):
+        connection = sqlite3.connect(self._db_path)
+        try:
+            # Losing the latest uses on a system crash is harmless, but
+            # waiting for the disk on every cache hit is not.
+            connection.execute("PRAGMA synchronous = OFF")
+            with connection:
+                connection.execute(_CREATE_TABLE)
+                yield connection
+        finally:
+            connection.close()
+
+    def _last_uses(self):
+        try:
+            with self._connection() as connection:
+                return dict(connection.execute(
+                    "SELECT filename, time FROM last_use"
+                ))
+        except sqlite3.Error as e:
+            logger.warn("Could not read cache usage database: %r", e)
+            return {}
+
+    def touch(self, path, when=None):
+        """ Record the given cached egg as used now (or at the given
+        time)."""
+        if when is None:
+            when = time.time()
+        try:
+            with self._connection() as connection:
+                connection.execute(
+                    "INSERT OR REPLACE INTO last_use VALUES (?, ?)",
+                    (os.path.basename(path), when)
+                )
+        except sqlite3.Error as e:
+            logger.warn("Could not write cache usage database: %r", e)
+
+    def iter_eggs(self):
+        """ Iterate over the cached eggs, as CachedEgg instances."""
+        try:
+            filenames = os.listdir(self.directory)
+        except OSError:
+            return
+
+        last_uses = self._last_uses()
+        for filename in filenames:
+            if not filename.endswith((_EGG_SUFFIX, _EGG_SUFFIX + PART_SUFFIX)):
+                continue
+            path = os.path.join(self.directory, filename)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            yield CachedEgg(path, st.st_size,
+                            last_uses.get(filename, st.st_mtime))
+
+    @property
+    def size(self):
+        """ The total size of the cached eggs, in bytes."""
+        return sum(egg.size for egg in self.iter_eggs())
+
+    def collect(self, pinned=(), max_size=None):
+        """ Remove the least recently used eggs until the cache fits in its
+        budget.
+
+        Parameters
+        ----------
+        pinned : iterable
+            Egg filenames which must not be removed.
+        max_size : int or None
+            The budget to use instead of the cache's one. If both are None,
+            every egg not pinned is removed.
+
+        Returns
+        -------
+        removed : list
+            The removed CachedEgg instances.
+        """
+        if max_size is None:
+            max_size = self.max_size or 0
+        pinned = set(pinned)
+
+        eggs = sorted(self.iter_eggs(), key=lambda egg: egg.last_use)
+        size = sum(egg.size for egg in eggs)
+
+        removed = []
+        for egg in eggs:
+            if size <= max_size:
+                break
+            if egg.key in pinned:
+                continue
+            try:
+                os.unlink(egg.path)
+            except OSError as e:
+                logger.warn("Could not remove cached egg %r: %r", egg.path, e)
+                continue
+            size -= egg.size
+            removed.append(egg)
+
+        if removed:
+            try:
+                with self._connection() as connection:
+                    connection.executemany(
+                        "DELETE FROM last_use WHERE filename = ?",
+                        [(egg.filename,) for egg in removed]
+                    )
+            except sqlite3.Error as e:
+                logger.warn("Could not write cache usage database: %r", e)
+        return removed
@@ -0,0 +1,249 @@
+"""
+A host-wide, content-addressed egg store, shared by several download caches.
+
+Eggs are stored once, keyed by their md5, and exposed in the download cache
+of each runtime as hard links (or copies when hard links are not supported,
+e.g. across filesystems). Fetching an egg missing from the store is
+serialized across processes with a lock file, so that an egg needed by
+several runtimes at the same time is only downloaded once.
+
+As cached eggs may be shared, they must never be modified in place, only
+replaced by renaming a new file over them (as done when downloading).
+"""
+from __future__ import absolute_import
+
+import errno
+import logging
+import os
+import os.path
+import shutil
+import time
+import uuid
+
+from egginst.utils import makedirs, rename
+
+
+logger = logging.getLogger(__name__)
+
+_EGG_SUFFIX = ".egg"
+_LOCK_SUFFIX = ".lock"
+_STALE_SUFFIX = ".stale"
+
+# A lock which has not been refreshed for that long (in seconds) is assumed to
+# be left over by a dead process.
+_STALE_LOCK_AGE = 60.0
+_LOCK_REFRESH_INTERVAL = 10.0
+_LOCK_POLL_INTERVAL = 0.1
+
+
+def _link_or_copy(source, target):
+    """ Atomically make target a hard link to source, or a copy of source if
+    hard links are not supported."""
+    temp = "{0}.{1}.tmp".format(target, uuid.uuid4().hex)
+    try:
+        try:
+            os.link(source, temp)
+        except (AttributeError, OSError):
+            shutil.copyfile(source, temp)
+        rename(temp, target)
+        if os.path.exists(temp):
+            # rename does nothing when both are links to the same file
+            os.unlink(temp)
+    except BaseException:
+        if os.path.exists(temp):
+            os.unlink(temp)
+        raise
+
+
+class _StoreLock(object):
+    """ An inter-process lock, held by creating a lock file.
+
+    The holder is expected to call refresh regularly: a lock not refreshed
+    for a while is considered stale, and broken by the processes waiting for
+    it.
+    """
+    def __init__(self, path):
+        self.path = path
+        # Written into the lock file, so that we never remove a lock taken
+        # by someone else after ours was broken
+        self._token = "{0}:{1}".format(os.getpid(), uuid.uuid4().hex)
+        self._last_refresh = None
+
+    def _is_stale(self, path=None):
+        try:
+            mtime = os.stat(path or self.path).st_mtime
+        except OSError:
+            return False
+        return time.time() - mtime > _STALE_LOCK_AGE
+
+    def _break_stale(self):
+        """ Remove the lock file if it is stale.
+
+        Several processes may find the same lock stale, and one of them may
+        already have broken it and taken the lock again by the time another
+        one removes it. The lock file is thus first moved away atomically,
+        and only removed if what was moved is still stale. A live lock moved
+        by mistake is put back, or left where it was moved to if that fails
+        (its holder still owns it, and we keep waiting; SharedEggStore.collect
+        eventually removes it).
+        """
+        moved = "{0}.{1}{2}".format(self.path, uuid.uuid4().hex,
+                                    _STALE_SUFFIX)
+        try:
+            os.rename(self.path, moved)
+        except OSError:
+            # Already broken by someone else
+            return
+
+        if self._is_stale(moved):
+            logger.warn("Removed stale lock %r", self.path)
+        else:
+            try:
+                # Unlike rename, link does not replace an existing lock
+                os.link(moved, self.path)
+            except (AttributeError, OSError) as e:
+                logger.warn("Could not restore lock %r: %r", self.path, e)
+                return
+        try:
+            os.unlink(moved)
+        except OSError:
+            pass
+
+    def acquire(self):
+        while True:
+            try:
+                fd = os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+                if self._is_stale():
+                    self._break_stale()
+                else:
+                    time.sleep(_LOCK_POLL_INTERVAL)
+            else:
+                os.write(fd, self._token.encode("ascii"))
+                os.close(fd)
+                self._last_refresh = time.time()
+                return
+
+    def refresh(self):
+        """ Mark the lock as still in use."""
+        now = time.time()
+        if now - self._last_refresh > _LOCK_REFRESH_INTERVAL:
+            try:
+                os.utime(self.path, None)
+            except OSError as e:
+                logger.warn("Could not refresh lock %r: %r", self.path, e)
+            self._last_refresh = now
+
+    def release(self):
+        """ Remove the lock file, unless our lock was broken and the lock
+        taken by someone else in the meantime."""
+        try:
+            with open(self.path, "rb") as fp:
+                token = fp.read().decode("ascii")
+            if token == self._token:
+                os.unlink(self.path)
+            else:
+                logger.warn("Lock %r was broken while held", self.path)
+        except (IOError, OSError, UnicodeDecodeError) as e:
+            logger.warn("Could not release lock %r: %r", self.path, e)
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *a):
+        self.release()
+
+
+class SharedEggStore(object):
+    """ A directory of eggs keyed by md5.
+
+    Parameters
+    ----------
+    directory : str
+        The store directory (created if needed).
+    """
+    def __init__(self, directory):
+        self.directory = directory
+
+    def _object_path(self, md5):
+        return os.path.join(self.directory, md5[:2], md5 + _EGG_SUFFIX)
+
+    def __contains__(self, md5):
+        return os.path.isfile(self._object_path(md5))
+
+    def lock(self, md5):
+        """ Returns the lock to hold while fetching the egg with the given
+        md5 into the store."""
+        path = self._object_path(md5)
+        makedirs(os.path.dirname(path))
+        return _StoreLock(path + _LOCK_SUFFIX)
+
+    def link(self, md5, path):
+        """ Make path a link to the stored egg with the given md5.
+
+        Returns False if the egg is not in the store.
+        """
+        source = self._object_path(md5)
+        try:
+            _link_or_copy(source, path)
+        except (IOError, OSError) as e:
+            if e.errno != errno.ENOENT:
+                logger.warn("Could not link %r from the egg store: %r",
+                            path, e)
+            return False
+        else:
+            return True
+
+    def add(self, path, md5):
+        """ Add the given file, whose md5 must have been checked, to the
+        store.
+
+        An egg already stored with the same md5 is replaced.
+        """
+        target = self._object_path(md5)
+        try:
+            makedirs(os.path.dirname(target))
+            _link_or_copy(path, target)
+        except (IOError, OSError) as e:
+            logger.warn("Could not add %r to the egg store: %r", path, e)
+
+    def _remove_moved_lock(self, path):
+        """ Remove a lock left over by _StoreLock._break_stale, once it is
+        stale."""
+        try:
+            if time.time() - os.stat(path).st_mtime > _STALE_LOCK_AGE:
+                os.unlink(path)
+        except OSError:
+            pass
+
+    def collect(self):
+        """ Remove the stored eggs which are not linked from any download
+        cache anymore.
+
+        Returns
+        -------
+        removed : list
+            The (path, size) pairs of the removed eggs.
+        """
+        removed = []
+        for root, dirs, files in os.walk(self.directory):
+            for filename in files:
+                path = os.path.join(root, filename)
+                if filename.endswith(_STALE_SUFFIX):
+                    self._remove_moved_lock(path)
+                    continue
+                if not filename.endswith(_EGG_SUFFIX):
+                    continue
+                if os.path.exists(path + _LOCK_SUFFIX):
+                    continue
+                try:
+                    st = os.stat(path)
+                    if st.st_nlink == 1:
+                        os.unlink(path)
+                        removed.append((path, st.st_size))
+                except OSError as e:
+                    logger.warn("Could not remove %r: %r", path, e)
+        return removed
@@ -6,9 +6,16 @@ import sys
 
 from os.path import isfile, join
 
+import requests
+import six
+
+from concurrent.futures import ThreadPoolExecutor
+
 from egginst.main import EggInst, _default_runtime_info
 from egginst.progress import dummy_progress_bar_factory
 
+from enstaller.egg_cache import pinned_eggs
+from enstaller.egg_store import SharedEggStore
 from enstaller.errors import EnpkgError, InvalidChecksum, NoSuchPackage
 from enstaller.eggcollect import meta_dir_from_prefix
 from enstaller.fetch import _DownloadManager
@@ -21,6 +28,23 @@ from enstaller.solver import ForceMode, Solver, SolverMode
 
 _DEFAULT_MAX_RETRIES = 2
 
+# Errors after which fetching an egg is retried. Partially downloaded eggs
+# are resumed when retrying.
+_RETRIED_FETCH_ERRORS = (
+    InvalidChecksum,
+    requests.exceptions.ChunkedEncodingError,
+    requests.exceptions.ConnectionError,
+)
+
+# Reported by fetches executed in the background when a new download attempt
+# starts
+_NEW_ATTEMPT = object()
+
+# How often (in seconds) the thread waiting for a background fetch wakes up,
+# so that KeyboardInterrupt is not delayed until the fetch completes on
+# python 2.
+_WAIT_POLL_INTERVAL = 0.1
+
 logger = logging.getLogger(__name__)
 
 
@@ -57,11 +81,12 @@ class _BaseAction(object):
 class FetchAction(_BaseAction):
     def __init__(self, package, downloader, remote_repository, force=True,
                  progress_bar_factory=dummy_progress_bar_factory,
-                 max_retries=_DEFAULT_MAX_RETRIES):
+                 max_retries=_DEFAULT_MAX_RETRIES, priority=0):
         super(FetchAction, self).__init__()
         self._downloader = downloader
         self._package = package
         self._force = force
+        self._priority = priority
         self._remote_repository = remote_repository
 
         self._progress_bar_factory = progress_bar_factory
@@ -72,13 +97,15 @@ class FetchAction(_BaseAction):
 
     def cancel(self):
         super(FetchAction, self).cancel()
-        self._current_context.cancel()
+        if self._current_context is not None:
+            self._current_context.cancel()
 
     def progress_update(self, step):
         self._progress.update(step)
 
     def iter_execute(self):
-        context = self._downloader.iter_fetch(self._package, self._force)
+        context = self._downloader.iter_fetch(self._package, self._force,
+                                              self._priority)
         if not context.needs_to_download:
             return
 
@@ -97,12 +124,103 @@ class FetchAction(_BaseAction):
             try:
                 for chunk_size in self.iter_execute():
                     self.progress_update(chunk_size)
-            except InvalidChecksum:
+            except _RETRIED_FETCH_ERRORS:
                 if i >= self._retries - 1:
                     raise
             else:
                 return
 
+    def _execute_in_background(self, report):
+        """ Execute the action without touching the progress bar, for use
+        from a worker thread.
+
+        report is called with _NEW_ATTEMPT when a download attempt starts,
+        and with the size of each downloaded chunk.
+        """
+        for i in range(self._retries):
+            if self.is_canceled:
+                return
+            context = self._downloader.iter_fetch(self._package, self._force,
+                                                  self._priority)
+            if not context.needs_to_download:
+                return
+            self._current_context = context
+            if self.is_canceled:
+                return
+
+            report(_NEW_ATTEMPT)
+            try:
+                for chunk in context.iter_content():
+                    report(len(chunk))
+            except _RETRIED_FETCH_ERRORS:
+                if i >= self._retries - 1:
+                    raise
+            else:
+                return
+
+
+class _BackgroundFetch(object):
+    """ A FetchAction executed by the given executor.
+
+    The download runs in a worker thread, but its progress is displayed by
+    the thread calling wait, so that progress bars are never written to
+    concurrently.
+    """
+    def __init__(self, action, executor):
+        self.action = action
+        self._events = six.moves.queue.Queue()
+        self._is_done = False
+        self._future = executor.submit(self._run)
+
+    def _run(self):
+        try:
+            self.action._execute_in_background(self._events.put)
+        finally:
+            self._events.put(None)
+
+    def _iter_events(self):
+        while True:
+            try:
+                event = self._events.get(timeout=_WAIT_POLL_INTERVAL)
+            except six.moves.queue.Empty:
+                continue
+            if event is None:
+                return
+            yield event
+
+    def cancel(self):
+        if self._future.cancel():
+            # _run will never be called, so wait would never get its
+            # sentinel
+            self._events.put(None)
+        self.action.cancel()
+
+    def wait(self):
+        """ Wait for the fetch to complete, updating the action progress
+        bar in the calling thread. Errors of the fetch are raised here."""
+        if self._is_done:
+            return
+
+        package = self.action._package
+        progress = None
+        try:
+            for event in self._iter_events():
+                if event is _NEW_ATTEMPT:
+                    if progress is not None:
+                        progress.__exit__(None, None, None)
+                    progress = self.action._progress_bar_factory(
+                        package.key, package.size
+                    )
+                    progress = progress.__enter__()
+                else:
+                    progress.update(event)
+        finally:
+            if progress is not None:
+                progress.__exit__(None, None, None)
+
+        self._is_done = True
+        self._future.result()
+
 
 class InstallAction(_BaseAction):
     def __init__(self, package, runtime_info, remote_repository,
@@ -243,14 +361,14 @@ class _ExecuteContext(object):
 
         self._max_retries = max_retries
 
-    def _action_factory(self, action):
+    def _action_factory(self, action, priority=0):
         opcode, egg = action
 
         if opcode.startswith('fetch'):
             return FetchAction(egg, self._enpkg._downloader,
                                self._remote_repository, self._force,
                                self._pbar_context.fetch_progress,
-                               self._max_retries)
+                               self._max_retries, priority)
         elif opcode.startswith("install"):
             return InstallAction(egg, self._enpkg._runtime_info,
                                  self._enpkg._remote_repository,
@@ -268,9 +386,49 @@ class _ExecuteContext(object):
 
     def __iter__(self):
         with History(self._top_prefix):
-            for action in self._actions:
+            for i, action in enumerate(self._actions):
                 logger.info('\t' + str(action))
-                yield self._action_factory(action)
+                yield self._action_factory(action, i)
+
+    def execute_pipelined(self, max_concurrent_fetches):
+        """ Execute every action, fetching eggs concurrently.
+
+        Up to max_concurrent_fetches eggs are downloaded in the background,
+        while the other actions are executed in order in the calling thread.
+        Each install waits for the fetch of its own egg only, so installs
+        start as soon as possible instead of after every download.
+
+        Fetches are prioritized in the download scheduler of the session by
+        their position in the actions, so that the eggs installed first are
+        downloaded first.
+        """
+        actions = [(action, self._action_factory(action, i))
+                   for i, action in enumerate(self._actions)]
+
+        with ThreadPoolExecutor(max_workers=max_concurrent_fetches) as \
+                executor:
+            fetches = {}
+            try:
+                for (_, egg), action in actions:
+                    if isinstance(action, FetchAction):
+                        fetches[egg.key] = _BackgroundFetch(action, executor)
+
+                with History(self._top_prefix):
+                    for (opcode, egg), action in actions:
+                        logger.info('\t' + str((opcode, egg)))
+                        if isinstance(action, FetchAction):
+                            continue
+                        if isinstance(action, InstallAction) \
+                                and egg.key in fetches:
+                            fetches[egg.key].wait()
+                        action.execute()
+                    for (_, egg), action in actions:
+                        if isinstance(action, FetchAction):
+                            fetches[egg.key].wait()
+            except BaseException:
+                for fetch in fetches.values():
+                    fetch.cancel()
+                raise
 
 
 class Enpkg(object):
@@ -295,11 +453,25 @@ class Enpkg(object):
     max_retries : int
         Maximum number of retries to fetch an egg when checksum mismatchs
         occur.
+    max_concurrent_fetches : int
+        Maximum number of eggs downloaded at the same time by execute. If
+        greater than 1, installs are started while the following eggs are
+        being downloaded.
+    repository_cache_max_size : int or None
+        If not None, the least recently used eggs of the download cache are
+        removed after executing actions, until the cache fits in that many
+        bytes. Eggs referenced by the last history revisions of the
+        prefixes are kept (see enstaller.egg_cache.pinned_eggs).
+    shared_egg_store : str or None
+        If not None, the directory of an egg store shared with other
+        download caches: eggs already in the store are linked instead of
+        downloaded, and downloaded eggs are added to it.
     """
     def __init__(self, remote_repository, session,
                  prefixes=[sys.prefix], progress_context=None,
                  force=False, max_retries=_DEFAULT_MAX_RETRIES,
-                 runtime_info=None):
+                 runtime_info=None, max_concurrent_fetches=1,
+                 repository_cache_max_size=None, shared_egg_store=None):
         self.prefixes = prefixes
         self.top_prefix = prefixes[0]
 
@@ -310,17 +482,28 @@ class Enpkg(object):
         self._remote_repository = remote_repository
 
         self._installed_repository = Repository._from_prefixes(self.prefixes)
-        self._top_installed_repository = \
-            Repository._from_prefixes([self.top_prefix])
+        # The top prefix is part of prefixes, no need to read it again
+        self._top_installed_repository = Repository(
+            package
+            for package in self._installed_repository.iter_packages()
+            if package.prefix == self.top_prefix
+        )
 
         self._session = session
-        self._downloader = _DownloadManager(session, remote_repository)
+        if shared_egg_store is None:
+            egg_store = None
+        else:
+            egg_store = SharedEggStore(shared_egg_store)
+        self._downloader = _DownloadManager(session, remote_repository,
+                                            egg_store=egg_store)
 
         self._progress_context = progress_context or \
             ProgressBarContext(dummy_progress_bar_factory)
 
         self._force = force
         self.max_retries = max_retries
+        self.max_concurrent_fetches = max_concurrent_fetches
+        self.repository_cache_max_size = repository_cache_max_size
 
     def _solver_factory(self, mode=SolverMode.RECUR, force=ForceMode.NONE):
         solver = Solver(self._remote_repository,
@@ -346,8 +529,22 @@ class Enpkg(object):
             Solver.
         """
         logger.info("Enpkg.execute: %d", len(actions))
-        for action in self.execute_context(actions):
-            action.execute()
+        if self.max_concurrent_fetches > 1:
+            context = self.execute_context(actions)
+            context.execute_pipelined(self.max_concurrent_fetches)
+        else:
+            for action in self.execute_context(actions):
+                action.execute()
+
+        if self.repository_cache_max_size is not None:
+            self._collect_cache()
+
+    def _collect_cache(self):
+        removed = self._downloader.egg_cache.collect(
+            pinned_eggs(self.prefixes), self.repository_cache_max_size
+        )
+        for egg in removed:
+            logger.info("Removed %r from the download cache", egg.path)
 
     def revert_actions(self, arg):
         """
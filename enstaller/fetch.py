@@ -1,17 +1,65 @@
 import logging
+import os.path
+import re
+import time
 
 from os.path import isfile, join
 
-from egginst.utils import checked_content, compute_md5, makedirs
+import requests
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from egginst.utils import makedirs, resumable_checked_content
+
+from enstaller.checksum_db import ChecksumDatabase
+from enstaller.download_scheduler import DownloadScheduler
+from enstaller.egg_cache import EggCache
+from enstaller.repository_info import MirroredRepositoryInfo
+from enstaller.requests_utils import NO_STORE_HEADERS
 
 
 logger = logging.getLogger(__name__)
 
 
+_CONTENT_RANGE_R = re.compile(r"bytes\s+(\d+)-")
+
+# Status code of a response to a range request which cannot be satisfied
+_RANGE_NOT_SATISFIABLE = 416
+
+
+def _content_range_start(response):
+    """ Returns the first byte position of a 206 response, or None if it
+    cannot be determined."""
+    m = _CONTENT_RANGE_R.match(response.headers.get("content-range", ""))
+    if m is None:
+        return None
+    else:
+        return int(m.group(1))
+
+
+def _close_response(future):
+    if future.exception() is None and future.result() is not None:
+        future.result().close()
+
+
 class _CancelableResponse(object):
-    def __init__(self, path, package_metadata, fetcher, force):
+    def __init__(self, path, package_metadata, fetcher, force,
+                 checksums=None, egg_cache=None, egg_store=None,
+                 scheduler=None, priority=0):
         self._path = path
         self._package_metadata = package_metadata
+        self._checksums = checksums or \
+            ChecksumDatabase.from_directory(os.path.dirname(path))
+        self._egg_cache = egg_cache or EggCache(os.path.dirname(path))
+        self._egg_store = egg_store
+        self._scheduler = scheduler or DownloadScheduler()
+        self._priority = priority
+
+        repository_info = getattr(package_metadata, "repository_info", None)
+        if isinstance(repository_info, MirroredRepositoryInfo):
+            self._mirrors = repository_info
+        else:
+            self._mirrors = None
 
         self._canceled = False
 
@@ -24,22 +72,203 @@ class _CancelableResponse(object):
     def __iter__(self):
         return self.iter_content()
 
+    def _resume(self, url, target):
+        """ Returns the response for the data missing from target, or None if
+        the download cannot be resumed."""
+        headers = dict(NO_STORE_HEADERS)
+        headers["Range"] = "bytes={0}-".format(target.size)
+        try:
+            response = self._fetcher.fetch(url, headers=headers)
+        except requests.exceptions.HTTPError as e:
+            if e.response.status_code == _RANGE_NOT_SATISFIABLE:
+                return None
+            raise
+
+        if response.status_code == 200:
+            # Range not supported by the server: use the full content
+            logger.info("Cannot resume %r, restarting", url)
+            target.restart()
+            return response
+        elif _content_range_start(response) == target.size:
+            logger.info("Resuming %r at byte %d", url, target.size)
+            return response
+        else:
+            response.close()
+            return None
+
+    def _open(self, url, target):
+        expected_size = self._package_metadata.size
+        if expected_size and target.size > expected_size:
+            target.restart()
+
+        if target.size > 0:
+            if expected_size and target.size == expected_size:
+                # Complete, but not validated yet
+                return None
+            response = self._resume(url, target)
+            if response is not None:
+                return response
+            target.restart()
+
+        return self._fetcher.fetch(url, headers=NO_STORE_HEADERS)
+
+    def _candidates(self):
+        """ The (mirror, url) pairs to fetch the package from, in order of
+        preference. mirror is None for repositories without mirrors."""
+        if self._mirrors is None:
+            return [(None, self._package_metadata.source_url)]
+        else:
+            return self._mirrors._package_urls(self._package_metadata)
+
+    def _timed_open(self, mirror, url, target):
+        """ Like _open, but also records the latency (or failure) of the
+        mirror."""
+        start = time.time()
+        try:
+            response = self._open(url, target)
+        except requests.exceptions.RequestException:
+            if mirror is not None:
+                self._mirrors.stats.record_failure(mirror)
+            raise
+        if mirror is not None and response is not None:
+            self._mirrors.stats.record_latency(mirror, time.time() - start)
+        return response
+
+    def _race(self, candidates, target):
+        """ Open every candidate at the same time, and returns the (mirror,
+        url, response) of the first one to respond. The other responses are
+        closed."""
+        executor = ThreadPoolExecutor(max_workers=len(candidates))
+        try:
+            futures = dict(
+                (executor.submit(self._timed_open, mirror, url, target),
+                 (mirror, url))
+                for mirror, url in candidates
+            )
+            for future in as_completed(futures):
+                if future.exception() is None:
+                    for other in futures:
+                        if other is not future:
+                            other.add_done_callback(_close_response)
+                    mirror, url = futures[future]
+                    return mirror, url, future.result()
+            # Every candidate failed: raise the last error
+            return future.result()
+        finally:
+            executor.shutdown(wait=False)
+
+    def _open_preferred(self, candidates, target):
+        """ Open the preferred candidate (or race the two preferred ones),
+        removing it from candidates, and returns its (mirror, url,
+        response)."""
+        race = (self._mirrors is not None and self._mirrors.race
+                and len(candidates) > 1 and target.size == 0)
+        if race:
+            raced = candidates[:2]
+            del candidates[:2]
+            mirror, url, response = self._race(raced, target)
+            # The slower mirror may still be used if this one fails
+            raced.remove((mirror, url))
+            candidates[:0] = raced
+            return mirror, url, response
+        else:
+            mirror, url = candidates.pop(0)
+            return mirror, url, self._timed_open(mirror, url, target)
+
+    def _iter_timed(self, mirror, response):
+        """ Iterate over the response content, recording the throughput of
+        the mirror."""
+        start = time.time()
+        size = 0
+        for chunk in response.iter_content(1024):
+            size += len(chunk)
+            yield chunk
+        if mirror is not None:
+            self._mirrors.stats.record_transfer(mirror, size,
+                                                time.time() - start)
+
+    def _link_from_store(self):
+        md5 = self._package_metadata.md5
+        if self._egg_store.link(md5, self._path):
+            logger.info("Linked %r from the shared egg store", self._path)
+            self._checksums.record(self._path, md5)
+            return True
+        else:
+            return False
+
+    def _iter_download(self, on_chunk=None):
+        with self._scheduler.transfer(self._priority):
+            for chunk in self._iter_transfer(on_chunk):
+                yield chunk
+
+    def _iter_transfer(self, on_chunk):
+        with resumable_checked_content(self._path,
+                                       self._package_metadata.md5,
+                                       self._package_metadata.size) as target:
+            candidates = self._candidates()
+            expected_size = self._package_metadata.size
+            while True:
+                mirror = None
+                try:
+                    mirror, url, response = self._open_preferred(candidates,
+                                                                 target)
+                    if response is None:
+                        break
+                    for chunk in self._iter_timed(mirror, response):
+                        if self._canceled:
+                            response.close()
+                            target.abort()
+                            return
+
+                        self._scheduler.throttle(len(chunk))
+                        target.write(chunk)
+                        if on_chunk is not None:
+                            on_chunk()
+                        yield chunk
+                except requests.exceptions.RequestException as e:
+                    if len(candidates) == 0:
+                        raise
+                    error = e
+                else:
+                    if len(candidates) == 0 or not expected_size \
+                            or target.size >= expected_size:
+                        break
+                    error = "truncated response"
+
+                if mirror is not None:
+                    # Failed while transferring: what was already written is
+                    # kept, and resumed from another mirror
+                    self._mirrors.stats.record_failure(mirror)
+                logger.warn("Could not fetch %r (%s), trying %r",
+                            self._package_metadata.key, error,
+                            candidates[0][1])
+
+        self._checksums.record(self._path, target.hexdigest())
+        self._egg_cache.touch(self._path)
+
     def iter_content(self):
         if not self.needs_to_download:
             return
 
-        with checked_content(self._path, self._package_metadata.md5) as target:
-            url = self._package_metadata.source_url
-            response = self._fetcher.fetch(url)
+        if self._egg_store is None:
+            for chunk in self._iter_download():
+                yield chunk
+            return
 
-            for chunk in response.iter_content(1024):
-                if self._canceled:
-                    response.close()
-                    target.abort()
+        md5 = self._package_metadata.md5
+        # The transfer slot is taken first: waiting for it while holding the
+        # store lock would let the lock go stale.
+        with self._scheduler.transfer(self._priority):
+            with self._egg_store.lock(md5) as lock:
+                # Another process may have fetched the egg while we were
+                # waiting for the lock
+                if self._link_from_store():
+                    self._egg_cache.touch(self._path)
                     return
-
-                target.write(chunk)
-                yield chunk
+                for chunk in self._iter_transfer(lock.refresh):
+                    yield chunk
+                if not self._canceled:
+                    self._egg_store.add(self._path, md5)
 
     @property
     def needs_to_download(self):
@@ -47,28 +276,38 @@ class _CancelableResponse(object):
 
         if isfile(self._path):
             if self._force:
-                if compute_md5(self._path) == self._package_metadata.md5:
+                md5 = self._checksums.md5(self._path)
+                if md5 == self._package_metadata.md5:
                     logger.info("Not refetching, %r MD5 match", self._path)
                     needs_to_download = False
             else:
                 logger.info("Not forcing refetch, %r exists", self._path)
                 needs_to_download = False
+        elif self._egg_store is not None and self._link_from_store():
+            needs_to_download = False
+
+        if not needs_to_download:
+            self._egg_cache.touch(self._path)
 
         return needs_to_download
 
 
 class _DownloadManager(object):
-    def __init__(self, url_fetcher, repository, auth=None):
+    def __init__(self, url_fetcher, repository, auth=None, egg_store=None):
         self._repository = repository
         self._fetcher = url_fetcher
         self.cache_directory = url_fetcher.cache_directory
 
         makedirs(self.cache_directory)
+        self.checksums = ChecksumDatabase.from_directory(self.cache_directory)
+        self.egg_cache = EggCache(self.cache_directory)
+        self.egg_store = egg_store
+        self.scheduler = url_fetcher.download_scheduler
 
     def _path(self, fn):
         return join(self.cache_directory, fn)
 
-    def iter_fetch(self, package, force=False):
+    def iter_fetch(self, package, force=False, priority=0):
         """ Fetch the given package using streaming.
 
         Parameters
@@ -78,6 +317,10 @@ class _DownloadManager(object):
         force : bool
             If force is True, will download even if the file is already in the
             download cache.
+        priority : int
+            Priority of the download in the scheduler of the session (lower
+            values are downloaded first), e.g. the position of the package in
+            install order.
 
         Example
         -------
@@ -97,9 +340,10 @@ class _DownloadManager(object):
         path = self._path(package.key)
 
         return _CancelableResponse(path, package, self._fetcher,
-                                   force)
+                                   force, self.checksums, self.egg_cache,
+                                   self.egg_store, self.scheduler, priority)
 
-    def fetch(self, package, force=False):
+    def fetch(self, package, force=False, priority=0):
         """ Fetch the given package.
 
         Parameters
@@ -109,7 +353,9 @@ class _DownloadManager(object):
         force : bool
             If force is True, will download even if the file is already in the
             download cache.
+        priority : int
+            Priority of the download (see iter_fetch).
         """
-        context = self.iter_fetch(package, force)
+        context = self.iter_fetch(package, force, priority)
         for _ in context:
             pass
@@ -0,0 +1,210 @@
+"""
+Persistent snapshots of parsed indices.
+
+Parsing a large index (json decoding + building every package metadata
+instance) is much slower than fetching it when the server answers with a
+304. A snapshot stores the already parsed packages of an index, keyed on the
+index url, the ETag sent by the server, the python version and the enstaller
+version, so that it can be reused as long as the index does not change.
+"""
+from __future__ import absolute_import
+
+import hashlib
+import logging
+import os.path
+
+from egginst._compat import cPickle
+from egginst.utils import atomic_file, ensure_dir
+
+from enstaller import __version__
+from enstaller.collections import DefaultOrderedDict
+from enstaller.index_delta import parse_index_delta
+from enstaller.package import (RemotePackageMetadata, _python_from_tag,
+                               _scoped_intern_tables)
+from enstaller.repository import Repository
+from enstaller.utils import PY_VER
+
+
+logger = logging.getLogger(__name__)
+
+# Bump this whenever the format of the stored entries changes.
+_SNAPSHOT_FORMAT = 1
+
+
+def _package_to_entry(package):
+    return (package.key, package.name, package.version,
+            tuple(package.dependencies), package.python_tag, package.size,
+            package.md5, package.mtime, package.product, package.available)
+
+
+def _entry_to_package(entry, repository_info):
+    (key, name, version, dependencies, python_tag, size, md5, mtime, product,
+     available) = entry
+    return RemotePackageMetadata(
+        key, name, version, dependencies, _python_from_tag(python_tag), size,
+        md5, mtime, product, available, repository_info
+    )
+
+
+class IndexSnapshotCache(object):
+    """ A directory of parsed index snapshots.
+
+    Parameters
+    ----------
+    directory : str
+        The directory where to store snapshots (created if needed).
+    python_version : str
+        The major.minor python version the indices are parsed for.
+    """
+    @classmethod
+    def from_session(cls, session, python_version=PY_VER):
+        """ Create a snapshot cache stored next to the session's etag
+        cache."""
+        directory = os.path.join(session.cache_directory, "index_cache",
+                                 "snapshots")
+        return cls(directory, python_version)
+
+    def __init__(self, directory, python_version=PY_VER):
+        self.directory = directory
+        self.python_version = python_version
+
+    def _snapshot_key(self, index_url, etag):
+        return (_SNAPSHOT_FORMAT, index_url, etag, self.python_version,
+                __version__)
+
+    def _path(self, index_url):
+        # Only one snapshot is kept per index url and python version, older
+        # snapshots are simply overwritten.
+        s = "{0} {1}".format(index_url, self.python_version)
+        digest = hashlib.sha1(s.encode("utf8")).hexdigest()
+        return os.path.join(self.directory, digest + ".pickle")
+
+    def _load(self, repository_info, etag=None, key_only=False):
+        """ Returns the (snapshot key, entries) pair stored for the given
+        repository's index, or (None, None) if none is available.
+
+        Entries are only loaded if the snapshot was written for our python
+        and enstaller versions, at the given etag if any, and if key_only is
+        False. Otherwise, entries is None.
+        """
+        path = self._path(repository_info.index_url)
+        if not os.path.exists(path):
+            return None, None
+
+        try:
+            with open(path, "rb") as fp:
+                # The key is stored first, so that we don't need to load
+                # stale snapshots
+                snapshot_key = cPickle.load(fp)
+                snapshot_etag = snapshot_key[2]
+                if snapshot_key != self._snapshot_key(
+                        repository_info.index_url, snapshot_etag):
+                    logger.info("Ignoring stale index snapshot %r", path)
+                    return None, None
+                if key_only or (etag is not None and snapshot_etag != etag):
+                    return snapshot_key, None
+                return snapshot_key, cPickle.load(fp)
+        except Exception as e:
+            logger.warn("Could not read index snapshot %r: %r", path, e)
+            return None, None
+
+    def _repository_from_entries(self, entries, repository_info, lazy):
+        # Shared by the packages of this repository only
+        intern_tables = _scoped_intern_tables()
+
+        def _factory(entry):
+            with intern_tables:
+                return _entry_to_package(entry, repository_info)
+
+        if lazy:
+            name_to_entries = DefaultOrderedDict(list)
+            for entry in entries:
+                name_to_entries[entry[1]].append(entry)
+            repository = Repository()
+            repository._extend_lazy(name_to_entries, _factory)
+            return repository
+        else:
+            return Repository(_factory(entry) for entry in entries)
+
+    def _write(self, repository_info, etag, entries):
+        snapshot_key = self._snapshot_key(repository_info.index_url, etag)
+        path = self._path(repository_info.index_url)
+        try:
+            ensure_dir(path)
+            with atomic_file(path, "wb") as fp:
+                cPickle.dump(snapshot_key, fp, cPickle.HIGHEST_PROTOCOL)
+                cPickle.dump(entries, fp, cPickle.HIGHEST_PROTOCOL)
+        except (IOError, OSError) as e:
+            logger.warn("Could not write index snapshot %r: %r", path, e)
+
+    def latest_etag(self, repository_info):
+        """ Returns the etag of the snapshot stored for the given repository's
+        index, whatever the current index is, or None if there is no valid
+        snapshot.
+        """
+        snapshot_key, _ = self._load(repository_info, key_only=True)
+        if snapshot_key is None:
+            return None
+        return snapshot_key[2]
+
+    def get(self, repository_info, etag, lazy=True):
+        """ Returns the repository stored for the given repository's index at
+        the given etag, or None if no valid snapshot is available.
+
+        If lazy is True, package metadata are only created when first looked
+        up (see Repository.from_index).
+        """
+        if not etag:
+            return None
+
+        snapshot_key, entries = self._load(repository_info, etag)
+        if snapshot_key is None:
+            return None
+        elif entries is None:
+            logger.info("Ignoring index snapshot for %r: index changed",
+                        repository_info.index_url)
+            return None
+
+        logger.info("Using index snapshot for %r", repository_info.index_url)
+        return self._repository_from_entries(entries, repository_info, lazy)
+
+    def apply_delta(self, repository_info, base_etag, etag, delta,
+                    lazy=True):
+        """ Update the snapshot of the given repository's index at base_etag
+        with the given index delta (see enstaller.index_delta), and returns
+        the repository for the index at the given etag.
+
+        Entries not touched by the delta are reused as is, without being
+        parsed again. Returns None if no snapshot is stored at base_etag.
+        """
+        if not etag:
+            return None
+
+        snapshot_key, entries = self._load(repository_info, base_etag)
+        if entries is None:
+            return None
+
+        removed_keys, packages = parse_index_delta(
+            delta, ((entry[0], entry[1]) for entry in entries),
+            repository_info, self.python_version
+        )
+        entries = [entry for entry in entries if entry[0] not in removed_keys]
+        entries.extend(_package_to_entry(package) for package in packages)
+        self._write(repository_info, etag, entries)
+
+        logger.info("Applied index delta for %r (%d removed or changed, "
+                    "%d added or changed)", repository_info.index_url,
+                    len(removed_keys), len(packages))
+        return self._repository_from_entries(entries, repository_info, lazy)
+
+    def set(self, repository_info, etag, packages):
+        """ Store the given packages as the snapshot of the given repository's
+        index at the given etag.
+
+        Any previous snapshot for the same index is replaced.
+        """
+        if not etag:
+            return
+
+        self._write(repository_info, etag,
+                    [_package_to_entry(package) for package in packages])
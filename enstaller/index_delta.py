@@ -0,0 +1,121 @@
+"""
+Incremental (delta) updates of legacy json indices.
+
+Index deltas follow the HTTP delta encoding protocol (RFC 3229): the client
+sends the ETag of the index it already has in If-None-Match, together with an
+``A-IM: enstaller-index-delta`` header. A server supporting deltas may then
+answer with a ``226 IM Used`` response, whose body is a json delta against
+that index, and whose ETag is the one of the current index::
+
+    {
+        "added": {key: entry, ...},
+        "changed": {key: entry, ...},
+        "removed": [key, ...]
+    }
+
+Servers which do not support deltas simply ignore the A-IM header and answer
+with a 200 (or a 304 if the index did not change).
+"""
+from __future__ import absolute_import
+
+import six
+
+from enstaller.repository import _IndexEntryFactory, _RequirementNormalizer
+from enstaller.utils import PY_VER
+
+
+INDEX_DELTA_IM = "enstaller-index-delta"
+
+# Status code of a response encoded with an instance manipulation (RFC 3229)
+IM_USED = 226
+
+
+def is_index_delta_request(request):
+    """ Returns True if the given (requests) request accepts an index delta
+    as a response."""
+    return INDEX_DELTA_IM in request.headers.get("A-IM", "")
+
+
+def index_delta_headers(etag):
+    """ Returns the headers to send to ask for a delta against the index with
+    the given etag."""
+    return {"If-None-Match": etag, "A-IM": INDEX_DELTA_IM}
+
+
+def compute_index_delta(old_index, new_index):
+    """ Returns the delta from old_index to new_index, for servers (or
+    stand-in servers) implementing the protocol.
+
+    Parameters
+    ----------
+    old_index : dict
+        The parsed legacy json index the client has.
+    new_index : dict
+        The current parsed legacy json index.
+    """
+    added = {}
+    changed = {}
+    for key, entry in six.iteritems(new_index):
+        old_entry = old_index.get(key)
+        if old_entry is None:
+            added[key] = entry
+        elif old_entry != entry:
+            changed[key] = entry
+    removed = sorted(key for key in old_index if key not in new_index)
+    return {"added": added, "changed": changed, "removed": removed}
+
+
+def validate_index_delta(delta):
+    """ Raise a ValueError if the given decoded delta is not valid."""
+    if not isinstance(delta, dict):
+        raise ValueError("Invalid index delta: expected a json object")
+    for name, kind in (("added", dict), ("changed", dict),
+                       ("removed", list)):
+        if not isinstance(delta.get(name, kind()), kind):
+            raise ValueError(
+                "Invalid index delta: {0!r} has an invalid type".format(name)
+            )
+
+
+def parse_index_delta(delta, known_keys, repository_info,
+                      python_version=PY_VER):
+    """ Parse the added and changed entries of the given delta.
+
+    Parameters
+    ----------
+    delta : dict
+        The decoded delta.
+    known_keys : iterable
+        Iterable of the (key, name) pairs of the packages already known for
+        this index, used to normalize requirement names as parse_index would
+        do with the full index.
+    repository_info : IRepositoryInfo
+        An object describing the remote repository.
+    python_version : str
+        See parse_index.
+
+    Returns
+    -------
+    removed_keys : set
+        The keys of the entries removed or changed by the delta.
+    packages : list
+        The package metadata for the added and changed entries.
+    """
+    entries = dict(delta.get("added", {}))
+    entries.update(delta.get("changed", {}))
+
+    normalizer = _RequirementNormalizer({})
+    for key, name in known_keys:
+        normalizer.register(key, {"name": name})
+    for key, info in six.iteritems(entries):
+        normalizer.register(key, info)
+
+    factory = _IndexEntryFactory(entries, repository_info, python_version,
+                                 normalizer)
+    packages = [factory.from_entry(key, info)
+                for key, info in six.iteritems(entries)
+                if factory.accepts(info)]
+
+    removed_keys = set(delta.get("removed", []))
+    removed_keys.update(delta.get("changed", {}))
+    return removed_keys, packages
@@ -0,0 +1,236 @@
+"""
+Fetching and parsing the index of a repository, shared by the command line
+(repository_factory) and enstaller.async_fetch.
+
+Depending on what is available, the index is either:
+
+- rebuilt from the stored snapshot (see enstaller.index_cache), if the
+  server reports it to be unchanged or sends a delta against it (see
+  enstaller.index_delta),
+- parsed while it is downloaded (streaming),
+- or downloaded through the etag cache of the session, then parsed.
+"""
+from __future__ import absolute_import
+
+import io
+import logging
+
+import requests
+
+from enstaller.index_delta import (IM_USED, INDEX_DELTA_IM,
+                                   index_delta_headers, validate_index_delta)
+from enstaller.repository import Repository, parse_index_items
+from enstaller.repository_info import MirroredRepositoryInfo
+from enstaller.requests_utils import NO_STORE_HEADERS, _ResponseIterator
+from enstaller.utils import decode_json_from_buffer, iter_index_items
+
+
+logger = logging.getLogger(__name__)
+
+
+def _should_raise(resp, raise_on_error):
+    if not raise_on_error:
+        if resp.status_code in (403, 404):
+            return False
+    return True
+
+
+def _fetch_index_delta(session, repository_info, snapshot_cache, streaming,
+                       index_url=None):
+    """ Try to update the stored snapshot of the given repository's index
+    with a delta from the server (see enstaller.index_delta).
+
+    A server not supporting deltas answers with the full index, which is
+    parsed as is instead of being fetched again.
+
+    Returns None if a full fetch is needed: no snapshot, invalid delta,
+    error, etc...
+    """
+    index_url = index_url or repository_info.index_url
+    base_etag = snapshot_cache.latest_etag(repository_info)
+    if base_etag is None:
+        return None
+
+    headers = index_delta_headers(base_etag)
+    if streaming:
+        # See _stream_repository
+        headers.update(NO_STORE_HEADERS)
+
+    resp = session.get(index_url, headers=headers, stream=True)
+    try:
+        if resp.status_code == 304:
+            return snapshot_cache.get(repository_info, base_etag)
+        elif (resp.status_code == IM_USED
+              and resp.headers.get("IM") == INDEX_DELTA_IM):
+            try:
+                delta = decode_json_from_buffer(resp.content)
+                validate_index_delta(delta)
+            except ValueError as e:
+                logger.warn("Invalid index delta for %r: %r", index_url, e)
+                return None
+            return snapshot_cache.apply_delta(
+                repository_info, base_etag, resp.headers.get("etag"), delta
+            )
+        elif resp.status_code == 200:
+            return _repository_from_response(resp, repository_info,
+                                             snapshot_cache, streaming)
+        else:
+            # Errors are handled by the full fetch
+            return None
+    finally:
+        resp.close()
+
+
+def _repository_from_response(resp, repository_info, snapshot_cache,
+                              streaming):
+    """ Parse the full index from the given (200) response, storing its
+    snapshot if a snapshot cache is given."""
+    etag = resp.headers.get("etag")
+    if streaming:
+        # Entries are converted as soon as they are decoded, so neither
+        # the raw index nor its decoded json are ever kept in memory.
+        items = iter_index_items(_ResponseIterator(resp))
+        repository = Repository(parse_index_items(items, repository_info))
+        if snapshot_cache is not None:
+            snapshot_cache.set(repository_info, etag,
+                               repository.iter_packages())
+        return repository
+
+    use_snapshot = snapshot_cache is not None and bool(etag)
+    if use_snapshot:
+        repository = snapshot_cache.get(repository_info, etag)
+        if repository is not None:
+            resp.close()
+            return repository
+
+    data = io.BytesIO()
+    for chunk in _ResponseIterator(resp):
+        data.write(chunk)
+    json_data = decode_json_from_buffer(data.getvalue())
+
+    if use_snapshot:
+        # Every package is needed to write the snapshot, so no point
+        # in being lazy.
+        repository = Repository.from_index(json_data, repository_info)
+        # Packages are stored sorted, so that sorting them when
+        # loading the snapshot is cheap.
+        snapshot_cache.set(repository_info, etag, repository.iter_packages())
+    else:
+        repository = Repository.from_index(json_data, repository_info,
+                                           lazy=True)
+    return repository
+
+
+def _stream_repository(session, repository_info, raise_on_error,
+                       snapshot_cache=None, index_url=None):
+    """ Fetch the given repository's index, parsing it while it is
+    downloaded.
+
+    The etag cache is bypassed, since it would buffer the whole index:
+    the parsed snapshot, if any, serves as the cached copy instead, and is
+    revalidated with a conditional request.
+    """
+    index_url = index_url or repository_info.index_url
+    headers = dict(NO_STORE_HEADERS)
+    base_etag = None
+    if snapshot_cache is not None:
+        base_etag = snapshot_cache.latest_etag(repository_info)
+        if base_etag is not None:
+            headers["If-None-Match"] = base_etag
+
+    resp = session.get(index_url, headers=headers, stream=True)
+    try:
+        if resp.status_code == 304 and base_etag is not None:
+            repository = snapshot_cache.get(repository_info, base_etag)
+            if repository is not None:
+                return repository
+            # The snapshot was removed in between, fetch the full index
+            resp.close()
+            headers.pop("If-None-Match")
+            resp = session.get(index_url, headers=headers, stream=True)
+
+        if resp.status_code != 200:
+            if _should_raise(resp, raise_on_error):
+                resp.raise_for_status()
+            return None
+
+        return _repository_from_response(resp, repository_info,
+                                         snapshot_cache, True)
+    finally:
+        resp.close()
+
+
+def fetch_repository(session, repository_info, raise_on_error=False,
+                     snapshot_cache=None, streaming=False, use_deltas=False):
+    """ Fetch and parse the index of the given repository, using etag
+    caching.
+
+    The index of a mirrored repository is fetched from its preferred mirror,
+    and from the next ones (see MirrorStats.rank) if that fails.
+
+    Parameters
+    ----------
+    session : Session
+        The session to fetch the index with.
+    repository_info : IRepositoryInfo
+        The repository to fetch.
+    raise_on_error : bool
+        If False, None is returned if the index does not exist or is not
+        accessible (404 and 403), instead of raising an HTTPError.
+    snapshot_cache : IndexSnapshotCache
+        If given, parsed indices are stored in and reused from this cache.
+    streaming : bool
+        If True, the index is decoded and parsed while it is downloaded.
+    use_deltas : bool
+        If True, and a snapshot of the index is available, ask the server for
+        a delta against that snapshot instead of the full index. A server
+        not supporting deltas answers with the full index, so this never
+        costs an extra request.
+
+    Returns
+    -------
+    repository : Repository or None
+    """
+    if not isinstance(repository_info, MirroredRepositoryInfo):
+        return _fetch_index(session, repository_info, raise_on_error,
+                            snapshot_cache, streaming, use_deltas)
+
+    mirrors = repository_info.stats.rank(repository_info.mirrors)
+    for i, mirror in enumerate(mirrors):
+        try:
+            return _fetch_index(session, repository_info, raise_on_error,
+                                snapshot_cache, streaming, use_deltas,
+                                mirror.index_url)
+        except requests.exceptions.RequestException as e:
+            repository_info.stats.record_failure(mirror)
+            if i == len(mirrors) - 1:
+                raise
+            logger.warn("Could not fetch index %r (%s), trying %r",
+                        mirror.index_url, e, mirrors[i + 1].index_url)
+
+
+def _fetch_index(session, repository_info, raise_on_error, snapshot_cache,
+                 streaming, use_deltas, index_url=None):
+    index_url = index_url or repository_info.index_url
+    with session.etag():
+        if use_deltas and snapshot_cache is not None:
+            repository = _fetch_index_delta(session, repository_info,
+                                            snapshot_cache, streaming,
+                                            index_url)
+            if repository is not None:
+                return repository
+
+        if streaming:
+            return _stream_repository(session, repository_info,
+                                      raise_on_error, snapshot_cache,
+                                      index_url)
+
+        resp = session.get(index_url, stream=True)
+        if resp.status_code != 200:
+            if _should_raise(resp, raise_on_error):
+                resp.raise_for_status()
+            else:
+                return None
+        else:
+            return _repository_from_response(resp, repository_info,
+                                             snapshot_cache, False)
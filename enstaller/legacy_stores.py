@@ -53,6 +53,5 @@ def repository_factory(session, indices):
         resp = session.fetch(url)
         json_data = resp.json()
 
-        for package in parse_index(json_data, store_location):
-            repository.add_package(package)
+        repository.extend(parse_index(json_data, store_location))
     return repository
@@ -43,6 +43,12 @@ def _config_from_json_data(json_data):
     config.update(verify_ssl=json_data.get("verify_ssl", True))
     if json_data.get("proxy") is not None:
         config.update(proxy=json_data["proxy"])
+    # Processes started together may be given a share of the link each
+    for name in ("max_concurrent_transfers", "max_download_rate"):
+        if name in json_data:
+            config.update(**{name: json_data[name]})
+    if "stream_indices" in json_data:
+        config.update(stream_indices=json_data["stream_indices"])
     config.set_repositories_from_names(json_data["repositories"])
 
     return config
@@ -96,7 +102,8 @@ def install():
     config, requirement = install_parse_json_string(json_string)
 
     session = Session.authenticated_from_configuration(config)
-    repository = repository_factory(session, config.repositories)
+    repository = repository_factory(session, config.repositories,
+                                    streaming=config.stream_indices)
 
     progress_bar_context = ProgressBarContext(console_progress_manager_factory,
                                               fetch=fetch_progress_factory)
@@ -115,7 +122,8 @@ def remove():
     config, requirement = install_parse_json_string(json_string)
 
     session = Session.authenticated_from_configuration(config)
-    repository = repository_factory(session, config.repositories)
+    repository = repository_factory(session, config.repositories,
+                                    streaming=config.stream_indices)
 
     progress_bar_context = ProgressBarContext(console_progress_manager_factory,
                                               fetch=fetch_progress_factory)
@@ -140,7 +148,8 @@ def update_all():
     config = update_all_parse_json_string(json_string)
 
     session = Session.authenticated_from_configuration(config)
-    repository = repository_factory(session, config.repositories)
+    repository = repository_factory(session, config.repositories,
+                                    streaming=config.stream_indices)
 
     progress_bar_context = ProgressBarContext(console_progress_manager_factory,
                                               fetch=fetch_progress_factory)
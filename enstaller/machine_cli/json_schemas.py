@@ -18,6 +18,17 @@ UPDATE_ALL_SCHEMA = {
             "description": "Where to cache downloaded files.",
             "type": "string"
         },
+        "max_concurrent_transfers": {
+            "description": "Max number of eggs downloaded at the same time.",
+            "type": "integer",
+            "minimum": 1
+        },
+        "max_download_rate": {
+            "description": "Max bandwidth (in bytes per second) used to "
+                           "download eggs.",
+            "type": "integer",
+            "minimum": 1
+        },
         "proxy": {
             "description": "Proxy setting (full URL).",
             "type": "string"
@@ -27,6 +38,11 @@ UPDATE_ALL_SCHEMA = {
             "items": {"type": "string"},
             "description": "List of repositories."
         },
+        "stream_indices": {
+            "description": "Whether to parse indices while they are "
+                           "downloaded, instead of buffering them.",
+            "type": "boolean"
+        },
         "store_url": {
             "description": "The url (schema + hostname only of the store to "
                            "connect to).",
@@ -109,6 +109,67 @@ class TestParseJsonString(unittest.TestCase):
         # Then
         self.assertEqual(config.proxy_dict, {"http": "http://acme.com:3128"})
 
+    def test_download_limits(self):
+        # Given
+        data = {
+            "authentication": {
+                "kind": "simple",
+                "username": "nono",
+                "password": "le petit robot",
+            },
+            "files_cache": self.prefix,
+            "repositories": ["enthought/free"],
+            "requirement": "numpy",
+            "store_url": "https://acme.com",
+        }
+
+        # When
+        config, requirement = install_parse_json_string(json.dumps(data))
+
+        # Then
+        self.assertIsNone(config.max_concurrent_transfers)
+        self.assertIsNone(config.max_download_rate)
+
+        # Given
+        data["max_concurrent_transfers"] = 2
+        data["max_download_rate"] = 1048576
+
+        # When
+        config, requirement = install_parse_json_string(json.dumps(data))
+
+        # Then
+        self.assertEqual(config.max_concurrent_transfers, 2)
+        self.assertEqual(config.max_download_rate, 1048576)
+
+    def test_stream_indices(self):
+        # Given
+        data = {
+            "authentication": {
+                "kind": "simple",
+                "username": "nono",
+                "password": "le petit robot",
+            },
+            "files_cache": self.prefix,
+            "repositories": ["enthought/free"],
+            "requirement": "numpy",
+            "store_url": "https://acme.com",
+        }
+
+        # When
+        config, requirement = install_parse_json_string(json.dumps(data))
+
+        # Then
+        self.assertFalse(config.stream_indices)
+
+        # Given
+        data["stream_indices"] = True
+
+        # When
+        config, requirement = install_parse_json_string(json.dumps(data))
+
+        # Then
+        self.assertTrue(config.stream_indices)
+
     def test_verify_ssl(self):
         # Given
         data = {
@@ -30,6 +30,8 @@ from egginst.progress import console_progress_manager_factory
 import enstaller
 
 from enstaller.auth import UserPasswordAuth
+from enstaller.cache_server import (DEFAULT_HOST, DEFAULT_PORT,
+                                    parse_address)
 from enstaller.errors import (EnstallerException,
                               InvalidPythonPathConfiguration,
                               InvalidConfiguration,
@@ -47,11 +49,14 @@ from enstaller.solver import ForceMode, Requirement, SolverMode
 from enstaller.utils import abs_expanduser, input_auth, prompt_yes_no
 from enstaller.versions import EnpkgVersion
 
-from enstaller.cli.commands import (env_option, freeze, imports_option,
-                                    info_option, install_from_requirements,
-                                    list_option, print_history,
+from enstaller.cli.commands import (cache_gc, env_option, freeze,
+                                    imports_option, info_option,
+                                    install_from_requirements,
+                                    list_option, prefetch_from_requirements,
+                                    prefetch_reqs, print_history,
                                     remove_requirement, revert, search,
-                                    update_all, whats_new)
+                                    serve_cache, update_all, verify_cache,
+                                    whats_new)
 from enstaller.cli.utils import (exit_if_root_on_non_owned,
                                  humanize_ssl_error_and_die, install_req,
                                  repository_factory)
@@ -271,6 +276,11 @@ def dispatch_commands_without_enpkg(args, config, config_filename, prefixes,
         freeze(prefixes)
         return True
 
+    if args.cache_gc:                             # --cache-gc
+        cache_gc(config.repository_cache, prefixes,
+                 config.repository_cache_max_size, config.shared_egg_store)
+        return True
+
     if args.list:                                 # --list
         list_option(prefixes, pat)
         return True
@@ -306,6 +316,18 @@ def dispatch_commands_with_enpkg(args, enpkg, config, prefix, session, parser,
         revert(enpkg, args.revert)
         return
 
+    if args.prefetch:                             # --prefetch
+        # Handled before auto-updating enstaller, as the prefix must not be
+        # modified
+        if args.requirements:
+            prefetch_from_requirements(enpkg, config, args.requirements)
+        elif len(args.cnames) > 0:
+            mode = SolverMode.ROOT if args.no_deps else SolverMode.RECUR
+            prefetch_reqs(enpkg, config, _compute_reqs(args.cnames), mode)
+        else:
+            parser.error("Requirement(s) missing")
+        return
+
     # Try to auto-update enstaller
     if config.autoupdate and not args.no_autoupdate:
         if update_enstaller(session, enpkg._remote_repository, args):
@@ -329,6 +351,20 @@ def dispatch_commands_with_enpkg(args, enpkg, config, prefix, session, parser,
         whats_new(enpkg._remote_repository, enpkg._installed_repository)
         return
 
+    if args.verify_cache:                         # --verify-cache
+        verify_cache(enpkg._remote_repository, enpkg._downloader)
+        return
+
+    if args.serve_cache:                          # --serve-cache
+        def refresh_repository():
+            return repository_factory(session, config.repositories,
+                                      quiet=True, raise_on_error=True,
+                                      streaming=config.stream_indices)
+
+        serve_cache(enpkg._remote_repository, enpkg._downloader,
+                    args.serve_cache, refresh_repository)
+        return
+
     if args.force:
         if args.forceall:
             force = ForceMode.ALL
@@ -411,6 +447,12 @@ def _create_parser():
     p = ArgumentParser(description=__doc__)
     p.add_argument('cnames', metavar='NAME', nargs='*',
                    help='package(s) to work on')
+    p.add_argument("--cache-gc", action="store_true",
+                   help="remove the least recently used eggs from the "
+                        "download cache, until it fits in "
+                        "repository_cache_max_size (every egg not currently "
+                        "installed if not set), then the eggs of the "
+                        "shared egg store not used by any cache anymore")
     p.add_argument("--add-url", metavar='URL',
                    help="add a repository URL to the configuration file")
     p.add_argument("--insecure", "-k", action="store_true",
@@ -435,6 +477,17 @@ def _create_parser():
     p.add_argument("--log", action="store_true", help="print revision log")
     p.add_argument('-l', "--list", action="store_true",
                    help="list the packages currently installed on the system")
+    p.add_argument("--max-concurrent-fetches", type=int,
+                   default=argparse.SUPPRESS,
+                   help="Maximum number of eggs downloaded at the same time.")
+    p.add_argument("--max-concurrent-transfers", type=int,
+                   default=argparse.SUPPRESS,
+                   help="Maximum number of eggs downloaded at the same time "
+                        "by the whole process (not limited by default).")
+    p.add_argument("--max-download-rate", type=int, metavar="BYTES",
+                   default=argparse.SUPPRESS,
+                   help="Maximum bandwidth (in bytes per second) used to "
+                        "download eggs (not limited by default).")
     p.add_argument("--max-retries", type=int,
                    default=argparse.SUPPRESS,
                    help="Maximum number of retries for a checksum mismatch or "
@@ -446,6 +499,11 @@ def _create_parser():
     p.add_argument("--env", action="store_true",
                    help="based on the configuration, display how to set "
                         "environment variables")
+    p.add_argument("--prefetch", action="store_true",
+                   help="resolve the given package(s) (or the requirements "
+                        "file) together, and download every egg needed to "
+                        "install them into the download cache, without "
+                        "installing anything")
     p.add_argument("--prefix", metavar='PATH',
                    help="install prefix (disregarding any settings in "
                         "the config file)")
@@ -465,6 +523,21 @@ def _create_parser():
     p.add_argument('-s', "--search", action="store_true",
                    help="search the online repo index "
                         "and display versions available")
+    p.add_argument("--serve-cache", metavar="ADDRESS", nargs="?",
+                   const=str(DEFAULT_PORT),
+                   help="serve the download cache and an index of the "
+                        "configured repositories over HTTP at ADDRESS "
+                        "([HOST:]PORT, {0}:{1} by default), fetching the "
+                        "missing eggs on demand. There is no "
+                        "authentication: only give a host reachable from "
+                        "other machines (e.g. 0.0.0.0 for every interface) "
+                        "on a trusted network".format(DEFAULT_HOST,
+                                                      DEFAULT_PORT))
+    p.add_argument("--stream-indices", action="store_true",
+                   default=argparse.SUPPRESS,
+                   help="parse the indices while they are downloaded, "
+                        "instead of keeping them in memory (useful for "
+                        "large indices).")
     p.add_argument("--sys-config", action="store_true",
                    help="Do nothing, kept for backwarc compatibility.")
     p.add_argument("--sys-prefix", action="store_true",
@@ -483,6 +556,9 @@ def _create_parser():
                         "specified thrice.")
     p.add_argument('--version', action="version",
                    version='enstaller version: ' + enstaller.__version__)
+    p.add_argument("--verify-cache", action="store_true",
+                   help="re-hash the cached eggs, and remove the ones whose "
+                        "checksum does not match")
     p.add_argument("--whats-new", action="store_true",
                    help="display available updates for installed packages")
     p.add_argument("-y", "--yes", action="store_true",
@@ -534,7 +610,8 @@ def _preprocess_options(argv):
     simple_standalone_actions = (args.config, args.env, args.userpass,
                                  args.revert, args.log, args.whats_new,
                                  args.update_all, args.remove_enstaller,
-                                 args.add_url, args.freeze, args.requirements)
+                                 args.add_url, args.freeze, args.requirements,
+                                 args.serve_cache)
     # Action options which can take a package name pattern:
     complex_standalone_actions = (args.list, args.imports,
                                   args.search, args.info, args.remove)
@@ -558,6 +635,17 @@ def _preprocess_options(argv):
     if args.force and args.forceall:
         p.error("Options --force and --forceall exclude each other")
 
+    if args.prefetch and (count_complex_actions > 0 or count_simple_actions
+                          > int(bool(args.requirements))):
+        p.error("Option --prefetch only applies to package names or to a "
+                "requirements file")
+
+    if args.serve_cache:
+        try:
+            args.serve_cache = parse_address(args.serve_cache)
+        except ValueError as e:
+            p.error(str(e))
+
     return p, args
 
 
@@ -655,6 +743,20 @@ def main(argv=None):
     if hasattr(args, "max_retries"):
         config.update(max_retries=args.max_retries)
 
+    if hasattr(args, "max_concurrent_fetches"):
+        config.update(max_concurrent_fetches=args.max_concurrent_fetches)
+
+    if hasattr(args, "max_concurrent_transfers"):
+        config.update(
+            max_concurrent_transfers=args.max_concurrent_transfers
+        )
+
+    if hasattr(args, "max_download_rate"):
+        config.update(max_download_rate=args.max_download_rate)
+
+    if hasattr(args, "stream_indices"):
+        config.update(stream_indices=args.stream_indices)
+
     with Session.from_configuration(config) as session:
         if dispatch_commands_without_enpkg(args, config, config_filename,
                                            prefixes, prefix, pat,
@@ -668,7 +770,8 @@ def main(argv=None):
                                     use_new_format=use_new_format)
 
         repository = repository_factory(session, config.repositories,
-                                        args.quiet)
+                                        args.quiet,
+                                        streaming=config.stream_indices)
         if args.quiet:
             progress_bar_context = None
         else:
@@ -680,7 +783,12 @@ def main(argv=None):
                 console_progress_manager_factory, fetch=fetch_progress_factory)
         enpkg = Enpkg(repository, session, prefixes, progress_bar_context,
                       args.force or args.forceall,
-                      max_retries=config.max_retries)
+                      max_retries=config.max_retries,
+                      max_concurrent_fetches=config.max_concurrent_fetches,
+                      repository_cache_max_size=(
+                          config.repository_cache_max_size
+                      ),
+                      shared_egg_store=config.shared_egg_store)
 
         dispatch_commands_with_enpkg(args, enpkg, config, prefix, session, parser,
                                      pat)
@@ -0,0 +1,118 @@
+"""
+Latency and throughput of the mirrors of a repository, to route each egg to
+the mirror currently expected to be the fastest.
+
+Statistics only live for the duration of a run. The latency (time until the
+response headers are received) and the throughput of each mirror are moving
+averages of the measurements made while fetching eggs, so that a mirror
+slowing down during a transaction is quickly avoided. A mirror which failed
+is not used again for a while, unless every other mirror failed as well.
+"""
+from __future__ import absolute_import, division
+
+import threading
+import time
+
+
+# Weight of a new measurement in the moving averages
+_SMOOTHING = 0.3
+
+# Transfers smaller than this are dominated by latency, and tell nothing
+# about throughput
+_MIN_TRANSFER_SIZE = 64 * 1024
+
+# A mirror which failed is avoided for that long (in seconds)
+_FAILURE_BACKOFF = 60.0
+
+
+def _smooth(average, value):
+    if average is None:
+        return value
+    else:
+        return (1 - _SMOOTHING) * average + _SMOOTHING * value
+
+
+class _MirrorEstimate(object):
+    def __init__(self):
+        self.latency = None
+        self.throughput = None
+        self.failed_at = None
+
+
+class MirrorStats(object):
+    """ Thread-safe statistics of a set of mirrors.
+
+    Mirrors may be any hashable object (e.g. IRepositoryInfo instances).
+
+    Parameters
+    ----------
+    clock : callable
+        Returns the current time, in seconds.
+    """
+    def __init__(self, clock=time.time):
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._estimates = {}
+
+    def _estimate(self, mirror):
+        return self._estimates.setdefault(mirror, _MirrorEstimate())
+
+    def _is_available(self, mirror):
+        estimate = self._estimates.get(mirror)
+        return (estimate is None or estimate.failed_at is None
+                or self._clock() - estimate.failed_at > _FAILURE_BACKOFF)
+
+    def _expected_time(self, mirror, size):
+        estimate = self._estimates.get(mirror)
+        if estimate is None or estimate.latency is None:
+            return None
+        expected = estimate.latency
+        if size > 0 and estimate.throughput is not None:
+            expected += size / estimate.throughput
+        return expected
+
+    def record_latency(self, mirror, seconds):
+        """ Record the time the given mirror took to respond to a request.
+        """
+        with self._lock:
+            estimate = self._estimate(mirror)
+            estimate.latency = _smooth(estimate.latency, seconds)
+            estimate.failed_at = None
+
+    def record_transfer(self, mirror, size, seconds):
+        """ Record the time the given mirror took to send size bytes."""
+        if size < _MIN_TRANSFER_SIZE:
+            return
+        throughput = size / max(seconds, 1e-6)
+        with self._lock:
+            estimate = self._estimate(mirror)
+            estimate.throughput = _smooth(estimate.throughput, throughput)
+
+    def record_failure(self, mirror):
+        """ Record that a request to the given mirror failed."""
+        with self._lock:
+            self._estimate(mirror).failed_at = self._clock()
+
+    def expected_time(self, mirror, size=0):
+        """ Returns the expected time to fetch size bytes from the given
+        mirror, or None if the mirror was never measured."""
+        with self._lock:
+            return self._expected_time(mirror, size)
+
+    def rank(self, mirrors, size=0):
+        """ Returns the given mirrors, from the most to the least preferred
+        to fetch size bytes.
+
+        Mirrors never measured come first (in their original order), so that
+        every mirror gets measured, then the other mirrors by expected time.
+        Mirrors which failed recently always come last.
+        """
+        with self._lock:
+            def _key(item):
+                i, mirror = item
+                expected = self._expected_time(mirror, size)
+                return (not self._is_available(mirror), expected is not None,
+                        expected or 0.0, i)
+
+            return [mirror for _, mirror in sorted(enumerate(mirrors),
+                                                   key=_key)]
@@ -0,0 +1,133 @@
+"""
+Search of package names by regular expression.
+
+Most searches are either plain substrings (``enpkg -s numpy``) or anchored
+prefixes (``enpkg -s ^py``). A NameIndex answers those from a sorted list of
+names and a trigram index, without matching the pattern against every name.
+Other patterns fall back to a scan of the names.
+"""
+from __future__ import absolute_import
+
+import bisect
+import re
+
+import six
+
+
+_REGEX_METACHARACTERS = frozenset(".^$*+?{}[]\\|()")
+
+
+def _is_literal(s):
+    return not any(c in _REGEX_METACHARACTERS for c in s)
+
+
+def _literal_from_pattern(pattern):
+    """ Returns the (literal, anchored) pair for patterns matching a plain
+    substring (anchored is False) or prefix (anchored is True), or None for
+    any other pattern."""
+    if pattern.flags & re.VERBOSE:
+        return None
+
+    s = pattern.pattern
+    if s.startswith("^") and _is_literal(s[1:]):
+        return s[1:], True
+    elif _is_literal(s):
+        return s, False
+    else:
+        return None
+
+
+def _trigrams(s):
+    return set(s[i:i + 3] for i in range(len(s) - 2))
+
+
+def _sort_key(name):
+    return name.lower(), name
+
+
+def _compile(pattern):
+    if isinstance(pattern, six.string_types):
+        pattern = re.compile(pattern, re.I)
+    return pattern
+
+
+def scan_names(names, pattern):
+    """ Returns the names matching the given pattern (as by pattern.search),
+    sorted case-insensitively.
+
+    Parameters
+    ----------
+    names : iterable
+        The names to search.
+    pattern : str or regex
+        The pattern to look for. Strings are compiled case-insensitively.
+    """
+    pattern = _compile(pattern)
+    return sorted((name for name in names if pattern.search(name)),
+                  key=_sort_key)
+
+
+class NameIndex(object):
+    """ An index of package names, to look up names matching a regular
+    expression.
+
+    Literal and prefix-anchored patterns are answered from the index, any
+    other pattern is matched against every name.
+
+    Parameters
+    ----------
+    names : iterable
+        The names to index.
+    """
+    def __init__(self, names):
+        self._names = sorted(set(names), key=_sort_key)
+        self._lower_names = [name.lower() for name in self._names]
+
+        self._trigram_to_ids = {}
+        for i, name in enumerate(self._lower_names):
+            for trigram in _trigrams(name):
+                self._trigram_to_ids.setdefault(trigram, []).append(i)
+
+    def __len__(self):
+        return len(self._names)
+
+    def _candidates(self, literal, anchored):
+        literal = literal.lower()
+        lower_names = self._lower_names
+
+        if anchored:
+            start = bisect.bisect_left(lower_names, literal)
+            end = start
+            while (end < len(lower_names)
+                   and lower_names[end].startswith(literal)):
+                end += 1
+            return range(start, end)
+        elif len(literal) < 3:
+            return [i for i, name in enumerate(lower_names) if literal in name]
+        else:
+            postings = sorted((self._trigram_to_ids.get(trigram, [])
+                               for trigram in _trigrams(literal)), key=len)
+            ids = set(postings[0])
+            for other in postings[1:]:
+                ids.intersection_update(other)
+            return sorted(i for i in ids if literal in lower_names[i])
+
+    def search(self, pattern):
+        """ Returns the names matching the given pattern (as by
+        pattern.search), sorted case-insensitively.
+
+        Parameters
+        ----------
+        pattern : str or regex
+            The pattern to look for. Strings are compiled
+            case-insensitively.
+        """
+        pattern = _compile(pattern)
+        literal = _literal_from_pattern(pattern)
+        if literal is None:
+            return scan_names(self._names, pattern)
+
+        # The index is case-insensitive, the candidates are checked against
+        # the actual pattern.
+        return [self._names[i] for i in self._candidates(*literal)
+                if pattern.search(self._names[i])]
@@ -1,5 +1,6 @@
 import os.path
 import sys
+import threading
 import time
 
 from okonomiyaki.platforms import PythonImplementation
@@ -12,12 +13,120 @@ from enstaller.egg_meta import split_eggname
 from enstaller.eggcollect import info_from_metadir
 from enstaller.errors import EnstallerException
 from enstaller.repository_info import FSRepositoryInfo
+from enstaller.solver.requirement_cache import parse_legacy_requirement
 from enstaller.utils import (
     RUNNING_PYTHON, compute_md5, path_to_uri, python_string_to_major_minor
 )
 from enstaller.versions import EnpkgVersion
 
 
+class _InternTable(object):
+    """ A simple table to share equal, immutable values across package
+    metadata instances (names, keys, requirement sets, etc...).
+
+    Unlike the intern builtin, it works for any hashable value, including
+    unicode strings on python 2. Values are keyed on their type as well, so
+    that e.g. 'numpy' and u'numpy' are not conflated.
+    """
+    def __init__(self):
+        self._values = {}
+
+    def __call__(self, value):
+        # dict.setdefault is atomic, so this is thread-safe.
+        return self._values.setdefault((type(value), value), value)
+
+    def __len__(self):
+        return len(self._values)
+
+
+class _InternTables(object):
+    """ The intern tables shared by the package metadata instances created
+    within a scope.
+
+    Sharing mostly pays off between packages loaded together, e.g. the
+    entries of an index, so the tables are not global: they live as long as
+    the object loading the packages keeps them (e.g. an index parser, or a
+    lazily materialized repository). Use them as a context manager to make
+    them the current scope of the running thread::
+
+        with _InternTables():
+            packages = [RemotePackageMetadata(...) for ... in ...]
+
+    Instances created outside of any scope do not share anything.
+    """
+    def __init__(self):
+        self.string = _InternTable()
+        self.dependencies = _InternTable()
+        self.repository_info = _InternTable()
+        # pep425 tag -> PythonImplementation instance
+        self._pythons = {}
+
+    def __enter__(self):
+        _SCOPES.stack.append(self)
+        return self
+
+    def __exit__(self, *a, **kw):
+        _SCOPES.stack.pop()
+
+    def python(self, python):
+        if python is None:
+            return None
+        else:
+            return self._pythons.setdefault(python.pep425_tag, python)
+
+    def python_from_tag(self, python_tag):
+        if python_tag is None:
+            return None
+        python = self._pythons.get(python_tag)
+        if python is None:
+            python = self.python(PythonImplementation.from_string(python_tag))
+        return python
+
+
+def _no_intern(value):
+    return value
+
+
+class _NoInternTables(_InternTables):
+    """ The scope of packages created outside of any other scope."""
+    def __init__(self):
+        self.string = self.dependencies = self.repository_info = _no_intern
+
+    def python(self, python):
+        return python
+
+    def python_from_tag(self, python_tag):
+        if python_tag is None:
+            return None
+        return PythonImplementation.from_string(python_tag)
+
+
+class _Scopes(threading.local):
+    def __init__(self):
+        self.stack = [_NoInternTables()]
+
+
+_SCOPES = _Scopes()
+
+
+def _current_intern_tables():
+    return _SCOPES.stack[-1]
+
+
+def _scoped_intern_tables():
+    """ The intern tables of the current scope, or new tables if there is
+    none."""
+    tables = _current_intern_tables()
+    if isinstance(tables, _NoInternTables):
+        return _InternTables()
+    else:
+        return tables
+
+
+def _python_from_tag(python_tag):
+    return _current_intern_tables().python_from_tag(python_tag)
+
+
 class PackageVersionInfo(object):
     def __init__(self, name, version):
         self.name = name
@@ -30,7 +139,15 @@ class PackageMetadata(object):
     dependencies.
 
     They are not attached to a repository.
+
+    Instances are immutable, and use __slots__ to keep their memory footprint
+    small. Values likely to be identical across many instances (name, python
+    tag, dependencies, etc...) are shared between instances.
     """
+    __slots__ = ("_key", "_name", "_version", "_dependencies", "_python_tag",
+                 "_python", "_python_implementation",
+                 "_dependency_requirements", "_cached_comp_key", "_hash")
+
     @classmethod
     def from_egg(cls, path):
         """
@@ -50,10 +167,7 @@ class PackageMetadata(object):
         """
         version = EnpkgVersion.from_upstream_and_build(json_dict["version"],
                                                        json_dict["build"])
-        if json_dict["python_tag"] is not None:
-            python = PythonImplementation.from_string(json_dict["python_tag"])
-        else:
-            python = None
+        python = _python_from_tag(json_dict["python_tag"])
         return cls(key, json_dict["name"], version, json_dict["packages"],
                    python)
 
@@ -78,19 +192,33 @@ class PackageMetadata(object):
         )
 
     def __init__(self, key, name, version, packages, python):
-        self._key = key
+        tables = _current_intern_tables()
+        intern_string = tables.string
+
+        self._key = intern_string(key)
 
-        self._name = name
+        self._name = intern_string(name)
         self._version = version
 
-        self._dependencies = frozenset(packages)
+        self._dependencies = tables.dependencies(
+            frozenset(intern_string(package) for package in packages)
+        )
+        python = tables.python(python)
         if python is None:
             self._python_tag = self._python = None
         else:
-            self._python_tag = python.pep425_tag
-            self._python = "{0}.{1}".format(python.major, python.minor)
+            self._python_tag = intern_string(python.pep425_tag)
+            self._python = intern_string(
+                "{0}.{1}".format(python.major, python.minor)
+            )
 
         self._python_implementation = python
+        # Parsed lazily, see dependency_requirements
+        self._dependency_requirements = None
+        # Instances are immutable, so the comparison key and hash are only
+        # computed once, the first time they are needed.
+        self._cached_comp_key = None
+        self._hash = None
 
     # ------------------------
     # Protocols implementation
@@ -100,7 +228,11 @@ class PackageMetadata(object):
             self.name, self.version, self.key)
 
     def __eq__(self, other):
-        if not isinstance(other, self.__class__):
+        if self is other:
+            return True
+        elif not isinstance(other, self.__class__):
+            return False
+        elif hash(self) != hash(other):
             return False
         else:
             return self._comp_key == other._comp_key
@@ -109,7 +241,9 @@ class PackageMetadata(object):
         return not (self == other)
 
     def __hash__(self):
-        return hash(self._comp_key)
+        if self._hash is None:
+            self._hash = hash(self._comp_key)
+        return self._hash
 
     # ----------
     # Properties
@@ -118,6 +252,20 @@ class PackageMetadata(object):
     def dependencies(self):
         return self._dependencies
 
+    @property
+    def dependency_requirements(self):
+        """ The dependencies as a frozenset of Requirement instances.
+
+        Requirements are parsed the first time they are needed, through
+        the process-wide requirement cache.
+        """
+        if self._dependency_requirements is None:
+            self._dependency_requirements = frozenset(
+                parse_legacy_requirement(dependency)
+                for dependency in self._dependencies
+            )
+        return self._dependency_requirements
+
     @property
     def full_version(self):
         """
@@ -156,11 +304,18 @@ class PackageMetadata(object):
     # ------------------
     @property
     def _comp_key(self):
+        if self._cached_comp_key is None:
+            self._cached_comp_key = self._make_comp_key()
+        return self._cached_comp_key
+
+    def _make_comp_key(self):
         return (self.name, self.version, self._dependencies, self.python_tag)
 
 
 class RepositoryPackageMetadata(PackageMetadata):
     """ Like PackageMetadata, but attached to a repository. """
+    __slots__ = ("_repository_info",)
+
     @classmethod
     def from_package(cls, package, repository_info):
         return cls(package.key, package.name, package.version,
@@ -185,7 +340,8 @@ class RepositoryPackageMetadata(PackageMetadata):
     def __init__(self, key, name, version, packages, python, repository_info):
         super(RepositoryPackageMetadata, self).__init__(key, name,
                                                         version, packages, python)
-        self._repository_info = repository_info
+        self._repository_info = \
+            _current_intern_tables().repository_info(repository_info)
 
     def __repr__(self):
         return ("RepositoryPackageMetadata('{self.name}-{self.version}', "
@@ -195,9 +351,8 @@ class RepositoryPackageMetadata(PackageMetadata):
     def repository_info(self):
         return self._repository_info
 
-    @property
-    def _comp_key(self):
-        return (super(RepositoryPackageMetadata, self)._comp_key +
+    def _make_comp_key(self):
+        return (super(RepositoryPackageMetadata, self)._make_comp_key() +
                 (self._repository_info,))
 
 
@@ -209,6 +364,9 @@ class RemotePackageMetadata(PackageMetadata):
     In particular, you can fetch a package from its RemotePackageMetadata's
     instance through the source_url attribute.
     """
+    __slots__ = ("_size", "_md5", "_mtime", "_product", "_available",
+                 "_repository_info")
+
     @classmethod
     def from_egg(cls, path, repository_info=None, python=RUNNING_PYTHON):
         """
@@ -249,10 +407,7 @@ class RemotePackageMetadata(PackageMetadata):
     @classmethod
     def _from_json_dict_impl(cls, key, json_dict, version, repository_info):
         json_dict = _set_default_python_tag(json_dict)
-        if json_dict["python_tag"] is not None:
-            python = PythonImplementation.from_string(json_dict["python_tag"])
-        else:
-            python = None
+        python = _python_from_tag(json_dict["python_tag"])
         return cls(key, json_dict["name"], version, json_dict["packages"],
                    python, json_dict["size"], json_dict["md5"],
                    json_dict.get("mtime", 0.0), json_dict.get("product", None),
@@ -268,13 +423,13 @@ class RemotePackageMetadata(PackageMetadata):
         self._md5 = md5
 
         self._mtime = mtime
-        self._product = product
+        tables = _current_intern_tables()
+        self._product = tables.string(product)
         self._available = available
-        self._repository_info = repository_info
+        self._repository_info = tables.repository_info(repository_info)
 
-    @property
-    def _comp_key(self):
-        return (super(RemotePackageMetadata, self)._comp_key +
+    def _make_comp_key(self):
+        return (super(RemotePackageMetadata, self)._make_comp_key() +
                 (self.size, self.md5, self.mtime, self.product, self.available,
                  self.repository_info))
 
@@ -331,6 +486,8 @@ class RemotePackageMetadata(PackageMetadata):
 
 
 class InstalledPackageMetadata(PackageMetadata):
+    __slots__ = ("_ctime", "_prefix")
+
     @classmethod
     def from_egg(cls, path, ctime, prefix=None):
         """
@@ -379,8 +536,9 @@ class InstalledPackageMetadata(PackageMetadata):
         super(InstalledPackageMetadata, self).__init__(key, name, version,
                                                        packages, python)
 
-        self._ctime = ctime
-        self._prefix = prefix
+        intern_string = _current_intern_tables().string
+        self._ctime = intern_string(ctime)
+        self._prefix = intern_string(prefix)
 
     @property
     def ctime(self):
@@ -390,9 +548,8 @@ class InstalledPackageMetadata(PackageMetadata):
     def prefix(self):
         return self._prefix
 
-    @property
-    def _comp_key(self):
-        return (super(InstalledPackageMetadata, self)._comp_key +
+    def _make_comp_key(self):
+        return (super(InstalledPackageMetadata, self)._make_comp_key() +
                 (self.ctime, self._prefix))
 
 
@@ -0,0 +1,185 @@
+"""
+Resolve requirements and fetch every egg they need into the download cache,
+without installing anything (``enpkg --prefetch``)::
+
+    packages = resolve_requirements(repository, ["numpy", "scipy 0.14.0"])
+    stats = prefetch(_DownloadManager(session, repository), packages)
+    print(stats.throughput)
+
+Requirements are resolved together, as for an empty prefix: every egg needed
+to install them is fetched, whatever is installed where enpkg runs, so that
+the later install only uses the cache.
+
+Eggs are fetched concurrently, with the eggs installed first given priority
+in the download scheduler of the session. Downloaded eggs are checked while
+being written, and eggs already in the cache are checked against the md5 of
+the repository (and fetched again if they do not match).
+"""
+from __future__ import absolute_import, division
+
+import time
+
+import six
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from enstaller.enpkg import _DEFAULT_MAX_RETRIES, _RETRIED_FETCH_ERRORS
+from enstaller.repository import Repository
+from enstaller.solver import Request, Requirement, Solver, SolverMode
+
+
+DEFAULT_MAX_WORKERS = 4
+
+
+class PrefetchStats(object):
+    """ Outcome of a prefetch.
+
+    Attributes
+    ----------
+    packages : int
+        Number of eggs prefetched.
+    fetched : int
+        Number of eggs downloaded (the other ones were already in the cache).
+    size : int
+        Number of bytes downloaded.
+    elapsed : float
+        Duration of the prefetch (in seconds).
+    """
+    def __init__(self, packages=0, fetched=0, size=0, elapsed=0.0):
+        self.packages = packages
+        self.fetched = fetched
+        self.size = size
+        self.elapsed = elapsed
+
+    @property
+    def cached(self):
+        """ Number of eggs which were already in the cache."""
+        return self.packages - self.fetched
+
+    @property
+    def throughput(self):
+        """ Download throughput (in bytes per second)."""
+        if self.elapsed > 0:
+            return self.size / self.elapsed
+        else:
+            return 0.0
+
+    def __repr__(self):
+        return ("PrefetchStats(packages={0}, fetched={1}, size={2}, "
+                "elapsed={3:.3f})".format(self.packages, self.fetched,
+                                          self.size, self.elapsed))
+
+
+def resolve_requirements(remote_repository, requirements,
+                         mode=SolverMode.RECUR):
+    """ Returns the packages to install to satisfy every given requirement in
+    an empty prefix, in install order.
+
+    Parameters
+    ----------
+    remote_repository : Repository
+        The repository to resolve the requirements against.
+    requirements : iterable
+        Requirement instances, or legacy requirement strings (e.g.
+        'numpy 1.8.0-1').
+    mode : SolverMode
+        SolverMode.ROOT to ignore the dependencies of the requirements (e.g.
+        for requirements from enpkg --freeze).
+    """
+    request = Request()
+    for requirement in requirements:
+        if isinstance(requirement, six.string_types):
+            requirement = Requirement.from_legacy_requirement_string(
+                requirement
+            )
+        request.install(requirement)
+
+    solver = Solver(remote_repository, Repository(), mode)
+    return [package for opcode, package in solver.resolve(request)
+            if opcode == "install"]
+
+
+class _Prefetch(object):
+    def __init__(self, downloader, max_retries):
+        self._downloader = downloader
+        self._retries = max_retries + 1
+        self._contexts = []
+        self._canceled = False
+
+    def cancel(self):
+        self._canceled = True
+        for context in self._contexts:
+            context.cancel()
+
+    def fetch(self, package, priority):
+        """ Fetch the given package if needed, and returns the number of
+        downloaded bytes."""
+        for i in range(self._retries):
+            if self._canceled:
+                return 0
+            # Cached eggs are only kept if their md5 matches
+            context = self._downloader.iter_fetch(package, True, priority)
+            if not context.needs_to_download:
+                return 0
+            self._contexts.append(context)
+
+            size = 0
+            try:
+                for chunk in context:
+                    size += len(chunk)
+            except _RETRIED_FETCH_ERRORS:
+                if i >= self._retries - 1:
+                    raise
+            else:
+                return size
+
+
+def prefetch(downloader, packages, max_workers=DEFAULT_MAX_WORKERS,
+             max_retries=_DEFAULT_MAX_RETRIES, on_fetched=None):
+    """ Fetch the given packages into the download cache, concurrently.
+
+    Parameters
+    ----------
+    downloader : _DownloadManager
+        The download manager of the cache to fill.
+    packages : list
+        The packages to fetch, in install order.
+    max_workers : int
+        Maximum number of eggs downloaded at the same time.
+    max_retries : int
+        Maximum number of retries to fetch an egg when checksum mismatchs
+        or connection errors occur.
+    on_fetched : callable
+        If given, called with each package and its downloaded size (0 if
+        it was already in the cache) once it is in the cache. Calls are made
+        from the calling thread.
+
+    Returns
+    -------
+    stats : PrefetchStats
+    """
+    start = time.time()
+    stats = PrefetchStats(len(packages))
+    state = _Prefetch(downloader, max_retries)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = dict(
+            (executor.submit(state.fetch, package, priority), package)
+            for priority, package in enumerate(packages)
+        )
+        try:
+            for future in as_completed(futures):
+                size = future.result()
+                if size > 0:
+                    stats.fetched += 1
+                    stats.size += size
+                if on_fetched is not None:
+                    on_fetched(futures[future], size)
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            state.cancel()
+            raise
+
+    stats.elapsed = time.time() - start
+    return stats
@@ -1,29 +1,115 @@
 from __future__ import absolute_import
 
 import operator
-import os
-import os.path
 import sys
 import warnings
 
 import six
 
+from okonomiyaki.errors import InvalidVersion
+
+from egginst.installed_index import iter_installed_infos
+
 from enstaller.collections import DefaultOrderedDict
-from enstaller.eggcollect import info_from_metadir
 from enstaller.errors import NoSuchPackage
+from enstaller.name_index import NameIndex, scan_names
 from enstaller.package import (InstalledPackageMetadata,
-                               RemotePackageMetadata)
+                               RemotePackageMetadata, _scoped_intern_tables)
 from enstaller.utils import PY_VER
 from enstaller.versions import EnpkgVersion
 
 
-def _valid_meta_dir_iterator(prefixes):
-    for prefix in prefixes:
-        egg_info_root = os.path.join(prefix, "EGG-INFO")
-        if os.path.isdir(egg_info_root):
-            for path in os.listdir(egg_info_root):
-                meta_dir = os.path.join(egg_info_root, path)
-                yield prefix, egg_info_root, meta_dir
+def _bisect_left_by_version(packages, version):
+    """ Returns the index of the first package whose version is not lower
+    than the given version, in the version-sorted list of packages."""
+    lo, hi = 0, len(packages)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if packages[mid].version < version:
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+
+def _bisect_right_by_version(packages, version, lo=0):
+    """ Returns the index after the last package whose version is not
+    greater than the given version, in the version-sorted list of
+    packages."""
+    hi = len(packages)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if version < packages[mid].version:
+            hi = mid
+        else:
+            lo = mid + 1
+    return lo
+
+
+def _iter_same_version(packages, version):
+    """ Iterate over the packages with the given version, in the
+    version-sorted list of packages."""
+    lo = _bisect_left_by_version(packages, version)
+    hi = _bisect_right_by_version(packages, version, lo)
+    for i in range(lo, hi):
+        yield packages[i]
+
+
+def _insort_by_version(packages, package_metadata):
+    """ Insert the given package in the version-sorted list of packages,
+    after any package with the same version (same semantics as appending
+    and doing a stable sort)."""
+    i = _bisect_right_by_version(packages, package_metadata.version)
+    packages.insert(i, package_metadata)
+
+
+def _merge_two_by_version(left, right):
+    if len(left) == 0:
+        return list(right)
+    elif len(right) == 0 or not right[0].version < left[-1].version:
+        # No overlap, the common case for packages coming from different
+        # indices
+        return left + right
+
+    merged = []
+    i = j = 0
+    while i < len(left) and j < len(right):
+        # Only take from right when strictly lower, to keep packages with
+        # the same version in order.
+        if right[j].version < left[i].version:
+            merged.append(right[j])
+            j += 1
+        else:
+            merged.append(left[i])
+            i += 1
+    merged.extend(left[i:])
+    merged.extend(right[j:])
+    return merged
+
+
+def _merge_by_version(package_lists):
+    """ Merge the given version-sorted lists of packages into a new
+    version-sorted list.
+
+    Lists are merged pairwise, so that each package is compared O(log k)
+    times for k lists. Packages with the same version are kept in the order
+    of the lists they come from (same semantics as concatenating the lists
+    and doing a stable sort).
+    """
+    package_lists = [packages for packages in package_lists
+                     if len(packages) > 0]
+    if len(package_lists) == 0:
+        return []
+
+    while len(package_lists) > 1:
+        merged = [_merge_two_by_version(package_lists[i],
+                                        package_lists[i + 1])
+                  for i in range(0, len(package_lists) - 1, 2)]
+        if len(package_lists) % 2 == 1:
+            merged.append(package_lists[-1])
+        package_lists = merged
+
+    return list(package_lists[0])
 
 
 class Repository(object):
@@ -37,22 +123,24 @@ class Repository(object):
 
         prefix_info = []
         json_dict = {}
-        for prefix, egg_info_root, meta_dir in _valid_meta_dir_iterator(prefixes):
-            info = info_from_metadir(meta_dir)
-            if info is not None:
+        for prefix in prefixes:
+            for meta_dir, info in iter_installed_infos(prefix):
                 prefix_info.append((prefix, info))
                 json_dict[info["key"]] = info
 
         requirement_normalizer = _RequirementNormalizer(json_dict)
 
-        for prefix, info in prefix_info:
-            key = info["key"]
-            info = requirement_normalizer(key, info)
+        def _iter_packages():
+            for prefix, info in prefix_info:
+                key = info["key"]
+                info = requirement_normalizer(key, info)
 
-            package = InstalledPackageMetadata.from_installed_meta_dict(
-                info, prefix
-            )
-            self.add_package(package)
+                yield InstalledPackageMetadata.from_installed_meta_dict(
+                    info, prefix
+                )
+
+        with _scoped_intern_tables():
+            self.extend(_iter_packages())
 
     @classmethod
     def _from_prefixes(cls, prefixes=None):
@@ -93,34 +181,142 @@ class Repository(object):
             resp = session.fetch(repository_info.index_url)
             json_data = resp.json()
 
-            for package in parse_index(json_data, repository_info):
-                repository.add_package(package)
+            repository.extend(parse_index(json_data, repository_info))
+
+        return repository
+
+    @classmethod
+    def from_index(cls, json_dict, repository_info, python_version=PY_VER,
+                   lazy=False):
+        """ Create a repository from a parsed legacy json index.
 
+        Parameters
+        ----------
+        json_dict: dict
+            Parsed legacy json index
+        repository_info: IRepositoryInfo
+            An object describing the remote repository to parse
+        python_version: str
+            The major.minor string describing the python version (see
+            parse_index).
+        lazy: bool
+            If True, index entries are only converted to package metadata
+            the first time packages with the corresponding name are looked
+            up. The repository content is the same as when lazy is False.
+        """
+        repository = cls()
+        if lazy:
+            factory = _IndexEntryFactory(json_dict, repository_info,
+                                         python_version)
+            name_to_keys = DefaultOrderedDict(list)
+            for key, info in six.iteritems(json_dict):
+                if factory.accepts(info):
+                    name_to_keys[info["name"]].append(key)
+            repository._extend_lazy(name_to_keys, factory)
+        else:
+            repository.extend(
+                parse_index(json_dict, repository_info, python_version)
+            )
         return repository
 
     def __init__(self, packages=None):
         self._name_to_packages = DefaultOrderedDict(list)
+        # name -> list of (factory, items) pairs, for packages which have not
+        # been materialized yet. Those logically come after the packages in
+        # _name_to_packages.
+        self._name_to_pending = {}
 
         self._store_info = ""
 
+        # Built on demand by build_name_index
+        self._name_index = None
+
         packages = packages or []
-        for package in packages:
-            self.add_package(package)
+        self.extend(packages)
 
     def __len__(self):
-        return sum(len(self._name_to_packages[p])
-                   for p in self._name_to_packages)
+        n_packages = sum(len(packages)
+                         for packages in self._name_to_packages.values())
+        n_pending = sum(len(items)
+                        for pending in self._name_to_pending.values()
+                        for _, items in pending)
+        return n_packages + n_pending
 
     def __iter__(self):
         return self.iter_packages()
 
     def add_package(self, package_metadata):
-        self._name_to_packages[package_metadata.name].append(package_metadata)
-        # Fixme: this should not be that costly as long as we don't have
-        # many versions for a given package.
-        self._name_to_packages[package_metadata.name].sort(
-            key=operator.attrgetter("version")
-        )
+        """ Add the given package to this repository.
+
+        Note
+        ----
+        To add many packages at once, use :method:`extend`, which is much
+        faster.
+        """
+        _insort_by_version(self._materialize(package_metadata.name),
+                           package_metadata)
+
+    def extend(self, packages):
+        """ Add the given packages to this repository.
+
+        This is equivalent to calling add_package for each package, but
+        packages are grouped by name and each per-name list is sorted only
+        once.
+
+        Parameters
+        ----------
+        packages : iterable
+            Iterable of PackageMetadata-like instances.
+        """
+        modified = set()
+        for package in packages:
+            if package.name not in modified:
+                self._materialize(package.name)
+                modified.add(package.name)
+            self._name_to_packages[package.name].append(package)
+
+        version_key = operator.attrgetter("version")
+        for name in modified:
+            # sort is stable, so packages with the same version stay in
+            # insertion order, as with add_package.
+            self._name_to_packages[name].sort(key=version_key)
+
+    def _extend_lazy(self, name_to_items, factory):
+        """ Add packages which will only be created when first needed.
+
+        Parameters
+        ----------
+        name_to_items : OrderedDict
+            name -> list of items mapping. factory(item) must return a package
+            metadata instance with the given name.
+        factory : callable
+            Package metadata factory.
+        """
+        for name, items in name_to_items.items():
+            # Register the name now to keep the same iteration order as when
+            # adding packages eagerly
+            self._name_to_packages[name]
+            self._name_to_pending.setdefault(name, []).append(
+                (factory, items)
+            )
+
+    def _materialize(self, name):
+        """ Create the pending packages for the given name, and returns the
+        sorted list of packages with that name."""
+        packages = self._name_to_packages[name]
+        pending = self._name_to_pending.pop(name, None)
+        if pending is not None:
+            for factory, items in pending:
+                packages.extend(factory(item) for item in items)
+            packages.sort(key=operator.attrgetter("version"))
+        return packages
+
+    def _packages(self, name):
+        """ Like _materialize, but does not register unknown names."""
+        if name in self._name_to_packages:
+            return self._materialize(name)
+        else:
+            return []
 
     def delete_package(self, package_metadata):
         """ Remove the given package.
@@ -138,7 +334,7 @@ class Repository(object):
             raise NoSuchPackage(msg)
         else:
             candidates = [p for p in
-                          self._name_to_packages[package_metadata.name]
+                          self._materialize(package_metadata.name)
                           if p.full_version != package_metadata.full_version]
             self._name_to_packages[package_metadata.name] = candidates
 
@@ -155,9 +351,11 @@ class Repository(object):
         ret : bool
             True if the package is in the repository, false otherwise.
         """
-        candidates = self._name_to_packages[package_metadata.name]
-        for candidate in candidates:
-            if candidate.full_version == package_metadata.full_version:
+        candidates = self._packages(package_metadata.name)
+        full_version = package_metadata.full_version
+        for candidate in _iter_same_version(candidates,
+                                            package_metadata.version):
+            if candidate.full_version == full_version:
                 return True
         return False
 
@@ -178,8 +376,8 @@ class Repository(object):
             The corresponding metadata.
         """
         version = EnpkgVersion.from_string(version)
-        candidates = self._name_to_packages[name]
-        for candidate in candidates:
+        candidates = self._packages(name)
+        for candidate in _iter_same_version(candidates, version):
             if candidate.version == version:
                 return candidate
         raise NoSuchPackage("Package '{0}-{1}' not found".format(name,
@@ -198,17 +396,14 @@ class Repository(object):
         package : RemotePackageMetadata
             The corresponding metadata.
         """
-        candidates = [
-            candidate for candidate in self.find_packages(requirement.name)
-            if requirement.matches(candidate.version)
-        ]
-
-        if len(candidates) == 0:
-            msg = "No package found for requirement {0!r}"
-            raise NoSuchPackage(msg.format(requirement))
+        # Candidates are sorted by version, so the first match starting from
+        # the end is the latest one.
+        for candidate in reversed(self._packages(requirement.name)):
+            if requirement.matches(candidate.version):
+                return candidate
 
-        candidates.sort(key=operator.attrgetter("version"))
-        return candidates[-1]
+        msg = "No package found for requirement {0!r}"
+        raise NoSuchPackage(msg.format(requirement))
 
     def find_latest_package(self, name):
         """Returns the latest package with the given name.
@@ -222,7 +417,7 @@ class Repository(object):
         -------
         package : PackageMetadata
         """
-        packages = self.find_packages(name)
+        packages = self._packages(name)
         if len(packages) < 1:
             raise NoSuchPackage("No package with name {0!r}".format(name))
         else:
@@ -269,11 +464,21 @@ class Repository(object):
         packages : iterable
             Iterable of RemotePackageMetadata-like (order is unspecified)
         """
-        candidates = self._name_to_packages.get(name, [])
+        candidates = self._packages(name)
         if version is None:
-            return [package for package in candidates]
+            return list(candidates)
+
+        try:
+            parsed_version = EnpkgVersion.from_string(version)
+        except InvalidVersion:
+            # Cannot bisect, fall back to a linear scan
+            return [package for package in candidates
+                    if package.full_version == version]
         else:
-            return [package for package in candidates if package.full_version == version]
+            return [package
+                    for package in _iter_same_version(candidates,
+                                                      parsed_version)
+                    if package.full_version == version]
 
     def iter_packages(self):
         """Iter over each package of the repository
@@ -283,10 +488,49 @@ class Repository(object):
         packages : iterable
             Iterable of RemotePackageMetadata-like.
         """
-        for packages_set in self._name_to_packages.values():
-            for package in packages_set:
+        for name in list(self._name_to_packages):
+            for package in self._materialize(name):
                 yield package
 
+    def iter_names(self):
+        """ Iter over the names of the packages in this repository.
+
+        Contrary to iter_packages, this does not create the package
+        metadata of lazy repositories.
+        """
+        for name, packages in list(self._name_to_packages.items()):
+            if len(packages) > 0 or name in self._name_to_pending:
+                yield name
+
+    def build_name_index(self):
+        """ Build an index of the package names, which speeds up subsequent
+        calls to search_names.
+
+        This is only worth it when searching many times (e.g. interactive
+        search): a single search is faster without an index. The index is
+        ignored once packages with new names are added.
+        """
+        self._name_index = NameIndex(self._name_to_packages)
+
+    def search_names(self, pattern):
+        """ Returns the names of the packages matching the given pattern (as
+        by pattern.search), sorted case-insensitively.
+
+        Parameters
+        ----------
+        pattern : str or regex
+            The pattern to look for. Strings are compiled
+            case-insensitively.
+        """
+        index = self._name_index
+        # Names are never removed from _name_to_packages, so the index is
+        # up to date as long as no name was added
+        if index is not None and len(index) == len(self._name_to_packages):
+            return [name for name in index.search(pattern)
+                    if len(self._packages(name)) > 0]
+        else:
+            return scan_names(self.iter_names(), pattern)
+
     def iter_most_recent_packages(self):
         """Iter over each package of the repository, but only the most recent
         version of a given package
@@ -297,14 +541,68 @@ class Repository(object):
             Iterable of the corresponding RemotePackageMetadata-like
             instances.
         """
-        for name, packages in self._name_to_packages.items():
-            yield packages[-1]
+        for name in list(self._name_to_packages):
+            packages = self._materialize(name)
+            if len(packages) > 0:
+                yield packages[-1]
 
     def update(self, repository):
         """ Add the given repository's packages to this repository.
+
+        Packages not yet materialized in the given repository stay so.
+        """
+        self._merge([repository])
+
+    @classmethod
+    def merge(cls, repositories):
+        """ Create a new repository with the packages of all the given
+        repositories.
+
+        The per-name sorted lists of packages are merged directly instead of
+        adding each package again. The result only depends on the order of
+        the given repositories: it is the same as creating an empty
+        repository and calling update with each repository in turn.
+
+        Packages not yet materialized in the given repositories stay so.
+
+        Parameters
+        ----------
+        repositories : iterable
+            Iterable of Repository instances.
         """
-        for package in repository:
-            self.add_package(package)
+        repository = cls()
+        repository._merge(repositories)
+        return repository
+
+    def _merge(self, repositories):
+        # name -> repositories with packages of that name, names being in
+        # order of first appearance.
+        name_to_sources = DefaultOrderedDict(list)
+        for repository in repositories:
+            for name in repository._name_to_packages:
+                name_to_sources[name].append(repository)
+
+        for name, sources in name_to_sources.items():
+            # Pending packages are sorted after the others when materialized,
+            # so those of a repository followed by a repository with already
+            # created packages must be created now to keep the merge order.
+            last_created = 0
+            for i, source in enumerate(sources):
+                if len(source._name_to_packages[name]) > 0:
+                    last_created = i
+            package_lists = [source._materialize(name)
+                             for source in sources[:last_created]]
+            package_lists.append(sources[last_created]._name_to_packages[name])
+            pendings = []
+            for source in sources[last_created:]:
+                pendings.extend(source._name_to_pending.get(name, []))
+
+            packages = self._materialize(name)
+            self._name_to_packages[name] = _merge_by_version(
+                [packages] + package_lists
+            )
+            if len(pendings) > 0:
+                self._name_to_pending.setdefault(name, []).extend(pendings)
 
 
 def parse_index(json_dict, repository_info, python_version=PY_VER):
@@ -324,12 +622,89 @@ def parse_index(json_dict, repository_info, python_version=PY_VER):
         equal to this string. If python_version == "*", then every package is
         iterated over.
     """
-    # We cache versions as building instances of EnpkgVersion from a string is
-    # slow. For the PyPi repository, caching saves ~90 % of the calls, and
-    # speed up parse_index by ~300 ms on my machine.
-    cache = {}
+    factory = _IndexEntryFactory(json_dict, repository_info, python_version)
+
+    for key, info in six.iteritems(json_dict):
+        if factory.accepts(info):
+            yield factory(key)
+
+
+def parse_index_items(items, repository_info, python_version=PY_VER):
+    """
+    Like parse_index, but from an iterable of (key, info) pairs, e.g. as
+    decoded incrementally by enstaller.utils.iter_index_items.
 
-    def _version_factory(upstream, build):
+    The items are consumed one at a time, and only the package metadata are
+    kept in memory, not the index entries themselves.
+    """
+    normalizer = _RequirementNormalizer({})
+    factory = _IndexEntryFactory({}, repository_info, python_version,
+                                 normalizer)
+
+    packages = []
+    # Requirements may refer to an entry which comes later in the index, in
+    # which case their normalized name is only known once every entry has
+    # been seen. We keep the raw requirements of those packages to fix them
+    # afterwards.
+    unresolved = []
+    for key, info in items:
+        normalizer.register(key, info)
+        if not factory.accepts(info):
+            continue
+        requirements = info.get("packages", [])
+        if not all(normalizer.is_known(requirement.split(None, 1)[0])
+                   for requirement in requirements if requirement.strip()):
+            unresolved.append((len(packages), list(requirements)))
+        packages.append(factory.from_entry(key, info))
+
+    for i, requirements in unresolved:
+        package = packages[i]
+        dependencies = frozenset(_normalize_requirement_names(
+            requirements, normalizer._normalizer
+        ))
+        if dependencies != package.dependencies:
+            with factory.intern_tables:
+                packages[i] = RemotePackageMetadata(
+                    package.key, package.name, package.version, dependencies,
+                    package._python_implementation, package.size,
+                    package.md5, package.mtime, package.product,
+                    package.available, package.repository_info
+                )
+
+    return iter(packages)
+
+
+class _IndexEntryFactory(object):
+    """ Create package metadata instances from legacy json index entries.
+
+    Parameters
+    ----------
+    json_dict: dict
+        Parsed legacy json index. Entries are modified in place when
+        converted.
+    repository_info: IRepositoryInfo
+        An object describing the remote repository to parse
+    python_version: str
+        See parse_index.
+    """
+    def __init__(self, json_dict, repository_info, python_version=PY_VER,
+                 requirement_normalizer=None):
+        self._json_dict = json_dict
+        self._repository_info = repository_info
+        self._python_version = python_version
+
+        # We cache versions as building instances of EnpkgVersion from a
+        # string is slow. For the PyPi repository, caching saves ~90 % of the
+        # calls, and speed up parse_index by ~300 ms on my machine.
+        self._version_cache = {}
+        self._requirement_normalizer = requirement_normalizer
+
+        # Values are shared between the packages created by this factory
+        # (and the current scope's, if any), and released with it.
+        self.intern_tables = _scoped_intern_tables()
+
+    def _version_factory(self, upstream, build):
+        cache = self._version_cache
         if (upstream, build) in cache:
             version = cache[(upstream, build)]
         else:
@@ -337,19 +712,33 @@ def parse_index(json_dict, repository_info, python_version=PY_VER):
             cache[(upstream, build)] = version
         return version
 
-    requirement_normalizer = _RequirementNormalizer(json_dict)
+    def accepts(self, info):
+        """ Returns True if the given entry is available for our python
+        version."""
+        python = info.get("python", self._python_version)
+        return (self._python_version == "*" or
+                python in (None, self._python_version))
 
-    for key, info in six.iteritems(json_dict):
+    def __call__(self, key):
+        if self._requirement_normalizer is None:
+            self._requirement_normalizer = \
+                _RequirementNormalizer(self._json_dict)
+
+        return self.from_entry(key, self._json_dict[key])
+
+    def from_entry(self, key, info):
+        """ Create the package metadata for the given entry, which does not
+        need to be part of the factory's json_dict."""
         info.setdefault('type', 'egg')
         info.setdefault('packages', [])
-        info.setdefault('python', python_version)
+        info.setdefault('python', self._python_version)
 
-        version = _version_factory(info["version"], info["build"])
-        info = requirement_normalizer(key, info)
+        version = self._version_factory(info["version"], info["build"])
+        info = self._requirement_normalizer(key, info)
 
-        if python_version == "*" or info["python"] in (None, python_version):
-            yield RemotePackageMetadata.from_json_dict_and_version(
-                key, info, version, repository_info
+        with self.intern_tables:
+            return RemotePackageMetadata.from_json_dict_and_version(
+                key, info, version, self._repository_info
             )
 
 
@@ -363,12 +752,17 @@ class _RequirementNormalizer(object):
     requirement like `MKL 10.3` will be converted to `mkl 10.3`.
     """
     def __init__(self, json_data):
-        egg_name_to_name = {}
+        self._egg_name_to_name = {}
         for key, value in six.iteritems(json_data):
-            egg_name = key.split("-", 1)[0]
-            egg_name_to_name[egg_name] = value["name"]
+            self.register(key, value)
+
+    def register(self, key, value):
+        """ Make the given index entry known to the normalizer."""
+        egg_name = key.split("-", 1)[0]
+        self._egg_name_to_name[egg_name] = value["name"]
 
-        self._egg_name_to_name = egg_name_to_name
+    def is_known(self, requirement_name):
+        return requirement_name in self._egg_name_to_name
 
     def _normalizer(self, requirement_name):
         return self._egg_name_to_name.get(
@@ -9,6 +9,7 @@ from egginst._compat import with_metaclass
 from egginst._compat import urljoin, urlsplit, urlunsplit
 
 from enstaller.auth import _INDEX_NAME
+from enstaller.mirror_stats import MirrorStats
 
 
 class IRepositoryInfo(with_metaclass(abc.ABCMeta)):
@@ -194,3 +195,63 @@ class FSRepositoryInfo(IBroodRepositoryInfo):
 
     def __repr__(self):
         return "FSRepositoryInfo(<{0}>)".format(self._store_url)
+
+
+class MirroredRepositoryInfo(IRepositoryInfo):
+    """ A repository available from several equivalent mirrors, e.g. an
+    internal share and the upstream store.
+
+    The index is fetched from the preferred mirror, and from the other
+    mirrors if that one fails. Each egg is fetched from the mirror expected
+    to be the fastest for its size, according to the latency and throughput
+    measured so far (see MirrorStats), and from the other mirrors if that
+    one fails.
+
+    Parameters
+    ----------
+    mirrors : list
+        The IRepositoryInfo instances of each mirror, in order of preference.
+        Every mirror must serve the same eggs.
+    race : bool
+        If True, eggs are requested from the two preferred mirrors at the
+        same time, and fetched from the first one to respond.
+    """
+    def __init__(self, mirrors, race=False):
+        self.mirrors = tuple(mirrors)
+        if len(self.mirrors) == 0:
+            raise ValueError("A mirrored repository needs at least one "
+                             "mirror")
+        self.race = race
+        self.stats = MirrorStats()
+
+    @property
+    def index_url(self):
+        # The first mirror's, used to identify the index (e.g. for snapshots)
+        # whichever mirror it is actually fetched from.
+        return self.mirrors[0].index_url
+
+    @property
+    def name(self):
+        return self.mirrors[0].name
+
+    @property
+    def _base_url(self):
+        return self.mirrors[0]._base_url
+
+    @property
+    def _key(self):
+        return (tuple((type(mirror).__name__, mirror._key)
+                      for mirror in self.mirrors), self.race)
+
+    def _package_urls(self, package):
+        """ The (mirror, url) pairs to fetch the given package from, in order
+        of preference.
+        """
+        mirrors = self.stats.rank(self.mirrors, package.size or 0)
+        return [(mirror, mirror._package_url(package)) for mirror in mirrors]
+
+    def _package_url(self, package):
+        return self._package_urls(package)[0][1]
+
+    def __repr__(self):
+        return "MirroredRepositoryInfo({0!r})".format(list(self.mirrors))
@@ -2,26 +2,48 @@
 A few utilities for python requests.
 """
 import base64
+import contextlib
 import logging
 import os
+import re
 import sqlite3
+import threading
+import time
+import zlib
 
 from io import FileIO
 
 import requests
-import sqlite_cache
 
+from requests.packages.urllib3._collections import RecentlyUsedContainer
+from requests.packages.urllib3.poolmanager import PoolManager
+
+from cachecontrol.adapter import CacheControlAdapter
 from cachecontrol.cache import BaseCache
 from cachecontrol.controller import CacheController
 
 from egginst._compat import buffer, urlparse, urlunparse
 
+from enstaller.index_delta import is_index_delta_request
 from enstaller.utils import uri_to_path
 
 
 logger = logging.getLogger(__name__)
 
 
+_RANGE_R = re.compile(r"bytes=(\d+)-$")
+
+# Headers of the requests whose response must not be cached (e.g. eggs, which
+# are large and never fetched twice from the same cache)
+NO_STORE_HEADERS = {"Cache-Control": "no-store"}
+
+
+def is_no_store_request(request):
+    """ Returns True if the given (requests) request asks for its response
+    not to be cached."""
+    return "no-store" in request.headers.get("Cache-Control", "")
+
+
 class FileResponse(FileIO):
     """
     A FileIO subclass that can be used as an argument to
@@ -58,13 +80,25 @@ class LocalFileAdapter(requests.adapters.HTTPAdapter):
     session.mount("file://", LocalFileAdapter())
 
     session.get("file:///bin/ls")
+
+    Open-ended range requests (``Range: bytes=<start>-``) are supported.
     """
     def build_response_from_file(self, request, stream):
         path = uri_to_path(request.url)
-        stat_info = os.stat(path)
-
-        response = self.build_response(request, FileResponse(path, "rb"))
-        response.headers["content-length"] = str(stat_info.st_size)
+        size = os.stat(path).st_size
+
+        fp = FileResponse(path, "rb")
+        m = _RANGE_R.match(request.headers.get("Range", ""))
+        start = 0
+        if m is not None and int(m.group(1)) < size:
+            start = int(m.group(1))
+            fp.seek(start)
+            fp.status = 206
+            fp.headers["content-range"] = \
+                "bytes {0}-{1}/{2}".format(start, size - 1, size)
+
+        response = self.build_response(request, fp)
+        response.headers["content-length"] = str(size - start)
         return response
 
     def send(self, request, stream=False, timeout=None,
@@ -73,6 +107,103 @@ class LocalFileAdapter(requests.adapters.HTTPAdapter):
         return self.build_response_from_file(request, stream)
 
 
+class ConnectionStats(object):
+    """ Connection reuse statistics of one host.
+
+    Attributes
+    ----------
+    requests : int
+        Number of requests sent to the host.
+    connections : int
+        Number of connections opened to the host.
+    """
+    def __init__(self, requests=0, connections=0):
+        self.requests = requests
+        self.connections = connections
+
+    @property
+    def reused(self):
+        """ Number of requests sent over an already open connection."""
+        return max(self.requests - self.connections, 0)
+
+    def __repr__(self):
+        return "ConnectionStats(requests={0}, connections={1})".format(
+            self.requests, self.connections)
+
+
+class _TrackingPoolManager(PoolManager):
+    """ A PoolManager keeping track of the connection pools it creates, and
+    of the statistics of the pools it already discarded (least recently used
+    pools are discarded once there are more than num_pools of them).
+    """
+    def __init__(self, num_pools=10, headers=None, **connection_pool_kw):
+        super(_TrackingPoolManager, self).__init__(num_pools, headers,
+                                                   **connection_pool_kw)
+        self.pools = RecentlyUsedContainer(num_pools,
+                                           dispose_func=self._dispose_pool)
+        self._lock = threading.Lock()
+        self._live_pools = set()
+        # host url -> ConnectionStats of the discarded pools
+        self._discarded_stats = {}
+
+    def _new_pool(self, scheme, host, port):
+        pool = super(_TrackingPoolManager, self)._new_pool(scheme, host, port)
+        with self._lock:
+            self._live_pools.add(pool)
+        return pool
+
+    def _dispose_pool(self, pool):
+        with self._lock:
+            self._live_pools.discard(pool)
+            _add_pool_stats(self._discarded_stats, pool)
+        pool.close()
+
+    def connection_stats(self):
+        """ Returns a dictionary of host url -> ConnectionStats for every
+        host a connection was opened to."""
+        with self._lock:
+            stats = dict(
+                (host, ConnectionStats(host_stats.requests,
+                                       host_stats.connections))
+                for host, host_stats in self._discarded_stats.items()
+            )
+            for pool in self._live_pools:
+                _add_pool_stats(stats, pool)
+        return stats
+
+
+def _add_pool_stats(stats, pool):
+    host = "{0}://{1}:{2}".format(pool.scheme, pool.host, pool.port)
+    host_stats = stats.setdefault(host, ConnectionStats())
+    host_stats.requests += pool.num_requests
+    host_stats.connections += pool.num_connections
+
+
+class PooledHTTPAdapter(requests.adapters.HTTPAdapter):
+    """
+    An HTTPAdapter keeping track of the connection pools it creates, to
+    report connection reuse statistics.
+
+    Connections of proxied requests are not tracked.
+    """
+    def init_poolmanager(self, connections, maxsize,
+                         block=requests.adapters.DEFAULT_POOLBLOCK,
+                         **pool_kwargs):
+        # Same as HTTPAdapter.init_poolmanager, with our own PoolManager
+        self._pool_connections = connections
+        self._pool_maxsize = maxsize
+        self._pool_block = block
+
+        self.poolmanager = _TrackingPoolManager(num_pools=connections,
+                                                maxsize=maxsize, block=block,
+                                                strict=True, **pool_kwargs)
+
+    def connection_stats(self):
+        """ Returns a dictionary of host url -> ConnectionStats for every
+        host a connection was opened to."""
+        return self.poolmanager.connection_stats()
+
+
 class _ResponseIterator(object):
     """
     A simple iterator on top of a requests response
@@ -118,6 +249,166 @@ class _NullCache(object):
         pass
 
 
+# Version of the DBCache database layout, stored as the sqlite user_version.
+# Version 1 (unversioned) is the base64-encoded queue table of sqlite_cache.
+_DB_CACHE_VERSION = 2
+
+_CREATE_ENTRIES_TABLE = """\
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    value BLOB,
+    compressed INTEGER,
+    size INTEGER,
+    modified_at REAL
+)"""
+
+_LEGACY_TABLE = "queue"
+
+# Values smaller than this are not worth compressing
+_MIN_COMPRESSED_SIZE = 1024
+_COMPRESSION_LEVEL = 1
+# Compressibility is estimated on that many leading bytes, so that already
+# compressed values (e.g. cachecontrol's zlib-compressed serialization) are
+# not compressed again for nothing
+_COMPRESSION_PROBE_SIZE = 16 * 1024
+_MAX_COMPRESSION_RATIO = 0.9
+
+DEFAULT_INDEX_CACHE_MAX_ENTRIES = 100
+DEFAULT_INDEX_CACHE_MAX_SIZE = 256 * 1024 ** 2
+
+
+def _is_compressible(value):
+    probe = value[:_COMPRESSION_PROBE_SIZE]
+    compressed = zlib.compress(probe, _COMPRESSION_LEVEL)
+    return len(compressed) < len(probe) * _MAX_COMPRESSION_RATIO
+
+
+def _encode_blob(value, compress):
+    """ Returns the (blob, compressed) pair to store for the given bytes."""
+    if compress and len(value) >= _MIN_COMPRESSED_SIZE \
+            and _is_compressible(value):
+        data = zlib.compress(value, _COMPRESSION_LEVEL)
+        if len(data) < len(value):
+            return data, True
+    return value, False
+
+
+def _decode_blob(blob, compressed):
+    data = bytes(blob)
+    if compressed:
+        data = zlib.decompress(data)
+    return data
+
+
+class _SQLiteBlobCache(object):
+    """ A sqlite key/value store of bytes, bounded in number of entries and
+    total stored size (least recently written entries are evicted first).
+
+    Tables of the unversioned layout (sqlite_cache) are migrated when
+    opening the database.
+    """
+    def __init__(self, uri, max_entries, max_size, compress):
+        self._uri = uri
+        self.max_entries = max_entries
+        self.max_size = max_size
+        self.compress = compress
+
+        with self._connection() as cx:
+            version = cx.execute("PRAGMA user_version").fetchone()[0]
+            cx.execute(_CREATE_ENTRIES_TABLE)
+            if version < _DB_CACHE_VERSION:
+                self._migrate(cx)
+                cx.execute("PRAGMA user_version = {0}".format(
+                    _DB_CACHE_VERSION))
+            self._evict(cx)
+
+    @contextlib.contextmanager
+    def _connection(self):
+        # One connection per operation, so that the cache may be used from
+        # several threads.
+        cx = sqlite3.connect(self._uri)
+        try:
+            cx.execute("PRAGMA synchronous = OFF")
+            with cx:
+                yield cx
+        finally:
+            cx.close()
+
+    def _migrate(self, cx):
+        row = cx.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' "
+            "AND name = ?", (_LEGACY_TABLE,)
+        ).fetchone()
+        if row is None:
+            return
+
+        try:
+            legacy_rows = cx.execute(
+                "SELECT key, value FROM queue ORDER BY id"
+            ).fetchall()
+        except sqlite3.Error as e:
+            logger.warn("Could not migrate sqlite cache: %r", e)
+            legacy_rows = []
+
+        # Legacy entries are older than any new one
+        for i, (encoded_key, encoded_value) in enumerate(legacy_rows):
+            try:
+                key = base64.b64decode(encoded_key).decode("utf8")
+                value = base64.b64decode(bytes(encoded_value))
+            except (TypeError, ValueError) as e:
+                logger.warn("Could not migrate sqlite cache entry: %r", e)
+                continue
+            blob, compressed = _encode_blob(value, self.compress)
+            self._write(cx, key, blob, compressed, i)
+        cx.execute("DROP TABLE queue")
+
+    def _write(self, cx, key, blob, compressed, modified_at):
+        cx.execute(
+            "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)",
+            (key, buffer(blob), compressed, len(blob), modified_at)
+        )
+
+    def _evict(self, cx):
+        count, size = cx.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries"
+        ).fetchone()
+        if count <= self.max_entries and size <= self.max_size:
+            return
+
+        to_delete = []
+        for key, entry_size in cx.execute(
+                "SELECT key, size FROM entries ORDER BY modified_at"):
+            if count <= self.max_entries and size <= self.max_size:
+                break
+            to_delete.append((key,))
+            count -= 1
+            size -= entry_size
+        cx.executemany("DELETE FROM entries WHERE key = ?", to_delete)
+
+    def close(self):
+        pass
+
+    def get(self, key):
+        with self._connection() as cx:
+            return cx.execute(
+                "SELECT value, compressed FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+
+    def set(self, key, value):
+        blob, compressed = _encode_blob(value, self.compress)
+        with self._connection() as cx:
+            if len(blob) > self.max_size:
+                # Storing it would evict every other entry, then itself
+                cx.execute("DELETE FROM entries WHERE key = ?", (key,))
+            else:
+                self._write(cx, key, blob, compressed, time.time())
+                self._evict(cx)
+
+    def delete(self, key):
+        with self._connection() as cx:
+            cx.execute("DELETE FROM entries WHERE key = ?", (key,))
+
+
 class DBCache(BaseCache):
     """
     A Sqlite-backed cache.
@@ -125,11 +416,28 @@ class DBCache(BaseCache):
     Using sqlite guarantees data consistency without much overhead and
     without the need of usually brittle file locks, or external services
     (impractical in many cases)
+
+    Values are stored as raw BLOBs, zlib-compressed when it makes them
+    smaller. The least recently written entries are evicted when the cache
+    holds more than max_entries entries or max_size bytes.
+
+    Parameters
+    ----------
+    uri : str
+        Sqlite connection string (e.g. 'foo.db', or ':memory:')
+    max_entries : int
+        Maximum number of entries.
+    max_size : int
+        Maximum total size of the stored (compressed) values, in bytes.
+    compress : bool
+        Whether to compress the stored values.
     """
-    def __init__(self, uri=":memory:", capacity=10):
+    def __init__(self, uri=":memory:",
+                 max_entries=DEFAULT_INDEX_CACHE_MAX_ENTRIES,
+                 max_size=DEFAULT_INDEX_CACHE_MAX_SIZE, compress=True):
         try:
-            self._cache = sqlite_cache.SQLiteCache(uri, capacity,
-                                                   use_separate_connection=True)
+            self._cache = _SQLiteBlobCache(uri, max_entries, max_size,
+                                           compress)
         except sqlite3.Error as e:
             logger.warn("Could not create sqlite cache: %r", e)
             self._cache = _NullCache()
@@ -140,30 +448,16 @@ class DBCache(BaseCache):
             self._cache.close()
             self.closed = True
 
-    def _encode_key(self, key):
-        return base64.b64encode(key.encode("utf8")).decode("utf8")
-
-    def _encode_value(self, value):
-        data = base64.b64encode(value)
-        return buffer(data)
-
-    def _decode_value(self, encoded_value):
-        return base64.b64decode(bytes(encoded_value))
-
     def get(self, key):
         try:
-            encoded_value = self._cache.get(self._encode_key(key))
+            row = self._cache.get(key)
         except sqlite3.Error as e:
             logger.warn("Could not fetch data from cache: %r", e)
             return None
         else:
-            if encoded_value is not None:
+            if row is not None:
                 try:
-                    return self._decode_value(encoded_value)
-                except UnicodeDecodeError as e:
-                    msg = "Could not fetch data from cache: (decoding error)"
-                    logger.warn(msg)
-                    return None
+                    return _decode_blob(*row)
                 except Exception as e:
                     msg = "Could not fetch data from cache: {0!r}".format(e)
                     logger.warn(msg)
@@ -173,13 +467,13 @@ class DBCache(BaseCache):
 
     def set(self, key, value):
         try:
-            self._cache.set(self._encode_key(key), self._encode_value(value))
+            self._cache.set(key, value)
         except sqlite3.Error as e:
             logger.warn("Could not fetch data from cache: %r", e)
 
     def delete(self, key):
         try:
-            self._cache.delete(self._encode_key(key))
+            self._cache.delete(key)
         except sqlite3.Error as e:
             logger.warn("Could not fetch data from cache: %r", e)
 
@@ -188,8 +482,56 @@ class QueryPathOnlyCacheController(CacheController):
     """
     A cache controller that caches entries based solely on scheme, hostname and
     path.
+
+    Index delta requests carry their own validator (the ETag of the index
+    the delta is computed against), and bypass the cache.
     """
     def cache_url(self, uri):
         url = super(QueryPathOnlyCacheController, self).cache_url(uri)
         p = urlparse(url)
         return urlunparse((p.scheme, p.hostname, p.path, "", "", ""))
+
+    def cached_request(self, request):
+        if is_index_delta_request(request):
+            return False
+        return super(QueryPathOnlyCacheController, self).cached_request(
+            request
+        )
+
+    def conditional_headers(self, request):
+        if is_index_delta_request(request):
+            return {}
+        return super(QueryPathOnlyCacheController, self).conditional_headers(
+            request
+        )
+
+    def update_cached_response(self, request, response):
+        if is_index_delta_request(request):
+            return response
+        return super(QueryPathOnlyCacheController,
+                     self).update_cached_response(request, response)
+
+
+class IndexCacheAdapter(CacheControlAdapter):
+    """
+    The adapter of the etag context.
+
+    Requests asking for their response not to be cached (see
+    NO_STORE_HEADERS) bypass the cache entirely, instead of having their
+    whole content buffered by cachecontrol to be thrown away once read.
+    """
+    def send(self, request, **kw):
+        if is_no_store_request(request):
+            return requests.adapters.HTTPAdapter.send(self, request, **kw)
+        return super(IndexCacheAdapter, self).send(request, **kw)
+
+    def build_response(self, request, response, from_cache=False):
+        if is_no_store_request(request):
+            resp = requests.adapters.HTTPAdapter.build_response(
+                self, request, response
+            )
+            resp.from_cache = False
+            return resp
+        return super(IndexCacheAdapter, self).build_response(
+            request, response, from_cache
+        )
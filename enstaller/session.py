@@ -7,7 +7,7 @@ import threading
 
 import requests
 
-from cachecontrol.adapter import CacheControlAdapter
+from requests.adapters import DEFAULT_POOLSIZE
 
 from egginst._compat import urlparse
 from egginst.utils import atomic_file, ensure_dir
@@ -17,9 +17,13 @@ from enstaller.auth.auth_managers import (BroodAuthenticator,
                                           LegacyCanopyAuthManager,
                                           OldRepoAuthManager)
 from enstaller.config import STORE_KIND_BROOD
+from enstaller.download_scheduler import DownloadScheduler
 from enstaller.errors import EnstallerException
 
-from enstaller.requests_utils import (DBCache, LocalFileAdapter,
+from enstaller.requests_utils import (DEFAULT_INDEX_CACHE_MAX_ENTRIES,
+                                      DEFAULT_INDEX_CACHE_MAX_SIZE, DBCache,
+                                      IndexCacheAdapter, LocalFileAdapter,
+                                      PooledHTTPAdapter,
                                       QueryPathOnlyCacheController)
 
 from enstaller.auth import UserPasswordAuth
@@ -70,13 +74,35 @@ class Session(object):
         Configuration.proxy_dict).
     verify : bool
         If True, SSL CA are verified (default).
+    index_cache_max_entries : int
+        Maximum number of responses kept in the index (etag) cache.
+    index_cache_max_size : int
+        Maximum size (in bytes) of the index (etag) cache.
+    pool_maxsize : int
+        Maximum number of connections kept open to each host.
+    pool_block : bool
+        If True, requests wait for a connection to be available instead of
+        opening connections beyond pool_maxsize (which are then discarded
+        after use).
+    download_scheduler : DownloadScheduler
+        The scheduler shared by every egg download made through this
+        session. Downloads are not limited if not given.
     """
     def __init__(self, authenticator, cache_directory, proxies=None,
-                 verify=True, max_retries=0):
+                 verify=True, max_retries=0,
+                 index_cache_max_entries=DEFAULT_INDEX_CACHE_MAX_ENTRIES,
+                 index_cache_max_size=DEFAULT_INDEX_CACHE_MAX_SIZE,
+                 pool_maxsize=DEFAULT_POOLSIZE, pool_block=False,
+                 download_scheduler=None):
         self.proxies = proxies
         self.verify = verify
         self.cache_directory = cache_directory
         self.max_retries = max_retries
+        self.index_cache_max_entries = index_cache_max_entries
+        self.index_cache_max_size = index_cache_max_size
+        self.pool_maxsize = pool_maxsize
+        self.pool_block = pool_block
+        self.download_scheduler = download_scheduler or DownloadScheduler()
 
         self._authenticator = authenticator
         self._raw = _PatchedRawSession()
@@ -86,9 +112,13 @@ class Session(object):
 
         self._raw.mount("file://", LocalFileAdapter())
 
-        adapter = requests.adapters.HTTPAdapter(max_retries=self.max_retries)
+        self._adapter = PooledHTTPAdapter(max_retries=self.max_retries,
+                                          pool_maxsize=pool_maxsize,
+                                          pool_block=pool_block)
         for prefix in ("http://", "https://"):
-            self._raw.mount(prefix, adapter)
+            self._raw.mount(prefix, self._adapter)
+        # Created on first use of the etag context, and kept afterwards
+        self._etag_adapter = None
 
         user_agent = "enstaller/{0} {1}".format(__version__,
                                                 self._raw.headers["user-agent"])
@@ -131,10 +161,28 @@ class Session(object):
         authenticator = klass.from_configuration(configuration)
         return cls(authenticator, configuration.repository_cache,
                    configuration.proxy_dict, verify=configuration.verify_ssl,
-                   max_retries=configuration.max_retries)
+                   max_retries=configuration.max_retries,
+                   index_cache_max_entries=(
+                       configuration.index_cache_max_entries
+                   ),
+                   index_cache_max_size=configuration.index_cache_max_size,
+                   pool_maxsize=configuration.connection_pool_size,
+                   pool_block=configuration.connection_pool_block,
+                   download_scheduler=DownloadScheduler(
+                       configuration.max_concurrent_transfers,
+                       configuration.max_download_rate
+                   ))
 
     def close(self):
         self._raw.close()
+        if self._etag_adapter is not None:
+            self._etag_adapter.cache.close()
+
+    def connection_stats(self):
+        """ Returns the connection reuse statistics of the session, as a
+        dictionary of host url (e.g. 'https://api.enthought.com:443') ->
+        ConnectionStats."""
+        return self._adapter.connection_stats()
 
     @contextlib.contextmanager
     def etag(self):
@@ -186,7 +234,7 @@ class Session(object):
 
         return target
 
-    def fetch(self, url):
+    def fetch(self, url, headers=None):
         """ Small helper to fetch data from URLS.
 
         Equivalent to a get, but it automatically raises for errors, and the
@@ -196,8 +244,10 @@ class Session(object):
         ----------
         url: str
             A url.
+        headers: dict
+            Extra headers to send, if any.
         """
-        resp = self._raw.get(url, stream=True)
+        resp = self._raw.get(url, stream=True, headers=headers)
         resp.raise_for_status()
         return resp
 
@@ -246,24 +296,30 @@ class Session(object):
     # Private methods
     def _etag_setup(self):
         if self._in_etag_context == 0:
-            uri = os.path.join(self.cache_directory, "index_cache", "index.db")
-            ensure_dir(uri)
-            cache = DBCache(uri)
-
+            if self._etag_adapter is None:
+                self._etag_adapter = self._create_etag_adapter()
             for prefix in ("http://", "https://"):
-                adapter = CacheControlAdapter(
-                    cache, controller_class=QueryPathOnlyCacheController,
-                    max_retries=self.max_retries)
-                self._raw.mount(prefix, adapter)
+                self._raw.mount(prefix, self._etag_adapter)
 
         self._in_etag_context += 1
 
     def _etag_tear(self):
         if self._in_etag_context == 1:
             for prefix in ("https://", "http://"):
-                # XXX: This close is ugly, but I am not sure how one can link a cache
-                # controller to a http adapter in cachecontrol. See issue #42 on
-                # ionrock/cachecontrol @ github.
-                adapter = self._raw.umount(prefix)
-                adapter.cache.close()
+                self._raw.umount(prefix)
         self._in_etag_context -= 1
+
+    def _create_etag_adapter(self):
+        uri = os.path.join(self.cache_directory, "index_cache", "index.db")
+        ensure_dir(uri)
+        cache = DBCache(uri, self.index_cache_max_entries,
+                        self.index_cache_max_size)
+
+        adapter = IndexCacheAdapter(
+            cache, controller_class=QueryPathOnlyCacheController,
+            max_retries=self.max_retries)
+        # Share the connections of the default adapter, so that they are
+        # kept open when entering or leaving the etag context
+        adapter.poolmanager = self._adapter.poolmanager
+        adapter.proxy_manager = self._adapter.proxy_manager
+        return adapter
@@ -14,6 +14,50 @@ class ForceMode(Enum):
     ALL = 2
 
 
+def _merge_install_sequences(sequences):
+    """ Merge the given install sequences into one, where each package name
+    appears once.
+
+    Each name gets the version required by the last sequence needing it
+    (i.e. the version which would end up installed if the sequences were
+    installed one after the other). The chosen packages are then put in
+    install order again, since a version coming from a later sequence may
+    have dependencies which earlier sequences do not install. Names keep
+    the order in which they first appear otherwise.
+    """
+    chosen = {}
+    names = []
+    for sequence in sequences:
+        for package in sequence:
+            if package.name not in chosen:
+                names.append(package.name)
+            chosen[package.name] = package
+    positions = dict((name, i) for i, name in enumerate(names))
+
+    merged = []
+    visited = set()
+
+    def _visit(name):
+        visited.add(name)
+        package = chosen[name]
+        dependencies = set(
+            _LegacyRequirement(requirement).name
+            for requirement in package.dependency_requirements
+        )
+        # Dependencies outside the sequences (e.g. in ROOT mode) are not
+        # installed, and so do not constrain the order
+        for dependency in sorted(dependencies & set(chosen),
+                                 key=positions.get):
+            if dependency not in visited:
+                _visit(dependency)
+        merged.append(package)
+
+    for name in names:
+        if name not in visited:
+            _visit(name)
+    return merged
+
+
 class Solver(object):
     def __init__(self, remote_repository, top_installed_repository,
                  mode=SolverMode.RECUR, force=ForceMode.NONE):
@@ -26,25 +70,41 @@ class Solver(object):
     def resolve(self, request):
         operations = []
 
+        # Consecutive install jobs are resolved together, so that packages
+        # needed by several of them are only installed once.
+        install_requirements = []
         for job in request.jobs:
             if job.kind == JobType.install:
                 assert isinstance(job.requirement, Requirement)
-                legacy_requirement = _LegacyRequirement(job.requirement)
-                operations.extend(self._install(legacy_requirement))
+                install_requirements.append(
+                    _LegacyRequirement(job.requirement)
+                )
             elif job.kind == JobType.remove:
                 assert isinstance(job.requirement, Requirement)
+                operations.extend(self._install(install_requirements))
+                install_requirements = []
                 legacy_requirement = _LegacyRequirement(job.requirement)
                 operations.extend(("remove", p) for p in
                                   self._remove(legacy_requirement))
             else:
                 raise ValueError("Unsupported job kind: {0}".format(job.kind))
 
+        operations.extend(self._install(install_requirements))
         return operations
 
-    def _install(self, requirement):
-        eggs = Resolve(self._remote_repository).install_sequence(requirement,
-                                                                 self.mode)
-        return self._install_actions(eggs, self.mode, self.force)
+    def _install(self, requirements):
+        sequences = [
+            Resolve(self._remote_repository).install_sequence(requirement,
+                                                              self.mode)
+            for requirement in requirements
+        ]
+        sequences = [sequence for sequence in sequences if len(sequence) > 0]
+        packages = _merge_install_sequences(sequences)
+        # The main packages are the versions chosen for the requested names
+        name_to_package = dict((package.name, package) for package in packages)
+        main_packages = set(name_to_package[sequence[-1].name]
+                            for sequence in sequences)
+        return self._install_actions(packages, main_packages, self.force)
 
     def _remove(self, requirement):
         packages = self._top_installed_repository.find_packages(
@@ -55,19 +115,23 @@ class Solver(object):
             )
         return [packages[0]]
 
-    def _install_actions(self, packages, mode, force):
+    def _install_actions(self, packages, main_packages, force):
         if force == ForceMode.NONE:
             # remove already installed packages from package list
             packages = self._filter_installed_packages(packages)
         elif force == ForceMode.MAIN_ONLY:
-            packages = self._filter_installed_packages(packages[:-1]) + [packages[-1]]
+            not_installed = set(self._filter_installed_packages(packages))
+            packages = [package for package in packages
+                        if package in main_packages
+                        or package in not_installed]
 
         # remove packages with the same name (from first package collection
         # only, in reverse install order)
         res = []
         for package in reversed(packages):
             name = package.name
-            installed_packages = self._top_installed_repository.find_packages(name)
+            installed_packages = \
+                self._top_installed_repository.find_packages(name)
             assert len(installed_packages) < 2
             if len(installed_packages) == 1:
                 installed_package = installed_packages[0]
@@ -87,7 +151,9 @@ class Solver(object):
         filtered_packages = []
         for package in packages:
             name = package.name
-            for installed in self._top_installed_repository.find_packages(name):
+            installed_packages = \
+                self._top_installed_repository.find_packages(name)
+            for installed in installed_packages:
                 if installed.key == package.key:
                     break
             else:
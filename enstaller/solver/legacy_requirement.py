@@ -1,9 +1,8 @@
 import six
 
-from okonomiyaki.versions import EnpkgVersion
 from simplesat.constraints.kinds import Any, Equal, EnpkgUpstreamMatch
 
-from . import Requirement
+from .requirement_cache import parse_legacy_requirement
 
 
 class _LegacyRequirement(object):
@@ -17,10 +16,7 @@ class _LegacyRequirement(object):
         requirement_string : str
             The legacy requirement string, e.g. 'MKL 10.3'
         """
-        ret = Requirement.from_legacy_requirement_string(
-            requirement_string, EnpkgVersion.from_string
-        )
-        return cls(ret)
+        return cls(parse_legacy_requirement(requirement_string))
 
     def __init__(self, requirement):
         constraints = requirement._constraints._constraints
@@ -0,0 +1,99 @@
+"""
+Process-wide cache of parsed legacy requirement strings.
+
+Dependencies are stored as legacy requirement strings (e.g. 'MKL 10.3-1') in
+package metadata, and the same few thousand strings are parsed over and over
+while resolving dependencies.
+"""
+from __future__ import absolute_import
+
+import threading
+
+from simplesat import Requirement
+
+from enstaller.compat import OrderedDict
+
+
+DEFAULT_CAPACITY = 8192
+
+
+def _normalize(requirement_string):
+    return " ".join(requirement_string.split())
+
+
+class RequirementCache(object):
+    """ A bounded, thread-safe cache of parsed legacy requirements, keyed on
+    the whitespace-normalized requirement string.
+
+    Parsed requirements are shared between callers, and must not be
+    modified.
+
+    Parameters
+    ----------
+    capacity : int
+        Maximum number of requirements to keep. The least recently used
+        requirement is evicted first.
+    """
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        self.capacity = capacity
+
+        self._lock = threading.Lock()
+        self._requirements = OrderedDict()
+        self._hits = 0
+        self._misses = 0
+
+    @property
+    def hits(self):
+        return self._hits
+
+    @property
+    def misses(self):
+        return self._misses
+
+    def __len__(self):
+        return len(self._requirements)
+
+    def clear(self):
+        """ Empty the cache and reset the counters."""
+        with self._lock:
+            self._requirements.clear()
+            self._hits = self._misses = 0
+
+    def parse(self, requirement_string):
+        """ Returns the Requirement instance for the given legacy requirement
+        string, as Requirement.from_legacy_requirement_string would."""
+        key = _normalize(requirement_string)
+
+        with self._lock:
+            requirement = self._requirements.pop(key, None)
+            if requirement is not None:
+                # Re-insert to mark the entry as the most recently used
+                self._requirements[key] = requirement
+                self._hits += 1
+                return requirement
+            self._misses += 1
+
+        # Parse outside the lock: parsing the same string concurrently is
+        # harmless, and invalid strings are not cached.
+        requirement = Requirement.from_legacy_requirement_string(key)
+
+        with self._lock:
+            self._requirements[key] = requirement
+            while len(self._requirements) > self.capacity:
+                self._requirements.popitem(last=False)
+
+        return requirement
+
+
+_REQUIREMENT_CACHE = RequirementCache()
+
+
+def get_requirement_cache():
+    """ Returns the process-wide requirement cache."""
+    return _REQUIREMENT_CACHE
+
+
+def parse_legacy_requirement(requirement_string):
+    """ Parse the given legacy requirement string through the process-wide
+    requirement cache."""
+    return _REQUIREMENT_CACHE.parse(requirement_string)
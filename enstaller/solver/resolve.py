@@ -129,8 +129,8 @@ class Resolve(object):
         return the set of requirement objects listed by the given package
         """
         return set(
-            _LegacyRequirement.from_requirement_string(s)
-            for s in package.dependencies
+            _LegacyRequirement(requirement)
+            for requirement in package.dependency_requirements
         )
 
     def _sequence_recur(self, root):
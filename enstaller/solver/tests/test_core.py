@@ -282,3 +282,111 @@ class TestSolverDependencies(unittest.TestCase):
             [("remove", installed_numpy), ("remove", installed_mkl),
              ("install", remote_mkl), ("install", remote_numpy)]
         )
+
+    def test_several_install_jobs(self):
+        # Given
+        mkl = dummy_repository_package_factory("MKL", "10.3", 1)
+        mkl_11 = dummy_repository_package_factory("MKL", "11.1", 1)
+        numpy = dummy_repository_package_factory("numpy", "1.8.0", 2,
+                                                 dependencies=["MKL 10.3"])
+        scipy = dummy_repository_package_factory(
+            "scipy", "0.14.0", 1, dependencies=["MKL 10.3", "numpy 1.8.0"]
+        )
+        llvm = dummy_repository_package_factory("llvm", "3.3", 1,
+                                                dependencies=["MKL 11.1"])
+        repository = repository_factory([mkl, mkl_11, numpy, scipy, llvm])
+
+        installed_numpy = dummy_installed_package_factory("numpy", "1.7.1", 1)
+        installed_repository = repository_factory([installed_numpy])
+
+        request = Request()
+        request.install(Requirement("numpy"))
+        request.install(Requirement("scipy"))
+
+        # When
+        actions = Solver(repository, installed_repository).resolve(request)
+
+        # Then
+        self.assertListEqual(
+            actions,
+            [("remove", installed_numpy), ("install", mkl),
+             ("install", numpy), ("install", scipy)]
+        )
+
+        # Given
+        request.install(Requirement("llvm"))
+
+        # When
+        actions = Solver(repository, installed_repository).resolve(request)
+
+        # Then
+        # The last required version of MKL wins, as if the jobs were
+        # executed one after the other
+        self.assertListEqual(
+            actions,
+            [("remove", installed_numpy), ("install", mkl_11),
+             ("install", numpy), ("install", scipy), ("install", llvm)]
+        )
+
+        # When
+        solver = Solver(repository, installed_repository,
+                        force=ForceMode.MAIN_ONLY)
+        actions = solver.resolve(request)
+
+        # Then
+        self.assertListEqual(
+            actions,
+            [("remove", installed_numpy), ("install", mkl_11),
+             ("install", numpy), ("install", scipy), ("install", llvm)]
+        )
+
+    def test_several_install_jobs_overridden_version(self):
+        # Given
+        mkl = dummy_repository_package_factory("MKL", "10.3", 1)
+        openblas = dummy_repository_package_factory("openblas", "0.2.14", 1)
+        numpy = dummy_repository_package_factory("numpy", "1.8.0", 1,
+                                                 dependencies=["MKL 10.3"])
+        numpy_1_9 = dummy_repository_package_factory(
+            "numpy", "1.9.2", 1, dependencies=["openblas 0.2.14"]
+        )
+        pandas = dummy_repository_package_factory(
+            "pandas", "0.16.0", 1, dependencies=["numpy 1.9.2"]
+        )
+        repository = repository_factory([mkl, openblas, numpy, numpy_1_9,
+                                         pandas])
+
+        request = Request()
+        request.install(
+            Requirement.from_legacy_requirement_string("numpy 1.8.0-1")
+        )
+        request.install(Requirement("pandas"))
+
+        # When
+        actions = Solver(repository, Repository()).resolve(request)
+
+        # Then
+        # numpy 1.9.2 replaces numpy 1.8.0, but is installed after its own
+        # dependencies
+        self.assertListEqual(
+            actions,
+            [("install", mkl), ("install", openblas),
+             ("install", numpy_1_9), ("install", pandas)]
+        )
+
+        # Given
+        installed_numpy = dummy_installed_package_factory("numpy", "1.9.2", 1)
+        installed_repository = repository_factory([installed_numpy])
+
+        # When
+        solver = Solver(repository, installed_repository,
+                        force=ForceMode.MAIN_ONLY)
+        actions = solver.resolve(request)
+
+        # Then
+        # numpy is still a main package, at the version chosen by the merge
+        self.assertListEqual(
+            actions,
+            [("remove", installed_numpy), ("install", mkl),
+             ("install", openblas), ("install", numpy_1_9),
+             ("install", pandas)]
+        )
@@ -0,0 +1,115 @@
+import threading
+import unittest
+
+from simplesat import Requirement
+
+from enstaller.solver.requirement_cache import (
+    RequirementCache, get_requirement_cache, parse_legacy_requirement
+)
+
+
+class TestRequirementCache(unittest.TestCase):
+    def test_simple(self):
+        # Given
+        s = "MKL 10.3-1"
+        cache = RequirementCache()
+
+        # When
+        requirement = cache.parse(s)
+
+        # Then
+        self.assertEqual(requirement,
+                         Requirement.from_legacy_requirement_string(s))
+        self.assertEqual((cache.hits, cache.misses), (0, 1))
+
+        # When
+        cached_requirement = cache.parse(s)
+
+        # Then
+        self.assertIs(cached_requirement, requirement)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+        self.assertEqual(len(cache), 1)
+
+    def test_normalized_key(self):
+        # Given
+        cache = RequirementCache()
+
+        # When
+        requirement = cache.parse("MKL 10.3-1")
+
+        # Then
+        self.assertIs(cache.parse(" MKL  10.3-1\t"), requirement)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_capacity(self):
+        # Given
+        cache = RequirementCache(capacity=2)
+        numpy = cache.parse("numpy 1.8.0")
+        cache.parse("MKL 10.3-1")
+
+        # When
+        cache.parse("numpy 1.8.0")
+        cache.parse("scipy")
+
+        # Then
+        # MKL is the least recently used entry
+        self.assertEqual(len(cache), 2)
+        self.assertIs(cache.parse("numpy 1.8.0"), numpy)
+        cache.parse("MKL 10.3-1")
+        self.assertEqual((cache.hits, cache.misses), (2, 4))
+
+    def test_invalid_requirement(self):
+        # Given
+        cache = RequirementCache()
+
+        # When/Then
+        for _ in range(2):
+            with self.assertRaises(Exception):
+                cache.parse("numpy 1.8.0-1-1")
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.misses, 2)
+
+    def test_clear(self):
+        # Given
+        cache = RequirementCache()
+        cache.parse("numpy")
+        cache.parse("numpy")
+
+        # When
+        cache.clear()
+
+        # Then
+        self.assertEqual(len(cache), 0)
+        self.assertEqual((cache.hits, cache.misses), (0, 0))
+
+    def test_threads(self):
+        # Given
+        cache = RequirementCache(capacity=50)
+        requirement_strings = ["numpy 1.{0}.0".format(i) for i in range(100)]
+
+        def _target():
+            for _ in range(5):
+                for requirement_string in requirement_strings:
+                    cache.parse(requirement_string)
+
+        threads = [threading.Thread(target=_target) for _ in range(4)]
+
+        # When
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # Then
+        self.assertEqual(len(cache), 50)
+        self.assertEqual(cache.hits + cache.misses, 4 * 5 * 100)
+
+    def test_process_wide_cache(self):
+        # Given
+        cache = get_requirement_cache()
+
+        # When
+        requirement = parse_legacy_requirement("nose 1.3.0-1")
+
+        # Then
+        self.assertIs(cache.parse("nose 1.3.0-1"), requirement)
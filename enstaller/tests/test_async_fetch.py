@@ -0,0 +1,202 @@
+import json
+import os.path
+import shutil
+import sys
+import tempfile
+
+import requests
+import responses
+
+from egginst.tests.common import _EGGINST_COMMON_DATA
+
+from enstaller.config import Configuration
+from enstaller.fetch import _DownloadManager
+from enstaller.repository import Repository, RemotePackageMetadata
+from enstaller.tests.common import mocked_session_factory
+from enstaller.utils import PY_VER, compute_md5
+
+try:
+    import asyncio
+except ImportError:
+    asyncio = None
+else:
+    from enstaller.async_fetch import AsyncDownloadManager, AsyncSession
+
+if sys.version_info[0] == 2:
+    import unittest2 as unittest
+else:
+    import unittest
+
+
+def _index_factory(name, n):
+    index = {}
+    for i in range(n):
+        key = "{0}-1.0.{1}-1.egg".format(name, i)
+        index[key] = {
+            "available": True, "build": 1, "md5": "a" * 32,
+            "mtime": 0.0, "name": name, "packages": [],
+            "product": "free", "python": PY_VER, "size": 1,
+            "type": "egg", "version": "1.0.{0}".format(i),
+        }
+    return index
+
+
+@unittest.skipIf(asyncio is None, "asyncio is not available")
+class TestAsyncSession(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.loop = asyncio.new_event_loop()
+        self.async_session = AsyncSession(
+            mocked_session_factory(self.tempdir), self.loop
+        )
+
+    def tearDown(self):
+        self.async_session.close()
+        self.loop.close()
+        shutil.rmtree(self.tempdir)
+
+    @responses.activate
+    def test_fetch(self):
+        # Given
+        url = "https://acme.com/data.json"
+        responses.add(responses.GET, url, body=b"some data")
+
+        # When
+        response = self.loop.run_until_complete(
+            self.async_session.fetch(url)
+        )
+
+        # Then
+        self.assertEqual(response.content, b"some data")
+
+    @responses.activate
+    def test_fetch_error(self):
+        # Given
+        url = "https://acme.com/data.json"
+        responses.add(responses.GET, url, status=404)
+
+        # When/Then
+        with self.assertRaises(requests.exceptions.HTTPError):
+            self.loop.run_until_complete(self.async_session.fetch(url))
+
+    @responses.activate
+    def test_download(self):
+        # Given
+        url = "https://acme.com/data.json"
+        target = os.path.join(self.tempdir, "data.json")
+        responses.add(responses.GET, url, body=b"some data")
+
+        # When
+        path = self.loop.run_until_complete(
+            self.async_session.download(url, target)
+        )
+
+        # Then
+        self.assertEqual(path, target)
+        with open(target, "rb") as fp:
+            self.assertEqual(fp.read(), b"some data")
+
+    @responses.activate
+    def test_fetch_repositories(self):
+        # Given
+        config = Configuration(store_url="https://acme.com",
+                               use_webservice=False)
+        config.set_repositories_from_names(["enthought/free",
+                                            "enthought/commercial",
+                                            "enthought/missing"])
+        free, commercial, missing = config.repositories
+        responses.add(responses.GET, free.index_url,
+                      body=json.dumps(_index_factory("foo", 3)))
+        responses.add(responses.GET, commercial.index_url,
+                      body=json.dumps(_index_factory("bar", 2)))
+        responses.add(responses.GET, missing.index_url, status=404)
+
+        # When
+        repository = self.loop.run_until_complete(
+            self.async_session.fetch_repositories(config.repositories)
+        )
+
+        # Then
+        self.assertEqual(len(repository.find_packages("foo")), 3)
+        self.assertEqual(len(repository.find_packages("bar")), 2)
+
+        # When/Then
+        with self.assertRaises(requests.exceptions.HTTPError):
+            self.loop.run_until_complete(
+                self.async_session.fetch_repositories(config.repositories,
+                                                      raise_on_error=True)
+            )
+
+    def test_fetch_no_repositories(self):
+        # When
+        repository = self.loop.run_until_complete(
+            self.async_session.fetch_repositories([])
+        )
+
+        # Then
+        self.assertEqual(len(repository), 0)
+
+
+@unittest.skipIf(asyncio is None, "asyncio is not available")
+class TestAsyncDownloadManager(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.loop = asyncio.new_event_loop()
+        self.async_session = AsyncSession(
+            mocked_session_factory(self.tempdir), self.loop
+        )
+
+    def tearDown(self):
+        self.async_session.close()
+        self.loop.close()
+        shutil.rmtree(self.tempdir)
+
+    def _create_repository(self, eggs):
+        repository = Repository()
+        for egg in eggs:
+            path = os.path.join(_EGGINST_COMMON_DATA, egg)
+            repository.add_package(RemotePackageMetadata.from_egg(path))
+        return repository
+
+    def test_fetch(self):
+        # Given
+        filenames = ["nose-1.3.0-1.egg", "nose-1.2.1-1.egg"]
+        repository = self._create_repository(filenames)
+        downloader = AsyncDownloadManager(
+            _DownloadManager(self.async_session.session, repository),
+            self.async_session
+        )
+        packages = list(repository.iter_packages())
+        chunk_sizes = []
+
+        # When
+        futures = [downloader.fetch(package) for package in packages[1:]]
+        _, future = downloader.iter_fetch(packages[0],
+                                          on_chunk=chunk_sizes.append)
+        futures.append(future)
+        self.loop.run_until_complete(asyncio.gather(*futures))
+
+        # Then
+        for package in packages:
+            target = os.path.join(self.tempdir, package.key)
+            self.assertEqual(compute_md5(target), package.md5)
+        self.assertEqual(sum(chunk_sizes), packages[0].size)
+
+    def test_cancel(self):
+        # Given
+        filename = "nose-1.3.0-1.egg"
+        repository = self._create_repository([filename])
+        package = repository.find_package("nose", "1.3.0-1")
+        downloader = AsyncDownloadManager(
+            _DownloadManager(self.async_session.session, repository),
+            self.async_session
+        )
+
+        # When
+        response, future = downloader.iter_fetch(package)
+        response.cancel()
+        self.loop.run_until_complete(future)
+
+        # Then
+        self.assertFalse(os.path.exists(os.path.join(self.tempdir,
+                                                     filename)))
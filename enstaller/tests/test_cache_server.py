@@ -0,0 +1,237 @@
+import os.path
+import shutil
+import sys
+import tempfile
+import threading
+
+import mock
+import requests
+
+from egginst.tests.common import _EGGINST_COMMON_DATA
+
+from enstaller.cache_server import CacheServer, parse_address
+from enstaller.fetch import _DownloadManager
+from enstaller.repository import (Repository, RemotePackageMetadata,
+                                  parse_index)
+from enstaller.repository_info import (FSRepositoryInfo,
+                                       OldstyleRepositoryInfo)
+from enstaller.utils import compute_md5, path_to_uri
+
+from enstaller.tests.common import mocked_session_factory
+
+if sys.version_info[0] == 2:
+    import unittest2 as unittest
+else:
+    import unittest
+
+
+FILENAME = "nose-1.3.0-1.egg"
+
+
+class TestParseAddress(unittest.TestCase):
+    def test_simple(self):
+        # Only local clients by default
+        self.assertEqual(parse_address("8080"), ("127.0.0.1", 8080))
+        self.assertEqual(parse_address(":80"), ("127.0.0.1", 80))
+        self.assertEqual(parse_address("0.0.0.0:0"), ("0.0.0.0", 0))
+
+    def test_invalid(self):
+        for s in ("", "acme.com", "acme.com:http", "70000"):
+            with self.assertRaises(ValueError):
+                parse_address(s)
+
+
+class TestCacheServer(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+
+        self.upstream = os.path.join(self.tempdir, "upstream")
+        os.makedirs(self.upstream)
+        self.egg = os.path.join(self.upstream, FILENAME)
+        shutil.copy(os.path.join(_EGGINST_COMMON_DATA, FILENAME), self.egg)
+
+        repository_info = FSRepositoryInfo(path_to_uri(self.upstream))
+        self.package = RemotePackageMetadata.from_egg(self.egg,
+                                                      repository_info)
+        self.repository = Repository([self.package])
+
+        self.session = mocked_session_factory(
+            os.path.join(self.tempdir, "cache")
+        )
+        self.downloader = _DownloadManager(self.session, self.repository)
+
+        self.server = CacheServer(self.downloader, self.repository,
+                                  ("127.0.0.1", 0), max_workers=4)
+        self.url = "http://127.0.0.1:{0}/".format(
+            self.server.server_address[1]
+        )
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.thread.join()
+        self.server.close()
+        shutil.rmtree(self.tempdir)
+
+    def test_index(self):
+        # When
+        response = requests.get(self.url + "index.json")
+
+        # Then
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(),
+                         {FILENAME: self.package.s3index_data})
+
+        # When
+        etag = response.headers["ETag"]
+        response = requests.get(self.url + "index.json",
+                                headers={"If-None-Match": etag})
+
+        # Then
+        self.assertEqual(response.status_code, 304)
+
+    def test_index_refresh(self):
+        # Given
+        etag = requests.get(self.url + "index.json").headers["ETag"]
+        refresh = mock.Mock(return_value=Repository())
+        self.server._refresh_repository = refresh
+        self.server._refresh_interval = 0
+
+        # When
+        response = requests.get(self.url + "index.json",
+                                headers={"If-None-Match": etag})
+
+        # Then
+        # The upstream egg was removed
+        self.assertEqual(refresh.call_count, 1)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {})
+        self.assertNotEqual(response.headers["ETag"], etag)
+        self.assertEqual(requests.get(self.url + FILENAME).status_code, 404)
+
+        # Given
+        etag = response.headers["ETag"]
+        refresh.side_effect = requests.exceptions.ConnectionError()
+
+        # When
+        response = requests.get(self.url + "index.json",
+                                headers={"If-None-Match": etag})
+
+        # Then
+        # The previous index is kept
+        self.assertEqual(response.status_code, 304)
+
+        # Given
+        refresh.reset_mock()
+        self.server._refresh_interval = 3600
+
+        # When
+        requests.get(self.url + "index.json")
+
+        # Then
+        self.assertFalse(refresh.called)
+
+    def test_egg(self):
+        # Given
+        target = os.path.join(self.downloader.cache_directory, FILENAME)
+        self.assertFalse(os.path.exists(target))
+
+        # When
+        response = requests.get(self.url + FILENAME)
+
+        # Then
+        self.assertEqual(response.status_code, 200)
+        with open(self.egg, "rb") as fp:
+            self.assertEqual(response.content, fp.read())
+        # Cache misses are kept in the cache
+        self.assertEqual(compute_md5(target), self.package.md5)
+
+        # When
+        os.unlink(self.egg)
+        response = requests.get(self.url + FILENAME)
+
+        # Then
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.content), self.package.size)
+
+    def test_egg_range(self):
+        # When
+        response = requests.get(self.url + FILENAME,
+                                headers={"Range": "bytes=100-"})
+
+        # Then
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(
+            response.headers["Content-Range"],
+            "bytes 100-{0}/{1}".format(self.package.size - 1,
+                                       self.package.size)
+        )
+        with open(self.egg, "rb") as fp:
+            self.assertEqual(response.content, fp.read()[100:])
+
+        # When
+        response = requests.get(
+            self.url + FILENAME,
+            headers={"Range": "bytes={0}-".format(self.package.size)}
+        )
+
+        # Then
+        self.assertEqual(response.status_code, 416)
+
+    def test_unknown_egg(self):
+        # When/Then
+        for name in ("numpy-1.8.0-1.egg", "../upstream/" + FILENAME):
+            response = requests.get(self.url + name)
+            self.assertEqual(response.status_code, 404)
+
+    def test_upstream_error(self):
+        # Given
+        error = requests.exceptions.ConnectionError("Connection refused")
+
+        # When
+        with mock.patch.object(self.downloader, "fetch", side_effect=error):
+            response = requests.get(self.url + FILENAME)
+
+        # Then
+        self.assertEqual(response.status_code, 502)
+
+    def test_concurrent_misses(self):
+        # Given
+        responses = []
+
+        def _get():
+            responses.append(requests.get(self.url + FILENAME))
+
+        # When
+        with mock.patch.object(self.session, "fetch",
+                               wraps=self.session.fetch) as mocked_fetch:
+            threads = [threading.Thread(target=_get) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        # Then
+        self.assertEqual([response.status_code for response in responses],
+                         [200] * 8)
+        self.assertEqual(mocked_fetch.call_count, 1)
+
+    def test_client(self):
+        # Given
+        client_session = mocked_session_factory(
+            os.path.join(self.tempdir, "client")
+        )
+        repository_info = OldstyleRepositoryInfo(self.url)
+
+        # When
+        index = client_session.fetch(repository_info.index_url).json()
+        # The test egg is built for python 2.7
+        repository = Repository(parse_index(index, repository_info, "*"))
+        package = repository.find_package("nose", "1.3.0-1")
+        _DownloadManager(client_session, repository).fetch(package)
+
+        # Then
+        target = os.path.join(client_session.cache_directory, FILENAME)
+        self.assertEqual(compute_md5(target), self.package.md5)
+        self.assertEqual(package.source_url, self.url + FILENAME)
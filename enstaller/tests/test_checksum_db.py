@@ -0,0 +1,145 @@
+import hashlib
+import os.path
+import shutil
+import sys
+import tempfile
+
+import mock
+
+from enstaller.checksum_db import CHECKSUM_DB_FILENAME, ChecksumDatabase
+
+if sys.version_info[0] == 2:
+    import unittest2 as unittest
+else:
+    import unittest
+
+
+class TestChecksumDatabase(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tempdir, "foo.egg")
+        self.data = b"some data"
+        self._write(self.data)
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def _write(self, data):
+        with open(self.path, "wb") as fp:
+            fp.write(data)
+
+    def test_lookup_unknown(self):
+        # Given
+        checksums = ChecksumDatabase.from_directory(self.tempdir)
+
+        # When/Then
+        self.assertIsNone(checksums.lookup(self.path))
+        self.assertIsNone(checksums.lookup(self.path + ".missing"))
+
+    def test_record(self):
+        # Given
+        md5 = hashlib.md5(self.data).hexdigest()
+        checksums = ChecksumDatabase.from_directory(self.tempdir)
+
+        # When
+        checksums.record(self.path, md5)
+
+        # Then
+        self.assertTrue(os.path.exists(os.path.join(self.tempdir,
+                                                    CHECKSUM_DB_FILENAME)))
+        self.assertEqual(
+            ChecksumDatabase.from_directory(self.tempdir).lookup(self.path),
+            md5
+        )
+
+    def test_lookup_modified_file(self):
+        # Given
+        checksums = ChecksumDatabase.from_directory(self.tempdir)
+        checksums.record(self.path, hashlib.md5(self.data).hexdigest())
+
+        # When
+        st = os.stat(self.path)
+        os.utime(self.path, (st.st_atime, st.st_mtime + 10))
+
+        # Then
+        self.assertIsNone(checksums.lookup(self.path))
+
+        # Given
+        checksums.record(self.path, hashlib.md5(self.data).hexdigest())
+
+        # When
+        self._write(b"other data")
+
+        # Then
+        self.assertIsNone(checksums.lookup(self.path))
+
+    def test_lookup_replaced_file(self):
+        # Given
+        checksums = ChecksumDatabase.from_directory(self.tempdir)
+        checksums.record(self.path, hashlib.md5(self.data).hexdigest())
+        st = os.stat(self.path)
+
+        # When
+        # Same size and mtime, but a different inode
+        other = os.path.join(self.tempdir, "other.egg")
+        with open(other, "wb") as fp:
+            fp.write(b"some date")
+        os.utime(other, (st.st_atime, st.st_mtime))
+        os.rename(other, self.path)
+
+        # Then
+        self.assertIsNone(checksums.lookup(self.path))
+
+    def test_md5(self):
+        # Given
+        md5 = hashlib.md5(self.data).hexdigest()
+        checksums = ChecksumDatabase.from_directory(self.tempdir)
+
+        # When
+        with mock.patch("enstaller.checksum_db.compute_md5",
+                        return_value=md5) as mocked_compute_md5:
+            first = checksums.md5(self.path)
+            second = checksums.md5(self.path)
+
+        # Then
+        self.assertEqual(first, md5)
+        self.assertEqual(second, md5)
+        self.assertEqual(mocked_compute_md5.call_count, 1)
+
+    def test_verify(self):
+        # Given
+        paths = [self.path]
+        for i in range(5):
+            path = os.path.join(self.tempdir, "bar-{0}.egg".format(i))
+            with open(path, "wb") as fp:
+                fp.write(str(i).encode("ascii"))
+            paths.append(path)
+
+        checksums = ChecksumDatabase.from_directory(self.tempdir)
+        checksums.record(self.path, "a" * 32)
+
+        # When
+        md5s = checksums.verify(paths)
+
+        # Then
+        self.assertEqual(md5s[self.path], hashlib.md5(self.data).hexdigest())
+        for i, path in enumerate(paths[1:]):
+            r_md5 = hashlib.md5(str(i).encode("ascii")).hexdigest()
+            self.assertEqual(md5s[path], r_md5)
+            self.assertEqual(checksums.lookup(path), r_md5)
+        self.assertEqual(checksums.lookup(self.path),
+                         hashlib.md5(self.data).hexdigest())
+
+    def test_unusable_database(self):
+        # Given
+        md5 = hashlib.md5(self.data).hexdigest()
+        checksums = ChecksumDatabase(
+            os.path.join(self.tempdir, "missing", CHECKSUM_DB_FILENAME)
+        )
+
+        # When
+        checksums.record(self.path, md5)
+
+        # Then
+        self.assertIsNone(checksums.lookup(self.path))
+        self.assertEqual(checksums.md5(self.path), md5)
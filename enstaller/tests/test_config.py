@@ -24,11 +24,14 @@ from enstaller.repository_info import (CanopyRepositoryInfo,
                                        BroodRepositoryInfo,
                                        FSRepositoryInfo,
                                        IBroodRepositoryInfo,
+                                       MirroredRepositoryInfo,
                                        OldstyleRepositoryInfo)
+from enstaller.requests_utils import (DEFAULT_INDEX_CACHE_MAX_ENTRIES,
+                                      DEFAULT_INDEX_CACHE_MAX_SIZE)
 from enstaller.session import Session
 from enstaller.errors import (EnstallerException,
                               InvalidConfiguration)
-from enstaller.utils import PY_VER
+from enstaller.utils import PY_VER, abs_expanduser
 
 from .common import DummyAuthenticator, WarningTestMixin, mock_print
 
@@ -296,6 +299,179 @@ class TestAuthenticationConfiguration(unittest.TestCase):
 
 
 class TestConfigurationParsing(unittest.TestCase):
+    def test_max_concurrent_fetches_setup(self):
+        # When
+        config = Configuration()
+
+        # Then
+        self.assertEqual(config.max_concurrent_fetches, 4)
+
+        # Given
+        data = StringIO("max_concurrent_fetches = 1")
+
+        # When
+        config = Configuration.from_file(data)
+
+        # Then
+        self.assertEqual(config.max_concurrent_fetches, 1)
+
+        # Given
+        data = StringIO("max_concurrent_fetches = 0")
+
+        # When/Then
+        with self.assertRaises(InvalidConfiguration):
+            Configuration.from_file(data)
+
+        # Given
+        data = StringIO("max_concurrent_fetches = 'a'")
+
+        # When/Then
+        with self.assertRaises(InvalidConfiguration):
+            Configuration.from_file(data)
+
+    def test_download_limits_setup(self):
+        # When
+        config = Configuration()
+
+        # Then
+        self.assertIsNone(config.max_concurrent_transfers)
+        self.assertIsNone(config.max_download_rate)
+
+        # Given
+        data = StringIO(textwrap.dedent("""\
+            max_concurrent_transfers = 2
+            max_download_rate = 1048576
+        """))
+
+        # When
+        config = Configuration.from_file(data)
+
+        # Then
+        self.assertEqual(config.max_concurrent_transfers, 2)
+        self.assertEqual(config.max_download_rate, 1048576)
+
+        # When/Then
+        for name in ("max_concurrent_transfers", "max_download_rate"):
+            for value in ("0", "'a'"):
+                data = StringIO("{0} = {1}".format(name, value))
+                with self.assertRaises(InvalidConfiguration):
+                    Configuration.from_file(data)
+
+    def test_repository_cache_max_size_setup(self):
+        # When
+        config = Configuration()
+
+        # Then
+        self.assertIsNone(config.repository_cache_max_size)
+
+        # Given
+        data = StringIO("repository_cache_max_size = 1073741824")
+
+        # When
+        config = Configuration.from_file(data)
+
+        # Then
+        self.assertEqual(config.repository_cache_max_size, 1073741824)
+
+        # Given
+        data = StringIO("repository_cache_max_size = -1")
+
+        # When/Then
+        with self.assertRaises(InvalidConfiguration):
+            Configuration.from_file(data)
+
+    def test_stream_indices_setup(self):
+        # When
+        config = Configuration()
+
+        # Then
+        self.assertFalse(config.stream_indices)
+
+        # Given
+        data = StringIO("stream_indices = True")
+
+        # When
+        config = Configuration.from_file(data)
+
+        # Then
+        self.assertTrue(config.stream_indices)
+
+    def test_connection_pool_setup(self):
+        # When
+        config = Configuration()
+
+        # Then
+        self.assertEqual(config.connection_pool_size, 10)
+        self.assertFalse(config.connection_pool_block)
+
+        # Given
+        data = StringIO(textwrap.dedent("""\
+            connection_pool_size = 4
+            connection_pool_block = True
+        """))
+
+        # When
+        config = Configuration.from_file(data)
+
+        # Then
+        self.assertEqual(config.connection_pool_size, 4)
+        self.assertTrue(config.connection_pool_block)
+
+        # Given
+        data = StringIO("connection_pool_size = 0")
+
+        # When/Then
+        with self.assertRaises(InvalidConfiguration):
+            Configuration.from_file(data)
+
+    def test_index_cache_capacity_setup(self):
+        # When
+        config = Configuration()
+
+        # Then
+        self.assertEqual(config.index_cache_max_entries,
+                         DEFAULT_INDEX_CACHE_MAX_ENTRIES)
+        self.assertEqual(config.index_cache_max_size,
+                         DEFAULT_INDEX_CACHE_MAX_SIZE)
+
+        # Given
+        data = StringIO(textwrap.dedent("""\
+            index_cache_max_entries = 20
+            index_cache_max_size = 1048576
+        """))
+
+        # When
+        config = Configuration.from_file(data)
+
+        # Then
+        self.assertEqual(config.index_cache_max_entries, 20)
+        self.assertEqual(config.index_cache_max_size, 1048576)
+
+        # Given
+        for data in ("index_cache_max_entries = 0",
+                     "index_cache_max_size = -1"):
+            # When/Then
+            with self.assertRaises(InvalidConfiguration):
+                Configuration.from_file(StringIO(data))
+
+    def test_shared_egg_store_setup(self):
+        # When
+        config = Configuration()
+
+        # Then
+        self.assertIsNone(config.shared_egg_store)
+
+        # Given
+        data = StringIO("shared_egg_store = '~/.enstaller/eggs'")
+
+        # When
+        config = Configuration.from_file(data)
+
+        # Then
+        self.assertEqual(config.shared_egg_store,
+                         os.path.join(abs_expanduser("~"), ".enstaller",
+                                      "eggs"))
+
     def test_parse_simple_unsupported_entry(self):
         # XXX: ideally, we would like something like with self.assertWarns to
         # check for the warning, but backporting the python 3.3 code to
@@ -1198,6 +1374,41 @@ class TestYamlConfiguration(unittest.TestCase):
         # Then
         self.assertEqual(config.max_retries, 1)
 
+    def test_stream_indices(self):
+        # Given
+        yaml_string = textwrap.dedent("""\
+            stream_indices: true
+        """)
+
+        # When
+        config = Configuration.from_yaml_filename(StringIO(yaml_string))
+
+        # Then
+        self.assertTrue(config.stream_indices)
+
+    def test_download_limits(self):
+        # Given
+        yaml_string = textwrap.dedent("""\
+            max_concurrent_transfers: 2
+            max_download_rate: 1048576
+        """)
+
+        # When
+        config = Configuration.from_yaml_filename(StringIO(yaml_string))
+
+        # Then
+        self.assertEqual(config.max_concurrent_transfers, 2)
+        self.assertEqual(config.max_download_rate, 1048576)
+
+        # Given
+        yaml_string = textwrap.dedent("""\
+            max_download_rate: 0
+        """)
+
+        # When/Then
+        with self.assertRaises(InvalidConfiguration):
+            Configuration.from_yaml_filename(StringIO(yaml_string))
+
     def test_verify_ssl(self):
         # Given
         yaml_string = textwrap.dedent("""\
@@ -1240,3 +1451,44 @@ class TestYamlConfiguration(unittest.TestCase):
 
         # Then
         self.assertEqual(config.repositories, r_repositories)
+
+    def test_mirrored_repositories(self):
+        # Given
+        yaml_string = textwrap.dedent("""\
+            store_url: "http://www.acme.com"
+
+            repositories:
+              - "enthought/free"
+              - mirrors:
+                  - "file:///mnt/commercial"
+                  - "enthought/commercial"
+                race: true
+        """)
+
+        # When
+        config = Configuration.from_yaml_filename(StringIO(yaml_string))
+
+        # Then
+        self.assertEqual(len(config.repositories), 2)
+        self.assertEqual(
+            config.repositories[0],
+            BroodRepositoryInfo("http://www.acme.com", "enthought/free")
+        )
+        repository = config.repositories[1]
+        self.assertIsInstance(repository, MirroredRepositoryInfo)
+        self.assertEqual(repository.mirrors, (
+            FSRepositoryInfo("file:///mnt/commercial"),
+            BroodRepositoryInfo("http://www.acme.com", "enthought/commercial"),
+        ))
+        self.assertTrue(repository.race)
+
+    def test_invalid_mirrored_repositories(self):
+        # Given
+        yaml_string = textwrap.dedent("""\
+            repositories:
+              - mirrors: []
+        """)
+
+        # When/Then
+        with self.assertRaises(InvalidConfiguration):
+            Configuration.from_yaml_filename(StringIO(yaml_string))
@@ -0,0 +1,164 @@
+import sys
+import threading
+import time
+
+from enstaller.download_scheduler import DownloadScheduler, _TokenBucket
+
+if sys.version_info[0] == 2:
+    import unittest2 as unittest
+else:
+    import unittest
+
+
+class _FakeClock(object):
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class Test_TokenBucket(unittest.TestCase):
+    def test_burst(self):
+        # Given
+        clock = _FakeClock()
+        bucket = _TokenBucket(1000, capacity=1000, clock=clock,
+                              sleep=clock.sleep)
+
+        # When
+        bucket.consume(600)
+        bucket.consume(400)
+
+        # Then
+        self.assertEqual(clock.sleeps, [])
+
+    def test_rate(self):
+        # Given
+        clock = _FakeClock()
+        bucket = _TokenBucket(1000, capacity=100, clock=clock,
+                              sleep=clock.sleep)
+
+        # When
+        for _ in range(30):
+            bucket.consume(100)
+
+        # Then
+        # The first 100 bytes are taken from the initial burst
+        self.assertAlmostEqual(clock.now, 2.9)
+
+    def test_refill(self):
+        # Given
+        clock = _FakeClock()
+        bucket = _TokenBucket(1000, clock=clock, sleep=clock.sleep)
+        bucket.consume(100)
+
+        # When
+        clock.now += 10
+        bucket.consume(100)
+
+        # Then
+        # Tokens do not accumulate beyond the capacity (0.1 s by default)
+        self.assertEqual(clock.sleeps, [])
+        bucket.consume(500)
+        self.assertAlmostEqual(clock.sleeps[0], 0.5)
+
+
+class TestDownloadScheduler(unittest.TestCase):
+    def test_unlimited(self):
+        # Given
+        clock = _FakeClock()
+        scheduler = DownloadScheduler(clock=clock, sleep=clock.sleep)
+
+        # When
+        with scheduler.transfer():
+            with scheduler.transfer():
+                active = scheduler.active_transfers
+                scheduler.throttle(10 ** 9)
+
+        # Then
+        self.assertEqual(active, 2)
+        self.assertEqual(scheduler.active_transfers, 0)
+        self.assertEqual(clock.sleeps, [])
+
+    def test_throttle(self):
+        # Given
+        clock = _FakeClock()
+        scheduler = DownloadScheduler(max_bytes_per_second=1024,
+                                      clock=clock, sleep=clock.sleep)
+
+        # When
+        for _ in range(4):
+            scheduler.throttle(1024)
+
+        # Then
+        self.assertAlmostEqual(clock.now, 4.0 - 0.1, places=2)
+
+    def test_max_transfers(self):
+        # Given
+        scheduler = DownloadScheduler(max_transfers=2)
+        max_active = []
+        lock = threading.Lock()
+
+        def _transfer():
+            with scheduler.transfer():
+                with lock:
+                    max_active.append(scheduler.active_transfers)
+                time.sleep(0.02)
+
+        # When
+        threads = [threading.Thread(target=_transfer) for _ in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # Then
+        self.assertEqual(len(max_active), 6)
+        self.assertLessEqual(max(max_active), 2)
+        self.assertEqual(scheduler.active_transfers, 0)
+
+    def test_priority(self):
+        # Given
+        scheduler = DownloadScheduler(max_transfers=1)
+        started = []
+        lock = threading.Lock()
+
+        def _transfer(priority):
+            with scheduler.transfer(priority):
+                with lock:
+                    started.append(priority)
+
+        # When
+        with scheduler.transfer():
+            threads = []
+            for priority in (3, 1, 2, 0):
+                thread = threading.Thread(target=_transfer, args=(priority,))
+                thread.start()
+                threads.append(thread)
+            # Wait for every transfer to be queued
+            while len(scheduler._waiting) < 4:
+                time.sleep(0.01)
+        for thread in threads:
+            thread.join()
+
+        # Then
+        self.assertEqual(started, [0, 1, 2, 3])
+
+    def test_release_on_error(self):
+        # Given
+        scheduler = DownloadScheduler(max_transfers=1)
+
+        # When
+        with self.assertRaises(ValueError):
+            with scheduler.transfer():
+                raise ValueError()
+
+        # Then
+        self.assertEqual(scheduler.active_transfers, 0)
+        with scheduler.transfer():
+            self.assertEqual(scheduler.active_transfers, 1)
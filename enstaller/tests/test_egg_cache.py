@@ -0,0 +1,197 @@
+import os.path
+import shutil
+import sys
+import tempfile
+import textwrap
+
+import mock
+
+from egginst.utils import PART_SUFFIX
+
+from enstaller.egg_cache import EggCache, pinned_eggs
+
+if sys.version_info[0] == 2:
+    import unittest2 as unittest
+else:
+    import unittest
+
+
+class TestEggCache(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def _add_egg(self, filename, size, last_use=None):
+        path = os.path.join(self.tempdir, filename)
+        with open(path, "wb") as fp:
+            fp.write(b"a" * size)
+        if last_use is not None:
+            EggCache(self.tempdir).touch(path, last_use)
+        return path
+
+    def _filenames(self):
+        return sorted(egg.filename
+                      for egg in EggCache(self.tempdir).iter_eggs())
+
+    def test_iter_eggs(self):
+        # Given
+        self._add_egg("numpy-1.8.0-1.egg", 10, last_use=1.0)
+        self._add_egg("scipy-0.14.0-1.egg" + PART_SUFFIX, 5)
+        self._add_egg("index.json", 5)
+
+        # When
+        eggs = dict((egg.filename, egg)
+                    for egg in EggCache(self.tempdir).iter_eggs())
+
+        # Then
+        self.assertEqual(sorted(eggs), ["numpy-1.8.0-1.egg",
+                                        "scipy-0.14.0-1.egg" + PART_SUFFIX])
+        self.assertEqual(eggs["numpy-1.8.0-1.egg"].size, 10)
+        self.assertEqual(eggs["numpy-1.8.0-1.egg"].last_use, 1.0)
+        self.assertEqual(eggs["scipy-0.14.0-1.egg" + PART_SUFFIX].key,
+                         "scipy-0.14.0-1.egg")
+        self.assertEqual(EggCache(self.tempdir).size, 15)
+
+    def test_collect_lru(self):
+        # Given
+        self._add_egg("a-1.0.0-1.egg", 10, last_use=3.0)
+        self._add_egg("b-1.0.0-1.egg", 10, last_use=1.0)
+        self._add_egg("c-1.0.0-1.egg", 10, last_use=2.0)
+        egg_cache = EggCache(self.tempdir, max_size=15)
+
+        # When
+        removed = egg_cache.collect()
+
+        # Then
+        self.assertEqual([egg.filename for egg in removed],
+                         ["b-1.0.0-1.egg", "c-1.0.0-1.egg"])
+        self.assertEqual(self._filenames(), ["a-1.0.0-1.egg"])
+
+    def test_collect_within_budget(self):
+        # Given
+        self._add_egg("a-1.0.0-1.egg", 10)
+        egg_cache = EggCache(self.tempdir, max_size=10)
+
+        # When
+        removed = egg_cache.collect()
+
+        # Then
+        self.assertEqual(removed, [])
+        self.assertEqual(self._filenames(), ["a-1.0.0-1.egg"])
+
+    def test_collect_pinned(self):
+        # Given
+        self._add_egg("a-1.0.0-1.egg", 10, last_use=1.0)
+        self._add_egg("b-1.0.0-1.egg", 10, last_use=2.0)
+        self._add_egg("c-1.0.0-1.egg", 10, last_use=3.0)
+        egg_cache = EggCache(self.tempdir)
+
+        # When
+        removed = egg_cache.collect(pinned=["a-1.0.0-1.egg"], max_size=10)
+
+        # Then
+        self.assertEqual([egg.filename for egg in removed],
+                         ["b-1.0.0-1.egg", "c-1.0.0-1.egg"])
+        self.assertEqual(self._filenames(), ["a-1.0.0-1.egg"])
+
+    def test_touch(self):
+        # Given
+        path = self._add_egg("a-1.0.0-1.egg", 10, last_use=1.0)
+        self._add_egg("b-1.0.0-1.egg", 10, last_use=2.0)
+        egg_cache = EggCache(self.tempdir, max_size=10)
+
+        # When
+        egg_cache.touch(path, 3.0)
+        removed = egg_cache.collect()
+
+        # Then
+        self.assertEqual([egg.filename for egg in removed],
+                         ["b-1.0.0-1.egg"])
+
+    def test_missing_directory(self):
+        # Given
+        egg_cache = EggCache(os.path.join(self.tempdir, "missing"))
+
+        # When/Then
+        self.assertEqual(egg_cache.collect(), [])
+        self.assertEqual(egg_cache.size, 0)
+
+
+class TestPinnedEggs(unittest.TestCase):
+    def setUp(self):
+        self.prefix = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.prefix)
+
+    def test_history(self):
+        # Given
+        with open(os.path.join(self.prefix, "enpkg.hist"), "w") as fp:
+            fp.write(textwrap.dedent("""\
+            ==> 2014-06-01 10:00:00 UTC <==
+            numpy-1.7.1-1.egg
+            ==> 2014-06-02 10:00:00 UTC <==
+            -numpy-1.7.1-1.egg
+            +numpy-1.8.0-1.egg
+            +scipy-0.14.0-1.egg
+            """))
+
+        # When
+        pinned = pinned_eggs([self.prefix])
+
+        # Then
+        self.assertEqual(pinned,
+                         set(["numpy-1.7.1-1.egg", "numpy-1.8.0-1.egg",
+                              "scipy-0.14.0-1.egg"]))
+
+        # When
+        pinned = pinned_eggs([self.prefix], max_revisions=1)
+
+        # Then
+        self.assertEqual(pinned,
+                         set(["numpy-1.8.0-1.egg", "scipy-0.14.0-1.egg"]))
+
+    def test_collect_previous_revision(self):
+        # Given
+        with open(os.path.join(self.prefix, "enpkg.hist"), "w") as fp:
+            fp.write(textwrap.dedent("""\
+            ==> 2014-06-01 10:00:00 UTC <==
+            numpy-1.7.1-1.egg
+            ==> 2014-06-02 10:00:00 UTC <==
+            -numpy-1.7.1-1.egg
+            +numpy-1.8.0-1.egg
+            """))
+        cache_directory = os.path.join(self.prefix, "LOCAL-REPO")
+        os.makedirs(cache_directory)
+        egg_cache = EggCache(cache_directory)
+        for i, filename in enumerate(["numpy-1.7.1-1.egg",
+                                      "numpy-1.8.0-1.egg",
+                                      "scipy-0.14.0-1.egg"]):
+            path = os.path.join(cache_directory, filename)
+            with open(path, "wb") as fp:
+                fp.write(b"a" * 10)
+            egg_cache.touch(path, float(i))
+
+        # When
+        removed = egg_cache.collect(pinned_eggs([self.prefix]), max_size=0)
+
+        # Then
+        self.assertEqual([egg.filename for egg in removed],
+                         ["scipy-0.14.0-1.egg"])
+        self.assertEqual(
+            sorted(egg.filename for egg in egg_cache.iter_eggs()),
+            ["numpy-1.7.1-1.egg", "numpy-1.8.0-1.egg"]
+        )
+
+    def test_no_history(self):
+        # Given
+        installed = ["numpy-1.8.0-1.egg"]
+
+        # When
+        with mock.patch("egginst.get_installed", return_value=installed):
+            pinned = pinned_eggs([self.prefix])
+
+        # Then
+        self.assertEqual(pinned, set(installed))
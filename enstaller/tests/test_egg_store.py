@@ -0,0 +1,260 @@
+import os
+import os.path
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+import mock
+
+from egginst.utils import compute_md5
+
+from enstaller.egg_store import SharedEggStore, _STALE_LOCK_AGE
+
+if sys.version_info[0] == 2:
+    import unittest2 as unittest
+else:
+    import unittest
+
+
+class TestSharedEggStore(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.store = SharedEggStore(os.path.join(self.tempdir, "store"))
+        self.cache_directories = []
+        for name in ("cache1", "cache2"):
+            path = os.path.join(self.tempdir, name)
+            os.makedirs(path)
+            self.cache_directories.append(path)
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def _write_egg(self, directory, filename, data=b"some egg data"):
+        path = os.path.join(directory, filename)
+        with open(path, "wb") as fp:
+            fp.write(data)
+        return path, compute_md5(path)
+
+    def test_add_and_link(self):
+        # Given
+        cache1, cache2 = self.cache_directories
+        path, md5 = self._write_egg(cache1, "nose-1.3.0-1.egg")
+        target = os.path.join(cache2, "nose-1.3.0-1.egg")
+
+        # When
+        self.store.add(path, md5)
+        linked = self.store.link(md5, target)
+
+        # Then
+        self.assertTrue(md5 in self.store)
+        self.assertTrue(linked)
+        self.assertEqual(compute_md5(target), md5)
+        self.assertEqual(os.stat(target).st_ino, os.stat(path).st_ino)
+        self.assertEqual(os.stat(path).st_nlink, 3)
+        self.assertEqual(os.listdir(cache2), ["nose-1.3.0-1.egg"])
+
+    def test_link_twice(self):
+        # Given
+        cache1, _ = self.cache_directories
+        path, md5 = self._write_egg(cache1, "nose-1.3.0-1.egg")
+        self.store.add(path, md5)
+
+        # When
+        linked = self.store.link(md5, path)
+
+        # Then
+        self.assertTrue(linked)
+        self.assertEqual(os.listdir(cache1), ["nose-1.3.0-1.egg"])
+        self.assertEqual(os.stat(path).st_nlink, 2)
+
+    def test_link_missing(self):
+        # Given
+        target = os.path.join(self.cache_directories[0], "nose-1.3.0-1.egg")
+
+        # When
+        linked = self.store.link("a" * 32, target)
+
+        # Then
+        self.assertFalse(linked)
+        self.assertFalse(os.path.exists(target))
+
+    def test_link_without_hardlinks(self):
+        # Given
+        cache1, cache2 = self.cache_directories
+        path, md5 = self._write_egg(cache1, "nose-1.3.0-1.egg")
+        target = os.path.join(cache2, "nose-1.3.0-1.egg")
+
+        # When
+        with mock.patch("enstaller.egg_store.os.link",
+                        side_effect=OSError("Cross-device link")):
+            self.store.add(path, md5)
+            linked = self.store.link(md5, target)
+
+        # Then
+        self.assertTrue(linked)
+        self.assertEqual(compute_md5(target), md5)
+        self.assertNotEqual(os.stat(target).st_ino, os.stat(path).st_ino)
+
+    def test_collect(self):
+        # Given
+        cache1, cache2 = self.cache_directories
+        used_path, used_md5 = self._write_egg(cache1, "nose-1.3.0-1.egg")
+        unused_path, unused_md5 = self._write_egg(cache2, "numpy-1.8.0-1.egg",
+                                                  b"numpy egg data")
+        self.store.add(used_path, used_md5)
+        self.store.add(unused_path, unused_md5)
+        os.unlink(unused_path)
+
+        # When
+        removed = self.store.collect()
+
+        # Then
+        self.assertEqual([size for _, size in removed],
+                         [len(b"numpy egg data")])
+        self.assertTrue(used_md5 in self.store)
+        self.assertFalse(unused_md5 in self.store)
+
+    def test_collect_skips_locked(self):
+        # Given
+        path, md5 = self._write_egg(self.cache_directories[0],
+                                    "nose-1.3.0-1.egg")
+        self.store.add(path, md5)
+        os.unlink(path)
+
+        # When
+        with self.store.lock(md5):
+            removed = self.store.collect()
+
+        # Then
+        self.assertEqual(removed, [])
+        self.assertTrue(md5 in self.store)
+
+
+class TestStoreLock(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.store = SharedEggStore(self.tempdir)
+        self.md5 = "a" * 32
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_exclusion(self):
+        # Given
+        events = []
+        first = self.store.lock(self.md5)
+        first.acquire()
+
+        def _locked():
+            with self.store.lock(self.md5):
+                events.append("second")
+
+        # When
+        thread = threading.Thread(target=_locked)
+        thread.start()
+        time.sleep(0.3)
+        events.append("first")
+        first.release()
+        thread.join()
+
+        # Then
+        self.assertEqual(events, ["first", "second"])
+        self.assertFalse(os.path.exists(first.path))
+
+    def test_break_stale_lock(self):
+        # Given
+        stale = self.store.lock(self.md5)
+        stale.acquire()
+        old = time.time() - _STALE_LOCK_AGE - 1
+        os.utime(stale.path, (old, old))
+
+        # When
+        with self.store.lock(self.md5) as lock:
+            acquired = os.path.exists(lock.path)
+
+        # Then
+        self.assertTrue(acquired)
+        self.assertEqual(os.listdir(os.path.dirname(lock.path)), [])
+
+    def test_break_retaken_lock(self):
+        # Given
+        # Another process found the lock stale as well, broke it and took
+        # it again before us.
+        holder = self.store.lock(self.md5)
+        holder.acquire()
+        lock = self.store.lock(self.md5)
+
+        # When
+        lock._break_stale()
+
+        # Then
+        self.assertTrue(os.path.exists(holder.path))
+        self.assertEqual(os.listdir(os.path.dirname(holder.path)),
+                         [os.path.basename(holder.path)])
+        holder.release()
+
+    def test_break_retaken_lock_restore_failure(self):
+        # Given
+        holder = self.store.lock(self.md5)
+        holder.acquire()
+        lock = self.store.lock(self.md5)
+        directory = os.path.dirname(holder.path)
+
+        # When
+        with mock.patch("enstaller.egg_store.os.link",
+                        side_effect=OSError("no hard links")):
+            lock._break_stale()
+
+        # Then
+        # The live lock is left alone where it was moved to
+        filenames = os.listdir(directory)
+        self.assertEqual(len(filenames), 1)
+        self.assertTrue(filenames[0].endswith(".stale"))
+
+        # When
+        moved = os.path.join(directory, filenames[0])
+        old = time.time() - _STALE_LOCK_AGE - 1
+        os.utime(moved, (old, old))
+        self.store.collect()
+
+        # Then
+        self.assertEqual(os.listdir(directory), [])
+
+    def test_release_broken_lock(self):
+        # Given
+        # Our lock was broken, and taken again by someone else
+        broken = self.store.lock(self.md5)
+        broken.acquire()
+        os.unlink(broken.path)
+        holder = self.store.lock(self.md5)
+        holder.acquire()
+
+        # When
+        broken.release()
+
+        # Then
+        self.assertTrue(os.path.exists(holder.path))
+
+        # When
+        holder.release()
+
+        # Then
+        self.assertFalse(os.path.exists(holder.path))
+
+    def test_refresh(self):
+        # Given
+        lock = self.store.lock(self.md5)
+        lock.acquire()
+        old = time.time() - _STALE_LOCK_AGE - 1
+        os.utime(lock.path, (old, old))
+
+        # When
+        with mock.patch("enstaller.egg_store.time.time",
+                        return_value=time.time() + 3600):
+            lock.refresh()
+
+        # Then
+        self.assertGreater(os.stat(lock.path).st_mtime, old + 1)
+        lock.release()
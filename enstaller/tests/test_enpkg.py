@@ -2,17 +2,22 @@ import os.path
 import shutil
 import sys
 import tempfile
+import threading
 
 import mock
+import requests
 import responses
 
+from concurrent.futures import CancelledError, ThreadPoolExecutor
+
 from egginst.main import _default_runtime_info
 from egginst.progress import console_progress_manager_factory
 from egginst.tests.common import mkdtemp, DUMMY_EGG, _EGGINST_COMMON_DATA
 from egginst.utils import compute_md5, makedirs
 
 from enstaller.config import Configuration
-from enstaller.enpkg import Enpkg, FetchAction, InstallAction, RemoveAction
+from enstaller.enpkg import (Enpkg, FetchAction, InstallAction, RemoveAction,
+                             _BackgroundFetch)
 from enstaller.errors import EnpkgError, InvalidChecksum
 from enstaller.fetch import _DownloadManager
 from enstaller.package import (
@@ -91,8 +96,8 @@ class TestEnpkgActions(unittest.TestCase):
         def factory(*a, **kw):
             return console_progress_manager_factory("fetching", *a, **kw)
 
-        action = RemoveAction(package, self.prefix, top_repository,
-                              remote_repository, factory)
+        action = RemoveAction(package, _default_runtime_info(self.prefix),
+                              top_repository, remote_repository, factory)
         progress = mock.Mock()
         progress.__enter__ = mock.Mock(return_value=progress)
         progress.__exit__ = mock.Mock()
@@ -149,6 +154,131 @@ class TestEnpkgExecute(unittest.TestCase):
                 self.assertTrue(mocked_fetch.called)
                 mocked_install.assert_called_with()
 
+    def test_collect_cache(self):
+        # Given
+        config = Configuration()
+        dummy_package = dummy_repository_package_factory("dummy", "1.0.1", 1)
+        repository = repository_factory([dummy_package])
+        enpkg = Enpkg(repository,
+                      mocked_session_factory(config.repository_cache),
+                      prefixes=self.prefixes, repository_cache_max_size=42)
+
+        # When
+        with mock.patch("enstaller.enpkg.FetchAction.execute"):
+            with mock.patch("enstaller.enpkg.pinned_eggs",
+                            return_value=set(["dummy-1.0.1-1.egg"])):
+                with mock.patch("enstaller.egg_cache.EggCache.collect") \
+                        as mocked_collect:
+                    enpkg.execute([("fetch", dummy_package)])
+
+        # Then
+        mocked_collect.assert_called_once_with(set(["dummy-1.0.1-1.egg"]),
+                                               42)
+
+    def _pipelined_enpkg_factory(self, packages):
+        config = Configuration()
+        repository = repository_factory(packages)
+        return Enpkg(repository,
+                     mocked_session_factory(config.repository_cache),
+                     prefixes=self.prefixes, max_concurrent_fetches=2)
+
+    def test_pipelined_install(self):
+        # Given
+        numpy = dummy_repository_package_factory("numpy", "1.8.0", 1)
+        scipy = dummy_repository_package_factory("scipy", "0.14.0", 1)
+        enpkg = self._pipelined_enpkg_factory([numpy, scipy])
+        actions = [
+            ("fetch_0", numpy),
+            ("fetch_0", scipy),
+            ("install", numpy),
+            ("install", scipy),
+        ]
+
+        events = []
+        numpy_installed = threading.Event()
+
+        def fetch(action, report):
+            if action._package is scipy:
+                # scipy is only fetched once numpy is installed: numpy install
+                # must not wait for every fetch to complete.
+                numpy_installed.wait(5)
+            events.append(("fetch", action._package.key))
+
+        def install(action):
+            events.append(("install", action._package.key))
+            if action._package is numpy:
+                numpy_installed.set()
+
+        # When
+        with mock.patch("enstaller.enpkg.FetchAction._execute_in_background",
+                        autospec=True, side_effect=fetch):
+            with mock.patch("enstaller.enpkg.InstallAction.execute",
+                            autospec=True, side_effect=install):
+                enpkg.execute(actions)
+
+        # Then
+        self.assertEqual(events, [
+            ("fetch", numpy.key),
+            ("install", numpy.key),
+            ("fetch", scipy.key),
+            ("install", scipy.key),
+        ])
+
+    def test_pipelined_fetch_failure(self):
+        # Given
+        numpy = dummy_repository_package_factory("numpy", "1.8.0", 1)
+        enpkg = self._pipelined_enpkg_factory([numpy])
+        actions = [("fetch_0", numpy), ("install", numpy)]
+
+        # When
+        with mock.patch("enstaller.enpkg.FetchAction._execute_in_background",
+                        side_effect=InvalidChecksum("numpy", "a", "b")):
+            with mock.patch("enstaller.enpkg.InstallAction.execute") \
+                    as mocked_install:
+                with self.assertRaises(InvalidChecksum):
+                    enpkg.execute(actions)
+
+        # Then
+        self.assertFalse(mocked_install.called)
+
+    def test_pipelined_install_failure_cancels_fetches(self):
+        # Given
+        numpy = dummy_repository_package_factory("numpy", "1.8.0", 1)
+        scipy = dummy_repository_package_factory("scipy", "0.14.0", 1)
+        enpkg = self._pipelined_enpkg_factory([numpy, scipy])
+        actions = [
+            ("fetch_0", numpy),
+            ("fetch_0", scipy),
+            ("install", numpy),
+            ("install", scipy),
+        ]
+
+        canceled = []
+        scipy_started = threading.Event()
+
+        def fetch(action, report):
+            if action._package is scipy:
+                scipy_started.set()
+                # Only completes once canceled
+                while not action.is_canceled:
+                    threading.Event().wait(0.01)
+                canceled.append(action._package.key)
+
+        def install():
+            scipy_started.wait(5)
+            raise EnpkgError("install failed")
+
+        # When
+        with mock.patch("enstaller.enpkg.FetchAction._execute_in_background",
+                        autospec=True, side_effect=fetch):
+            with mock.patch("enstaller.enpkg.InstallAction.execute",
+                            side_effect=install):
+                with self.assertRaises(EnpkgError):
+                    enpkg.execute(actions)
+
+        # Then
+        self.assertEqual(canceled, [scipy.key])
+
 
 class TestEnpkgRevert(unittest.TestCase):
     def setUp(self):
@@ -462,6 +592,160 @@ class TestFetchAction(unittest.TestCase):
         # No exception
         action.execute()
 
+    @responses.activate
+    def test_retry_connection_error(self):
+        # Given
+        path, downloader, repository = self._retry_common_setup()
+        package = repository.find_package("nose", "1.3.0-1")
+
+        with open(path, "rb") as fp:
+            payload = fp.read()
+
+        counter = [0]
+
+        def request_callback(request):
+            counter[0] += 1
+            if counter[0] == 1:
+                raise requests.exceptions.ConnectionError("dropped")
+            return (200, {}, payload)
+
+        responses.add_callback(responses.GET, package.source_url,
+                               callback=request_callback,
+                               content_type='application/octet-stream')
+
+        # When
+        action = FetchAction(package, downloader, repository, max_retries=1)
+        action.execute()
+
+        # Then
+        self.assertEqual(counter[0], 2)
+        target = os.path.join(downloader.cache_directory,
+                              os.path.basename(path))
+        self.assertEqual(compute_md5(target), compute_md5(path))
+
+    def test_cancel_before_execute(self):
+        # Given
+        downloader, repository = self._downloader_factory([])
+        package = dummy_repository_package_factory("nose", "1.3.0", 1)
+        action = FetchAction(package, downloader, repository)
+
+        # When
+        action.cancel()
+
+        # Then
+        self.assertTrue(action.is_canceled)
+
+    @responses.activate
+    def test_background(self):
+        # Given
+        filename = "nose-1.3.0-1.egg"
+        path = os.path.join(_EGGINST_COMMON_DATA, filename)
+        downloader, repository = self._downloader_factory([path])
+        package = repository.find_package("nose", "1.3.0-1")
+        self._add_response_for_path(path)
+
+        updates = []
+        progress = mock.MagicMock()
+        progress.__enter__.return_value = progress
+        progress.update.side_effect = \
+            lambda n: updates.append((n, threading.current_thread()))
+
+        # When
+        action = FetchAction(package, downloader, repository,
+                             progress_bar_factory=lambda *a, **kw: progress)
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            _BackgroundFetch(action, executor).wait()
+
+        # Then
+        target = os.path.join(downloader.cache_directory, filename)
+        self.assertEqual(compute_md5(target), compute_md5(path))
+        self.assertEqual(sum(n for n, _ in updates), os.path.getsize(path))
+        self.assertEqual(set(thread for _, thread in updates),
+                         set([threading.current_thread()]))
+
+    @responses.activate
+    def test_background_retry(self):
+        # Given
+        path, downloader, repository = self._retry_common_setup()
+        package = repository.find_package("nose", "1.3.0-1")
+
+        url = list(repository.iter_packages())[0].source_url
+        with open(path, "rb") as fp:
+            payload = fp.read()
+
+        max_retries = 2
+        self._add_failing_checksum_response(url, payload, max_retries)
+
+        progress_bar_factory = mock.MagicMock()
+
+        # When
+        action = FetchAction(package, downloader, repository,
+                             progress_bar_factory=progress_bar_factory,
+                             max_retries=max_retries)
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            _BackgroundFetch(action, executor).wait()
+
+        # Then
+        self.assertEqual(progress_bar_factory.call_count, max_retries + 1)
+        target = os.path.join(downloader.cache_directory,
+                              os.path.basename(path))
+        self.assertEqual(compute_md5(target), compute_md5(path))
+
+    @responses.activate
+    def test_background_not_enough_retry(self):
+        # Given
+        path, downloader, repository = self._retry_common_setup()
+        package = repository.find_package("nose", "1.3.0-1")
+
+        url = list(repository.iter_packages())[0].source_url
+        with open(path, "rb") as fp:
+            payload = fp.read()
+
+        max_retries = 2
+        self._add_failing_checksum_response(url, payload, max_retries)
+
+        # When/Then
+        action = FetchAction(package, downloader, repository,
+                             max_retries=max_retries - 1)
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            with self.assertRaises(InvalidChecksum):
+                _BackgroundFetch(action, executor).wait()
+
+    def test_background_cancel_before_start(self):
+        # Given
+        filename = "nose-1.3.0-1.egg"
+        path = os.path.join(_EGGINST_COMMON_DATA, filename)
+        downloader, repository = self._downloader_factory([path])
+        package = repository.find_package("nose", "1.3.0-1")
+        action = FetchAction(package, downloader, repository)
+
+        errors = []
+
+        def _wait(fetch):
+            try:
+                fetch.wait()
+            except CancelledError as e:
+                errors.append(e)
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            # Keep the only worker busy, so that the fetch never starts
+            blocker = threading.Event()
+            executor.submit(blocker.wait)
+            fetch = _BackgroundFetch(action, executor)
+
+            # When
+            fetch.cancel()
+            waiter = threading.Thread(target=_wait, args=(fetch,))
+            waiter.daemon = True
+            waiter.start()
+            waiter.join(5)
+            blocker.set()
+
+        # Then
+        self.assertFalse(waiter.is_alive())
+        self.assertEqual(len(errors), 1)
+        self.assertTrue(action.is_canceled)
+
 
 class TestRemoveAction(unittest.TestCase):
     def setUp(self):
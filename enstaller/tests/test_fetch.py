@@ -3,16 +3,24 @@ import os.path
 import shutil
 import sys
 import tempfile
+import threading
+import time
 
+import mock
 import requests
 import responses
 
 from egginst.tests.common import _EGGINST_COMMON_DATA
+from egginst.utils import PART_SUFFIX
 
+from enstaller.download_scheduler import DownloadScheduler
+from enstaller.egg_store import SharedEggStore
 from enstaller.errors import InvalidChecksum
 from enstaller.fetch import _DownloadManager
 from enstaller.repository import Repository, RemotePackageMetadata
-from enstaller.repository_info import CanopyRepositoryInfo
+from enstaller.repository_info import (CanopyRepositoryInfo,
+                                       MirroredRepositoryInfo,
+                                       OldstyleRepositoryInfo)
 from enstaller.utils import compute_md5
 
 from enstaller.tests.common import mocked_session_factory
@@ -23,6 +31,29 @@ else:
     import unittest
 
 
+class _FakeResponse(object):
+    """ A response whose content fails after fail_after bytes."""
+    def __init__(self, payload, status_code=200, headers=None,
+                 fail_after=None):
+        self.payload = payload
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.fail_after = fail_after
+        self.closed = False
+
+    def iter_content(self, chunk_size):
+        size = len(self.payload)
+        if self.fail_after is not None:
+            size = self.fail_after
+        for i in range(0, size, chunk_size):
+            yield self.payload[i:min(i + chunk_size, size)]
+        if self.fail_after is not None:
+            raise requests.exceptions.ConnectionError("Connection reset")
+
+    def close(self):
+        self.closed = True
+
+
 class Test_DownloadManager(unittest.TestCase):
     def setUp(self):
         self.tempdir = tempfile.mkdtemp()
@@ -55,6 +86,36 @@ class Test_DownloadManager(unittest.TestCase):
         self.assertEqual(compute_md5(target),
                          repository.find_package("nose", "1.3.0-1").md5)
 
+    def test_fetch_scheduled(self):
+        # Given
+        filename = "nose-1.3.0-1.egg"
+        repository = self._create_store_and_repository([filename])
+        package = repository.find_package("nose", "1.3.0-1")
+
+        session = mocked_session_factory(self.tempdir)
+        real_scheduler = DownloadScheduler()
+        scheduler = mock.Mock(wraps=real_scheduler)
+        session.download_scheduler = scheduler
+
+        # When
+        downloader = _DownloadManager(session, repository)
+        downloader.fetch(package, priority=3)
+
+        # Then
+        scheduler.transfer.assert_called_once_with(3)
+        throttled = sum(call[0][0] for call in
+                        scheduler.throttle.call_args_list)
+        self.assertEqual(throttled, package.size)
+        self.assertEqual(real_scheduler.active_transfers, 0)
+
+        # When
+        scheduler.reset_mock()
+        downloader.fetch(package)
+
+        # Then
+        # Nothing is scheduled for eggs already in the cache
+        self.assertFalse(scheduler.transfer.called)
+
     def test_fetch_invalid_md5(self):
         # Given
         filename = "nose-1.3.0-1.egg"
@@ -165,3 +226,418 @@ class Test_DownloadManager(unittest.TestCase):
         # When/Then
         with self.assertRaises(requests.exceptions.HTTPError):
             downloader.fetch(package)
+
+    def _resume_common_setup(self):
+        filename = "nose-1.3.0-1.egg"
+        store_url = "http://api.enthought.com"
+        repository_info = CanopyRepositoryInfo(store_url)
+
+        repository = Repository()
+
+        path = os.path.join(_EGGINST_COMMON_DATA, filename)
+        package = RemotePackageMetadata.from_egg(path, repository_info)
+        repository.add_package(package)
+
+        with open(path, "rb") as fp:
+            payload = fp.read()
+
+        downloader = _DownloadManager(mocked_session_factory(self.tempdir),
+                                      repository)
+        target = os.path.join(self.tempdir, filename)
+        return package, payload, downloader, target
+
+    def _write_part(self, target, data):
+        with open(target + PART_SUFFIX, "wb") as fp:
+            fp.write(data)
+
+    def _add_range_response(self, url, payload, n_truncated=0,
+                            supports_range=True):
+        """ Serve payload at the given url, truncated for the first
+        n_truncated requests. Returns the list of Range headers received."""
+        ranges = []
+
+        def request_callback(request):
+            range_header = request.headers.get("Range")
+            ranges.append(range_header)
+
+            if range_header is not None and supports_range:
+                start = int(range_header[len("bytes="):-1])
+                if start >= len(payload):
+                    return (416, {}, b"")
+                headers = {
+                    "Content-Range": "bytes {0}-{1}/{2}".format(
+                        start, len(payload) - 1, len(payload)
+                    )
+                }
+                status, body = 206, payload[start:]
+            else:
+                headers = {}
+                status, body = 200, payload
+
+            if len(ranges) <= n_truncated:
+                body = body[:len(body) // 2]
+            return (status, headers, body)
+
+        responses.add_callback(responses.GET, url,
+                               callback=request_callback,
+                               content_type='application/octet-stream')
+        return ranges
+
+    def test_fetch_resume_local(self):
+        # Given
+        filename = "nose-1.3.0-1.egg"
+        path = os.path.join(_EGGINST_COMMON_DATA, filename)
+        repository = self._create_store_and_repository([filename])
+        package = repository.find_package("nose", "1.3.0-1")
+
+        session = mocked_session_factory(self.tempdir)
+        downloader = _DownloadManager(session, repository)
+        target = os.path.join(self.tempdir, filename)
+
+        with open(path, "rb") as fp:
+            self._write_part(target, fp.read(1000))
+
+        # When
+        with mock.patch.object(session, "fetch",
+                               wraps=session.fetch) as mocked_fetch:
+            downloader.fetch(package)
+
+        # Then
+        mocked_fetch.assert_called_once_with(
+            package.source_url,
+            headers={"Range": "bytes=1000-", "Cache-Control": "no-store"}
+        )
+        self.assertEqual(compute_md5(target), compute_md5(path))
+        self.assertFalse(os.path.exists(target + PART_SUFFIX))
+
+    @responses.activate
+    def test_fetch_resume_after_truncated_response(self):
+        # Given
+        package, payload, downloader, target = self._resume_common_setup()
+        ranges = self._add_range_response(package.source_url, payload,
+                                          n_truncated=1)
+
+        # When
+        with self.assertRaises(InvalidChecksum):
+            downloader.fetch(package)
+
+        # Then
+        self.assertFalse(os.path.exists(target))
+        self.assertTrue(os.path.exists(target + PART_SUFFIX))
+
+        # When
+        downloader.fetch(package)
+
+        # Then
+        self.assertEqual(
+            ranges, [None, "bytes={0}-".format(len(payload) // 2)]
+        )
+        self.assertEqual(compute_md5(target), package.md5)
+        self.assertFalse(os.path.exists(target + PART_SUFFIX))
+
+    @responses.activate
+    def test_fetch_resume_range_not_supported(self):
+        # Given
+        package, payload, downloader, target = self._resume_common_setup()
+        ranges = self._add_range_response(package.source_url, payload,
+                                          supports_range=False)
+        self._write_part(target, b"garbage")
+
+        # When
+        downloader.fetch(package)
+
+        # Then
+        self.assertEqual(ranges, ["bytes=7-"])
+        self.assertEqual(compute_md5(target), package.md5)
+
+    @responses.activate
+    def test_fetch_resume_range_not_satisfiable(self):
+        # Given
+        package, payload, downloader, target = self._resume_common_setup()
+        ranges = self._add_range_response(package.source_url, payload[:100])
+        self._write_part(target, payload[:200])
+
+        # When
+        with self.assertRaises(InvalidChecksum):
+            downloader.fetch(package)
+
+        # Then
+        self.assertEqual(ranges, ["bytes=200-", None])
+
+    @responses.activate
+    def test_fetch_complete_part(self):
+        # Given
+        package, payload, downloader, target = self._resume_common_setup()
+        ranges = self._add_range_response(package.source_url, payload)
+        self._write_part(target, payload)
+
+        # When
+        downloader.fetch(package)
+
+        # Then
+        self.assertEqual(ranges, [])
+        self.assertEqual(compute_md5(target), package.md5)
+
+    def test_fetch_records_checksum(self):
+        # Given
+        filename = "nose-1.3.0-1.egg"
+        repository = self._create_store_and_repository([filename])
+        package = repository.find_package("nose", "1.3.0-1")
+        downloader = _DownloadManager(mocked_session_factory(self.tempdir),
+                                      repository)
+        target = os.path.join(self.tempdir, filename)
+
+        # When
+        downloader.fetch(package)
+
+        # Then
+        self.assertEqual(downloader.checksums.lookup(target), package.md5)
+
+        # When
+        with mock.patch("enstaller.checksum_db.compute_md5") as \
+                mocked_compute_md5:
+            context = downloader.iter_fetch(package, force=True)
+            needs_to_download = context.needs_to_download
+
+        # Then
+        self.assertFalse(needs_to_download)
+        self.assertFalse(mocked_compute_md5.called)
+
+    def test_fetch_records_last_use(self):
+        # Given
+        filename = "nose-1.3.0-1.egg"
+        repository = self._create_store_and_repository([filename])
+        package = repository.find_package("nose", "1.3.0-1")
+        downloader = _DownloadManager(mocked_session_factory(self.tempdir),
+                                      repository)
+
+        # When
+        downloader.fetch(package)
+
+        # Then
+        eggs = list(downloader.egg_cache.iter_eggs())
+        self.assertEqual([egg.filename for egg in eggs], [filename])
+        first_use = eggs[0].last_use
+
+        # When
+        with mock.patch("enstaller.egg_cache.time.time",
+                        return_value=first_use + 10):
+            downloader.fetch(package)
+
+        # Then
+        eggs = list(downloader.egg_cache.iter_eggs())
+        self.assertEqual(eggs[0].last_use, first_use + 10)
+
+    def test_fetch_shared_egg_store(self):
+        # Given
+        filename = "nose-1.3.0-1.egg"
+        repository = self._create_store_and_repository([filename])
+        package = repository.find_package("nose", "1.3.0-1")
+        egg_store = SharedEggStore(os.path.join(self.tempdir, "store"))
+
+        downloaders = []
+        for name in ("cache1", "cache2"):
+            session = mocked_session_factory(os.path.join(self.tempdir, name))
+            downloaders.append(_DownloadManager(session, repository,
+                                                egg_store=egg_store))
+        first, second = downloaders
+
+        # When
+        first.fetch(package)
+        with mock.patch.object(second._fetcher, "fetch") as mocked_fetch:
+            second.fetch(package)
+
+        # Then
+        self.assertFalse(mocked_fetch.called)
+        first_target = os.path.join(first.cache_directory, filename)
+        second_target = os.path.join(second.cache_directory, filename)
+        self.assertEqual(compute_md5(second_target), package.md5)
+        self.assertEqual(os.stat(first_target).st_ino,
+                         os.stat(second_target).st_ino)
+        self.assertEqual(second.checksums.lookup(second_target), package.md5)
+
+    def test_fetch_shared_egg_store_scheduled(self):
+        # Given
+        filename = "nose-1.3.0-1.egg"
+        repository = self._create_store_and_repository([filename])
+        package = repository.find_package("nose", "1.3.0-1")
+        egg_store = SharedEggStore(os.path.join(self.tempdir, "store"))
+        session = mocked_session_factory(os.path.join(self.tempdir, "cache"))
+        scheduler = DownloadScheduler(max_transfers=1)
+        session.download_scheduler = scheduler
+        downloader = _DownloadManager(session, repository,
+                                      egg_store=egg_store)
+
+        active_transfers = []
+        real_lock = egg_store.lock
+
+        def _lock(md5):
+            active_transfers.append(scheduler.active_transfers)
+            return real_lock(md5)
+
+        # When
+        with mock.patch.object(egg_store, "lock", _lock):
+            downloader.fetch(package)
+
+        # Then
+        # The transfer slot is held before taking the store lock, so that
+        # the lock is not left unrefreshed while waiting for a slot.
+        self.assertEqual(active_transfers, [1])
+        self.assertEqual(scheduler.active_transfers, 0)
+        self.assertTrue(package.md5 in egg_store)
+
+    def test_fetch_shared_egg_store_force(self):
+        # Given
+        filename = "nose-1.3.0-1.egg"
+        repository = self._create_store_and_repository([filename])
+        package = repository.find_package("nose", "1.3.0-1")
+        egg_store = SharedEggStore(os.path.join(self.tempdir, "store"))
+        session = mocked_session_factory(os.path.join(self.tempdir, "cache"))
+        downloader = _DownloadManager(session, repository,
+                                      egg_store=egg_store)
+        downloader.fetch(package)
+
+        target = os.path.join(downloader.cache_directory, filename)
+        os.unlink(target)
+        with open(target, "wb") as fp:
+            fp.write(b"corrupted")
+
+        # When
+        with mock.patch.object(session, "fetch") as mocked_fetch:
+            downloader.fetch(package, force=True)
+
+        # Then
+        self.assertFalse(mocked_fetch.called)
+        self.assertEqual(compute_md5(target), package.md5)
+
+    def _mirrored_setup(self, race=False):
+        filename = "nose-1.3.0-1.egg"
+        mirrors = [OldstyleRepositoryInfo("http://a.acme.com/eggs/"),
+                   OldstyleRepositoryInfo("http://b.acme.com/eggs/")]
+        repository_info = MirroredRepositoryInfo(mirrors, race)
+
+        path = os.path.join(_EGGINST_COMMON_DATA, filename)
+        package = RemotePackageMetadata.from_egg(path, repository_info)
+        repository = Repository([package])
+
+        with open(path, "rb") as fp:
+            payload = fp.read()
+
+        session = mocked_session_factory(self.tempdir)
+        downloader = _DownloadManager(session, repository)
+        target = os.path.join(self.tempdir, filename)
+        urls = [mirror._package_url(package) for mirror in mirrors]
+        return package, payload, session, downloader, target, urls
+
+    @responses.activate
+    def test_fetch_mirror_failover(self):
+        # Given
+        package, payload, session, downloader, target, urls = \
+            self._mirrored_setup()
+        responses.add(responses.GET, urls[0], status=404)
+        responses.add(responses.GET, urls[1], body=payload)
+
+        # When
+        downloader.fetch(package)
+
+        # Then
+        self.assertEqual(compute_md5(target), package.md5)
+        # The failed mirror is avoided for the next eggs
+        self.assertEqual(package.source_url, urls[1])
+
+    @responses.activate
+    def test_fetch_mirror_all_failed(self):
+        # Given
+        package, payload, session, downloader, target, urls = \
+            self._mirrored_setup()
+        for url in urls:
+            responses.add(responses.GET, url, status=404)
+
+        # When/Then
+        with self.assertRaises(requests.exceptions.HTTPError):
+            downloader.fetch(package)
+
+    def test_fetch_mirror_failover_while_transferring(self):
+        # Given
+        package, payload, session, downloader, target, urls = \
+            self._mirrored_setup()
+        half = len(payload) // 2
+        requested = []
+
+        def fetch(url, headers=None):
+            requested.append((url, headers.get("Range")))
+            if url == urls[0]:
+                return _FakeResponse(payload, fail_after=half)
+            else:
+                content_range = "bytes {0}-{1}/{2}".format(
+                    half, len(payload) - 1, len(payload)
+                )
+                return _FakeResponse(payload[half:], 206,
+                                     {"content-range": content_range})
+
+        # When
+        with mock.patch.object(session, "fetch", fetch):
+            downloader.fetch(package)
+
+        # Then
+        self.assertEqual(requested, [
+            (urls[0], None), (urls[1], "bytes={0}-".format(half))
+        ])
+        self.assertEqual(compute_md5(target), package.md5)
+
+    def test_fetch_mirror_failover_after_truncated_response(self):
+        # Given
+        package, payload, session, downloader, target, urls = \
+            self._mirrored_setup()
+        half = len(payload) // 2
+        requested = []
+
+        def fetch(url, headers=None):
+            requested.append((url, headers.get("Range")))
+            if url == urls[0]:
+                return _FakeResponse(payload[:half])
+            else:
+                content_range = "bytes {0}-{1}/{2}".format(
+                    half, len(payload) - 1, len(payload)
+                )
+                return _FakeResponse(payload[half:], 206,
+                                     {"content-range": content_range})
+
+        # When
+        with mock.patch.object(session, "fetch", fetch):
+            downloader.fetch(package)
+
+        # Then
+        self.assertEqual(requested, [
+            (urls[0], None), (urls[1], "bytes={0}-".format(half))
+        ])
+        self.assertEqual(compute_md5(target), package.md5)
+
+    def test_fetch_mirror_race(self):
+        # Given
+        package, payload, session, downloader, target, urls = \
+            self._mirrored_setup(race=True)
+        slow_response = _FakeResponse(payload)
+        fetched = threading.Event()
+
+        def fetch(url, headers=None):
+            if url == urls[0]:
+                # Only responds once the egg was fetched from the other
+                # mirror
+                fetched.wait(5)
+                return slow_response
+            else:
+                return _FakeResponse(payload)
+
+        # When
+        with mock.patch.object(session, "fetch", fetch):
+            downloader.fetch(package)
+            fetched.set()
+
+        # Then
+        self.assertEqual(compute_md5(target), package.md5)
+        for _ in range(50):
+            if slow_response.closed:
+                break
+            time.sleep(0.1)
+        self.assertTrue(slow_response.closed)
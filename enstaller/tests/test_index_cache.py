@@ -0,0 +1,233 @@
+import operator
+import os.path
+import shutil
+import sys
+import tempfile
+
+import mock
+
+from egginst._compat import cPickle
+
+from enstaller.index_cache import IndexSnapshotCache
+from enstaller.index_delta import compute_index_delta
+from enstaller.repository import Repository, parse_index
+from enstaller.repository_info import BroodRepositoryInfo
+from enstaller.tests.common import SIMPLE_INDEX, mocked_session_factory
+
+if sys.version_info[0] == 2:
+    import unittest2 as unittest
+else:
+    import unittest
+
+
+INDEX = {
+    "MKL-10.3-1.egg": {
+        "available": True, "build": 1, "md5": "a" * 32, "mtime": 0.0,
+        "name": "mkl", "packages": [], "product": "free", "python": None,
+        "size": 1, "type": "egg", "version": "10.3",
+    },
+    "numpy-1.8.0-1.egg": {
+        "available": True, "build": 1, "md5": "b" * 32, "mtime": 0.0,
+        "name": "numpy", "packages": ["MKL 10.3-1"], "product": "commercial",
+        "python": "2.7", "size": 1, "type": "egg", "version": "1.8.0",
+    },
+}
+INDEX.update(SIMPLE_INDEX)
+
+
+class TestIndexSnapshotCache(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.repository_info = BroodRepositoryInfo("https://acme.com",
+                                                   "enthought/free")
+        self.packages = list(Repository(
+            parse_index(dict((k, dict(v)) for k, v in INDEX.items()),
+                        self.repository_info, "2.7")
+        ))
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_round_trip(self):
+        # Given
+        cache = IndexSnapshotCache(self.tempdir, "2.7")
+
+        # When
+        cache.set(self.repository_info, '"etag1"', self.packages)
+        repository = cache.get(self.repository_info, '"etag1"')
+
+        # Then
+        self.assertEqual(list(repository), self.packages)
+
+        # When
+        repository = cache.get(self.repository_info, '"etag1"', lazy=False)
+
+        # Then
+        self.assertEqual(list(repository), self.packages)
+
+    def test_different_etag(self):
+        # Given
+        cache = IndexSnapshotCache(self.tempdir, "2.7")
+        cache.set(self.repository_info, '"etag1"', self.packages)
+
+        # When/Then
+        self.assertIsNone(cache.get(self.repository_info, '"etag2"'))
+
+        # When
+        cache.set(self.repository_info, '"etag2"', self.packages[:1])
+
+        # Then
+        self.assertEqual(len(os.listdir(self.tempdir)), 1)
+        self.assertIsNone(cache.get(self.repository_info, '"etag1"'))
+        self.assertEqual(list(cache.get(self.repository_info, '"etag2"')),
+                         self.packages[:1])
+
+    def test_different_python_version(self):
+        # Given
+        cache = IndexSnapshotCache(self.tempdir, "2.7")
+        cache.set(self.repository_info, '"etag1"', self.packages)
+
+        # When
+        cache = IndexSnapshotCache(self.tempdir, "3.4")
+
+        # Then
+        self.assertIsNone(cache.get(self.repository_info, '"etag1"'))
+
+    def test_different_enstaller_version(self):
+        # Given
+        cache = IndexSnapshotCache(self.tempdir, "2.7")
+        cache.set(self.repository_info, '"etag1"', self.packages)
+
+        # When/Then
+        with mock.patch("enstaller.index_cache.__version__", "0.0.1"):
+            self.assertIsNone(cache.get(self.repository_info, '"etag1"'))
+
+    def test_no_etag(self):
+        # Given
+        cache = IndexSnapshotCache(self.tempdir, "2.7")
+
+        # When
+        cache.set(self.repository_info, None, self.packages)
+
+        # Then
+        self.assertEqual(os.listdir(self.tempdir), [])
+        self.assertIsNone(cache.get(self.repository_info, None))
+
+    def test_corrupted_snapshot(self):
+        # Given
+        cache = IndexSnapshotCache(self.tempdir, "2.7")
+        cache.set(self.repository_info, '"etag1"', self.packages)
+        path = os.path.join(self.tempdir, os.listdir(self.tempdir)[0])
+        with open(path, "wb") as fp:
+            fp.write(b"garbage")
+
+        # When/Then
+        self.assertIsNone(cache.get(self.repository_info, '"etag1"'))
+
+    def test_latest_etag(self):
+        # Given
+        cache = IndexSnapshotCache(self.tempdir, "2.7")
+
+        # When/Then
+        self.assertIsNone(cache.latest_etag(self.repository_info))
+
+        # When
+        cache.set(self.repository_info, '"etag1"', self.packages)
+
+        # Then
+        self.assertEqual(cache.latest_etag(self.repository_info), '"etag1"')
+        self.assertIsNone(
+            IndexSnapshotCache(self.tempdir, "3.4")
+            .latest_etag(self.repository_info)
+        )
+
+    def test_latest_etag_key_only(self):
+        # Given
+        cache = IndexSnapshotCache(self.tempdir, "2.7")
+        cache.set(self.repository_info, '"etag1"', self.packages)
+
+        # When
+        with mock.patch("enstaller.index_cache.cPickle.load",
+                        wraps=cPickle.load) as load:
+            etag = cache.latest_etag(self.repository_info)
+
+        # Then
+        self.assertEqual(etag, '"etag1"')
+        self.assertEqual(load.call_count, 1)
+
+        # When
+        with mock.patch("enstaller.index_cache.cPickle.load",
+                        wraps=cPickle.load) as load:
+            repository = cache.get(self.repository_info, '"etag2"')
+
+        # Then
+        self.assertIsNone(repository)
+        self.assertEqual(load.call_count, 1)
+
+        # When
+        with mock.patch("enstaller.index_cache.cPickle.load",
+                        wraps=cPickle.load) as load:
+            repository = cache.get(self.repository_info, '"etag1"')
+
+        # Then
+        self.assertEqual(list(repository), self.packages)
+        self.assertEqual(load.call_count, 2)
+
+    def test_apply_delta(self):
+        # Given
+        new_index = dict((k, dict(v)) for k, v in INDEX.items())
+        del new_index["MKL-10.3-1.egg"]
+        new_index["numpy-1.9.0-1.egg"] = dict(
+            new_index["numpy-1.8.0-1.egg"], version="1.9.0"
+        )
+        new_index["numpy-1.8.0-1.egg"]["md5"] = "c" * 32
+        delta = compute_index_delta(INDEX, new_index)
+        r_packages = list(Repository(
+            parse_index(new_index, self.repository_info, "2.7")
+        ))
+
+        cache = IndexSnapshotCache(self.tempdir, "2.7")
+        cache.set(self.repository_info, '"etag1"', self.packages)
+
+        # When
+        repository = cache.apply_delta(self.repository_info, '"etag1"',
+                                       '"etag2"', delta)
+
+        # Then
+        key = operator.attrgetter("key")
+        self.assertEqual(sorted(repository, key=key),
+                         sorted(r_packages, key=key))
+        self.assertEqual(
+            repository.find_package("numpy", "1.8.0-1").md5, "c" * 32
+        )
+        self.assertEqual(cache.latest_etag(self.repository_info), '"etag2"')
+        self.assertEqual(
+            sorted(cache.get(self.repository_info, '"etag2"'), key=key),
+            sorted(r_packages, key=key)
+        )
+
+    def test_apply_delta_unknown_base(self):
+        # Given
+        cache = IndexSnapshotCache(self.tempdir, "2.7")
+        cache.set(self.repository_info, '"etag1"', self.packages)
+
+        # When
+        repository = cache.apply_delta(self.repository_info, '"etag0"',
+                                       '"etag2"', {"removed": []})
+
+        # Then
+        self.assertIsNone(repository)
+        self.assertEqual(cache.latest_etag(self.repository_info), '"etag1"')
+
+    def test_from_session(self):
+        # Given
+        session = mocked_session_factory(self.tempdir)
+
+        # When
+        cache = IndexSnapshotCache.from_session(session)
+
+        # Then
+        self.assertEqual(
+            cache.directory,
+            os.path.join(self.tempdir, "index_cache", "snapshots")
+        )
@@ -0,0 +1,97 @@
+import operator
+import sys
+
+from enstaller.index_delta import (compute_index_delta, parse_index_delta,
+                                   validate_index_delta)
+from enstaller.repository import Repository, parse_index
+from enstaller.repository_info import BroodRepositoryInfo
+
+if sys.version_info[0] == 2:
+    import unittest2 as unittest
+else:
+    import unittest
+
+
+def _entry(name, version, python="2.7", packages=None, md5="a" * 32):
+    return {
+        "available": True, "build": 1, "md5": md5, "mtime": 0.0,
+        "name": name, "packages": packages or [], "product": "free",
+        "python": python, "size": 1, "type": "egg", "version": version,
+    }
+
+
+OLD_INDEX = {
+    "MKL-10.3-1.egg": _entry("mkl", "10.3", None),
+    "numpy-1.7.1-1.egg": _entry("numpy", "1.7.1", packages=["MKL 10.3-1"]),
+    "numpy-1.8.0-1.egg": _entry("numpy", "1.8.0", packages=["MKL 10.3-1"]),
+    "nose-1.3.0-1.egg": _entry("nose", "1.3.0"),
+}
+
+NEW_INDEX = {
+    "MKL-10.3-1.egg": _entry("mkl", "10.3", None),
+    "numpy-1.8.0-1.egg": _entry("numpy", "1.8.0", packages=["MKL 10.3-1"],
+                                md5="b" * 32),
+    "numpy-1.9.0-1.egg": _entry("numpy", "1.9.0", packages=["MKL 10.3-1"]),
+    "numpy-1.9.0-1.egg3.4": _entry("numpy", "1.9.0", python="3.4"),
+    "nose-1.3.0-1.egg": _entry("nose", "1.3.0"),
+}
+
+
+def _copy(index):
+    return dict((key, dict(value)) for key, value in index.items())
+
+
+class TestIndexDelta(unittest.TestCase):
+    def setUp(self):
+        self.repository_info = BroodRepositoryInfo("https://acme.com",
+                                                   "enthought/free")
+
+    def test_compute_index_delta(self):
+        # When
+        delta = compute_index_delta(OLD_INDEX, NEW_INDEX)
+
+        # Then
+        self.assertEqual(sorted(delta["added"]),
+                         ["numpy-1.9.0-1.egg", "numpy-1.9.0-1.egg3.4"])
+        self.assertEqual(sorted(delta["changed"]), ["numpy-1.8.0-1.egg"])
+        self.assertEqual(delta["removed"], ["numpy-1.7.1-1.egg"])
+
+    def test_validate_index_delta(self):
+        # When/Then
+        validate_index_delta(compute_index_delta(OLD_INDEX, NEW_INDEX))
+        validate_index_delta({})
+        for delta in ([], {"added": []}, {"removed": {}}):
+            with self.assertRaises(ValueError):
+                validate_index_delta(delta)
+
+    def test_parse_index_delta(self):
+        # Given
+        delta = compute_index_delta(OLD_INDEX, _copy(NEW_INDEX))
+        old_packages = list(parse_index(_copy(OLD_INDEX),
+                                        self.repository_info, "2.7"))
+        r_packages = list(parse_index(_copy(NEW_INDEX), self.repository_info,
+                                      "2.7"))
+
+        # When
+        removed_keys, packages = parse_index_delta(
+            delta, ((p.key, p.name) for p in old_packages),
+            self.repository_info, "2.7"
+        )
+
+        # Then
+        self.assertEqual(removed_keys,
+                         set(["numpy-1.7.1-1.egg", "numpy-1.8.0-1.egg"]))
+        self.assertEqual(sorted(p.key for p in packages),
+                         ["numpy-1.8.0-1.egg", "numpy-1.9.0-1.egg"])
+
+        # When
+        repository = Repository(
+            [p for p in old_packages if p.key not in removed_keys] + packages
+        )
+
+        # Then
+        key = operator.attrgetter("key")
+        self.assertEqual(sorted(repository, key=key),
+                         sorted(r_packages, key=key))
+        self.assertEqual(repository.find_latest_package("numpy").dependencies,
+                         frozenset(["mkl 10.3-1"]))
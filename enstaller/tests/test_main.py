@@ -34,7 +34,7 @@ from enstaller.eggcollect import meta_info_from_prefix
 from enstaller.plat import custom_plat
 from enstaller.repository import Repository, InstalledPackageMetadata
 from enstaller.session import Session
-from enstaller.solver import Requirement
+from enstaller.solver import Requirement, SolverMode
 from enstaller.utils import PY_VER
 from enstaller.versions import EnpkgVersion
 
@@ -842,6 +842,60 @@ class TestMain(unittest.TestCase):
         self.assertTrue(m.called)
         self.assertEqual(config.max_retries, 42)
 
+    @mock_index({})
+    def test_max_concurrent_fetches(self, install_req):
+        # Given
+        args = ["--max-concurrent-fetches", "8"]
+
+        # When
+        with mock.patch("enstaller.main.dispatch_commands_with_enpkg") as m:
+            main(args)
+        enpkg = m.call_args[0][0]
+        config = m.call_args[0][2]
+
+        # Then
+        self.assertEqual(config.max_concurrent_fetches, 8)
+        self.assertEqual(enpkg.max_concurrent_fetches, 8)
+
+    @mock_index({})
+    def test_download_limits(self, install_req):
+        # Given
+        args = ["--max-concurrent-transfers", "2",
+                "--max-download-rate", "1048576"]
+
+        # When
+        with mock.patch("enstaller.main.dispatch_commands_with_enpkg") as m:
+            main(args)
+        enpkg = m.call_args[0][1]
+        config = m.call_args[0][2]
+
+        # Then
+        self.assertEqual(config.max_concurrent_transfers, 2)
+        self.assertEqual(config.max_download_rate, 1048576)
+        scheduler = enpkg._downloader.scheduler
+        self.assertEqual(scheduler.max_transfers, 2)
+        self.assertEqual(scheduler.max_bytes_per_second, 1048576)
+
+    @mock_index({})
+    def test_stream_indices(self, install_req):
+        # When
+        with mock.patch("enstaller.main.dispatch_commands_with_enpkg"):
+            with mock.patch("enstaller.main.repository_factory",
+                            return_value=Repository()) as factory:
+                main([])
+
+        # Then
+        self.assertFalse(factory.call_args[1]["streaming"])
+
+        # When
+        with mock.patch("enstaller.main.dispatch_commands_with_enpkg"):
+            with mock.patch("enstaller.main.repository_factory",
+                            return_value=Repository()) as factory:
+                main(["--stream-indices"])
+
+        # Then
+        self.assertTrue(factory.call_args[1]["streaming"])
+
     @mock_index({})
     def test_quiet(self, install_req):
         # Given
@@ -958,3 +1012,82 @@ class TestMain(unittest.TestCase):
 
         # Then
         self.assertFalse(m.called)
+
+    @mock_index({})
+    def test_serve_cache(self, install_req):
+        # Given
+        args = ["--serve-cache", "127.0.0.1:8000"]
+
+        # When
+        with mock.patch("enstaller.main.serve_cache") as m:
+            main(args)
+
+        # Then
+        self.assertEqual(m.call_args[0][2], ("127.0.0.1", 8000))
+        self.assertFalse(install_req.called)
+
+        # Given
+        args = ["--serve-cache"]
+
+        # When
+        with mock.patch("enstaller.main.serve_cache") as m:
+            main(args)
+
+        # Then
+        self.assertEqual(m.call_args[0][2], ("127.0.0.1", 8080))
+
+    def test_serve_cache_invalid_address(self, install_req):
+        # Given
+        args = ["--serve-cache", "acme.com:http"]
+
+        # When/Then
+        with mock.patch("sys.stderr", new=StringIO()):
+            with self.assertRaises(SystemExit):
+                main(args)
+
+    @mock_index({})
+    def test_prefetch(self, install_req):
+        # Given
+        args = ["--prefetch", "numpy", "scipy-0.14.0"]
+
+        # When
+        with mock.patch("enstaller.main.prefetch_reqs") as m:
+            with mock.patch("enstaller.main.update_enstaller") as \
+                    mocked_update:
+                main(args)
+
+        # Then
+        reqs = m.call_args[0][2]
+        self.assertEqual([str(req) for req in reqs],
+                         [str(Requirement.from_legacy_requirement_string(s))
+                          for s in ("numpy", "scipy 0.14.0")])
+        self.assertEqual(m.call_args[0][3], SolverMode.RECUR)
+        self.assertFalse(install_req.called)
+        self.assertFalse(mocked_update.called)
+
+    @mock_index({})
+    def test_prefetch_requirements(self, install_req):
+        # Given
+        with tempfile.NamedTemporaryFile(mode="w", delete=False) as fp:
+            fp.write("numpy 1.8.0-1\n")
+        args = ["--prefetch", "--requirements", fp.name]
+
+        # When
+        try:
+            with mock.patch("enstaller.main.prefetch_from_requirements") \
+                    as m:
+                main(args)
+        finally:
+            os.unlink(fp.name)
+
+        # Then
+        self.assertEqual(m.call_args[0][2], fp.name)
+        self.assertFalse(install_req.called)
+
+    def test_prefetch_invalid_options(self, install_req):
+        # When/Then
+        for args in (["--prefetch", "--remove", "numpy"],
+                     ["--prefetch", "--update-all"]):
+            with mock.patch("sys.stderr", new=StringIO()):
+                with self.assertRaises(SystemExit):
+                    main(args)
@@ -0,0 +1,105 @@
+import sys
+
+from enstaller.mirror_stats import (_FAILURE_BACKOFF, _MIN_TRANSFER_SIZE,
+                                    MirrorStats)
+
+if sys.version_info[0] == 2:
+    import unittest2 as unittest
+else:
+    import unittest
+
+
+class _Clock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestMirrorStats(unittest.TestCase):
+    def setUp(self):
+        self.clock = _Clock()
+        self.stats = MirrorStats(self.clock)
+
+    def test_unmeasured_first(self):
+        # Given
+        self.stats.record_latency("a", 0.01)
+
+        # When
+        ranked = self.stats.rank(["a", "b", "c"])
+
+        # Then
+        self.assertEqual(ranked, ["b", "c", "a"])
+        self.assertIsNone(self.stats.expected_time("b"))
+
+    def test_rank_by_latency(self):
+        # Given
+        self.stats.record_latency("a", 0.5)
+        self.stats.record_latency("b", 0.1)
+
+        # When/Then
+        self.assertEqual(self.stats.rank(["a", "b"]), ["b", "a"])
+
+    def test_rank_by_size(self):
+        # Given
+        # a: low latency, 1 MB/s; b: high latency, 10 MB/s
+        size = 1024 ** 2
+        self.stats.record_latency("a", 0.05)
+        self.stats.record_transfer("a", size, 1.0)
+        self.stats.record_latency("b", 0.5)
+        self.stats.record_transfer("b", size, 0.1)
+
+        # When/Then
+        self.assertEqual(self.stats.rank(["a", "b"], 1024), ["a", "b"])
+        self.assertEqual(self.stats.rank(["a", "b"], 10 * size), ["b", "a"])
+        self.assertAlmostEqual(self.stats.expected_time("b", size), 0.6)
+
+    def test_small_transfers_ignored(self):
+        # Given
+        self.stats.record_latency("a", 0.1)
+
+        # When
+        self.stats.record_transfer("a", _MIN_TRANSFER_SIZE - 1, 1e-9)
+
+        # Then
+        self.assertAlmostEqual(self.stats.expected_time("a", 10 ** 9), 0.1)
+
+    def test_moving_average(self):
+        # Given
+        self.stats.record_latency("a", 1.0)
+
+        # When
+        self.stats.record_latency("a", 2.0)
+
+        # Then
+        expected = self.stats.expected_time("a")
+        self.assertTrue(1.0 < expected < 2.0)
+
+    def test_failure_backoff(self):
+        # Given
+        self.stats.record_latency("a", 0.1)
+        self.stats.record_latency("b", 0.5)
+
+        # When
+        self.stats.record_failure("a")
+
+        # Then
+        self.assertEqual(self.stats.rank(["a", "b"]), ["b", "a"])
+
+        # When
+        self.clock.now += _FAILURE_BACKOFF + 1
+
+        # Then
+        self.assertEqual(self.stats.rank(["a", "b"]), ["a", "b"])
+
+    def test_success_clears_failure(self):
+        # Given
+        self.stats.record_latency("b", 0.5)
+        self.stats.record_failure("a")
+
+        # When
+        self.stats.record_latency("a", 0.1)
+
+        # Then
+        self.assertEqual(self.stats.rank(["a", "b"]), ["a", "b"])
@@ -0,0 +1,55 @@
+import re
+import sys
+
+from enstaller.name_index import NameIndex, scan_names
+
+if sys.version_info[0] == 2:
+    import unittest2 as unittest
+else:
+    import unittest
+
+
+NAMES = ["numpy", "numexpr", "scipy", "PyQt", "pyside", "py", "MKL",
+         "libxml2", "lxml", "nose", "pytables", "Cython"]
+
+
+class TestNameIndex(unittest.TestCase):
+    def setUp(self):
+        self.index = NameIndex(NAMES)
+
+    def _assert_same_as_scan(self, pattern):
+        self.assertEqual(self.index.search(pattern),
+                         scan_names(NAMES, pattern))
+
+    def test_literal(self):
+        # When/Then
+        self.assertEqual(self.index.search("num"), ["numexpr", "numpy"])
+        self.assertEqual(self.index.search("xml"), ["libxml2", "lxml"])
+        self.assertEqual(self.index.search("mkl"), ["MKL"])
+        self.assertEqual(self.index.search("zzz"), [])
+        for pattern in ("py", "y", "", "cy", "thon", "pyqt"):
+            self._assert_same_as_scan(pattern)
+
+    def test_prefix(self):
+        # When/Then
+        self.assertEqual(self.index.search("^py"),
+                         ["py", "PyQt", "pyside", "pytables"])
+        self.assertEqual(self.index.search("^lx"), ["lxml"])
+        self.assertEqual(self.index.search("^zz"), [])
+        for pattern in ("^", "^c", "^PY", "^numpy"):
+            self._assert_same_as_scan(pattern)
+
+    def test_case_sensitive_pattern(self):
+        # Given
+        pattern = re.compile("Py")
+
+        # When/Then
+        self.assertEqual(self.index.search(pattern), ["PyQt"])
+        self.assertEqual(self.index.search(re.compile("^py")),
+                         ["py", "pyside", "pytables"])
+
+    def test_regex(self):
+        # When/Then
+        for pattern in ("py$", "^(py|num)", "n.m", "l?xml", r"\d"):
+            self._assert_same_as_scan(pattern)
+        self.assertEqual(self.index.search("py$"), ["numpy", "py", "scipy"])
@@ -9,9 +9,10 @@ from egginst.tests.common import _EGGINST_COMMON_DATA
 from enstaller.compat import path_to_uri
 from enstaller.package import (InstalledPackageMetadata, PackageMetadata,
                                RemotePackageMetadata,
-                               RepositoryPackageMetadata,
+                               RepositoryPackageMetadata, _InternTables,
                                egg_name_to_name_version)
 from enstaller.repository_info import BroodRepositoryInfo, FSRepositoryInfo
+from enstaller.solver import Requirement
 from enstaller.utils import PY_VER
 from enstaller.versions import EnpkgVersion
 
@@ -306,6 +307,100 @@ class TestRemotePackageMetadata(unittest.TestCase):
         # Then
         self.assertEqual(metadata, r_metadata)
 
+    def test_compact_representation(self):
+        # Given
+        json_dict = {
+            "available": True, "build": 1, "md5": "a" * 32, "mtime": 0.0,
+            "name": "nose", "packages": ["MKL 10.3-1"], "product": "free",
+            "python": "2.7", "size": 1, "type": "egg", "version": "1.3.0",
+        }
+        repository_info = BroodRepositoryInfo("https://acme.com",
+                                              "enthought/free")
+
+        # When
+        with _InternTables():
+            package1 = RemotePackageMetadata.from_json_dict(
+                "nose-1.3.0-1.egg", dict(json_dict), self.repository_info
+            )
+            package2 = RemotePackageMetadata.from_json_dict(
+                "nose-1.3.0-1.egg", dict(json_dict), repository_info
+            )
+        package3 = RemotePackageMetadata.from_json_dict(
+            "nose-1.3.0-1.egg", dict(json_dict), repository_info
+        )
+
+        # Then
+        self.assertFalse(hasattr(package1, "__dict__"))
+        self.assertEqual(package1, package2)
+        self.assertIs(package1.name, package2.name)
+        self.assertIs(package1.key, package2.key)
+        self.assertIs(package1.python_tag, package2.python_tag)
+        self.assertIs(package1.dependencies, package2.dependencies)
+        self.assertIs(package1._python_implementation,
+                      package2._python_implementation)
+        self.assertIs(package1.repository_info, package2.repository_info)
+
+        # Nothing is shared outside of a scope
+        self.assertEqual(package3, package1)
+        self.assertIsNot(package3.dependencies, package1.dependencies)
+        self.assertIsNot(package3._python_implementation,
+                         package1._python_implementation)
+
+    def test_cached_hash_and_comparison_key(self):
+        # Given
+        json_dict = {
+            "available": True, "build": 1, "md5": "a" * 32, "mtime": 0.0,
+            "name": "nose", "packages": [], "product": "free",
+            "python": "2.7", "size": 1, "type": "egg", "version": "1.3.0",
+        }
+        package1 = RemotePackageMetadata.from_json_dict(
+            "nose-1.3.0-1.egg", dict(json_dict), self.repository_info
+        )
+        package2 = RemotePackageMetadata.from_json_dict(
+            "nose-1.3.0-1.egg", dict(json_dict), self.repository_info
+        )
+        json_dict["md5"] = "b" * 32
+        package3 = RemotePackageMetadata.from_json_dict(
+            "nose-1.3.0-1.egg", dict(json_dict), self.repository_info
+        )
+
+        # When
+        comp_key = package1._comp_key
+
+        # Then
+        self.assertIs(package1._comp_key, comp_key)
+        self.assertEqual(comp_key, package1._make_comp_key())
+        self.assertEqual(hash(package1), hash(comp_key))
+        self.assertEqual(hash(package1), hash(package2))
+        self.assertEqual(package1, package2)
+        self.assertNotEqual(package1, package3)
+        self.assertEqual(len(set([package1, package2, package3])), 2)
+
+    def test_dependency_requirements(self):
+        # Given
+        json_dict = {
+            "available": True, "build": 1, "md5": "a" * 32, "mtime": 0.0,
+            "name": "scipy", "packages": ["MKL 10.3-1", "numpy 1.8.0"],
+            "product": "free", "python": "2.7", "size": 1, "type": "egg",
+            "version": "0.14.0",
+        }
+        package = RemotePackageMetadata.from_json_dict(
+            "scipy-0.14.0-1.egg", json_dict, self.repository_info
+        )
+
+        # When
+        requirements = package.dependency_requirements
+
+        # Then
+        self.assertEqual(
+            requirements,
+            frozenset([
+                Requirement.from_legacy_requirement_string("MKL 10.3-1"),
+                Requirement.from_legacy_requirement_string("numpy 1.8.0"),
+            ])
+        )
+        self.assertIs(package.dependency_requirements, requirements)
+
 
 class TestInstalledPackage(unittest.TestCase):
     def test_eq(self):
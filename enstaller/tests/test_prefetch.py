@@ -0,0 +1,161 @@
+import os.path
+import shutil
+import sys
+import tempfile
+
+from egginst.tests.common import _EGGINST_COMMON_DATA
+
+from enstaller.errors import InvalidChecksum, NoPackageFound
+from enstaller.fetch import _DownloadManager
+from enstaller.prefetch import PrefetchStats, prefetch, resolve_requirements
+from enstaller.repository import Repository, RemotePackageMetadata
+from enstaller.repository_info import FSRepositoryInfo
+from enstaller.solver import Requirement, SolverMode
+from enstaller.utils import compute_md5, path_to_uri
+
+from enstaller.tests.common import (dummy_repository_package_factory,
+                                    mocked_session_factory,
+                                    repository_factory)
+
+if sys.version_info[0] == 2:
+    import unittest2 as unittest
+else:
+    import unittest
+
+
+EGGS = ["MKL-10.3-1.egg", "dummy-1.0.1-1.egg", "nose-1.3.0-1.egg"]
+
+
+class TestResolveRequirements(unittest.TestCase):
+    def setUp(self):
+        self.repository = repository_factory([
+            dummy_repository_package_factory("mkl", "10.3", 1),
+            dummy_repository_package_factory(
+                "numpy", "1.8.0", 1, dependencies=["MKL 10.3-1"]
+            ),
+            dummy_repository_package_factory(
+                "scipy", "0.14.0", 1,
+                dependencies=["MKL 10.3-1", "numpy 1.8.0-1"]
+            ),
+            dummy_repository_package_factory("nose", "1.3.0", 1),
+        ])
+
+    def test_together(self):
+        # When
+        packages = resolve_requirements(self.repository, ["scipy", "numpy",
+                                                          "nose"])
+
+        # Then
+        # Shared dependencies are only listed once, in install order
+        self.assertEqual([package.key for package in packages],
+                         ["mkl-10.3-1.egg", "numpy-1.8.0-1.egg",
+                          "scipy-0.14.0-1.egg", "nose-1.3.0-1.egg"])
+
+    def test_root_mode(self):
+        # When
+        packages = resolve_requirements(
+            self.repository,
+            [Requirement.from_legacy_requirement_string("scipy 0.14.0-1")],
+            SolverMode.ROOT
+        )
+
+        # Then
+        self.assertEqual([package.key for package in packages],
+                         ["scipy-0.14.0-1.egg"])
+
+    def test_missing(self):
+        # When/Then
+        with self.assertRaises(NoPackageFound):
+            resolve_requirements(self.repository, ["pandas"])
+
+
+class TestPrefetch(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+
+        upstream = os.path.join(self.tempdir, "upstream")
+        os.makedirs(upstream)
+        repository_info = FSRepositoryInfo(path_to_uri(upstream))
+
+        self.packages = []
+        for egg in EGGS:
+            path = os.path.join(upstream, egg)
+            shutil.copy(os.path.join(_EGGINST_COMMON_DATA, egg), path)
+            self.packages.append(
+                RemotePackageMetadata.from_egg(path, repository_info)
+            )
+
+        self.cache = os.path.join(self.tempdir, "cache")
+        self.downloader = _DownloadManager(
+            mocked_session_factory(self.cache), Repository(self.packages)
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_simple(self):
+        # Given
+        fetched = []
+
+        # When
+        stats = prefetch(self.downloader, self.packages,
+                         on_fetched=lambda package, size:
+                         fetched.append((package, size)))
+
+        # Then
+        self.assertEqual(stats.packages, 3)
+        self.assertEqual(stats.fetched, 3)
+        self.assertEqual(stats.cached, 0)
+        self.assertEqual(stats.size,
+                         sum(package.size for package in self.packages))
+        self.assertEqual(sorted(fetched, key=lambda item: item[0].key),
+                         [(package, package.size)
+                          for package in self.packages])
+        for package in self.packages:
+            path = os.path.join(self.cache, package.key)
+            self.assertEqual(compute_md5(path), package.md5)
+
+        # When
+        stats = prefetch(self.downloader, self.packages)
+
+        # Then
+        self.assertEqual(stats.fetched, 0)
+        self.assertEqual(stats.cached, 3)
+        self.assertEqual(stats.size, 0)
+
+    def test_invalid_cached_egg(self):
+        # Given
+        prefetch(self.downloader, self.packages)
+        package = self.packages[-1]
+        path = os.path.join(self.cache, package.key)
+        with open(path, "wb") as fp:
+            fp.write(b"a" * package.size)
+
+        # When
+        stats = prefetch(self.downloader, self.packages)
+
+        # Then
+        self.assertEqual(stats.fetched, 1)
+        self.assertEqual(compute_md5(path), package.md5)
+
+    def test_invalid_checksum(self):
+        # Given
+        package = self.packages[-1]
+        package._md5 = "a" * 32
+
+        # When/Then
+        with self.assertRaises(InvalidChecksum):
+            prefetch(self.downloader, self.packages, max_retries=1)
+        self.assertFalse(os.path.exists(os.path.join(self.cache,
+                                                     package.key)))
+
+
+class TestPrefetchStats(unittest.TestCase):
+    def test_throughput(self):
+        # Given
+        stats = PrefetchStats(packages=4, fetched=3, size=1024, elapsed=2.0)
+
+        # When/Then
+        self.assertEqual(stats.cached, 1)
+        self.assertEqual(stats.throughput, 512.0)
+        self.assertEqual(PrefetchStats().throughput, 0.0)
@@ -1,6 +1,7 @@
 import itertools
 import operator
 import os.path
+import re
 import sys
 
 import mock
@@ -19,12 +20,15 @@ from enstaller.session import Session
 from enstaller.utils import RUNNING_PYTHON
 from enstaller.versions import EnpkgVersion
 
-from enstaller.package import PackageMetadata, RemotePackageMetadata
-from enstaller.repository import _RequirementNormalizer, Repository
+from enstaller.package import (PackageMetadata, RemotePackageMetadata,
+                               _InternTables)
+from enstaller.repository import (_RequirementNormalizer, Repository,
+                                  parse_index, parse_index_items)
 from enstaller.repository_info import BroodRepositoryInfo, FSRepositoryInfo
 from enstaller.solver import Requirement
 from enstaller.tests.common import (SIMPLE_INDEX, WarningTestMixin,
                                     dummy_installed_package_factory,
+                                    dummy_repository_package_factory,
                                     mock_brood_repository_indices)
 
 if sys.version_info[0] == 2:
@@ -305,33 +309,17 @@ class TestRepository(unittest.TestCase):
             }
         }
 
-        def info_from_metadir(meta_dir):
-            if meta_dir == os.path.join("dummy_prefix", "EGG-INFO", "libyaml"):
-                return r_installed_metadata["libYAML-0.1.4-1.egg"]
-            elif meta_dir == os.path.join("dummy_prefix", "EGG-INFO", "pyyaml"):
-                return r_installed_metadata["PyYAML-3.11-1.egg"]
-            else:
-                return None
-
-        def _valid_meta_dir_iterator(prefixes):
-            for prefix in prefixes:
-                egg_info_root = os.path.join(prefix, "EGG-INFO")
-                for info in six.itervalues(r_installed_metadata):
-                    yield (
-                        prefix, egg_info_root,
-                        os.path.join(egg_info_root, info["name"])
-                    )
+        def iter_installed_infos(prefix):
+            egg_info_root = os.path.join(prefix, "EGG-INFO")
+            for info in six.itervalues(r_installed_metadata):
+                yield os.path.join(egg_info_root, info["name"]), info
 
         # When
         with mock.patch(
-            "enstaller.repository._valid_meta_dir_iterator",
-            _valid_meta_dir_iterator
+            "enstaller.repository.iter_installed_infos",
+            iter_installed_infos
         ):
-            with mock.patch(
-                "enstaller.repository.info_from_metadir",
-                info_from_metadir
-            ):
-                repository = Repository._from_prefixes(["dummy_prefix"])
+            repository = Repository._from_prefixes(["dummy_prefix"])
 
         # Then
         packages = repository.find_packages("pyyaml")
@@ -453,6 +441,54 @@ class TestRepository(unittest.TestCase):
                          [EnpkgVersion.from_string("1.2.1-1"),
                           EnpkgVersion.from_string("1.3.0-1")])
 
+    def test_sorted_insertion_same_version(self):
+        # Given
+        repository_info1 = FSRepositoryInfo("file:///foo")
+        repository_info2 = FSRepositoryInfo("file:///bar")
+        entries = [
+            dummy_repository_package_factory(
+                "nose", "1.3.0", 1, repository_info=repository_info1),
+            dummy_repository_package_factory("nose", "1.2.1", 1),
+            dummy_repository_package_factory(
+                "nose", "1.3.0", 1, repository_info=repository_info2),
+        ]
+        repository = Repository()
+
+        # When
+        for entry in entries:
+            repository.add_package(entry)
+
+        # Then
+        self.assertEqual(repository.find_packages("nose"),
+                         [entries[1], entries[0], entries[2]])
+
+    def test_extend(self):
+        # Given
+        entries = [
+            dummy_repository_package_factory("numpy", "1.8.0", 2),
+            dummy_repository_package_factory("nose", "1.3.0", 1),
+            dummy_repository_package_factory("numpy", "1.6.1", 1),
+            dummy_repository_package_factory("numpy", "1.7.1", 1),
+            dummy_repository_package_factory("nose", "1.2.1", 1),
+        ]
+        r_repository = Repository()
+        for entry in entries:
+            r_repository.add_package(entry)
+
+        repository = Repository()
+        repository.add_package(entries[0])
+
+        # When
+        repository.extend(entries[1:])
+
+        # Then
+        self.assertEqual(len(repository), len(entries))
+        for name in ("nose", "numpy"):
+            self.assertEqual(repository.find_packages(name),
+                             r_repository.find_packages(name))
+        self.assertEqual(list(repository.iter_packages()),
+                         list(r_repository.iter_packages()))
+
     def test_update(self):
         # Given
         def repository_factory_from_egg(filenames):
@@ -497,6 +533,108 @@ class TestRepository(unittest.TestCase):
             itertools.chain(iter(repository1), iter(repository2))
         )
 
+    def _repositories_with_shared_names(self):
+        repository_info1 = FSRepositoryInfo("file:///foo")
+        repository_info2 = FSRepositoryInfo("file:///bar")
+        repository1 = Repository([
+            dummy_repository_package_factory(
+                "numpy", version, 1, repository_info=repository_info1)
+            for version in ("1.8.0", "1.6.1", "1.7.1")
+        ] + [
+            dummy_repository_package_factory(
+                "mkl", "10.3", 1, repository_info=repository_info1)
+        ])
+        repository2 = Repository([
+            dummy_repository_package_factory(
+                "scipy", "0.14.0", 1, repository_info=repository_info2)
+        ] + [
+            dummy_repository_package_factory(
+                "numpy", version, 1, repository_info=repository_info2)
+            for version in ("1.7.1", "1.9.0", "1.5.0")
+        ])
+        return repository1, repository2
+
+    def test_merge(self):
+        # Given
+        repository1, repository2 = self._repositories_with_shared_names()
+
+        # When
+        repository = Repository.merge([repository1, repository2])
+
+        # Then
+        self.assertEqual(len(repository), 8)
+        self.assertEqual(
+            [(p.name, p.full_version, p.repository_info.name)
+             for p in repository.iter_packages()],
+            [("numpy", "1.5.0-1", "file:///bar"),
+             ("numpy", "1.6.1-1", "file:///foo"),
+             ("numpy", "1.7.1-1", "file:///foo"),
+             ("numpy", "1.7.1-1", "file:///bar"),
+             ("numpy", "1.8.0-1", "file:///foo"),
+             ("numpy", "1.9.0-1", "file:///bar"),
+             ("mkl", "10.3-1", "file:///foo"),
+             ("scipy", "0.14.0-1", "file:///bar")]
+        )
+
+        # Merging does not modify the merged repositories
+        self.assertEqual(len(repository1), 4)
+        self.assertEqual(len(repository2), 4)
+
+    def test_merge_same_as_update(self):
+        # Given
+        repository1, repository2 = self._repositories_with_shared_names()
+        r_repository = Repository()
+        r_repository.update(repository2)
+        r_repository.update(repository1)
+
+        # When
+        repository = Repository.merge([repository2, repository1])
+
+        # Then
+        self.assertEqual(list(repository.iter_packages()),
+                         list(r_repository.iter_packages()))
+        for name in ("numpy", "mkl", "scipy"):
+            self.assertEqual(
+                [p.repository_info for p in repository.find_packages(name)],
+                [p.repository_info for p in r_repository.find_packages(name)]
+            )
+
+    def test_search_names(self):
+        # Given
+        repository = Repository([
+            dummy_repository_package_factory(name, "1.0.0", 1)
+            for name in ("numpy", "numexpr", "scipy", "PyQt")
+        ])
+        repository.delete_package(repository.find_package("scipy",
+                                                          "1.0.0-1"))
+
+        # When/Then
+        self.assertEqual(list(repository.iter_names()),
+                         ["numpy", "numexpr", "pyqt"])
+        for pattern in ("num", "^py", "py$", "sci"):
+            self.assertEqual(
+                repository.search_names(pattern),
+                sorted(name for name in repository.iter_names()
+                       if re.search(pattern, name, re.I))
+            )
+
+        # When
+        repository.build_name_index()
+
+        # Then
+        self.assertEqual(repository.search_names("num"),
+                         ["numexpr", "numpy"])
+        self.assertEqual(repository.search_names("sci"), [])
+
+        # When
+        repository.add_package(
+            dummy_repository_package_factory("numba", "0.14.0", 1)
+        )
+
+        # Then
+        self.assertEqual(repository.search_names("num"),
+                         ["numba", "numexpr", "numpy"])
+
 
 class TestRepositoryMisc(WarningTestMixin, unittest.TestCase):
     def test_find_packages_invalid_versions(self):
@@ -567,6 +705,88 @@ class TestRepositoryMisc(WarningTestMixin, unittest.TestCase):
         self.assertEqual(deprecated_packages, packages)
 
 
+class TestRepositoryLookups(unittest.TestCase):
+    def setUp(self):
+        repository_info1 = FSRepositoryInfo("file:///foo")
+        repository_info2 = FSRepositoryInfo("file:///bar")
+
+        # Every version is available in both repositories, and some
+        # versions compare equal to each other (1.0 vs 1.0.0)
+        self.packages = []
+        for upstream in ("0.9", "1.0", "1.0.0", "1.1", "1.10", "2.0"):
+            for build in (1, 2):
+                for repository_info in (repository_info1, repository_info2):
+                    self.packages.append(dummy_repository_package_factory(
+                        "numpy", upstream, build,
+                        repository_info=repository_info
+                    ))
+        self.repository = Repository(self.packages[::-1])
+
+    def _linear_find_packages(self, version):
+        return [package for package in self.packages
+                if package.full_version == version]
+
+    def test_find_packages_with_version(self):
+        # Given
+        versions = [package.full_version for package in self.packages]
+        versions.extend(["1.0-3", "3.0-1", "0.1-1", "1.2"])
+
+        for version in versions:
+            # When
+            packages = self.repository.find_packages("numpy", version)
+
+            # Then
+            assertCountEqual(self, packages,
+                             self._linear_find_packages(version))
+
+        # When/Then
+        self.assertEqual(self.repository.find_packages("numpy", "a-b"), [])
+
+    def test_find_package(self):
+        # Given
+        version = EnpkgVersion.from_string("1.0.0-2")
+
+        # When
+        package = self.repository.find_package("numpy", "1.0.0-2")
+
+        # Then
+        self.assertEqual(package.version, version)
+
+        # When/Then
+        with self.assertRaises(NoSuchPackage):
+            self.repository.find_package("numpy", "1.0.0-3")
+
+    def test_has_package(self):
+        # Given
+        missing = dummy_repository_package_factory("numpy", "1.0.1", 1)
+
+        # When/Then
+        for package in self.packages:
+            self.assertTrue(self.repository.has_package(package))
+        self.assertFalse(self.repository.has_package(missing))
+
+    def test_find_package_from_requirement(self):
+        for requirement_string in ("numpy", "numpy 1.1", "numpy 1.0",
+                                   "numpy 1.0-1", "numpy 1.0.0-2"):
+            # Given
+            requirement = Requirement.from_legacy_requirement_string(
+                requirement_string
+            )
+            candidates = [
+                package for package in self.repository.find_packages("numpy")
+                if requirement.matches(package.version)
+            ]
+            candidates.sort(key=operator.attrgetter("version"))
+
+            # When
+            package = self.repository.find_package_from_requirement(
+                requirement
+            )
+
+            # Then
+            self.assertIs(package, candidates[-1])
+
+
 class Test_RequirementNormalizer(unittest.TestCase):
     def test_simple(self):
         # Given
@@ -624,3 +844,243 @@ class Test_RequirementNormalizer(unittest.TestCase):
 
         # Then
         self.assertEqual(normalized_dummy, r_normalized_dummy)
+
+
+def _index_entry(name, version, build, packages=None, python="2.7"):
+    return {
+        "available": True, "build": build, "md5": "a" * 32, "mtime": 0.0,
+        "name": name, "packages": packages or [], "product": "free",
+        "python": python, "size": 1, "type": "egg", "version": version,
+    }
+
+
+_LAZY_INDEX = {
+    "MKL-10.3-1.egg": _index_entry("mkl", "10.3", 1, python=None),
+    "MKL-10.2-1.egg": _index_entry("mkl", "10.2", 1, python=None),
+    "numpy-1.8.0-1.egg": _index_entry("numpy", "1.8.0", 1, ["MKL 10.3-1"]),
+    "numpy-1.7.1-2.egg": _index_entry("numpy", "1.7.1", 2, ["MKL 10.2-1"]),
+    "numpy-1.9.0-1.egg": _index_entry("numpy", "1.9.0", 1, ["MKL 10.3-1"],
+                                      python="3.4"),
+    "scipy-0.14.0-1.egg": _index_entry("scipy", "0.14.0", 1,
+                                       ["numpy 1.8.0-1", "MKL 10.3-1"]),
+    "nose-1.3.0-1.egg": _index_entry("nose", "1.3.0", 1),
+}
+
+
+class TestLazyRepository(unittest.TestCase):
+    def setUp(self):
+        self.repository_info1 = FSRepositoryInfo("file:///foo")
+        self.repository_info2 = FSRepositoryInfo("file:///bar")
+
+    def _from_index(self, repository_info, lazy):
+        index = dict((k, dict(v)) for k, v in _LAZY_INDEX.items())
+        return Repository.from_index(index, repository_info, "2.7",
+                                     lazy=lazy)
+
+    def _assert_same_repository(self, left, right):
+        self.assertEqual(len(left), len(right))
+        self.assertEqual(list(left.iter_packages()),
+                         list(right.iter_packages()))
+
+    def test_simple(self):
+        # Given
+        eager = self._from_index(self.repository_info1, False)
+
+        # When
+        lazy = self._from_index(self.repository_info1, True)
+
+        # Then
+        self.assertEqual(len(lazy), len(eager))
+        self.assertEqual(len(lazy), 6)
+        self.assertTrue(len(lazy._name_to_pending) > 0)
+        for name in ("mkl", "numpy", "scipy", "nose", "dummy"):
+            self.assertEqual(lazy.find_packages(name),
+                             eager.find_packages(name))
+        self.assertEqual(lazy.find_package("numpy", "1.8.0-1"),
+                         eager.find_package("numpy", "1.8.0-1"))
+        self.assertEqual(list(lazy.iter_most_recent_packages()),
+                         list(eager.iter_most_recent_packages()))
+        self._assert_same_repository(lazy, eager)
+        self.assertEqual(lazy._name_to_pending, {})
+
+    def test_only_materialize_looked_up_names(self):
+        # Given
+        lazy = self._from_index(self.repository_info1, True)
+
+        # When
+        packages = lazy.find_packages("numpy")
+
+        # Then
+        self.assertEqual([p.full_version for p in packages],
+                         ["1.7.1-2", "1.8.0-1"])
+        self.assertEqual(packages[-1].dependencies,
+                         frozenset(["mkl 10.3-1"]))
+        self.assertEqual(set(lazy._name_to_pending),
+                         set(["mkl", "scipy", "nose"]))
+
+    def test_update(self):
+        # Given
+        eager = self._from_index(self.repository_info1, False)
+        eager.update(self._from_index(self.repository_info2, False))
+        eager.add_package(dummy_repository_package_factory("mkl", "10.3", 1))
+
+        # When
+        lazy = self._from_index(self.repository_info1, True)
+        lazy.find_packages("mkl")
+        lazy.update(self._from_index(self.repository_info2, True))
+        lazy.add_package(dummy_repository_package_factory("mkl", "10.3", 1))
+
+        # Then
+        self.assertTrue(len(lazy._name_to_pending) > 0)
+        self._assert_same_repository(lazy, eager)
+
+    def test_merge(self):
+        # Given
+        eager = Repository.merge([
+            self._from_index(self.repository_info1, False),
+            self._from_index(self.repository_info2, False),
+        ])
+
+        # When
+        lazy1 = self._from_index(self.repository_info1, True)
+        lazy1.find_packages("numpy")
+        lazy = Repository.merge([
+            lazy1, self._from_index(self.repository_info2, True)
+        ])
+
+        # Then
+        self.assertEqual(set(lazy._name_to_pending),
+                         set(["mkl", "scipy", "nose", "numpy"]))
+        self._assert_same_repository(lazy, eager)
+
+    def test_merge_partly_materialized(self):
+        # Given
+        eager = Repository.merge([
+            self._from_index(self.repository_info1, False),
+            self._from_index(self.repository_info2, False),
+        ])
+
+        # When
+        lazy2 = self._from_index(self.repository_info2, True)
+        lazy2.find_packages("numpy")
+        lazy = Repository.merge([
+            self._from_index(self.repository_info1, True), lazy2
+        ])
+
+        # Then
+        self.assertNotIn("numpy", lazy._name_to_pending)
+        self.assertIn("scipy", lazy._name_to_pending)
+        self._assert_same_repository(lazy, eager)
+        for name in ("numpy", "scipy"):
+            self.assertEqual(
+                [(p.full_version, p.repository_info)
+                 for p in lazy.find_packages(name)],
+                [(p.full_version, p.repository_info)
+                 for p in eager.find_packages(name)]
+            )
+
+    def test_search_names(self):
+        # Given
+        lazy = self._from_index(self.repository_info1, True)
+
+        # When
+        names = lazy.search_names("^nu")
+
+        # Then
+        self.assertEqual(names, ["numpy"])
+        self.assertEqual(set(lazy._name_to_pending),
+                         set(["mkl", "numpy", "scipy", "nose"]))
+
+    def test_delete(self):
+        # Given
+        eager = self._from_index(self.repository_info1, False)
+        lazy = self._from_index(self.repository_info1, True)
+        package = eager.find_package("numpy", "1.8.0-1")
+
+        # When
+        eager.delete_package(package)
+        lazy.delete_package(package)
+
+        # Then
+        self._assert_same_repository(lazy, eager)
+
+
+class TestParseIndexItems(unittest.TestCase):
+    def setUp(self):
+        self.repository_info = FSRepositoryInfo("file:///foo")
+
+    def _items(self, keys):
+        return ((key, dict(_LAZY_INDEX[key])) for key in keys)
+
+    def _parse_index(self):
+        index = dict((k, dict(v)) for k, v in _LAZY_INDEX.items())
+        return parse_index(index, self.repository_info, "2.7")
+
+    def test_same_as_parse_index(self):
+        # Given
+        expected = self._parse_index()
+
+        # When
+        packages = parse_index_items(self._items(sorted(_LAZY_INDEX)),
+                                     self.repository_info, "2.7")
+
+        # Then
+        key = operator.attrgetter("key")
+        self.assertEqual(sorted(packages, key=key), sorted(expected, key=key))
+
+    def test_intern_scope(self):
+        # When
+        packages1 = list(parse_index_items(self._items(sorted(_LAZY_INDEX)),
+                                           self.repository_info, "2.7"))
+        packages2 = list(parse_index_items(self._items(sorted(_LAZY_INDEX)),
+                                           self.repository_info, "2.7"))
+
+        # Then
+        # Values are shared within a parse, but not kept around afterwards
+        pythons1 = set(id(p._python_implementation) for p in packages1
+                       if p.python is not None)
+        pythons2 = set(id(p._python_implementation) for p in packages2
+                       if p.python is not None)
+        self.assertEqual(len(pythons1), 1)
+        self.assertEqual(len(pythons2), 1)
+        self.assertNotEqual(pythons1, pythons2)
+
+        # When
+        with _InternTables():
+            packages1 = list(parse_index_items(
+                self._items(sorted(_LAZY_INDEX)), self.repository_info, "2.7"
+            ))
+            packages2 = list(parse_index_items(
+                self._items(sorted(_LAZY_INDEX)), self.repository_info, "2.7"
+            ))
+
+        # Then
+        pythons = set(id(p._python_implementation)
+                      for p in packages1 + packages2 if p.python is not None)
+        self.assertEqual(len(pythons), 1)
+
+    def test_forward_references(self):
+        # Given
+        # Packages depending on MKL come before any MKL entry
+        keys = sorted(_LAZY_INDEX, key=lambda key: key.startswith("MKL"))
+        items = list(self._items(keys))
+        items.append(("Cython-0.23.4-1.egg",
+                      _index_entry("Cython", "0.23.4", 1)))
+        items.insert(0, ("dummy-1.0.0-1.egg",
+                         _index_entry("dummy", "1.0.0", 1, ["Cython 0.23.4"])))
+
+        # When
+        repository = Repository(
+            parse_index_items(items, self.repository_info, "2.7")
+        )
+
+        # Then
+        self.assertEqual(
+            repository.find_package("scipy", "0.14.0-1").dependencies,
+            frozenset(["numpy 1.8.0-1", "mkl 10.3-1"])
+        )
+        self.assertEqual(
+            repository.find_package("dummy", "1.0.0-1").dependencies,
+            frozenset(["Cython 0.23.4"])
+        )
+        self.assertEqual(len(repository), 8)
@@ -12,6 +12,7 @@ from enstaller.egg_meta import split_eggname
 from enstaller.repository_info import (BroodRepositoryInfo,
                                        CanopyRepositoryInfo,
                                        FSRepositoryInfo,
+                                       MirroredRepositoryInfo,
                                        OldstyleRepositoryInfo)
 from enstaller.repository import RemotePackageMetadata
 from enstaller.utils import path_to_uri
@@ -268,3 +269,60 @@ class TestFSRepositoryInfo(unittest.TestCase):
         self.assertEqual(info.name, store_url)
         self.assertEqual(info._base_url, r__base_url)
         self.assertEqual(info._package_url(package), r_package_url)
+
+
+class TestMirroredRepositoryInfo(unittest.TestCase):
+    def setUp(self):
+        self.share = FSRepositoryInfo("file:///mnt/eggs")
+        self.store = OldstyleRepositoryInfo("http://acme.com/eggs/")
+        self.package = RemotePackageMetadata.from_egg(DUMMY_EGG)
+
+    def test_eq_and_hashing(self):
+        # When
+        info1 = MirroredRepositoryInfo([self.share, self.store])
+        info2 = MirroredRepositoryInfo([self.share, self.store])
+        info3 = MirroredRepositoryInfo([self.store, self.share])
+
+        # Then
+        self.assertEqual(info1, info2)
+        self.assertEqual(hash(info1), hash(info2))
+        self.assertNotEqual(info1, info3)
+        self.assertNotEqual(info1, self.share)
+
+    def test_no_mirrors(self):
+        # When/Then
+        with self.assertRaises(ValueError):
+            MirroredRepositoryInfo([])
+
+    def test_simple(self):
+        # When
+        info = MirroredRepositoryInfo([self.share, self.store])
+
+        # Then
+        self.assertEqual(info.index_url, self.share.index_url)
+        self.assertEqual(info.name, self.share.name)
+        self.assertEqual(info._package_url(self.package),
+                         self.share._package_url(self.package))
+        self.assertEqual(info._package_urls(self.package), [
+            (self.share, self.share._package_url(self.package)),
+            (self.store, self.store._package_url(self.package)),
+        ])
+
+    def test_fastest_mirror(self):
+        # Given
+        info = MirroredRepositoryInfo([self.share, self.store])
+
+        # When
+        info.stats.record_latency(self.share, 0.5)
+        info.stats.record_latency(self.store, 0.1)
+
+        # Then
+        self.assertEqual(info._package_url(self.package),
+                         self.store._package_url(self.package))
+
+        # When
+        info.stats.record_failure(self.store)
+
+        # Then
+        self.assertEqual(info._package_url(self.package),
+                         self.share._package_url(self.package))
@@ -1,18 +1,21 @@
+import base64
+import os
 import os.path
 import json
 import sqlite3
 import tempfile
 import sys
+import zlib
 
 import mock
 import requests
 
-from egginst._compat import cPickle
+from egginst._compat import buffer, cPickle
 from egginst.utils import rm_rf
 
 from enstaller.requests_utils import _ResponseIterator
 from enstaller.requests_utils import DBCache, FileResponse, LocalFileAdapter
-from enstaller.requests_utils import _NullCache
+from enstaller.requests_utils import _NullCache, PooledHTTPAdapter
 from enstaller.utils import compute_md5
 
 if sys.version_info[0] == 2:
@@ -78,6 +81,25 @@ class TestLocalFileAdapter(unittest.TestCase):
         self.assertEqual(data, r_data)
         self.assertEqual(resp.headers["content-length"], str(os.stat(__file__).st_size))
 
+    def test_range(self):
+        # Given
+        session = self._create_file_session()
+        with open(__file__, "rb") as fp:
+            r_data = fp.read()
+        size = len(r_data)
+
+        # When
+        resp = session.get("file://{0}".format(os.path.abspath(__file__)),
+                           headers={"Range": "bytes=10-"})
+        data = resp.content
+
+        # Then
+        self.assertEqual(resp.status_code, 206)
+        self.assertEqual(data, r_data[10:])
+        self.assertEqual(resp.headers["content-length"], str(size - 10))
+        self.assertEqual(resp.headers["content-range"],
+                         "bytes 10-{0}/{1}".format(size - 1, size))
+
 
 class TestResponseIterator(unittest.TestCase):
     def setUp(self):
@@ -124,6 +146,36 @@ class TestResponseIterator(unittest.TestCase):
         self.assertEqual(compute_md5(target), compute_md5(source))
 
 
+class TestPooledHTTPAdapter(unittest.TestCase):
+    def test_discarded_pools(self):
+        # Given
+        adapter = PooledHTTPAdapter(pool_connections=1)
+        pool = adapter.get_connection("https://acme.com/index.json")
+        pool.num_requests, pool.num_connections = 5, 2
+
+        # When
+        # Only one pool is kept: the first one is discarded
+        other = adapter.get_connection("https://mirror.acme.com/index.json")
+        other.num_requests, other.num_connections = 1, 1
+        stats = adapter.connection_stats()
+
+        # Then
+        self.assertEqual(adapter.poolmanager._live_pools, set([other]))
+        self.assertEqual(sorted(stats), ["https://acme.com:443",
+                                         "https://mirror.acme.com:443"])
+        self.assertEqual(stats["https://acme.com:443"].reused, 3)
+        self.assertEqual(stats["https://mirror.acme.com:443"].reused, 0)
+
+        # When
+        pool = adapter.get_connection("https://acme.com/index.json")
+        pool.num_requests, pool.num_connections = 2, 1
+        stats = adapter.connection_stats()
+
+        # Then
+        self.assertEqual(stats["https://acme.com:443"].requests, 7)
+        self.assertEqual(stats["https://acme.com:443"].connections, 3)
+
+
 class TestDBCache(unittest.TestCase):
     def setUp(self):
         self.prefix = tempfile.mkdtemp()
@@ -228,14 +280,14 @@ CREATE TABLE queue
         uri = os.path.join(self.prefix, "foo.db")
         self._create_invalid_table(uri)
 
-        cache = DBCache(uri)
-
         # When
+        cache = DBCache(uri)
         cache.set("foo", b"bar")
         value = cache.get("foo")
 
         # Then
-        self.assertIsNone(value)
+        # The invalid legacy table is discarded
+        self.assertEqual(value, b"bar")
 
         # When/Then
         cache.delete("foo")
@@ -247,14 +299,133 @@ CREATE TABLE queue
             fp.write(b"")
 
         cache = DBCache(uri)
-        r_value = b"bar"
+        r_value = b"bar" * 1000
 
         # When
         cache.set("foo", r_value)
 
-        with mock.patch("enstaller.requests_utils.base64.b64decode",
-                        side_effect=TypeError):
+        with mock.patch("enstaller.requests_utils.zlib.decompress",
+                        side_effect=zlib.error):
             value = cache.get("foo")
 
         # Then
         self.assertIsNone(value)
+
+    def _stored_rows(self, uri):
+        cx = sqlite3.connect(uri)
+        try:
+            return dict(
+                (key, (bytes(value), compressed)) for key, value, compressed
+                in cx.execute("SELECT key, value, compressed FROM entries")
+            )
+        finally:
+            cx.close()
+
+    def test_raw_and_compressed_blobs(self):
+        # Given
+        uri = os.path.join(self.prefix, "foo.db")
+        cache = DBCache(uri)
+        small_value = b"bar"
+        large_value = json.dumps({"bar": ["fubar"] * 1000}).encode("utf8")
+        random_value = os.urandom(4096)
+
+        # When
+        cache.set("small", small_value)
+        cache.set("large", large_value)
+        cache.set("random", random_value)
+
+        # Then
+        rows = self._stored_rows(uri)
+        self.assertEqual(rows["small"], (small_value, 0))
+        self.assertEqual(rows["large"][1], 1)
+        self.assertLess(len(rows["large"][0]), len(large_value))
+        self.assertEqual(rows["random"], (random_value, 0))
+        self.assertEqual(cache.get("small"), small_value)
+        self.assertEqual(cache.get("large"), large_value)
+        self.assertEqual(cache.get("random"), random_value)
+
+    def test_max_entries(self):
+        # Given
+        uri = os.path.join(self.prefix, "foo.db")
+        cache = DBCache(uri, max_entries=2)
+
+        # When
+        with mock.patch("enstaller.requests_utils.time.time",
+                        side_effect=[1.0, 2.0, 3.0]):
+            for key in ("a", "b", "c"):
+                cache.set(key, key.encode("ascii"))
+
+        # Then
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.get("b"), b"b")
+        self.assertEqual(cache.get("c"), b"c")
+
+    def test_max_size(self):
+        # Given
+        uri = os.path.join(self.prefix, "foo.db")
+        cache = DBCache(uri, max_size=2500, compress=False)
+
+        # When
+        with mock.patch("enstaller.requests_utils.time.time",
+                        side_effect=[1.0, 2.0, 3.0]):
+            for key in ("a", "b", "c"):
+                cache.set(key, key.encode("ascii") * 1000)
+
+        # Then
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.get("b"), b"b" * 1000)
+        self.assertEqual(cache.get("c"), b"c" * 1000)
+
+        # When
+        # An entry larger than the cache does not evict the others
+        cache.set("d", b"d" * 3000)
+
+        # Then
+        self.assertIsNone(cache.get("d"))
+        self.assertEqual(cache.get("b"), b"b" * 1000)
+        self.assertEqual(cache.get("c"), b"c" * 1000)
+
+    def test_migrate_legacy_db(self):
+        # Given
+        uri = os.path.join(self.prefix, "foo.db")
+        cx = sqlite3.connect(uri)
+        cx.execute("""\
+CREATE TABLE queue
+(
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    key STRING(256) UNIQUE,
+    value BLOB,
+    modified_at INT NOT NULL
+);""")
+        legacy_entries = [
+            ("http://acme.com/index.json", b"{}" * 1000),
+            ("http://acme.com/other.json", b"other"),
+        ]
+        for key, value in legacy_entries:
+            cx.execute(
+                "INSERT INTO queue (key, value, modified_at) "
+                "VALUES (?, ?, time('now'))",
+                (base64.b64encode(key.encode("utf8")).decode("utf8"),
+                 buffer(base64.b64encode(value)))
+            )
+        cx.execute("INSERT INTO queue (key, value, modified_at) "
+                   "VALUES ('invalid', 'invalid', 0)")
+        cx.commit()
+        cx.close()
+
+        # When
+        cache = DBCache(uri)
+
+        # Then
+        for key, value in legacy_entries:
+            self.assertEqual(cache.get(key), value)
+        self.assertEqual(sorted(self._stored_rows(uri)),
+                         sorted(key for key, _ in legacy_entries))
+        cx = sqlite3.connect(uri)
+        try:
+            tables = [row[0] for row in cx.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'table'"
+            )]
+        finally:
+            cx.close()
+        self.assertNotIn("queue", tables)
@@ -8,6 +8,7 @@ import tempfile
 import responses
 
 from cachecontrol.adapter import CacheControlAdapter
+from cachecontrol.filewrapper import CallbackFileWrapper
 from requests.adapters import HTTPAdapter
 
 import enstaller
@@ -17,6 +18,7 @@ from enstaller.auth.auth_managers import (BroodAuthenticator,
                                           OldRepoAuthManager)
 from enstaller.config import Configuration
 from enstaller.errors import EnstallerException
+from enstaller.requests_utils import NO_STORE_HEADERS
 from enstaller.session import _PatchedRawSession, Session
 from enstaller.tests.common import R_JSON_AUTH_RESP, mocked_session_factory
 
@@ -139,7 +141,7 @@ class TestSession(unittest.TestCase):
         session = mocked_session_factory(config.repository_cache)
 
         # When
-        with mock.patch("enstaller.session.CacheControlAdapter") as m:
+        with mock.patch("enstaller.session.IndexCacheAdapter") as m:
             with session.etag():
                 pass
             with session.etag():
@@ -150,7 +152,76 @@ class TestSession(unittest.TestCase):
                                     CacheControlAdapter))
         self.assertFalse(isinstance(session._raw.adapters["https://"],
                                     CacheControlAdapter))
-        self.assertEqual(m.call_count, 4)
+        # The etag adapter is kept across etag contexts
+        self.assertEqual(m.call_count, 1)
+
+    def test_etag_shares_connections(self):
+        # Given
+        session = mocked_session_factory(self.prefix)
+        pool = session._raw.adapters["http://"].get_connection(
+            "http://acme.com/index.json"
+        )
+
+        # When
+        with session.etag():
+            etag_adapter = session._raw.adapters["http://"]
+            etag_pool = etag_adapter.get_connection(
+                "http://acme.com/index.json"
+            )
+
+        # Then
+        self.assertIsInstance(etag_adapter, CacheControlAdapter)
+        self.assertIs(etag_pool, pool)
+
+    def test_connection_stats(self):
+        # Given
+        session = mocked_session_factory(self.prefix)
+        with session.etag():
+            pool = session._raw.adapters["https://"].get_connection(
+                "https://acme.com/index.json"
+            )
+
+        # When
+        pool.num_requests, pool.num_connections = 5, 2
+        stats = session.connection_stats()
+
+        # Then
+        self.assertEqual(list(stats), ["https://acme.com:443"])
+        self.assertEqual(stats["https://acme.com:443"].requests, 5)
+        self.assertEqual(stats["https://acme.com:443"].connections, 2)
+        self.assertEqual(stats["https://acme.com:443"].reused, 3)
+
+    def test_connection_pool_configuration(self):
+        # Given
+        config = Configuration()
+        config.update(connection_pool_size=4, connection_pool_block=True)
+
+        # When
+        with Session.from_configuration(config) as session:
+            pool = session._raw.adapters["http://"].get_connection(
+                "http://acme.com/index.json"
+            )
+
+            # Then
+            self.assertEqual(pool.pool.maxsize, 4)
+            self.assertTrue(pool.block)
+
+    def test_download_scheduler_configuration(self):
+        # Given
+        config = Configuration()
+
+        # When/Then
+        with Session.from_configuration(config) as session:
+            scheduler = session.download_scheduler
+            self.assertIsNone(scheduler.max_transfers)
+            self.assertIsNone(scheduler.max_bytes_per_second)
+
+        # When/Then
+        config.update(max_concurrent_transfers=2, max_download_rate=1024)
+        with Session.from_configuration(config) as session:
+            scheduler = session.download_scheduler
+            self.assertEqual(scheduler.max_transfers, 2)
+            self.assertEqual(scheduler.max_bytes_per_second, 1024)
 
     def test_max_retries(self):
         # Given
@@ -188,6 +259,41 @@ class TestSession(unittest.TestCase):
                     max_retries = session._raw.adapters[prefix].max_retries
                     self.assertEqual(max_retries.total, 3)
 
+    def test_index_cache_capacity_with_etag(self):
+        # Given
+        config = Configuration()
+        config.update(index_cache_max_entries=3, index_cache_max_size=1024)
+
+        # When/Then
+        with Session.from_configuration(config) as session:
+            with session.etag():
+                for prefix in ("http://", "https://"):
+                    cache = session._raw.adapters[prefix].cache._cache
+                    self.assertEqual(cache.max_entries, 3)
+                    self.assertEqual(cache.max_size, 1024)
+
+    @responses.activate
+    def test_etag_no_store(self):
+        # Given
+        index_url = "http://acme.com/index.json"
+        egg_url = "http://acme.com/eggs/foo-1.0.0-1.egg"
+        for url in (index_url, egg_url):
+            responses.add(responses.GET, url, body=b"some data",
+                          adding_headers={"ETag": "\"1234\""})
+        session = mocked_session_factory(self.prefix)
+
+        # When
+        with session.etag():
+            index_response = session.fetch(index_url)
+            egg_response = session.fetch(egg_url, headers=NO_STORE_HEADERS)
+
+        # Then
+        # Only the index content is buffered to be cached once read
+        self.assertIsInstance(index_response.raw._fp, CallbackFileWrapper)
+        self.assertNotIsInstance(egg_response.raw._fp, CallbackFileWrapper)
+        self.assertFalse(egg_response.from_cache)
+        self.assertEqual(egg_response.content, b"some data")
+
     def test_from_configuration(self):
         # Given
         config = Configuration()
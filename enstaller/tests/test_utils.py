@@ -1,6 +1,9 @@
 from __future__ import print_function
 
 import contextlib
+import gzip
+import io
+import json
 import os.path
 import random
 import sys
@@ -11,9 +14,12 @@ from egginst.main import name_version_fn
 from egginst.tests.common import DUMMY_EGG_SIZE, DUMMY_EGG, \
     DUMMY_EGG_MTIME, DUMMY_EGG_MD5
 
+import requests
+
 from enstaller.utils import canonical, comparable_version, input_auth, \
     path_to_uri, uri_to_path, info_file, cleanup_url, \
-    prompt_yes_no, under_venv, real_prefix
+    prompt_yes_no, under_venv, real_prefix, decode_json_from_buffer, \
+    iter_index_items
 from .common import INPUT_IMPORT_STRING, mock_input, mock_print, mock_raw_input
 
 if sys.version_info[0] == 2:
@@ -278,3 +284,127 @@ class TestInputAuth(unittest.TestCase):
     def test_empty(self):
         with mock_input(""):
             self.assertEqual(input_auth(), (None, None))
+
+
+def _chunked(data, size):
+    return [data[i:i+size] for i in range(0, len(data), size)]
+
+
+def _gzip(data):
+    buf = io.BytesIO()
+    with contextlib.closing(gzip.GzipFile(fileobj=buf, mode="wb")) as fp:
+        fp.write(data)
+    return buf.getvalue()
+
+
+class TestIterIndexItems(unittest.TestCase):
+    def setUp(self):
+        self.index = {
+            u"numpy-1.8.0-1.egg": {
+                u"name": u"numpy", u"packages": [u"MKL 10.3-1"],
+                u"build": 1, u"available": True, u"python": u"2.7",
+                u"md5": u"a" * 32, u"mtime": 1.5,
+            },
+            u"MKL-10.3-1.egg": {
+                u"name": u"mkl", u"packages": [], u"build": 1,
+                u"python": None, u"description": u"caf\xe9 {\"}",
+            },
+        }
+        self.data = json.dumps(self.index, indent=2,
+                               ensure_ascii=False).encode("utf8")
+
+    def test_simple(self):
+        # When
+        items = list(iter_index_items([self.data]))
+
+        # Then
+        self.assertEqual(dict(items), self.index)
+        self.assertEqual(len(items), 2)
+
+    def test_any_chunk_size(self):
+        # Given
+        # Chunks of size 1 split multi-bytes utf8 sequences, strings, numbers
+        # and literals
+        for size in (1, 2, 7, 64):
+            # When
+            items = iter_index_items(_chunked(self.data, size))
+
+            # Then
+            self.assertEqual(dict(items), self.index)
+
+    def test_same_as_decode_json_from_buffer(self):
+        # When
+        items = dict(iter_index_items(_chunked(self.data, 3)))
+
+        # Then
+        self.assertEqual(items, decode_json_from_buffer(self.data))
+
+    def test_empty_index(self):
+        # When/Then
+        self.assertEqual(list(iter_index_items([b" { } \n"])), [])
+
+    def test_stripped_gzip(self):
+        # Given
+        data = _gzip(self.data)
+
+        # When/Then
+        # The gzip magic may be split across chunks
+        for size in (1, 5):
+            items = iter_index_items(_chunked(data, size))
+            self.assertEqual(dict(items), self.index)
+
+    def test_short_first_chunk(self):
+        # When/Then
+        self.assertEqual(list(iter_index_items([b"{", b"}"])), [])
+        self.assertEqual(list(iter_index_items([b"", b"{", b"}"])), [])
+
+    def test_invalid_gzip(self):
+        # Given
+        data = _gzip(self.data)
+        data = data[:10] + b"x" * 20 + data[30:]
+
+        # When/Then
+        with self.assertRaises(requests.exceptions.ContentDecodingError):
+            list(iter_index_items(_chunked(data, 5)))
+
+    def test_invalid_data(self):
+        # Given
+        invalid_data = [
+            self.data[:-10],
+            self.data + b"{}",
+            b"[]",
+            b'{"a": 1,}',
+            b'{"a" 1}',
+            b'{1: 1}',
+            b"\xff\xfe",
+        ]
+
+        # When/Then
+        for data in invalid_data:
+            with self.assertRaises(ValueError):
+                list(iter_index_items(_chunked(data, 4)))
+
+    def test_invalid_data_fails_early(self):
+        # Given
+        invalid_entries = [
+            b'{"a": {"b": tru}, ',
+            b'{"a": {"b": [1, 2}}, ',
+            b'{"a": {"b": 1} ]',
+            b'{"a": 1x, ',
+        ]
+        consumed = []
+
+        def _chunks(head):
+            for chunk in _chunked(head, 3):
+                yield chunk
+            for i in range(1000):
+                consumed.append(i)
+                yield '"b{0}": {{"c": "d"}}, '.format(i).encode("ascii")
+
+        # When/Then
+        for head in invalid_entries:
+            del consumed[:]
+            with self.assertRaises(ValueError):
+                list(iter_index_items(_chunks(head)))
+            # The rest of the index is not read
+            self.assertLessEqual(len(consumed), 1)
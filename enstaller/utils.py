@@ -5,13 +5,16 @@ from egginst._compat import (
 )
 
 import getpass
+import codecs
 import json
 import logging
+import re
 import sys
 import textwrap
 import zlib
 
 import requests
+import six
 
 from okonomiyaki.platforms import PythonImplementation
 
@@ -215,6 +218,255 @@ def decode_json_from_buffer(data):
     return json.loads(decoded_data)
 
 
+_JSON_WHITESPACE = re.compile(r"[ \t\n\r]*")
+_JSON_BRACKET_OR_QUOTE = re.compile(r'[{}\[\]"]')
+_JSON_QUOTE_OR_ESCAPE = re.compile(r'["\\]')
+_JSON_SCALAR_END = re.compile(r"[ \t\n\r,\]}]")
+
+
+class _IncrementalIndexDecoder(object):
+    """ Decode the top-level json object of an index from chunks of bytes,
+    one (key, value) pair at a time.
+
+    Only the current, incomplete entry is kept in memory, so the memory
+    needed to decode an index does not grow with the index size.
+    """
+    def __init__(self):
+        self._decoder = json.JSONDecoder()
+        self._text_decoder = codecs.getincrementaldecoder("utf8")()
+        self._decompressor = None
+        # Start of the data, until it is long enough to detect gzip
+        self._head = b""
+
+        self._buffer = u""
+        self._position = 0
+        # One of "start", "first_key", "key", "colon", "value", "comma",
+        # "end"
+        self._state = "start"
+        self._key = None
+
+        # Progress of _scan_value through the current, incomplete value
+        self._scanned = 0
+        self._closers = []
+        self._in_string = False
+
+    def _decompress(self, chunk, final=False):
+        if self._head is not None:
+            # The gzip magic may be split across the first chunks
+            self._head += chunk
+            if len(self._head) < 2 and not final:
+                return b""
+            chunk, self._head = self._head, None
+            if _bytes_to_hex(chunk[:2]) == _GZIP_MAGIC:
+                # See decode_json_from_buffer
+                logging.debug("Detected compressed data with stripped header")
+                self._decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+        if self._decompressor is None:
+            return chunk
+        try:
+            if final:
+                return (self._decompressor.decompress(chunk)
+                        + self._decompressor.flush())
+            else:
+                return self._decompressor.decompress(chunk)
+        except (IOError, zlib.error) as e:
+            raise requests.exceptions.ContentDecodingError(
+                "Detected gzip-compressed response, but failed to decode it.",
+                e)
+
+    def _decode_text(self, data, final=False):
+        try:
+            return self._text_decoder.decode(data, final)
+        except UnicodeDecodeError as e:
+            raise ValueError("Invalid index data, try again ({0!r})".format(e))
+
+    def feed(self, chunk):
+        """ Feed the given chunk of bytes, and iterate over the (key, value)
+        pairs completed by it."""
+        self._buffer = (self._buffer[self._position:]
+                        + self._decode_text(self._decompress(chunk)))
+        self._position = 0
+        return self._iter_items(final=False)
+
+    def close(self):
+        """ Signal the end of the data, and iterate over the remaining
+        (key, value) pairs."""
+        tail = self._decompress(b"", final=True)
+        self._buffer = (self._buffer[self._position:]
+                        + self._decode_text(tail, final=True))
+        self._position = 0
+
+        for item in self._iter_items(final=True):
+            yield item
+
+        if self._state != "end" or self._skip_whitespace() < len(self._buffer):
+            raise ValueError("Invalid index data, try again (truncated or "
+                             "trailing data)")
+
+    def _skip_whitespace(self):
+        self._position = _JSON_WHITESPACE.match(self._buffer,
+                                                self._position).end()
+        return self._position
+
+    def _expect(self, characters):
+        position = self._skip_whitespace()
+        if position >= len(self._buffer):
+            return None
+        c = self._buffer[position]
+        if c not in characters:
+            raise ValueError("Invalid index data, try again (unexpected "
+                             "{0!r} at offset {1})".format(c, position))
+        self._position += 1
+        return c
+
+    def _raw_decode(self, final):
+        """ Decode the json value at the current position, or return None if
+        the buffer does not contain it fully yet."""
+        position = self._skip_whitespace()
+        if position >= len(self._buffer):
+            return None
+        try:
+            value, end = self._decoder.raw_decode(self._buffer, position)
+        except ValueError as e:
+            # Only wait for more data if the value is actually incomplete,
+            # so that invalid data are reported as soon as they are seen.
+            if final or self._scan_value():
+                raise ValueError("Invalid index data, try again "
+                                 "({0})".format(e))
+            return None
+        # A scalar at the end of the buffer may be incomplete (e.g. a
+        # number)
+        if end >= len(self._buffer) and not final:
+            return None
+        self._position = end
+        self._reset_scan()
+        return (value,)
+
+    def _reset_scan(self):
+        self._scanned = 0
+        self._closers = []
+        self._in_string = False
+
+    def _scan_value(self):
+        """ Returns True if the buffer contains the whole json value at the
+        current position, only looking at its brackets and strings.
+
+        The scan resumes where the previous call stopped, so that a value
+        received over many chunks is only scanned once.
+        """
+        buf = self._buffer
+        i = self._position + self._scanned
+        if self._scanned == 0:
+            c = buf[i]
+            if c == u"{":
+                self._closers.append(u"}")
+            elif c == u"[":
+                self._closers.append(u"]")
+            elif c == u'"':
+                self._in_string = True
+            else:
+                return _JSON_SCALAR_END.search(buf, i) is not None
+            i += 1
+
+        while True:
+            if self._in_string:
+                m = _JSON_QUOTE_OR_ESCAPE.search(buf, i)
+                if m is None:
+                    i = len(buf)
+                    break
+                elif m.group() == u"\\":
+                    if m.end() >= len(buf):
+                        # Look at the escaped character with the next chunk
+                        i = m.start()
+                        break
+                    i = m.end() + 1
+                    continue
+                self._in_string = False
+                i = m.end()
+            else:
+                m = _JSON_BRACKET_OR_QUOTE.search(buf, i)
+                if m is None:
+                    i = len(buf)
+                    break
+                c = m.group()
+                i = m.end()
+                if c == u'"':
+                    self._in_string = True
+                elif c == u"{":
+                    self._closers.append(u"}")
+                elif c == u"[":
+                    self._closers.append(u"]")
+                elif self._closers.pop() != c:
+                    raise ValueError("Invalid index data, try again "
+                                     "(unexpected {0!r} at offset "
+                                     "{1})".format(c, i - 1))
+
+            if not self._in_string and len(self._closers) == 0:
+                return True
+
+        self._scanned = i - self._position
+        return False
+
+    def _iter_items(self, final):
+        while True:
+            if self._state == "start":
+                if self._expect("{") is None:
+                    return
+                self._state = "first_key"
+            elif self._state == "first_key":
+                position = self._skip_whitespace()
+                if position >= len(self._buffer):
+                    return
+                if self._buffer[position] == u"}":
+                    self._position += 1
+                    self._state = "end"
+                else:
+                    self._state = "key"
+            elif self._state == "key":
+                decoded = self._raw_decode(final)
+                if decoded is None:
+                    return
+                self._key = decoded[0]
+                if not isinstance(self._key, six.string_types):
+                    raise ValueError("Invalid index data, try again "
+                                     "(invalid key {0!r})".format(self._key))
+                self._state = "colon"
+            elif self._state == "colon":
+                if self._expect(":") is None:
+                    return
+                self._state = "value"
+            elif self._state == "value":
+                decoded = self._raw_decode(final)
+                if decoded is None:
+                    return
+                self._state = "comma"
+                yield self._key, decoded[0]
+            elif self._state == "comma":
+                c = self._expect(",}")
+                if c is None:
+                    return
+                self._state = "key" if c == "," else "end"
+            else:
+                return
+
+
+def iter_index_items(chunks):
+    """
+    Iterate over the (key, value) pairs of the json index contained in the
+    given iterable of byte chunks, without decoding the whole index at once.
+
+    As for decode_json_from_buffer, the data are decompressed if detected as
+    gzip-encoded.
+    """
+    decoder = _IncrementalIndexDecoder()
+    for chunk in chunks:
+        for item in decoder.feed(chunk):
+            yield item
+    for item in decoder.close():
+        yield item
+
+
 def input_auth():
     """
     Prompt user for username and password.  Return (username, password)
@@ -27,7 +27,6 @@ INSTALL_REQUIRES = [
     "okonomiyaki >= 0.14.1",
     "requests>=2.7.0",
     "ruamel.yaml>=0.10.7",
-    "sqlite_cache>=0.0.3",
     "zipfile2 >= 0.0.10",
 ]
 